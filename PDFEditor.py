@@ -7,15 +7,30 @@ import math
 import os
 import sys 
 import re 
+import time
+import multiprocessing
+import numpy as np
 from typing import Optional, List, Set, Dict, Union
 from datetime import date, datetime 
-import pypdf
-from pypdf import PdfReader, PdfWriter, Transformation
-from pypdf.generic import RectangleObject, FloatObject, ArrayObject
-# ArrayObject jest nadal potrzebne, jeśli użyjesz add_transformation, choć FloatObject 
-# wystarczyłoby, jeśli pypdf je konwertuje. Zostawiam dla pełnej kompatybilności.
-from pypdf.generic import NameObject # Dodaj import dla NameObject
+from pypdf import PdfReader, PdfWriter
 import json
+from core.undo_history import UndoHistory
+from core.virtual_document import VirtualDocument
+from core.thumbnail_renderer import ThumbnailRenderService, render_thumbnail, PRIORITY_VISIBLE, PRIORITY_BACKGROUND
+from core.thumbnail_cache import ThumbnailDiskCache, PageContentHasher
+from core.display_list_cache import DisplayListCache, file_page_key
+from core.image_cache import ThumbnailImageCache
+from core.thumbnail_transforms import ROTATION, BOX_CHANGE, ThumbnailTransform, page_placement, transform_thumbnail
+from core.thumbnail_layout import ThumbnailGridLayout, pages_around
+from core.document_analysis import DocumentAnalyzer, PageAnalysisIndex, PAGE_FORMATS
+from core.empty_pages import EmptyPageResults, detect_empty_page
+from core import page_geometry, page_imposition, page_order, page_transfer
+from core.save_profiles import (BackgroundSaver, SAVE_PROFILES, SNAPSHOT_OPTIONS, DEFAULT_SAVE_PROFILE,
+                                get_profile, profile_name_for_label, is_source_file,
+                                can_save_incrementally, save_incrementally)
+from core.image_optimizer import IMAGE_PRESETS, plan_image_optimization, apply_image_optimization
+from core.refresh_scheduler import RefreshScheduler
+from core.page_selection import PageSelection
 
 # Definicja BASE_DIR i inne stałe
 if getattr(sys, 'frozen', False):
@@ -34,6 +49,9 @@ ICON_FOLDER = get_icon_folder()
 #FOCUS_HIGHLIGHT_COLOR = "#B3E5FC" # Czarny (Black)
 FOCUS_HIGHLIGHT_COLOR = "#d3d3d3" # Czarny (Black)
 FOCUS_HIGHLIGHT_WIDTH = 6       # Szerokość ramki fokusu (stała)
+DRAG_THRESHOLD_PX = 8           # Przesunięcie myszy, od którego kliknięcie miniatury staje się przeciąganiem
+DRAG_AUTOSCROLL_PX = 40         # Odległość od krawędzi widoku, przy której przeciąganie przewija siatkę
+DROP_MARKER_COLOR = "#0078D7"   # Znacznik miejsca upuszczenia przeciąganych stron
  
 # DANE PROGRAMU
 PROGRAM_TITLE = "GRYF PDF Editor" 
@@ -228,6 +246,11 @@ class PreferencesManager:
             'thumbnail_quality': 'Średnia',
             'confirm_delete': 'False',
             'export_image_dpi': '300',  # DPI dla eksportu obrazów (150, 300, 600)
+            'undo_history_budget_mb': '512',  # Budżet pamięci historii cofania (MB)
+            'thumbnail_cache_mb': '256',  # Limit cache miniatur na dysku (MB, 0 = wyłączony)
+            'thumbnail_memory_mb': '256',  # Budżet pamięci miniatur wyświetlanych w oknie (MB)
+            'save_profile': 'balanced',  # Profil zapisu: fast, balanced, compact
+            'save_image_preset': '',  # Optymalizacja obrazów przy zapisie: '', print, screen
             
             # PageCropResizeDialog
             'PageCropResizeDialog.crop_mode': 'nocrop',
@@ -277,6 +300,8 @@ class PreferencesManager:
             'MergePageGridDialog.spacing_x_mm': '10',
             'MergePageGridDialog.spacing_y_mm': '10',
             'MergePageGridDialog.dpi_var': '300',
+            'MergePageGridDialog.mode_var': 'vector',
+            'MergePageGridDialog.layout_var': 'grid',
             
             # EnhancedPageRangeDialog
             'EnhancedPageRangeDialog.last_range': '',
@@ -295,8 +320,11 @@ class PreferencesManager:
             
             # Color detection settings
             'color_detect_threshold': '5',
-            'color_detect_samples': '300',
             'color_detect_scale': '0.2',
+            
+            # Empty page detection settings
+            'empty_page_ink_percent': '0.02',
+            'empty_page_min_confidence': '0.5',
         }
         self.load_preferences()
     
@@ -365,6 +393,8 @@ class PreferencesManager:
 class PreferencesDialog(tk.Toplevel):
     """Okno dialogowe preferencji programu"""
     
+    KEEP_IMAGES_LABEL = "Bez zmian"
+    
     def __init__(self, parent, prefs_manager):
         super().__init__(parent)
         self.parent = parent
@@ -429,6 +459,33 @@ class PreferencesDialog(tk.Toplevel):
         dpi_combo = ttk.Combobox(general_frame, textvariable=self.export_image_dpi_var, values=["150", "300", "600"], state="readonly", width=10)
         dpi_combo.grid(row=4, column=1, sticky="w", padx=4, pady=4)
         
+        # Budżet pamięci historii cofania
+        ttk.Label(general_frame, text="Pamięć historii cofania (MB):").grid(row=5, column=0, sticky="w", padx=4, pady=4)
+        self.undo_budget_var = tk.StringVar()
+        ttk.Entry(general_frame, textvariable=self.undo_budget_var, width=10).grid(row=5, column=1, sticky="w", padx=4, pady=4)
+        
+        # Limit cache miniatur na dysku
+        ttk.Label(general_frame, text="Cache miniatur na dysku (MB):").grid(row=6, column=0, sticky="w", padx=4, pady=4)
+        self.thumbnail_cache_var = tk.StringVar()
+        ttk.Entry(general_frame, textvariable=self.thumbnail_cache_var, width=10).grid(row=6, column=1, sticky="w", padx=4, pady=4)
+        
+        # Budżet pamięci miniatur
+        ttk.Label(general_frame, text="Pamięć miniatur (MB):").grid(row=7, column=0, sticky="w", padx=4, pady=4)
+        self.thumbnail_memory_var = tk.StringVar()
+        ttk.Entry(general_frame, textvariable=self.thumbnail_memory_var, width=10).grid(row=7, column=1, sticky="w", padx=4, pady=4)
+        
+        # Profil zapisu (czas zapisu kontra rozmiar pliku)
+        ttk.Label(general_frame, text="Profil zapisu:").grid(row=8, column=0, sticky="w", padx=4, pady=4)
+        self.save_profile_var = tk.StringVar()
+        save_profile_combo = ttk.Combobox(general_frame, textvariable=self.save_profile_var, values=[profile.label for profile in SAVE_PROFILES.values()], state="readonly", width=14)
+        save_profile_combo.grid(row=8, column=1, sticky="w", padx=4, pady=4)
+        
+        # Optymalizacja obrazów przy zapisie (druk / ekran)
+        ttk.Label(general_frame, text="Obrazy przy zapisie:").grid(row=9, column=0, sticky="w", padx=4, pady=4)
+        self.save_image_preset_var = tk.StringVar()
+        save_image_preset_combo = ttk.Combobox(general_frame, textvariable=self.save_image_preset_var, values=[self.KEEP_IMAGES_LABEL] + [preset.label for preset in IMAGE_PRESETS.values()], state="readonly", width=14)
+        save_image_preset_combo.grid(row=9, column=1, sticky="w", padx=4, pady=4)
+        
         general_frame.columnconfigure(1, weight=1)
         
         # Sekcja wykrywania stron kolorowych
@@ -442,22 +499,33 @@ class PreferencesDialog(tk.Toplevel):
         threshold_entry.grid(row=0, column=1, sticky="w", padx=4, pady=4)
         ttk.Label(color_detect_frame, text="(1-255, domyślnie 5)", foreground="gray").grid(row=0, column=2, sticky="w", padx=4, pady=4)
         
-        # Liczba próbkowanych pikseli
-        ttk.Label(color_detect_frame, text="Liczba próbkowanych pikseli:").grid(row=1, column=0, sticky="w", padx=4, pady=4)
-        self.color_samples_var = tk.StringVar()
-        samples_entry = ttk.Entry(color_detect_frame, textvariable=self.color_samples_var, width=10)
-        samples_entry.grid(row=1, column=1, sticky="w", padx=4, pady=4)
-        ttk.Label(color_detect_frame, text="(10-1000, domyślnie 300)", foreground="gray").grid(row=1, column=2, sticky="w", padx=4, pady=4)
-        
-        # Skala renderowania
-        ttk.Label(color_detect_frame, text="Skala renderowania:").grid(row=2, column=0, sticky="w", padx=4, pady=4)
+        # Skala renderowania (analizowana jest cała wyrenderowana strona)
+        ttk.Label(color_detect_frame, text="Skala renderowania:").grid(row=1, column=0, sticky="w", padx=4, pady=4)
         self.color_scale_var = tk.StringVar()
         scale_entry = ttk.Entry(color_detect_frame, textvariable=self.color_scale_var, width=10)
-        scale_entry.grid(row=2, column=1, sticky="w", padx=4, pady=4)
-        ttk.Label(color_detect_frame, text="(0.1-2.0, domyślnie 0.2)", foreground="gray").grid(row=2, column=2, sticky="w", padx=4, pady=4)
+        scale_entry.grid(row=1, column=1, sticky="w", padx=4, pady=4)
+        ttk.Label(color_detect_frame, text="(0.1-2.0, domyślnie 0.2)", foreground="gray").grid(row=1, column=2, sticky="w", padx=4, pady=4)
         
         color_detect_frame.columnconfigure(2, weight=1)
         
+        # Sekcja wykrywania pustych stron
+        empty_detect_frame = ttk.LabelFrame(main_frame, text="Wykrywanie pustych stron", padding="8")
+        empty_detect_frame.pack(fill="x", pady=(0, 8))
+        
+        # Próg pokrycia tuszem (procent powierzchni strony)
+        ttk.Label(empty_detect_frame, text="Próg pokrycia tuszem (%):").grid(row=0, column=0, sticky="w", padx=4, pady=4)
+        self.empty_ink_var = tk.StringVar()
+        ttk.Entry(empty_detect_frame, textvariable=self.empty_ink_var, width=10).grid(row=0, column=1, sticky="w", padx=4, pady=4)
+        ttk.Label(empty_detect_frame, text="(0-5, domyślnie 0.02)", foreground="gray").grid(row=0, column=2, sticky="w", padx=4, pady=4)
+        
+        # Minimalna pewność wykrycia
+        ttk.Label(empty_detect_frame, text="Minimalna pewność:").grid(row=1, column=0, sticky="w", padx=4, pady=4)
+        self.empty_confidence_var = tk.StringVar()
+        ttk.Entry(empty_detect_frame, textvariable=self.empty_confidence_var, width=10).grid(row=1, column=1, sticky="w", padx=4, pady=4)
+        ttk.Label(empty_detect_frame, text="(0.5-1.0, domyślnie 0.5)", foreground="gray").grid(row=1, column=2, sticky="w", padx=4, pady=4)
+        
+        empty_detect_frame.columnconfigure(2, weight=1)
+        
         # Informacja
        # info_frame = ttk.Frame(main_frame)
        # info_frame.pack(fill="x", pady=8)
@@ -495,9 +563,16 @@ class PreferencesDialog(tk.Toplevel):
         self.thumbnail_quality_var.set(self.prefs_manager.get('thumbnail_quality'))
         self.confirm_delete_var.set(self.prefs_manager.get('confirm_delete') == 'True')
         self.export_image_dpi_var.set(self.prefs_manager.get('export_image_dpi'))
+        self.undo_budget_var.set(self.prefs_manager.get('undo_history_budget_mb'))
+        self.thumbnail_cache_var.set(self.prefs_manager.get('thumbnail_cache_mb'))
+        self.thumbnail_memory_var.set(self.prefs_manager.get('thumbnail_memory_mb'))
+        self.save_profile_var.set(get_profile(self.prefs_manager.get('save_profile')).label)
+        image_preset = IMAGE_PRESETS.get(self.prefs_manager.get('save_image_preset'))
+        self.save_image_preset_var.set(image_preset.label if image_preset else self.KEEP_IMAGES_LABEL)
         self.color_threshold_var.set(self.prefs_manager.get('color_detect_threshold'))
-        self.color_samples_var.set(self.prefs_manager.get('color_detect_samples'))
         self.color_scale_var.set(self.prefs_manager.get('color_detect_scale'))
+        self.empty_ink_var.set(self.prefs_manager.get('empty_page_ink_percent'))
+        self.empty_confidence_var.set(self.prefs_manager.get('empty_page_min_confidence'))
     
     def reset_all_defaults(self):
         """Przywraca domyślne wartości we wszystkich dialogach"""
@@ -537,21 +612,57 @@ class PreferencesDialog(tk.Toplevel):
             return
         
         try:
-            samples = int(self.color_samples_var.get())
-            if samples < 10 or samples > 1000:
-                custom_messagebox(self, "Błąd", "Liczba próbkowanych pikseli musi być z zakresu 10-1000.", typ="error")
+            scale = float(self.color_scale_var.get().replace(',', '.'))
+            if scale < 0.1 or scale > 2.0:
+                custom_messagebox(self, "Błąd", "Skala renderowania musi być z zakresu 0.1-2.0.", typ="error")
                 return
         except ValueError:
-            custom_messagebox(self, "Błąd", "Liczba próbkowanych pikseli musi być liczbą całkowitą.", typ="error")
+            custom_messagebox(self, "Błąd", "Skala renderowania musi być liczbą.", typ="error")
             return
         
         try:
-            scale = float(self.color_scale_var.get().replace(',', '.'))
-            if scale < 0.1 or scale > 2.0:
-                custom_messagebox(self, "Błąd", "Skala renderowania musi być z zakresu 0.1-2.0.", typ="error")
+            empty_ink = float(self.empty_ink_var.get().replace(',', '.'))
+            if empty_ink < 0 or empty_ink > 5:
+                custom_messagebox(self, "Błąd", "Próg pokrycia tuszem musi być z zakresu 0-5%.", typ="error")
                 return
         except ValueError:
-            custom_messagebox(self, "Błąd", "Skala renderowania musi być liczbą.", typ="error")
+            custom_messagebox(self, "Błąd", "Próg pokrycia tuszem musi być liczbą.", typ="error")
+            return
+        
+        try:
+            empty_confidence = float(self.empty_confidence_var.get().replace(',', '.'))
+            if empty_confidence < 0.5 or empty_confidence > 1.0:
+                custom_messagebox(self, "Błąd", "Minimalna pewność musi być z zakresu 0.5-1.0.", typ="error")
+                return
+        except ValueError:
+            custom_messagebox(self, "Błąd", "Minimalna pewność musi być liczbą.", typ="error")
+            return
+        
+        try:
+            undo_budget = int(self.undo_budget_var.get())
+            if undo_budget < 16 or undo_budget > 8192:
+                custom_messagebox(self, "Błąd", "Pamięć historii cofania musi być z zakresu 16-8192 MB.", typ="error")
+                return
+        except ValueError:
+            custom_messagebox(self, "Błąd", "Pamięć historii cofania musi być liczbą całkowitą.", typ="error")
+            return
+        
+        try:
+            thumbnail_cache = int(self.thumbnail_cache_var.get())
+            if thumbnail_cache < 0 or thumbnail_cache > 16384:
+                custom_messagebox(self, "Błąd", "Cache miniatur musi być z zakresu 0-16384 MB (0 wyłącza cache).", typ="error")
+                return
+        except ValueError:
+            custom_messagebox(self, "Błąd", "Cache miniatur musi być liczbą całkowitą.", typ="error")
+            return
+        
+        try:
+            thumbnail_memory = int(self.thumbnail_memory_var.get())
+            if thumbnail_memory < 32 or thumbnail_memory > 8192:
+                custom_messagebox(self, "Błąd", "Pamięć miniatur musi być z zakresu 32-8192 MB.", typ="error")
+                return
+        except ValueError:
+            custom_messagebox(self, "Błąd", "Pamięć miniatur musi być liczbą całkowitą.", typ="error")
             return
         
         self.prefs_manager.set('default_read_path', self.default_read_path_var.get())
@@ -559,9 +670,16 @@ class PreferencesDialog(tk.Toplevel):
         self.prefs_manager.set('thumbnail_quality', self.thumbnail_quality_var.get())
         self.prefs_manager.set('confirm_delete', 'True' if self.confirm_delete_var.get() else 'False')
         self.prefs_manager.set('export_image_dpi', self.export_image_dpi_var.get())
+        self.prefs_manager.set('undo_history_budget_mb', str(undo_budget))
+        self.prefs_manager.set('thumbnail_cache_mb', str(thumbnail_cache))
+        self.prefs_manager.set('thumbnail_memory_mb', str(thumbnail_memory))
+        self.prefs_manager.set('save_profile', profile_name_for_label(self.save_profile_var.get()))
+        self.prefs_manager.set('save_image_preset', next(
+            (name for name, preset in IMAGE_PRESETS.items() if preset.label == self.save_image_preset_var.get()), ''))
         self.prefs_manager.set('color_detect_threshold', str(threshold))
-        self.prefs_manager.set('color_detect_samples', str(samples))
         self.prefs_manager.set('color_detect_scale', str(scale))
+        self.prefs_manager.set('empty_page_ink_percent', str(empty_ink))
+        self.prefs_manager.set('empty_page_min_confidence', str(empty_confidence))
         self.result = True
         self.destroy()
     
@@ -2119,6 +2237,9 @@ class ThumbnailFrame(tk.Frame):
         self.column_width = column_width
         self.bg_normal = "#F5F5F5"
         self.bg_selected = "#B3E5FC"
+        # Styl nadany ramce - ponowne ustawienie tego samego stylu nie dotyka widgetów
+        self.selected = False
+        self.focused = False
         self.outer_frame = tk.Frame(
             self, 
             bg=self.bg_normal, 
@@ -2142,8 +2263,8 @@ class ThumbnailFrame(tk.Frame):
 
 
     def setup_ui(self, parent_frame):
-        img_tk = self.viewer_app._render_and_scale(self.page_index, self.column_width)
-        # Cache is now handled inside _render_and_scale
+        # Miniatura z cache albo placeholder - renderowanie odbywa się w tle
+        img_tk = self.viewer_app._get_thumbnail_image(self.page_index, self.column_width)
         
         image_container = tk.Frame(parent_frame, bg="white") 
         image_container.pack(padx=5, pady=(5, 0))
@@ -2151,16 +2272,37 @@ class ThumbnailFrame(tk.Frame):
         self.img_label = tk.Label(image_container, image=img_tk, bg="white")
         self.img_label.pack() 
         
-        tk.Label(parent_frame, text=f"Strona {self.page_index + 1}", bg=self.bg_normal, font=("Helvetica", 10, "bold")).pack(pady=(5, 0))
+        self.page_label = tk.Label(parent_frame, text=f"Strona {self.page_index + 1}", bg=self.bg_normal, font=("Helvetica", 10, "bold"))
+        self.page_label.pack(pady=(5, 0))
         
         format_label = self.viewer_app._get_page_size_label(self.page_index)
-        tk.Label(parent_frame, text=format_label, fg="gray", bg=self.bg_normal, font=("Helvetica", 9)).pack(pady=(0, 5))
+        self.format_label = tk.Label(parent_frame, text=format_label, fg="gray", bg=self.bg_normal, font=("Helvetica", 9))
+        self.format_label.pack(pady=(0, 5))
 
-        self._bind_all_children("<Button-1>", lambda event, idx=self.page_index: self.viewer_app._handle_lpm_click(idx, event))
+        # Indeks strony odczytywany przy kliknięciu - ramka wirtualnej siatki może zostać przypisana do innej strony
+        self._bind_all_children("<Button-1>", lambda event: self.viewer_app._handle_lpm_click(self.page_index, event))
 
-        self._bind_all_children("<Button-3>", lambda event, idx=self.page_index: self._handle_ppm_click(event, idx))
+        self._bind_all_children("<Button-3>", lambda event: self._handle_ppm_click(event, self.page_index))
+        # Przeciąganie miniatur zmienia kolejność stron (obsługa w aplikacji - ramka może zmienić stronę w trakcie)
+        self._bind_all_children("<B1-Motion>", self.viewer_app._handle_drag_motion)
+        self._bind_all_children("<ButtonRelease-1>", self.viewer_app._handle_drag_release)
        # parent_frame.bind("<Enter>", lambda event, idx=self.page_index: self.viewer_app._focus_by_mouse(idx))
 
+    def bind_page(self, page_index, column_width):
+        """Przypisuje ramkę do innej strony lub szerokości miniatury (ponowne użycie ramki z puli)."""
+        self.page_index = page_index
+        self.column_width = column_width
+        img_tk = self.viewer_app._get_thumbnail_image(page_index, column_width)
+        self.img_label.config(image=img_tk)
+        self.img_label.image = img_tk
+        self.page_label.config(text=f"Strona {page_index + 1}")
+        self.format_label.config(text=self.viewer_app._get_page_size_label(page_index))
+
+    def set_page_index(self, page_index):
+        """Przenosi ramkę na nową pozycję tej samej strony (po usunięciu/wstawieniu stron) - obraz bez zmian."""
+        self.page_index = page_index
+        self.page_label.config(text=f"Strona {page_index + 1}")
+
     def _handle_ppm_click(self, event, page_index):
         self.viewer_app.active_page_index = page_index
         
@@ -2197,7 +2339,16 @@ class MergePageGridDialog(tk.Toplevel):
         'spacing_x_mm': '10',
         'spacing_y_mm': '10',
         'dpi_var': '300',
+        'mode_var': 'vector',
+        'layout_var': 'grid',
     }
+    
+    LAYOUT_LABELS = [
+        ('grid', "Kolejno"),
+        ('step_repeat', "Powielanie (każda strona na cały arkusz)"),
+        ('cut_stack', "Wytnij i ułóż"),
+        ('booklet', "Broszura (zszywanie zeszytowe)"),
+    ]
 
     def __init__(self, parent, page_count, prefs_manager=None):
         super().__init__(parent)
@@ -2222,6 +2373,8 @@ class MergePageGridDialog(tk.Toplevel):
         self.rows_var = tk.StringVar()
         self.cols_var = tk.StringVar()
         self.dpi_var = tk.StringVar(value=self._get_pref('dpi_var'))
+        self.mode_var = tk.StringVar(value=self._get_pref('mode_var'))
+        self.layout_var = tk.StringVar(value=self._get_pref('layout_var'))
         self.page_count = page_count
 
         self.vcmd_200 = (self.register(lambda v: validate_float_range(v, 0, 200)), "%P")
@@ -2241,6 +2394,7 @@ class MergePageGridDialog(tk.Toplevel):
                 self.cols_var.set(str(min(max(sq, 1), 10)))
 
         self.build_ui()
+        self._update_layout_state()
         self._update_grid_preview()
         self.center_dialog(parent)
         self.grab_set()
@@ -2285,9 +2439,9 @@ class MergePageGridDialog(tk.Toplevel):
         orient_label.grid(row=1, column=0, sticky="e", padx=4, pady=4)
         orient_radio_frame = ttk.Frame(format_frame)
         orient_radio_frame.grid(row=1, column=1, sticky="w", padx=4, pady=4)
-        orient_pion = ttk.Radiobutton(orient_radio_frame, text="Pionowa", variable=self.orientation, value="Pionowa", command=self._update_grid_preview)
+        orient_pion = ttk.Radiobutton(orient_radio_frame, text="Pionowa", variable=self.orientation, value="Pionowa", command=self._update_layout_state)
         orient_pion.pack(side="left", padx=(0,8))
-        orient_poz = ttk.Radiobutton(orient_radio_frame, text="Pozioma", variable=self.orientation, value="Pozioma", command=self._update_grid_preview)
+        orient_poz = ttk.Radiobutton(orient_radio_frame, text="Pozioma", variable=self.orientation, value="Pozioma", command=self._update_layout_state)
         orient_poz.pack(side="left")
 
         margin_frame = ttk.LabelFrame(left_frame, text="Marginesy [mm]")
@@ -2310,18 +2464,30 @@ class MergePageGridDialog(tk.Toplevel):
         ttk.Entry(spacing_frame, textvariable=self.spacing_y_mm, width=6, validate="key", validatecommand=self.vcmd_200).grid(row=1, column=1, sticky="w", padx=2, pady=2)
         ttk.Label(spacing_frame, text="Zakres: 0–200 mm", foreground="gray").grid(row=2, column=0, columnspan=2, sticky="w", padx=4, pady=(2,2))
 
-        # NOWY WYBÓR DPI
-        dpi_frame = ttk.LabelFrame(left_frame, text="Rozdzielczość eksportu (DPI)")
+        # Tryb scalania: wektorowo (domyślnie) albo spłaszczenie do bitmap w wybranym DPI
+        dpi_frame = ttk.LabelFrame(left_frame, text="Tryb scalania")
         dpi_frame.pack(fill="x", pady=(0, 8))
-        ttk.Label(dpi_frame, text="DPI:").grid(row=0, column=0, sticky="e", padx=4, pady=4)
-        dpi_combo = ttk.Combobox(
+        ttk.Radiobutton(dpi_frame, text="Wektorowo (bez utraty jakości)", variable=self.mode_var,
+                        value="vector", command=self._update_mode_state).grid(row=0, column=0, columnspan=2, sticky="w", padx=4, pady=2)
+        ttk.Radiobutton(dpi_frame, text="Spłaszcz do bitmapy", variable=self.mode_var,
+                        value="flatten", command=self._update_mode_state).grid(row=1, column=0, columnspan=2, sticky="w", padx=4, pady=2)
+        ttk.Label(dpi_frame, text="DPI:").grid(row=2, column=0, sticky="e", padx=4, pady=4)
+        self.dpi_combo = dpi_combo = ttk.Combobox(
             dpi_frame,
             textvariable=self.dpi_var,
             values=["72", "150", "300", "600"],
             state="readonly",
             width=6
         )
-        dpi_combo.grid(row=0, column=1, sticky="w", padx=2, pady=4)
+        dpi_combo.grid(row=2, column=1, sticky="w", padx=2, pady=4)
+        self._update_mode_state()
+
+        # Układ arkuszy: zaznaczenie rozkładane jest na tyle arkuszy, ile potrzeba
+        layout_frame = ttk.LabelFrame(left_frame, text="Układ arkuszy")
+        layout_frame.pack(fill="x", pady=(0, 8))
+        for row, (value, label) in enumerate(self.LAYOUT_LABELS):
+            ttk.Radiobutton(layout_frame, text=label, variable=self.layout_var, value=value,
+                            command=self._update_layout_state).grid(row=row, column=0, sticky="w", padx=4, pady=1)
 
         grid_frame = ttk.LabelFrame(left_frame, text="Siatka stron")
         grid_frame.pack(fill="x", pady=(0, 8))
@@ -2357,6 +2523,8 @@ class MergePageGridDialog(tk.Toplevel):
             highlightthickness=0
         )
         self.preview_canvas.pack(padx=0, pady=0, fill="both", expand=True)
+        self.sheet_count_label = ttk.Label(preview_frame, text="", foreground="gray")
+        self.sheet_count_label.pack(pady=(0, 4))
 
         button_frame = ttk.Frame(self)
         button_frame.pack(fill="x", padx=16, pady=(0, 12), side="bottom")
@@ -2382,6 +2550,8 @@ class MergePageGridDialog(tk.Toplevel):
             self.prefs_manager.set('MergePageGridDialog.spacing_x_mm', self.spacing_x_mm.get())
             self.prefs_manager.set('MergePageGridDialog.spacing_y_mm', self.spacing_y_mm.get())
             self.prefs_manager.set('MergePageGridDialog.dpi_var', self.dpi_var.get())
+            self.prefs_manager.set('MergePageGridDialog.mode_var', self.mode_var.get())
+            self.prefs_manager.set('MergePageGridDialog.layout_var', self.layout_var.get())
     
     def restore_defaults(self):
         """Przywraca wartości domyślne"""
@@ -2394,6 +2564,30 @@ class MergePageGridDialog(tk.Toplevel):
         self.spacing_x_mm.set(self.DEFAULTS['spacing_x_mm'])
         self.spacing_y_mm.set(self.DEFAULTS['spacing_y_mm'])
         self.dpi_var.set(self.DEFAULTS['dpi_var'])
+        self.mode_var.set(self.DEFAULTS['mode_var'])
+        self.layout_var.set(self.DEFAULTS['layout_var'])
+        self._update_mode_state()
+        self._update_layout_state()
+        self._update_grid_preview()
+
+    def _update_mode_state(self):
+        """DPI ma znaczenie tylko przy spłaszczaniu do bitmap"""
+        self.dpi_combo.configure(state="readonly" if self.mode_var.get() == "flatten" else "disabled")
+
+    def _update_layout_state(self):
+        """Broszura ma zawsze dwie komórki: obok siebie na arkuszu poziomym, jedna nad drugą na pionowym"""
+        if self.layout_var.get() == 'booklet':
+            if self.orientation.get() == "Pozioma":
+                self.rows_var.set("1")
+                self.cols_var.set("2")
+            else:
+                self.rows_var.set("2")
+                self.cols_var.set("1")
+            state = "disabled"
+        else:
+            state = "readonly"
+        self.rows_combo.configure(state=state)
+        self.cols_combo.configure(state=state)
         self._update_grid_preview()
 
     def _get_sheet_dimensions(self):
@@ -2446,6 +2640,9 @@ class MergePageGridDialog(tk.Toplevel):
             cell_w_px = cell_w * scale
             cell_h_px = cell_h * scale
 
+            # Pierwszy arkusz według wybranego układu (numery stron w zaznaczeniu)
+            plan = page_imposition.plan_sheets(range(1, num_pages + 1), rows * cols, self.layout_var.get())
+            first_sheet = plan[0] if plan else []
             for r in range(rows):
                 for c in range(cols):
                     x0 = offset_x + margin_left_px + c * (cell_w_px + spacing_x_px)
@@ -2453,12 +2650,15 @@ class MergePageGridDialog(tk.Toplevel):
                     x1 = x0 + cell_w_px
                     y1 = y0 + cell_h_px
                     idx = r * cols + c
-                    color = "#d0e6f8" if idx < num_pages else "#f5f5f5"
+                    page_number = first_sheet[idx] if idx < len(first_sheet) else None
+                    color = "#d0e6f8" if page_number is not None else "#f5f5f5"
                     self.preview_canvas.create_rectangle(x0, y0, x1, y1, fill=color, outline="#666", width=1)
-                    if idx < num_pages:
-                        self.preview_canvas.create_text((x0+x1)/2, (y0+y1)/2, text=str(idx + 1), fill="#345", font=("Arial", 11, "bold"))
+                    if page_number is not None:
+                        self.preview_canvas.create_text((x0+x1)/2, (y0+y1)/2, text=str(page_number), fill="#345", font=("Arial", 11, "bold"))
+            self.sheet_count_label.config(text=f"Arkusz 1 z {len(plan)}")
         except Exception:
             self.preview_canvas.delete("all")
+            self.sheet_count_label.config(text="")
 
     def center_dialog(self, parent):
         self.update_idletasks()
@@ -2496,8 +2696,6 @@ class MergePageGridDialog(tk.Toplevel):
             cols = int(self.cols_var.get())
             if not (1 <= rows <= 10 and 1 <= cols <= 10):
                 raise ValueError("Liczba wierszy i kolumn musi być z zakresu 1–10.")
-            if rows * cols < self.page_count:
-                raise ValueError("Liczba komórek siatki musi być nie mniejsza niż liczba scalanych stron.")
 
             format_name = self.sheet_format.get()
             sheet_dims = self.PAPER_FORMATS[format_name]
@@ -2518,7 +2716,9 @@ class MergePageGridDialog(tk.Toplevel):
                 "rows": rows,
                 "cols": cols,
                 "orientation": orientation,
-                "dpi": int(self.dpi_var.get())
+                "dpi": int(self.dpi_var.get()),
+                "mode": self.mode_var.get() if self.mode_var.get() == "flatten" else "vector",
+                "layout": self.layout_var.get()
             }
             # Zapisz preferencje przed zamknięciem
             self._save_prefs()
@@ -3242,14 +3442,7 @@ class PDFAnalysisDialog(tk.Toplevel):
     """Okno analizy PDF - zlicza strony wg kolorystyki, formatu i orientacji"""
     
     # Formaty stron (w mm) z tolerancją ±5mm
-    FORMATS = {
-        'A0': (841, 1189),
-        'A1': (594, 841),
-        'A2': (420, 594),
-        'A3': (297, 420),
-        'A4': (210, 297),
-        'Letter': (216, 279),
-    }
+    FORMATS = PAGE_FORMATS
     
     def __init__(self, parent, viewer):
         super().__init__(parent)
@@ -3265,6 +3458,10 @@ class PDFAnalysisDialog(tk.Toplevel):
         
         self.analysis_results = {}
         self.result_buttons = []  # Store references to result buttons
+        self.index = None
+        self._last_refresh_ms = 0
+        self.analyzer = DocumentAnalyzer(self, on_progress=self._on_analysis_progress,
+                                         on_done=self._on_analysis_done)
         
         self.build_ui()
         self.position_below_macros(parent)
@@ -3311,6 +3508,8 @@ class PDFAnalysisDialog(tk.Toplevel):
         button_frame = ttk.Frame(main_frame)
         button_frame.pack(fill="x", pady=(0, 8))
         ttk.Button(button_frame, text="Analizuj PDF", command=self.analyze_pdf, width=15).pack()
+        self.status_label = ttk.Label(button_frame, text="", foreground="gray")
+        self.status_label.pack(pady=(4, 0))
         
         # Results area with scrollbar
         results_frame = ttk.LabelFrame(main_frame, text="Wyniki analizy")
@@ -3338,129 +3537,82 @@ class PDFAnalysisDialog(tk.Toplevel):
         ttk.Button(main_frame, text="Zamknij", command=self.close, width=15).pack()
     
     def analyze_pdf(self):
-        """Analizuje PDF i wyświetla wyniki"""
+        """
+        Analizuje PDF i wyświetla wyniki.
+        Strony analizowane są w tle (DocumentAnalyzer), wyniki pojawiają się w miarę postępu.
+        Wyniki trafiają do indeksu przeglądarki - ponowna analiza tej samej wersji dokumentu
+        obejmuje tylko brakujące strony.
+        """
+        self.analyzer.cancel()
         if not self.viewer.pdf_document:
+            self._clear_results()
             self._show_message("Brak otwartego dokumentu PDF.")
             return
         
-        # Clear previous results
-        for widget in self.results_container.winfo_children():
-            widget.destroy()
-        self.result_buttons.clear()
-        self.analysis_results.clear()
-        
         doc = self.viewer.pdf_document
-        total_pages = len(doc)
-        
-        if total_pages == 0:
+        if len(doc) == 0:
+            self._clear_results()
             self._show_message("Dokument nie zawiera stron.")
             return
         
-        # Show progress message
-        progress_label = ttk.Label(self.results_container, text="Analizowanie...")
-        progress_label.pack(pady=10)
-        self.update()
+        render_scale, _ = self._color_settings()
+        self.index = self.viewer._get_analysis_index(render_scale)
+        missing = np.flatnonzero(~self.index.analyzed).tolist()
+        if not missing:
+            self._on_analysis_done()
+            return
         
-        # Analyze each page
-        for page_idx in range(total_pages):
-            page = doc[page_idx]
-            
-            # Detect color
-            is_color = self._detect_color(page)
+        self._refresh_results()
+        self.status_label.config(text="Analizowanie...")
+        self.analyzer.start(self.index, doc, path=self.viewer._current_source_path(),
+                            render_scale=render_scale, page_indices=missing)
+    
+    def _on_analysis_progress(self, page_indices):
+        """Częściowe wyniki analizy - odświeża licznik i (co pewien czas) listę grup"""
+        if self.index is None:
+            return
+        self.status_label.config(text=f"Analizowanie... {self.index.analyzed_count}/{self.index.page_count}")
+        now_ms = time.perf_counter() * 1000.0
+        if now_ms - self._last_refresh_ms >= 300:
+            self._last_refresh_ms = now_ms
+            self._refresh_results()
+    
+    def _on_analysis_done(self):
+        """Koniec analizy - pokazuje pełne wyniki"""
+        if self.index is None:
+            return
+        self.status_label.config(text=f"Przeanalizowano stron: {self.index.analyzed_count}")
+        self._refresh_results()
+    
+    def _refresh_results(self):
+        """Przebudowuje listę grup kolor/format na podstawie indeksu"""
+        self._clear_results()
+        _, threshold = self._color_settings()
+        for (is_color, page_format), data in self.index.groups(threshold).items():
             color_type = "Kolor" if is_color else "Czarno-biały"
-            
-            # Detect format
-            page_format = self._detect_format(page)
-            
-            # Detect orientation
-            is_landscape = self._is_landscape(page)
-            
-            # Create key for grouping
-            key = f"{color_type}_{page_format}"
-            if not key in self.analysis_results:
-                self.analysis_results[key] = {
-                    'color': color_type,
-                    'format': page_format,
-                    'pages': [],
-                    'landscape_count': 0
-                }
-            
-            self.analysis_results[key]['pages'].append(page_idx)
-            if is_landscape:
-                self.analysis_results[key]['landscape_count'] += 1
-        
-        # Remove progress label
-        progress_label.destroy()
-        
-        # Display results
-        self._display_results()
+            self.analysis_results[f"{color_type}_{page_format}"] = {
+                'color': color_type,
+                'format': page_format,
+                'pages': data['pages'],
+                'landscape_count': data['landscape_count']
+            }
+        if self.analysis_results:
+            self._display_results()
+    
+    def _clear_results(self):
+        for widget in self.results_container.winfo_children():
+            widget.destroy()
+        self.result_buttons.clear()
+        self.analysis_results.clear()
     
-    def _detect_color(self, page):
-        """Wykrywa czy strona jest kolorowa czy czarno-biała"""
+    def _color_settings(self):
+        """Zwraca (skala renderowania, próg kolorowości) z preferencji"""
         try:
-            # Get settings from preferences
             render_scale = float(self.prefs_manager.get('color_detect_scale', '0.2'))
-            max_samples = int(self.prefs_manager.get('color_detect_samples', '300'))
             threshold = int(self.prefs_manager.get('color_detect_threshold', '5'))
-            
-            # Render page at configured resolution
-            mat = fitz.Matrix(render_scale, render_scale)
-            pix = page.get_pixmap(matrix=mat, alpha=False, colorspace=fitz.csGRAY)
-            
-            # Get another pixmap in RGB
-            pix_rgb = page.get_pixmap(matrix=mat, alpha=False, colorspace=fitz.csRGB)
-            
-            # Sample pixels - check if RGB differs from grayscale
-            samples = min(max_samples, pix.width * pix.height)
-            step = max(1, (pix.width * pix.height) // samples)
-            
-            for i in range(0, pix.width * pix.height, step):
-                y = i // pix.width
-                x = i % pix.width
-                if x >= pix.width or y >= pix.height:
-                    continue
-                
-                # Get RGB pixel
-                offset = (y * pix_rgb.width + x) * 3
-                if offset + 2 >= len(pix_rgb.samples):
-                    continue
-                
-                r = pix_rgb.samples[offset]
-                g = pix_rgb.samples[offset + 1]
-                b = pix_rgb.samples[offset + 2]
-                
-                # If R, G, B are different by more than threshold, it's color
-                if abs(r - g) > threshold or abs(g - b) > threshold or abs(r - b) > threshold:
-                    return True
-            
-            return False
-        except:
-            # If error, assume grayscale
-            return False
-    
-    def _detect_format(self, page):
-        """Wykrywa format strony (A4, A3, itp.)"""
-        rect = page.rect
-        width_pt = rect.width
-        height_pt = rect.height
-        
-        # Convert to mm
-        width_mm = round(width_pt / 72 * 25.4)
-        height_mm = round(height_pt / 72 * 25.4)
-        
-        # Check known formats with tolerance
-        tol = 5
-        for name, (fw, fh) in self.FORMATS.items():
-            if (abs(width_mm - fw) <= tol and abs(height_mm - fh) <= tol) or \
-               (abs(width_mm - fh) <= tol and abs(height_mm - fw) <= tol):
-                return name
-        
-        return "Niestandardowy"
-    
-    def _is_landscape(self, page):
-        """Sprawdza czy strona jest w orientacji poziomej"""
-        rect = page.rect
-        return rect.width > rect.height
+        except (TypeError, ValueError):
+            render_scale, threshold = 0.2, 5
+        return render_scale, threshold
     
     def _display_results(self):
         """Wyświetla wyniki analizy jako klikalne przyciski"""
@@ -3527,13 +3679,9 @@ class PDFAnalysisDialog(tk.Toplevel):
         if not self.viewer.pdf_document:
             return
         
-        # Clear current selection
-        self.viewer.selected_pages.clear()
-        
-        # Add pages to selection
-        for idx in page_indices:
-            if 0 <= idx < len(self.viewer.pdf_document):
-                self.viewer.selected_pages.add(idx)
+        # Replace current selection (pages outside the document are skipped)
+        self.viewer.selected_pages = PageSelection(
+            idx for idx in page_indices if idx >= 0).limited(len(self.viewer.pdf_document))
         
         # Update display
         self.viewer.update_selection_display()
@@ -3544,22 +3692,11 @@ class PDFAnalysisDialog(tk.Toplevel):
             self.viewer.update_focus_display()
             
             # Scroll to first selected page
-            if self.viewer.active_page_index in self.viewer.thumb_frames:
-                frame = self.viewer.thumb_frames[self.viewer.active_page_index]
-                self.viewer.canvas.yview_moveto(0)  # Reset scroll first
-                frame.update_idletasks()
-                # Calculate position
-                frame_y = frame.winfo_y()
-                canvas_height = self.viewer.canvas.winfo_height()
-                scroll_region = self.viewer.canvas.cget("scrollregion")
-                if scroll_region:
-                    _, _, _, max_y = map(int, scroll_region.split())
-                    if max_y > 0:
-                        fraction = frame_y / max_y
-                        self.viewer.canvas.yview_moveto(max(0, fraction - 0.1))
+            self.viewer._scroll_to_page(self.viewer.active_page_index)
     
     def close(self):
         """Zamknij okno"""
+        self.analyzer.cancel()
         self.destroy()
 
 
@@ -3576,8 +3713,6 @@ class SelectablePDFViewer:
     MARGIN_HEIGHT_PT = MARGIN_HEIGHT_MM * MM_TO_POINTS 
     import io
     import fitz
-    from pypdf import PdfReader, PdfWriter, Transformation
-    from pypdf.generic import RectangleObject, FloatObject
     from tkinterdnd2 import DND_FILES, TkinterDnD
 
     MM_TO_POINTS = 72 / 25.4
@@ -3645,61 +3780,26 @@ class SelectablePDFViewer:
                 return
         self._update_status(f"Można przeciągać tylko pliki PDF lub obrazy! Otrzymano: {filepath}")
 
-    def _crop_pages(self, pdf_bytes, selected_indices, top_mm, bottom_mm, left_mm, right_mm, reposition=False, pos_mode="center", offset_x_mm=0, offset_y_mm=0):
-        reader = PdfReader(io.BytesIO(pdf_bytes))
-        writer = PdfWriter()
-        total_pages = len(reader.pages)
-        
+    def _crop_pages(self, selected_indices, top_mm, bottom_mm, left_mm, right_mm, reposition=False, pos_mode="center", offset_x_mm=0, offset_y_mm=0):
+        """Kadruje wybrane strony w miejscu - CropBox/TrimBox/ArtBox, MediaBox bez zmian."""
         # Update status first to ensure it's visible immediately
         self._update_status("Kadrowanie stron...")
-        self.show_progressbar(maximum=total_pages)
-        
-        for i, page in enumerate(reader.pages):
-            if i not in selected_indices:
-                writer.add_page(page)
-                self.update_progressbar(i + 1)
-                continue
-            orig_mediabox = RectangleObject([float(v) for v in page.mediabox])
-            x0, y0, x1, y1 = [float(v) for v in orig_mediabox]
-            new_x0 = x0 + mm2pt(left_mm)
-            new_y0 = y0 + mm2pt(bottom_mm)
-            new_x1 = x1 - mm2pt(right_mm)
-            new_y1 = y1 - mm2pt(top_mm)
-            if new_x0 >= new_x1 or new_y0 >= new_y1:
-                writer.add_page(page)
-                self.update_progressbar(i + 1)
-                continue
-            new_rect = RectangleObject([new_x0, new_y0, new_x1, new_y1])
-
-            # Ustaw tylko cropbox, trimbox, artbox - mediabox zostaje oryginalny!
-            page.cropbox = new_rect
-            page.trimbox = new_rect
-            page.artbox = new_rect
-            # Przywracamy mediabox (nie zmieniamy!)
-            page.mediabox = orig_mediabox
-
-            # opcjonalnie: przesuwanie zawartości strony (zostawiam bez zmian)
-            if reposition:
-                dx = mm2pt(offset_x_mm) if pos_mode == "custom" else 0
-                dy = mm2pt(offset_y_mm) if pos_mode == "custom" else 0
-                if dx != 0 or dy != 0:
-                    transform = Transformation().translate(tx=dx, ty=dy)
-                    page.add_transformation(transform)
-
-            writer.add_page(page)
-            self.update_progressbar(i + 1)
-        
-        self.hide_progressbar()
-        out = io.BytesIO()
-        writer.write(out)
-        out.seek(0)
-        return out.read()
+        self.show_progressbar(maximum=len(selected_indices))
+        try:
+            page_geometry.crop_pages(
+                self.pdf_document, selected_indices, top_mm, bottom_mm, left_mm, right_mm,
+                reposition=reposition, pos_mode=pos_mode,
+                offset_x_mm=offset_x_mm, offset_y_mm=offset_y_mm,
+                progressbar_callback=lambda current, total: self.update_progressbar(current)
+            )
+        finally:
+            self.hide_progressbar()
         
     import fitz  # PyMuPDF
 
-    def _mask_crop_pages(self, pdf_bytes, selected_indices, top_mm, bottom_mm, left_mm, right_mm):
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        MM_TO_PT = 72 / 25.4
+    def _mask_crop_pages(self, selected_indices, top_mm, bottom_mm, left_mm, right_mm):
+        """Zakrywa marginesy wybranych stron białymi prostokątami (w miejscu, na bieżącym dokumencie)."""
+        doc = self.pdf_document
         
         # Update status first to ensure it's visible immediately
         self._update_status("Maskowanie marginesów...")
@@ -3707,108 +3807,98 @@ class SelectablePDFViewer:
         
         for idx_progress, i in enumerate(selected_indices):
             page = doc[i]
-            rect = page.rect
-
-            # Wylicz marginesy w punktach
-            left_pt   = left_mm * MM_TO_PT
-            right_pt  = right_mm * MM_TO_PT
-            top_pt    = top_mm * MM_TO_PT
-            bottom_pt = bottom_mm * MM_TO_PT
-
-            # Lewy margines
-            if left_pt > 0:
-                mask_rect = fitz.Rect(rect.x0, rect.y0, rect.x0 + left_pt, rect.y1)
-                page.draw_rect(mask_rect, color=(1,1,1), fill=(1,1,1), overlay=True)
-            # Prawy margines
-            if right_pt > 0:
-                mask_rect = fitz.Rect(rect.x1 - right_pt, rect.y0, rect.x1, rect.y1)
-                page.draw_rect(mask_rect, color=(1,1,1), fill=(1,1,1), overlay=True)
-            # Górny margines
-            if top_pt > 0:
-                mask_rect = fitz.Rect(rect.x0, rect.y1 - top_pt, rect.x1, rect.y1)
-                page.draw_rect(mask_rect, color=(1,1,1), fill=(1,1,1), overlay=True)
-            # Dolny margines
-            if bottom_pt > 0:
-                mask_rect = fitz.Rect(rect.x0, rect.y0, rect.x1, rect.y0 + bottom_pt)
+            for mask_rect in self._margin_mask_rects(page, top_mm, bottom_mm, left_mm, right_mm):
                 page.draw_rect(mask_rect, color=(1,1,1), fill=(1,1,1), overlay=True)
             
             self.update_progressbar(idx_progress + 1)
 
         self.hide_progressbar()
-        output_bytes = doc.write()
-        doc.close()
-        return output_bytes
 
-    def _resize_scale(self, pdf_bytes, selected_indices, width_mm, height_mm):
-        reader = PdfReader(io.BytesIO(pdf_bytes))
-        writer = PdfWriter()
-        target_width = mm2pt(width_mm)
-        target_height = mm2pt(height_mm)
-        total_pages = len(reader.pages)
-        
+    @staticmethod
+    def _margin_mask_rects(page, top_mm, bottom_mm, left_mm, right_mm):
+        """Prostokąty białych masek marginesów strony (współrzędne strony fitz)."""
+        MM_TO_PT = 72 / 25.4
+        rect = page.rect
+
+        # Wylicz marginesy w punktach
+        left_pt   = left_mm * MM_TO_PT
+        right_pt  = right_mm * MM_TO_PT
+        top_pt    = top_mm * MM_TO_PT
+        bottom_pt = bottom_mm * MM_TO_PT
+
+        rects = []
+        # Lewy margines
+        if left_pt > 0:
+            rects.append(fitz.Rect(rect.x0, rect.y0, rect.x0 + left_pt, rect.y1))
+        # Prawy margines
+        if right_pt > 0:
+            rects.append(fitz.Rect(rect.x1 - right_pt, rect.y0, rect.x1, rect.y1))
+        # Górny margines
+        if top_pt > 0:
+            rects.append(fitz.Rect(rect.x0, rect.y1 - top_pt, rect.x1, rect.y1))
+        # Dolny margines
+        if bottom_pt > 0:
+            rects.append(fitz.Rect(rect.x0, rect.y0, rect.x1, rect.y0 + bottom_pt))
+        return rects
+
+    def _crop_resize_transforms(self, indices, params):
+        """
+        Geometryczny skutek kadrowania/zmiany rozmiaru dla miniatur - liczony przed operacją.
+
+        Args:
+            indices: Indeksy stron
+            params: Parametry okna PageCropResizeDialog (jak w makrze apply_page_crop_resize)
+
+        Returns:
+            Słownik indeks strony -> ThumbnailTransform
+        """
+        crop_mode = params.get("crop_mode", "nocrop")
+        resize_mode = params.get("resize_mode", "noresize")
+        transforms = {}
+        for i in indices:
+            page = self.pdf_document[i]
+            if crop_mode == "crop_only" and resize_mode == "noresize":
+                masks = self._margin_mask_rects(page, params.get("crop_top_mm", 0), params.get("crop_bottom_mm", 0),
+                                                params.get("crop_left_mm", 0), params.get("crop_right_mm", 0))
+                transforms[i] = ThumbnailTransform(masks=tuple(masks))
+            elif resize_mode in ("resize_scale", "resize_noscale"):
+                matrix = page_geometry.resize_matrix(
+                    page.mediabox.width, page.mediabox.height,
+                    mm2pt(params.get("target_width_mm", 210)), mm2pt(params.get("target_height_mm", 297)),
+                    scale_content=resize_mode == "resize_scale",
+                    pos_mode=params.get("position_mode") or "center",
+                    offset_x_mm=params.get("offset_x_mm") or 0, offset_y_mm=params.get("offset_y_mm") or 0)
+                transforms[i] = ThumbnailTransform(content=fitz.Matrix(*matrix))
+            else:
+                transforms[i] = BOX_CHANGE
+        return transforms
+
+    def _resize_scale(self, selected_indices, width_mm, height_mm):
+        """Zmienia rozmiar wybranych stron w miejscu, skalując i centrując zawartość."""
         # Update status first to ensure it's visible immediately
         self._update_status("Zmiana rozmiaru stron ze skalowaniem...")
-        self.show_progressbar(maximum=total_pages)
-        
-        for i, page in enumerate(reader.pages):
-            if i not in selected_indices:
-                writer.add_page(page)
-                self.update_progressbar(i + 1)
-                continue
-            orig_w = float(page.mediabox.width)
-            orig_h = float(page.mediabox.height)
-            scale = min(target_width / orig_w, target_height / orig_h)
-            dx = (target_width - orig_w * scale) / 2
-            dy = (target_height - orig_h * scale) / 2
-            transform = Transformation().scale(sx=scale, sy=scale).translate(tx=dx, ty=dy)
-            page.add_transformation(transform)
-            page.mediabox = RectangleObject([0, 0, target_width, target_height])
-            page.cropbox = RectangleObject([0, 0, target_width, target_height])
-            writer.add_page(page)
-            self.update_progressbar(i + 1)
-        
-        self.hide_progressbar()
-        out = io.BytesIO()
-        writer.write(out)
-        out.seek(0)
-        return out.read()
-
-    def _resize_noscale(self, pdf_bytes, selected_indices, width_mm, height_mm, pos_mode="center", offset_x_mm=0, offset_y_mm=0):
-        reader = PdfReader(io.BytesIO(pdf_bytes))
-        writer = PdfWriter()
-        target_width = mm2pt(width_mm)
-        target_height = mm2pt(height_mm)
-        total_pages = len(reader.pages)
-        
+        self.show_progressbar(maximum=len(selected_indices))
+        try:
+            page_geometry.resize_pages(
+                self.pdf_document, selected_indices, width_mm, height_mm, scale_content=True,
+                progressbar_callback=lambda current, total: self.update_progressbar(current)
+            )
+        finally:
+            self.hide_progressbar()
+
+    def _resize_noscale(self, selected_indices, width_mm, height_mm, pos_mode="center", offset_x_mm=0, offset_y_mm=0):
+        """Zmienia rozmiar wybranych stron w miejscu bez skalowania zawartości."""
         # Update status first to ensure it's visible immediately
         self._update_status("Zmiana rozmiaru stron bez skalowania...")
-        self.show_progressbar(maximum=total_pages)
-        
-        for i, page in enumerate(reader.pages):
-            if i not in selected_indices:
-                writer.add_page(page)
-                self.update_progressbar(i + 1)
-                continue
-            orig_w = float(page.mediabox.width)
-            orig_h = float(page.mediabox.height)
-            if pos_mode == "center":
-                dx = (target_width - orig_w) / 2
-                dy = (target_height - orig_h) / 2
-            else:
-                dx = mm2pt(offset_x_mm)
-                dy = mm2pt(offset_y_mm)
-            transform = Transformation().translate(tx=dx, ty=dy)
-            page.add_transformation(transform)
-            page.mediabox = RectangleObject([0, 0, target_width, target_height])
-            page.cropbox = RectangleObject([0, 0, target_width, target_height])
-            writer.add_page(page)
-            self.update_progressbar(i + 1)
-        
-        self.hide_progressbar()
-        out = io.BytesIO()
-        writer.write(out)
-        out.seek(0)
-        return out.read()
+        self.show_progressbar(maximum=len(selected_indices))
+        try:
+            page_geometry.resize_pages(
+                self.pdf_document, selected_indices, width_mm, height_mm, scale_content=False,
+                pos_mode=pos_mode, offset_x_mm=offset_x_mm, offset_y_mm=offset_y_mm,
+                progressbar_callback=lambda current, total: self.update_progressbar(current)
+            )
+        finally:
+            self.hide_progressbar()
 
     def apply_page_crop_resize_dialog(self):
         """
@@ -3824,40 +3914,37 @@ class SelectablePDFViewer:
             self._update_status("Anulowano operację.")
             return
 
-        pdf_bytes_export = io.BytesIO()
-        self.pdf_document.save(pdf_bytes_export)
-        pdf_bytes_export.seek(0)
-        pdf_bytes_val = pdf_bytes_export.read()
         indices = sorted(list(self.selected_pages))
 
         crop_mode = result["crop_mode"]
         resize_mode = result["resize_mode"]
 
         try:
+            # Operacje zmieniają tylko wybrane strony bieżącego dokumentu (bez zapisu i ponownego otwarcia)
             if crop_mode == "crop_only" and resize_mode == "noresize":
-                new_pdf_bytes = self._mask_crop_pages(
-                    pdf_bytes_val, indices,
+                operation = lambda: self._mask_crop_pages(
+                    indices,
                     result["crop_top_mm"], result["crop_bottom_mm"],
                     result["crop_left_mm"], result["crop_right_mm"],
                 )
                 msg = "Dodano białe maski zamiast przycinania stron."
             elif crop_mode == "crop_resize" and resize_mode == "noresize":
-                new_pdf_bytes = self._crop_pages(
-                    pdf_bytes_val, indices,
+                operation = lambda: self._crop_pages(
+                    indices,
                     result["crop_top_mm"], result["crop_bottom_mm"],
                     result["crop_left_mm"], result["crop_right_mm"],
                     reposition=False
                 )
                 msg = "Zastosowano przycięcie i zmianę rozmiaru arkusza."
             elif resize_mode == "resize_scale":
-                new_pdf_bytes = self._resize_scale(
-                    pdf_bytes_val, indices,
+                operation = lambda: self._resize_scale(
+                    indices,
                     result["target_width_mm"], result["target_height_mm"]
                 )
                 msg = "Zmieniono rozmiar i skalowano zawartość."
             elif resize_mode == "resize_noscale":
-                new_pdf_bytes = self._resize_noscale(
-                    pdf_bytes_val, indices,
+                operation = lambda: self._resize_noscale(
+                    indices,
                     result["target_width_mm"], result["target_height_mm"],
                     pos_mode=result.get("position_mode") or "center",
                     offset_x_mm=result.get("offset_x_mm") or 0,
@@ -3867,18 +3954,14 @@ class SelectablePDFViewer:
             else:
                 self._update_status("Nie wybrano żadnej operacji do wykonania.")
                 return
-            self._save_state_to_undo() 
-            self.pdf_document.close()
-            self.pdf_document = fitz.open("pdf", new_pdf_bytes)
+            placements = self._capture_thumbnail_placements(indices)
+            transforms = self._crop_resize_transforms(indices, result)
+            self._save_state_to_undo(indices)
+            operation()
             self._update_status(msg)
             
-            # Optymalizacja: odśwież tylko zmienione miniatury (nie zmienia się liczba stron)
-            self.show_progressbar(maximum=len(indices))
-            for i, page_index in enumerate(indices):
-                self._update_status("Operacja zakończona. Odświeżanie miniatur...")
-                self.update_single_thumbnail(page_index)
-                self.update_progressbar(i + 1)
-            self.hide_progressbar()
+            # Miniatury wyliczane z obrazów w cache, dokładne renderowanie w tle
+            self._apply_thumbnail_transform(indices, placements, transforms)
             
             if hasattr(self, "update_selection_display"):
                 self.update_selection_display()
@@ -3923,7 +4006,7 @@ class SelectablePDFViewer:
         MM_PT = self.MM_TO_POINTS 
 
         try:
-            self._save_state_to_undo() 
+            self._save_state_to_undo(self.selected_pages)
             
             start_number = settings['start_num']
             mode = settings['mode']                 
@@ -4118,7 +4201,7 @@ class SelectablePDFViewer:
         try:
             pages_to_process = sorted(list(self.selected_pages))
             if pages_to_process:     # Zapisz stan tylko jeśli są strony do modyfikacji
-                self._save_state_to_undo()
+                self._save_state_to_undo(pages_to_process)
             modified_count = 0
             
             # Update status first to ensure it's visible immediately
@@ -4321,8 +4404,8 @@ class SelectablePDFViewer:
     def shift_page_content(self):
         """
         Otwiera okno dialogowe i przesuwa zawartość zaznaczonych stron.
-        Najpierw czyści/odświeża wybrane strony (resave przez PyMuPDF), potem wykonuje przesunięcie przez pypdf.
-        Dzięki temu unika białych stron w trudnych PDF.
+        Przesunięcie wykonywane jest w miejscu (core.page_geometry) - tylko na wybranych stronach,
+        bez zapisu całego dokumentu i ponownego parsowania przez pypdf.
         """
         if not self.pdf_document or not self.selected_pages:
             self._update_status("Musisz zaznaczyć przynajmniej jedną stronę PDF.")
@@ -4335,80 +4418,32 @@ class SelectablePDFViewer:
             self._update_status("Anulowano lub zerowe przesunięcie.")
             return
 
-        dx_pt = result['x_mm'] * self.MM_TO_POINTS
-        dy_pt = result['y_mm'] * self.MM_TO_POINTS
-
         x_sign = 1 if result['x_dir'] == 'P' else -1
         y_sign = 1 if result['y_dir'] == 'G' else -1
 
-        final_dx = dx_pt * x_sign
-        final_dy = dy_pt * y_sign
+        final_dx_mm = result['x_mm'] * x_sign
+        final_dy_mm = result['y_mm'] * y_sign
 
         try:
-            self._save_state_to_undo()
-
-            import io
-            from pypdf import PdfReader, PdfWriter, Transformation
-            import fitz
-
             pages_to_shift = sorted(list(self.selected_pages))
-            pages_to_shift_set = set(pages_to_shift)
-            total_pages = len(self.pdf_document)
+            placements = self._capture_thumbnail_placements(pages_to_shift)
+            self._save_state_to_undo(self.selected_pages)
             
             # Update status first to ensure it's visible immediately
             self._update_status("Przesuwanie zawartości stron...")
-            self.show_progressbar(maximum=total_pages * 2)  # 2 etapy: oczyszczanie i przesuwanie
-
-            # --- 1. Resave wybranych stron przez PyMuPDF (oczyszczenie) ---
-            original_pdf_bytes = self.pdf_document.tobytes()
-            pymupdf_doc = fitz.open("pdf", original_pdf_bytes)
-            cleaned_doc = fitz.open()
-            for idx in range(len(pymupdf_doc)):
-                if idx in pages_to_shift_set:
-                    # Dodajemy nową stronę (oczyszczamy ją "zapisz i wczytaj")
-                    temp = fitz.open()
-                    temp.insert_pdf(pymupdf_doc, from_page=idx, to_page=idx)
-                    cleaned_doc.insert_pdf(temp)
-                    temp.close()
-                else:
-                    # Dodajemy oryginalną stronę bez zmian
-                    cleaned_doc.insert_pdf(pymupdf_doc, from_page=idx, to_page=idx)
-                self.update_progressbar(idx + 1)
-
-            cleaned_pdf_bytes = cleaned_doc.write()
-            pymupdf_doc.close()
-            cleaned_doc.close()
-
-            # --- 2. Przesuwanie przez PyPDF ---
-            pdf_reader = PdfReader(io.BytesIO(cleaned_pdf_bytes))
-            pdf_writer = PdfWriter()
-            transform = Transformation().translate(tx=final_dx, ty=final_dy)
-
-            for i, page in enumerate(pdf_reader.pages):
-                if i in pages_to_shift_set:
-                    page.add_transformation(transform)
-                pdf_writer.add_page(page)
-                self.update_progressbar(total_pages + i + 1)
-
-            new_pdf_stream = io.BytesIO()
-            pdf_writer.write(new_pdf_stream)
-            new_pdf_bytes = new_pdf_stream.getvalue()
+            self.show_progressbar(maximum=len(pages_to_shift))
 
-            # --- 3. Aktualizacja dokumentu w aplikacji przez PyMuPDF ---
-            if self.pdf_document:
-                self.pdf_document.close()
-            import fitz
-            self.pdf_document = fitz.open("pdf", new_pdf_bytes)
+            # Przesunięcie w miejscu - tylko wybrane strony bieżącego dokumentu
+            page_geometry.shift_pages(
+                self.pdf_document, pages_to_shift, final_dx_mm, final_dy_mm,
+                progressbar_callback=lambda current, total: self.update_progressbar(current)
+            )
 
             self.hide_progressbar()
             
-            # Optymalizacja: odśwież tylko zmienione miniatury (nie zmienia się liczba stron)
-            self.show_progressbar(maximum=len(pages_to_shift))
-            for i, page_index in enumerate(pages_to_shift):
-                self._update_status(f"Przesunięto zawartość na {len(pages_to_shift)} stronach o {result['x_mm']} mm (X) i {result['y_mm']} mm (Y). Odświeżanie miniatur...")
-                self.update_single_thumbnail(page_index)
-                self.update_progressbar(i + 1)
-            self.hide_progressbar()
+            # Miniatury wyliczane z obrazów w cache (przesunięcie), dokładne renderowanie w tle
+            shift = ThumbnailTransform(content=fitz.Matrix(*page_geometry.shift_matrix(final_dx_mm, final_dy_mm)))
+            self._apply_thumbnail_transform(pages_to_shift, placements, shift)
             
             self._update_status(f"Przesunięto zawartość na {len(pages_to_shift)} stronach o {result['x_mm']} mm (X) i {result['y_mm']} mm (Y).")
             self._record_action('shift_page_content',
@@ -4419,58 +4454,46 @@ class SelectablePDFViewer:
 
         except Exception as e:
             self.hide_progressbar()
-            self._update_status(f"BŁĄD (pypdf): Nie udało się przesunąć zawartości: {e}")
+            self._update_status(f"BŁĄD: Nie udało się przesunąć zawartości: {e}")
                 
+    def _apply_page_order(self, order):
+        """
+        Zmienia kolejność stron w miejscu (strona i po zmianie = strona order[i] przed zmianą),
+        zapisuje krok w historii i odświeża miniatury stron, które zmieniły pozycję.
+
+        Returns:
+            Pozycje, na których stoi inna strona niż przed zmianą (pusta lista - bez zmian)
+        """
+        page_order.check_permutation(order, len(self.pdf_document))
+        if not page_order.changed_positions(order):
+            return []
+        self._record_undo_permutation(order)
+        changed = page_order.apply_page_order(self.pdf_document, order)
+
+        # Miniatury i ramki przechodzą razem ze stronami na nowe pozycje - bez renderowania
+        self._refresh_after_structure_change(page_order.permutation_map(order))
+        self.update_tool_button_states()
+        self.update_focus_display()
+        return changed
+
     def _reverse_pages(self):
-        """Odwraca kolejność wszystkich stron w bieżącym dokumencie PDF."""
+        """Odwraca kolejność wszystkich stron w bieżącym dokumencie PDF (w miejscu, bez kopiowania stron)."""
         if not self.pdf_document:
             custom_messagebox(self.master, "Informacja", "Najpierw otwórz plik PDF.", typ="info")
             return
 
-        # 1. Zapisz obecny stan do historii przed zmianą
-        self._save_state_to_undo() 
-        
         try:
-            doc = self.pdf_document
-            page_count = len(doc)
-            
-            # Tworzenie nowego, pustego dokumentu z odwróconą kolejnością
-            new_doc = fitz.open()
-            
-            # Update status first to ensure it's visible immediately
+            page_count = len(self.pdf_document)
             self._update_status("Odwracanie kolejności stron...")
-            self.show_progressbar(maximum=page_count)
-            
-            for idx, i in enumerate(range(page_count - 1, -1, -1)):
-                new_doc.insert_pdf(doc, from_page=i, to_page=i)
-                self.update_progressbar(idx + 1)
-            
-            self.hide_progressbar()
-            
-            # Zastąpienie starego dokumentu nowym
-            self.pdf_document.close()
-            self.pdf_document = new_doc
-            
-            # 2. Resetowanie stanu (wyzerowanie zaznaczenia)
+
+            # Resetowanie stanu (wyzerowanie zaznaczenia) przed odświeżeniem miniatur
             self.active_page_index = 0
             self.selected_pages.clear()
+            self._apply_page_order(page_order.reversed_order(page_count))
             
-            # 3. RĘCZNE CZYSZCZENIE I ODŚWIEŻENIE WIDOKU
-            # Używamy zestawu metod zidentyfikowanych w Twoim kodzie:
-            self.tk_images.clear()
-            for widget in list(self.scrollable_frame.winfo_children()): 
-                widget.destroy()
-            self.thumb_frames.clear()
-
-            self._reconfigure_grid()
-            self.update_tool_button_states()
-            self.update_focus_display()
-            # -----------------------------------------------
-            
-            self._update_status(f"Pomyślnie odwrócono kolejność {page_count} stron. Odswieżanie miniatur...")
+            self._update_status(f"Pomyślnie odwrócono kolejność {page_count} stron.")
             
         except Exception as e:
-            self.hide_progressbar()
             custom_messagebox(self.master, "Błąd", f"Wystąpił błąd podczas odwracania stron: {e}", typ="error")
             # W przypadku błędu użytkownik może użyć przycisku Cofnij aby przywrócić stan
     
@@ -4478,29 +4501,26 @@ class SelectablePDFViewer:
         """
         Zaznacza strony zgodnie z podanymi indeksami do source_page_count-1,
         a następnie wszystkie strony powyżej source_page_count do końca dokumentu.
+
+        Args:
+            indices_to_select: PageSelection albo indeksy stron (od 0)
+            macro_source_page_count: Liczba stron dokumentu, na którym nagrano makro
         """
         if not self.pdf_document:
             return
 
-        max_index = len(self.pdf_document) - 1
+        page_count = len(self.pdf_document)
+        if not isinstance(indices_to_select, PageSelection):
+            indices_to_select = PageSelection(i for i in indices_to_select or () if i >= 0)
 
-        indices = set()
-        if indices_to_select:
-            if macro_source_page_count is not None:
-                # Zaznacz tylko te, które są <= source_page_count - 1
-                indices.update(i for i in indices_to_select if 0 <= i < macro_source_page_count)
-                # Dodaj wszystkie strony powyżej source_page_count-1
-                indices.update(range(macro_source_page_count, max_index + 1))
-            else:
-                # Standardowe zachowanie dla braku makra
-                indices.update(i for i in indices_to_select if 0 <= i <= max_index)
+        if macro_source_page_count is not None:
+            # Strony z makra tylko do source_page_count - 1, dalej wszystkie strony do końca dokumentu
+            new_selection = (indices_to_select.limited(min(macro_source_page_count, page_count))
+                             | PageSelection.from_range(macro_source_page_count, page_count))
         else:
-            # Jeśli nie podano indeksów, ale jest source_page_count, zaznacz od source_page_count do końca
-            if macro_source_page_count is not None:
-                indices.update(range(macro_source_page_count, max_index + 1))
+            new_selection = indices_to_select.limited(page_count)
 
-        current_selection = self.selected_pages.copy()
-        new_selection = set(indices)
+        current_selection = self.selected_pages
         self.selected_pages = new_selection
 
         if current_selection != self.selected_pages:
@@ -4515,7 +4535,7 @@ class SelectablePDFViewer:
         self._record_action('select_odd')
         
         # W Pythonie indeksy są od 0, więc strony nieparzyste mają indeksy parzyste (0, 2, 4...)
-        indices = [i for i in range(len(self.pdf_document)) if i % 2 == 0]
+        indices = PageSelection.from_range(0, len(self.pdf_document), 2)
         self._apply_selection_by_indices(indices)
 
     def _select_even_pages(self):
@@ -4526,19 +4546,14 @@ class SelectablePDFViewer:
         self._record_action('select_even')
 
         # Strony parzyste mają indeksy nieparzyste (1, 3, 5...)
-        indices = [i for i in range(len(self.pdf_document)) if i % 2 != 0]
+        indices = PageSelection.from_range(1, len(self.pdf_document), 2)
         self._apply_selection_by_indices(indices)
 
     def _select_portrait_pages(self):
         """Zaznacza strony pionowe (wysokość > szerokość)."""
         if not self.pdf_document: return
         
-        indices = []
-        for i in range(len(self.pdf_document)):
-            page = self.pdf_document.load_page(i)
-            # Sprawdzenie, czy wysokość bounding boxu jest większa niż szerokość
-            if page.rect.height > page.rect.width:
-                indices.append(i)
+        indices = self._get_analysis_index().portrait_pages()
         self._apply_selection_by_indices(indices)
         self._record_action('select_portrait')
         
@@ -4546,12 +4561,7 @@ class SelectablePDFViewer:
         """Zaznacza strony poziome (szerokość >= wysokość)."""
         if not self.pdf_document: return
         
-        indices = []
-        for i in range(len(self.pdf_document)):
-            page = self.pdf_document.load_page(i)
-            # Sprawdzenie, czy szerokość bounding boxu jest większa lub równa wysokości
-            if page.rect.width >= page.rect.height:
-                indices.append(i)
+        indices = self._get_analysis_index().landscape_pages()
         self._apply_selection_by_indices(indices)
         self._record_action('select_landscape')
 
@@ -4601,7 +4611,8 @@ class SelectablePDFViewer:
                 if index < len(self.pdf_document):
                     page = self.pdf_document.load_page(index)
                     
-                    pix = page.get_pixmap(matrix=matrix, alpha=False)
+                    # Strony już zinterpretowane (miniatury) są tylko rasteryzowane
+                    pix = self.display_lists.get_pixmap(page, matrix, store=False)
                     
                     # Generuj unikalną nazwę pliku
                     single_page_range = str(index + 1)
@@ -4638,14 +4649,21 @@ class SelectablePDFViewer:
         self._init_macro_system()
 
         self.pdf_document = None
-        self.selected_pages: Set[int] = set()
-        # Multi-width thumbnail cache: {page_index: {width: ImageTk.PhotoImage}}
-        self.tk_images: Dict[int, Dict[int, ImageTk.PhotoImage]] = {}
+        # Zaznaczenie jako mapa bitowa stron (Ctrl+A na 20 000 stron bez tworzenia obiektów int)
+        self.selected_pages: PageSelection = PageSelection()
+        # Multi-width thumbnail cache: (page_index, width) -> ImageTk.PhotoImage, LRU z budżetem pamięci
+        self.tk_images = ThumbnailImageCache(max_bytes=self._get_thumbnail_memory_bytes())
         self.icons: Dict[str, Union[ImageTk.PhotoImage, str]] = {}
         
         self.thumb_frames: Dict[int, 'ThumbnailFrame'] = {}
         self.active_page_index = 0 
 
+        # Pasek statusu/postępu, stany przycisków i styl zaznaczenia odświeżane najwyżej raz na klatkę -
+        # długie pętle po stronach nie czekają na odrysowanie okna po każdej stronie
+        self._ui_refresh = RefreshScheduler(master)
+        self._ui_refresh.register('selection', self._refresh_selection_display)
+        self._ui_refresh.register('buttons', self._refresh_tool_button_states)
+
         self.clipboard: Optional[bytes] = None 
         self.pages_in_clipboard_count: int = 0 
         
@@ -4660,9 +4678,56 @@ class SelectablePDFViewer:
         self.MIN_WINDOW_WIDTH = 950
         self.render_dpi_factor = self._get_render_dpi_factor()
         
-        self.undo_stack: List[bytes] = []
-        self.redo_stack: List[bytes] = []
-        self.max_stack_size = 50
+        # Pochodzenie stron dokumentu roboczego (plik/schowek i numer strony) - miniatury niezmienionych
+        # stron renderowane są wprost ze źródeł, bez migawki całego dokumentu po każdej operacji
+        self.page_refs = VirtualDocument()
+        
+        # Listy wyświetlania stron (zinterpretowana treść) wspólne dla miniatur, eksportu i scalania -
+        # ponowne renderowanie strony w innej skali to tylko rasteryzacja
+        self.display_lists = DisplayListCache()
+        self.display_lists.key_resolver = self._display_list_key
+        
+        # Historia cofania oparta na deltach stron, ograniczona budżetem pamięci
+        self.history = UndoHistory(max_bytes=self._get_undo_budget_bytes(), page_refs=self.page_refs)
+        
+        # Renderowanie miniatur w tle (wątki robocze + kolejka odpytywana przez after())
+        # Trwały cache miniatur na dysku (obok pliku preferencji) - ponowne otwarcie pliku bez renderowania
+        self.thumbnail_disk_cache = ThumbnailDiskCache(
+            os.path.join(os.path.dirname(self.prefs_manager.filepath), 'thumbnail_cache.sqlite'),
+            max_bytes=self._get_thumbnail_cache_bytes()
+        )
+        self.thumbnail_service = ThumbnailRenderService(master, self._on_thumbnail_rendered,
+                                                        disk_cache=self.thumbnail_disk_cache,
+                                                        display_lists=self.display_lists)
+        self._render_source_key = None      # Wersja dokumentu przekazana do wątków renderujących
+        self._render_source_path = None     # Ścieżka pliku, jeśli dokument nie był modyfikowany
+        self._render_path_key = None
+        self._analysis_index = None         # Indeks analizy stron (orientacja, kolor, format...)
+        self._analysis_index_key = None
+        # Zapis dokumentu w osobnym procesie (profile inne niż przyrostowy)
+        self.background_saver = BackgroundSaver(master)
+        self.empty_page_analyzer = DocumentAnalyzer(master, on_progress=self._on_empty_scan_progress,
+                                                    on_done=self._on_empty_scan_done)
+        self._empty_page_results = None
+        self._empty_page_key = None
+        self._placeholder_images: Dict[tuple, ImageTk.PhotoImage] = {}
+        
+        # Wirtualna siatka miniatur: ramki istnieją tylko dla wierszy w widoku (+ zapas),
+        # thumb_frames zawiera wyłącznie żywe ramki, nieużywane czekają w puli
+        self._grid_layout: Optional[ThumbnailGridLayout] = None
+        self._grid_column_width = None
+        self._spare_frames: List['ThumbnailFrame'] = []
+        self._frame_chrome = None  # (dodatkowa szerokość, dodatkowa wysokość) ramki poza obrazem
+        self._focus_hidden = False
+        # Zaznaczenie i fokus pokazane na żywych ramkach - odświeżane są tylko strony, których stan się zmienił
+        self._styled_selection = PageSelection()
+        self._styled_focus: Optional[int] = None
+        self._layout_refresh_pending = False
+        
+        # Przeciąganie miniatur: (strona, x, y, czy była zaznaczona) przy kliknięciu, przeciągane strony, znacznik
+        self._drag_press = None
+        self._drag_pages: Optional[List[int]] = None
+        self._drop_marker = None
         
         # Debouncing for window resize events
         self._resize_timer = None
@@ -4775,8 +4840,8 @@ class SelectablePDFViewer:
         Tooltip(self.image_import_button, "Importuj strony z pliku obrazu.\n" "Strony zostaną wstawione po bieżącej, a przy braku zazanczenia - na końcu pliku.")
         Tooltip(self.export_image_button, "Eksportuj strony do plików PNG.\n" "Wymaga zaznaczenia przynajniej jednej strony.")
         
-        Tooltip(self.undo_button, "Cofnij ostatnią zmianę.\n" "Obsługuje do 50 kroków wstecz.")
-        Tooltip(self.redo_button, "Ponów cofniętą zmianę.\n" "Obsługuje do 50 kroków do przodu.")
+        Tooltip(self.undo_button, "Cofnij ostatnią zmianę.\n" "Liczba kroków zależy od budżetu pamięci historii.")
+        Tooltip(self.redo_button, "Ponów cofniętą zmianę.\n" "Liczba kroków zależy od budżetu pamięci historii.")
         
         Tooltip(self.delete_button, "Usuń zaznaczone strony.\n" "Wymaga zaznaczenia przynajniej jednej strony.")
         Tooltip(self.cut_button, "Wytnij zaznaczone strony.\n" "Wymaga zaznaczenia przynajniej jednej strony.")
@@ -4833,7 +4898,7 @@ class SelectablePDFViewer:
         
         self.canvas.bind("<Configure>", self._reconfigure_grid) 
         
-        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        self.canvas.configure(yscrollcommand=self._on_canvas_yscroll)
         self.scrollbar.pack(side="right", fill="y")
         self.canvas.pack(side="left", fill="both", expand=True) 
 
@@ -4855,9 +4920,43 @@ class SelectablePDFViewer:
         }
         return quality_map.get(quality, 0.8)
     
+    def _get_undo_budget_bytes(self):
+        """Zwraca budżet pamięci historii cofania (w bajtach) na podstawie preferencji"""
+        try:
+            budget_mb = int(self.prefs_manager.get('undo_history_budget_mb', '512'))
+        except ValueError:
+            budget_mb = 512
+        return max(16, budget_mb) * 1024 * 1024
+    
+    def _get_thumbnail_cache_bytes(self):
+        """Zwraca limit cache miniatur na dysku (w bajtach); 0 wyłącza cache"""
+        try:
+            cache_mb = int(self.prefs_manager.get('thumbnail_cache_mb', '256'))
+        except ValueError:
+            cache_mb = 256
+        return max(0, cache_mb) * 1024 * 1024
+    
+    def _get_thumbnail_memory_bytes(self):
+        """Zwraca budżet pamięci miniatur wyświetlanych w oknie (w bajtach)"""
+        try:
+            memory_mb = int(self.prefs_manager.get('thumbnail_memory_mb', '256'))
+        except ValueError:
+            memory_mb = 256
+        return max(32, memory_mb) * 1024 * 1024
+    
     def on_close_window(self):
+        if self.background_saver.running:
+            response = custom_messagebox(
+                self.master, "Zapisywanie w toku",
+                "Dokument jest właśnie zapisywany. Czy przerwać zapis i zamknąć program?",
+                typ="question"
+            )
+            if not response:
+                return
+            self.background_saver.cancel()
+            self.hide_progressbar()
         # Sprawdź czy są niezapisane zmiany (niepusty stos undo)
-        if self.pdf_document is not None and len(self.undo_stack) > 0:
+        if self.pdf_document is not None and self.history.can_undo():
             response = custom_messagebox(
                 self.master, "Niezapisane zmiany",
                 "Czy chcesz zapisać zmiany w dokumencie przed zamknięciem programu?",
@@ -4866,10 +4965,8 @@ class SelectablePDFViewer:
             if response is None:
                 return
             elif response is True: 
-                self.save_document() 
-                if len(self.undo_stack) > 0:
-                    return 
-                self.master.quit() 
+                # Zamknięcie dopiero po udanym zapisie (zapis może trwać w tle)
+                self.save_document(on_saved=self.master.quit) 
             else: 
                 self.master.quit()
         else:
@@ -4993,6 +5090,9 @@ class SelectablePDFViewer:
     def show_preferences_dialog(self):
         """Wyświetla okno dialogowe preferencji"""
         PreferencesDialog(self.master, self.prefs_manager)
+        self.history.set_budget(self._get_undo_budget_bytes())
+        self.thumbnail_disk_cache.set_budget(self._get_thumbnail_cache_bytes())
+        self.tk_images.set_budget(self._get_thumbnail_memory_bytes())
     
     def show_about_dialog(self):
         PROGRAM_LOGO_PATH = resource_path(os.path.join('icons', 'logo.png'))
@@ -5122,14 +5222,20 @@ class SelectablePDFViewer:
         
         # === USUWANIE PUSTYCH STRON ===
         menu_obj.add_command(label="Usuń puste strony", command=self.remove_empty_pages, state=tk.DISABLED)
+        
+        # === OPTYMALIZACJA OBRAZÓW ===
+        images_menu = tk.Menu(menu_obj, tearoff=0)
+        for name, preset in IMAGE_PRESETS.items():
+            images_menu.add_command(label=preset.label, command=lambda name=name: self.optimize_document_images(name))
+        menu_obj.add_cascade(label="Optymalizuj obrazy", menu=images_menu, state=tk.DISABLED)
     
     def _check_action_allowed(self, action_name):
         """Check if an action is allowed based on current button/menu state"""
         doc_loaded = self.pdf_document is not None
         has_selection = len(self.selected_pages) > 0
         has_single_selection = len(self.selected_pages) == 1
-        has_undo = len(self.undo_stack) > 0
-        has_redo = len(self.redo_stack) > 0
+        has_undo = self.history.can_undo()
+        has_redo = self.history.can_redo()
         has_clipboard_content = self.clipboard is not None
         
         # Map action names to their conditions
@@ -5223,7 +5329,7 @@ class SelectablePDFViewer:
         self.master.bind('<F12>', lambda e: self.pdf_document is not None and self.show_macros_list())
         
     def _setup_focus_logic(self):
-        self.master.bind('<Escape>', lambda e: self._clear_all_selection())
+        self.master.bind('<Escape>', lambda e: self._cancel_background_save() if self.background_saver.running else self._clear_all_selection())
         self.master.bind('<space>', lambda e: self._toggle_selection_space())
         self.master.bind('<Left>', lambda e: self._move_focus_and_scroll(-1))
         self.master.bind('<Right>', lambda e: self._move_focus_and_scroll(1))
@@ -5236,7 +5342,7 @@ class SelectablePDFViewer:
 
     def _select_all(self):
         if self.pdf_document:
-            all_pages = set(range(len(self.pdf_document)))
+            all_pages = PageSelection.from_range(0, len(self.pdf_document))
             # Zawsze zaznaczaj wszystkie strony, bez przełączania!
             self._record_action('select_all')
             self.selected_pages = all_pages
@@ -5251,7 +5357,7 @@ class SelectablePDFViewer:
             return
         if start_index > end_index:
             start_index, end_index = end_index, start_index
-        self.selected_pages = set(range(start_index, end_index + 1))
+        self.selected_pages = PageSelection.from_range(start_index, end_index + 1)
         self.update_selection_display()
         self.active_page_index = end_index
         
@@ -5282,13 +5388,11 @@ class SelectablePDFViewer:
         if 0 <= new_index <= max_index:
             self.active_page_index = new_index
             self.update_focus_display(hide_mouse_focus=False)  
-            frame = self._get_page_frame(self.active_page_index)
-            if frame:
-                self.canvas.update_idletasks()
-                y1 = frame.winfo_y()
-                y2 = frame.winfo_y() + frame.winfo_height()
-                bbox = self.canvas.bbox("all")
-                total_height = bbox[3] if bbox is not None else 1
+            layout = self._get_grid_layout()
+            if layout and layout.total_height > 0:
+                # Pozycja z modelu siatki - ramka strony nie musi jeszcze istnieć
+                y1, y2 = layout.page_bounds(self.active_page_index)
+                total_height = layout.total_height
                 norm_top = y1 / total_height
                 norm_bottom = y2 / total_height
                 current_top, current_bottom = self.canvas.yview()
@@ -5304,9 +5408,7 @@ class SelectablePDFViewer:
             return
         self.active_page_index = 0
         self.update_focus_display(hide_mouse_focus=False)
-        frame = self._get_page_frame(0)
-        if frame:
-            self.canvas.yview_moveto(0)
+        self.canvas.yview_moveto(0)
     
     def _jump_to_last_page(self):
         """Przejdź do ostatniej strony (End)"""
@@ -5314,9 +5416,7 @@ class SelectablePDFViewer:
             return
         self.active_page_index = len(self.pdf_document) - 1
         self.update_focus_display(hide_mouse_focus=False)
-        frame = self._get_page_frame(self.active_page_index)
-        if frame:
-            self.canvas.yview_moveto(1.0)
+        self.canvas.yview_moveto(1.0)
     
     def _page_up(self):
         """Przewiń w górę o jedną 'stronę' miniatur (PageUp)"""
@@ -5324,16 +5424,15 @@ class SelectablePDFViewer:
             return
         # Oblicz ile wierszy mieści się w oknie
         canvas_height = self.canvas.winfo_height()
-        # Oszacuj wysokość wiersza (średnia wysokość miniatury + padding)
-        if self.thumb_frames:
-            first_frame = self._get_page_frame(0)
-            if first_frame:
-                row_height = first_frame.winfo_height() + self.THUMB_PADDING
-                rows_per_page = max(1, canvas_height // row_height)
-                # Przesuń fokus o liczbę miniatur odpowiadającą liczbie wierszy * liczbie kolumn
-                delta = -(rows_per_page * self._get_current_num_cols())
-                self._move_focus_and_scroll(delta)
-                return
+        # Średnia wysokość wiersza z modelu siatki (ramki istnieją tylko dla widocznych wierszy)
+        layout = self._get_grid_layout()
+        if layout and layout.num_rows > 0:
+            row_height = layout.average_row_height()
+            rows_per_page = max(1, int(canvas_height // row_height))
+            # Przesuń fokus o liczbę miniatur odpowiadającą liczbie wierszy * liczbie kolumn
+            delta = -(rows_per_page * layout.num_cols)
+            self._move_focus_and_scroll(delta)
+            return
         # Fallback - przesuń o 10 stron
         self._move_focus_and_scroll(-10)
     
@@ -5343,16 +5442,15 @@ class SelectablePDFViewer:
             return
         # Oblicz ile wierszy mieści się w oknie
         canvas_height = self.canvas.winfo_height()
-        # Oszacuj wysokość wiersza (średnia wysokość miniatury + padding)
-        if self.thumb_frames:
-            first_frame = self._get_page_frame(0)
-            if first_frame:
-                row_height = first_frame.winfo_height() + self.THUMB_PADDING
-                rows_per_page = max(1, canvas_height // row_height)
-                # Przesuń fokus o liczbę miniatur odpowiadającą liczbie wierszy * liczbie kolumn
-                delta = rows_per_page * self._get_current_num_cols()
-                self._move_focus_and_scroll(delta)
-                return
+        # Średnia wysokość wiersza z modelu siatki (ramki istnieją tylko dla widocznych wierszy)
+        layout = self._get_grid_layout()
+        if layout and layout.num_rows > 0:
+            row_height = layout.average_row_height()
+            rows_per_page = max(1, int(canvas_height // row_height))
+            # Przesuń fokus o liczbę miniatur odpowiadającą liczbie wierszy * liczbie kolumn
+            delta = rows_per_page * layout.num_cols
+            self._move_focus_and_scroll(delta)
+            return
         # Fallback - przesuń o 10 stron
         self._move_focus_and_scroll(10)
                         
@@ -5361,6 +5459,7 @@ class SelectablePDFViewer:
         if not self.pdf_document or page_index < 0 or page_index >= len(self.pdf_document):
             return
 
+        self._drag_press = (page_index, event.x_root, event.y_root, page_index in self.selected_pages)
         is_shift_pressed = (event.state & 0x1) != 0 
         if is_shift_pressed and self.selected_pages:
             last_active = self.active_page_index
@@ -5372,9 +5471,9 @@ class SelectablePDFViewer:
 
         # --- Dodaj to poniżej! ---
         if getattr(self, "macro_recording", False):
-            indices = sorted(self.selected_pages)
+            # Zwarty opis zaznaczenia ("1-500,502") zamiast listy indeksów
             page_count = len(self.pdf_document) if self.pdf_document else 0
-            self._record_action('select_custom', indices=indices, source_page_count=page_count)
+            self._record_action('select_custom', pages=self.selected_pages.to_spec(), source_page_count=page_count)
         
     def _toggle_selection_lpm(self, page_index):
         # Validate page_index before using it
@@ -5387,24 +5486,107 @@ class SelectablePDFViewer:
             self.selected_pages.add(page_index)
         self.update_selection_display()
 
+    def _drop_position(self, x_root, y_root):
+        """Zwraca (pozycja wstawienia, znacznik (x, y, wysokość) w widoku) dla wskaźnika myszy."""
+        layout = self._get_grid_layout()
+        if layout is None:
+            return None, None
+        x = self.canvas.canvasx(x_root - self.canvas.winfo_rootx())
+        y = self.canvas.canvasy(y_root - self.canvas.winfo_rooty())
+        marker_x, marker_y, marker_height = layout.insertion_marker(x, y)
+        view_top = int(self.canvas.canvasy(0))
+        return layout.insertion_index_at(x, y), (marker_x, marker_y - view_top, marker_height)
+
+    def _handle_drag_motion(self, event):
+        """Przeciąganie miniatur: po przekroczeniu progu przenoszone są zaznaczone strony."""
+        press = self._drag_press
+        if press is None or not self.pdf_document:
+            return
+        page_index, press_x, press_y, was_selected = press
+        if self._drag_pages is None:
+            if abs(event.x_root - press_x) + abs(event.y_root - press_y) < DRAG_THRESHOLD_PX:
+                return
+            # Kliknięcie odznaczyło już zaznaczoną stronę - przeciągane jest całe zaznaczenie;
+            # przeciągnięcie niezaznaczonej strony przenosi tylko ją
+            if was_selected:
+                self.selected_pages.add(page_index)
+            else:
+                self.selected_pages = PageSelection([page_index])
+            self.update_selection_display()
+            self._drag_pages = sorted(self.selected_pages)
+            self.canvas.config(cursor="fleur")
+            self._update_status(f"Przenoszenie {len(self._drag_pages)} stron - upuść w wybranym miejscu.")
+
+        # Przewijanie siatki, gdy wskaźnik jest przy górnej/dolnej krawędzi widoku
+        pointer_y = event.y_root - self.canvas.winfo_rooty()
+        if pointer_y < DRAG_AUTOSCROLL_PX:
+            self.canvas.yview_scroll(-1, "units")
+        elif pointer_y > self.canvas.winfo_height() - DRAG_AUTOSCROLL_PX:
+            self.canvas.yview_scroll(1, "units")
+
+        _, marker = self._drop_position(event.x_root, event.y_root)
+        if marker is None:
+            return
+        if self._drop_marker is None or not self._drop_marker.winfo_exists():
+            self._drop_marker = tk.Frame(self.scrollable_frame, bg=DROP_MARKER_COLOR, width=4)
+        marker_x, marker_y, marker_height = marker
+        self._drop_marker.place(x=max(0, marker_x - 2), y=marker_y, height=marker_height)
+        self._drop_marker.lift()
+
+    def _handle_drag_release(self, event):
+        """Koniec przeciągania: przenosi strony w miejsce upuszczenia."""
+        press, pages = self._drag_press, self._drag_pages
+        self._drag_press = None
+        self._drag_pages = None
+        if pages is None:
+            return
+        self.canvas.config(cursor="")
+        if self._drop_marker is not None and self._drop_marker.winfo_exists():
+            self._drop_marker.place_forget()
+        if not self.pdf_document:
+            return
+
+        insert_at, _ = self._drop_position(event.x_root, event.y_root)
+        if insert_at is None:
+            return
+        order = page_order.moved_order(len(self.pdf_document), pages, insert_at)
+        try:
+            if not self._apply_page_order(order):
+                self._update_status("Strony są już w tym miejscu.")
+                return
+            moved = set(pages)
+            new_indices = [i for i, old_index in enumerate(order) if old_index in moved]
+            self.selected_pages = PageSelection(new_indices)
+            self.active_page_index = order.index(press[0])
+            self.update_selection_display()
+            self.update_focus_display()
+            self._update_status(f"Przeniesiono {len(pages)} stron na pozycję {new_indices[0] + 1}.")
+        except Exception as e:
+            self._update_status(f"BŁĄD: Nie udało się przenieść stron: {e}")
+
     def update_tool_button_states(self):
+        """Zgłasza odświeżenie stanów przycisków i pozycji menu (wykonywane najwyżej raz na klatkę)."""
+        self._ui_refresh.mark('buttons')
+
+    def _refresh_tool_button_states(self):
         doc_loaded = self.pdf_document is not None
-        has_selection = len(self.selected_pages) > 0
-        has_single_selection = len(self.selected_pages) == 1
-        has_undo = len(self.undo_stack) > 0
-        has_redo = len(self.redo_stack) > 0
+        selected_count = len(self.selected_pages)
+        has_selection = selected_count > 0
+        has_single_selection = selected_count == 1
+        has_undo = self.history.can_undo()
+        has_redo = self.history.can_redo()
         has_clipboard_content = self.clipboard is not None
         
         delete_state = tk.NORMAL if doc_loaded and has_selection else tk.DISABLED
-        insert_state = tk.NORMAL if doc_loaded and (len(self.selected_pages) > 0) else tk.DISABLED
-        paste_enable_state = tk.NORMAL if has_clipboard_content and doc_loaded and (len(self.selected_pages) > 0) else tk.DISABLED 
+        insert_state = tk.NORMAL if doc_loaded and has_selection else tk.DISABLED
+        paste_enable_state = tk.NORMAL if has_clipboard_content and doc_loaded and has_selection else tk.DISABLED 
         rotate_state = tk.NORMAL if doc_loaded and has_selection else tk.DISABLED
         undo_state = tk.NORMAL if has_undo else tk.DISABLED
         redo_state = tk.NORMAL if has_redo else tk.DISABLED
         import_state = tk.NORMAL if doc_loaded else tk.DISABLED 
         select_state = tk.NORMAL if doc_loaded else tk.DISABLED
         reverse_state = tk.NORMAL if doc_loaded else tk.DISABLED
-        two_pages_state = tk.NORMAL if doc_loaded and len(self.selected_pages) == 2 else tk.DISABLED,
+        two_pages_state = tk.NORMAL if doc_loaded and selected_count == 2 else tk.DISABLED,
          
         # 1. Aktualizacja przycisków w panelu głównym
         self.save_button_icon.config(state=import_state)
@@ -5489,6 +5671,7 @@ class SelectablePDFViewer:
             "Zapisz jako plik z hasłem...": reverse_state,
             "Zamień strony miejscami": two_pages_state,
             "Usuń puste strony": reverse_state,
+            "Optymalizuj obrazy": reverse_state,
             "Analiza PDF": reverse_state
             
         }
@@ -5503,7 +5686,7 @@ class SelectablePDFViewer:
        # --- Metody obsługi plików i edycji (Ze zmianami w import_image_to_new_page) ---
     
     def open_pdf(self, event=None, filepath=None):
-        if self.pdf_document is not None and len(self.undo_stack) > 0:
+        if self.pdf_document is not None and self.history.can_undo():
             response = custom_messagebox(
                 self.master, "Niezapisane zmiany",
                 "Dokument został zmodyfikowany. Czy chcesz zapisać zmiany przed otwarciem nowego pliku?",
@@ -5512,9 +5695,9 @@ class SelectablePDFViewer:
             if response is None:
                 return  # Anuluj
             elif response:  # Tak - zapisz
-                self.save_document()
-                if len(self.undo_stack) > 0:
-                    return  # Jeśli nie udało się zapisać, nie otwieraj nowego pliku
+                # Otwarcie dopiero po udanym zapisie (zapis może trwać w tle)
+                self.save_document(on_saved=lambda: self.open_pdf(filepath=filepath))
+                return
             # jeśli Nie - kontynuuj
 
         if not filepath:
@@ -5539,7 +5722,9 @@ class SelectablePDFViewer:
                 self.prefs_manager.set('last_open_path', os.path.dirname(filepath))
 
         try:
-            if self.pdf_document: self.pdf_document.close()
+            if self.pdf_document:
+                self.display_lists.invalidate_pages(self.pdf_document)
+                self.pdf_document.close()
             
             # Krok 1: inicjalizacja progresu i status
             # Update status FIRST, then show progress bar to ensure message is visible
@@ -5552,6 +5737,7 @@ class SelectablePDFViewer:
             doc = fitz.open(filepath)
             
             # Krok 3: obsługa hasła
+            was_encrypted = doc.is_encrypted
             if doc.is_encrypted:
                 doc.close()
                 password = self._ask_for_password()
@@ -5578,16 +5764,18 @@ class SelectablePDFViewer:
             # Status is updated and visible immediately thanks to _update_status() calling update_idletasks()
             self._update_status("Wczytywanie dokumentu i czyszczenie widoku...")
             self.pdf_document = doc
-            self.selected_pages = set()
-            self.tk_images = {}
-            self.undo_stack.clear()
-            self.redo_stack.clear()
+            self.selected_pages = PageSelection()
+            self.tk_images.clear()
+            self.history.clear()
             self.clipboard = None
             self.pages_in_clipboard_count = 0
             self.active_page_index = 0
             self.thumb_frames.clear()
-            self.undo_stack.clear()
-            self.redo_stack.clear()
+            self.history.clear()
+            # Niezmieniony, nieszyfrowany plik wątki renderujące mogą otworzyć bezpośrednio z dysku
+            self._render_source_path = None if was_encrypted else filepath
+            self.page_refs.reset(len(doc), path=self._render_source_path)
+            self._render_path_key = self._current_render_key()
             for widget in list(self.scrollable_frame.winfo_children()):
                 widget.destroy()
             self.thumb_width = 205  # Reset to default thumbnail width
@@ -5611,7 +5799,7 @@ class SelectablePDFViewer:
             self.update_tool_button_states()
     
     def close_pdf(self):
-        if self.pdf_document is not None and len(self.undo_stack) > 0:
+        if self.pdf_document is not None and self.history.can_undo():
             response = custom_messagebox(
                 self.master, "Niezapisane zmiany",
                 "Dokument został zmodyfikowany. Czy chcesz zapisać zmiany przed zamknięciem pliku?",
@@ -5620,20 +5808,26 @@ class SelectablePDFViewer:
             if response is None:
                 return  # Anuluj zamykanie pliku
             elif response is True:
-                self.save_document()
-                if len(self.undo_stack) > 0:
-                    return  # Jeśli nie udało się zapisać, nie zamykaj pliku
+                # Zamknięcie dopiero po udanym zapisie (zapis może trwać w tle)
+                self.save_document(on_saved=self.close_pdf)
+                return
             # jeśli Nie - kontynuuj zamykanie pliku (bez zapisu)
         if self.pdf_document is not None:
             self.pdf_document.close()
             self.pdf_document = None
+        self.thumbnail_service.clear_source()
+        self._render_source_key = None
+        self._render_source_path = None
+        self.page_refs.reset()
         self.selected_pages.clear()
+        print(f"[CACHE] Miniatury w pamięci: {self.tk_images.summary()}")
+        print(f"[CACHE] Listy wyświetlania: {self.display_lists.summary()}")
+        self.display_lists.clear()
         self.tk_images.clear()
         self.thumb_frames.clear()
         for widget in list(self.scrollable_frame.winfo_children()):
             widget.destroy()
-        self.undo_stack.clear()
-        self.redo_stack.clear()
+        self.history.clear()
         self.clipboard = None
         self.pages_in_clipboard_count = 0
         self.active_page_index = 0
@@ -5672,8 +5866,7 @@ class SelectablePDFViewer:
 
         # Stwórz nowy dokument PDF
         self.pdf_document = fitz.open()
-        self.undo_stack.clear()
-        self.redo_stack.clear()
+        self.history.clear()
         self.selected_pages.clear()
         self.tk_images.clear()
         for widget in list(self.scrollable_frame.winfo_children()): widget.destroy()
@@ -5683,6 +5876,7 @@ class SelectablePDFViewer:
         page = self.pdf_document.new_page(width=image_width_pt, height=image_height_pt)
         rect = fitz.Rect(0, 0, image_width_pt, image_height_pt)
         page.insert_image(rect, filename=image_path)
+        self.page_refs.reset(len(self.pdf_document))
 
         self.active_page_index = 0
         self._reconfigure_grid()
@@ -5754,36 +5948,30 @@ class SelectablePDFViewer:
                 insert_index = self.active_page_index + 1
             else:
                 if len(self.selected_pages) == 1:
-                    page_index = list(self.selected_pages)[0]
+                    page_index = self.selected_pages.first()
                     insert_index = page_index + 1 
                 elif len(self.selected_pages) > 1:
-                    insert_index = max(self.selected_pages) + 1
+                    insert_index = self.selected_pages.last() + 1
                 else:
                     insert_index = len(self.pdf_document)
                             
-            self._save_state_to_undo()
             num_inserted = len(selected_indices)
-            temp_doc_for_insert = fitz.open()
             
             self.show_progressbar(maximum=num_inserted)
             self._update_status("Importowanie stron z PDF...")
             
-            for idx, page_index_to_import in enumerate(selected_indices):
-                temp_doc_for_insert.insert_pdf(imported_doc, from_page=page_index_to_import, to_page=page_index_to_import)
-                self.update_progressbar(idx + 1)
-            
-            self.pdf_document.insert_pdf(temp_doc_for_insert, start_at=insert_index)
-            temp_doc_for_insert.close()
+            page_transfer.transfer_pages(self.pdf_document, imported_doc, selected_indices, start_at=insert_index,
+                                         progressbar_callback=lambda current, total: self.update_progressbar(current))
+            # Strony pliku bez hasła miniatury czytają wprost z importowanego pliku
+            origins = None if imported_doc.needs_pass else self.page_refs.source_pages(selected_indices, path=import_path)
+            self._record_undo_insertion(range(insert_index, insert_index + num_inserted), origins)
             self.hide_progressbar()
 
             # Select the newly imported pages
-            self.selected_pages = set(range(insert_index, insert_index + num_inserted))
+            self.selected_pages = PageSelection.from_range(insert_index, insert_index + num_inserted)
             
-            self.tk_images.clear()
-            for widget in list(self.scrollable_frame.winfo_children()): widget.destroy()
-            self.thumb_frames.clear()
-
-            self._reconfigure_grid()
+            self._refresh_after_structure_change(page_order.insertion_map(
+                len(self.pdf_document) - num_inserted, range(insert_index, insert_index + num_inserted)))
             self.update_selection_display()
             self.update_tool_button_states()
             self.update_focus_display()
@@ -5921,26 +6109,21 @@ class SelectablePDFViewer:
             # 6. Określenie pozycji wstawienia w głównym dokumencie
             insert_index = len(self.pdf_document)
             if len(self.selected_pages) == 1:
-                page_index = list(self.selected_pages)[0]
+                page_index = self.selected_pages.first()
                 insert_index = page_index + 1
             elif len(self.selected_pages) > 1:
-                insert_index = max(self.selected_pages) + 1
+                insert_index = self.selected_pages.last() + 1
             else:
                 insert_index = len(self.pdf_document)
 
-            self._save_state_to_undo()
             self.pdf_document.insert_pdf(imported_doc, from_page=0, to_page=0, start_at=insert_index)
+            self._record_undo_insertion([insert_index])
             
             # Select the newly imported image page
-            self.selected_pages = {insert_index}
+            self.selected_pages = PageSelection([insert_index])
             self.active_page_index = insert_index
 
-            self.tk_images.clear()
-            for widget in list(self.scrollable_frame.winfo_children()):
-                widget.destroy()
-            self.thumb_frames.clear()
-
-            self._reconfigure_grid()
+            self._refresh_after_structure_change(page_order.insertion_map(len(self.pdf_document) - 1, [insert_index]))
             self.update_selection_display()
             self.update_tool_button_states()
             self.update_focus_display()
@@ -5955,13 +6138,12 @@ class SelectablePDFViewer:
                 
     def _update_status(self, message):
         """
-        Updates the status bar with a message and ensures immediate GUI refresh.
-        This method forces the GUI to update immediately so status messages are
-        always visible, even before blocking operations.
+        Updates the status bar with a message and requests a GUI refresh.
+        The first message after an idle frame is drawn immediately, so status messages are
+        visible before blocking operations; bursts of messages are drawn at most once per frame.
         """
         self.status_bar.config(text=message, fg="black")
-        # Force immediate GUI update so the status is visible before any blocking operation
-        self.master.update_idletasks()
+        self._ui_refresh.redraw()
     
     def show_progressbar(self, maximum=100, mode="determinate"):
         """
@@ -5977,17 +6159,17 @@ class SelectablePDFViewer:
         self.progress_bar.pack(side=tk.RIGHT, padx=(5, 5))
         if mode == "indeterminate":
             self.progress_bar.start(10)  # Animacja w trybie nieokreślonym
-        self.master.update_idletasks()
+        self._ui_refresh.redraw()
     
     def update_progressbar(self, value):
         """
-        Aktualizuje wartość paska postępu i odświeża GUI.
+        Aktualizuje wartość paska postępu; GUI odświeżane jest najwyżej raz na klatkę.
         
         Args:
             value: Aktualna wartość postępu (0 do maximum)
         """
         self.progress_bar["value"] = value
-        self.master.update_idletasks()
+        self._ui_refresh.redraw()
     
     def hide_progressbar(self):
         """
@@ -5995,32 +6177,59 @@ class SelectablePDFViewer:
         """
         self.progress_bar.stop()  # Zatrzymaj animację (jeśli była)
         self.progress_bar.pack_forget()
-        self.master.update_idletasks()
+        self._ui_refresh.redraw()
             
-    def _save_state_to_undo(self):
-        """Zapisuje bieżący stan dokumentu na stosie undo i czyści stos redo."""
+    def _save_state_to_undo(self, pages=None):
+        """
+        Zapisuje w historii stan stron przed modyfikacją ich zawartości i czyści stos redo.
+        Kopiowane są tylko strony `pages`; bez listy stron zapisywana jest pełna migawka.
+        """
         if self.pdf_document:
-            buffer = self.pdf_document.write()
-            self.undo_stack.append(buffer)
-            if len(self.undo_stack) > self.max_stack_size:
-                self.undo_stack.pop(0)
-            # Każda nowa modyfikacja czyści stos redo
-            self.redo_stack.clear()
+            # Treść stron za chwilę się zmieni - ich listy wyświetlania są nieaktualne
+            self.display_lists.invalidate_pages(self.pdf_document, pages)
+            if pages is None:
+                self.history.record_snapshot(self.pdf_document)
+            else:
+                self.history.record_page_edit(self.pdf_document, pages)
+            self.page_refs.mark_edited(pages)
             self.update_tool_button_states()
         else:
-            self.undo_stack.clear()
-            self.redo_stack.clear()
+            self.history.clear()
             print("DEBUG: Czyszczenie historii _save_state_to_undo")
             self.update_tool_button_states()
+
+    def _record_undo_rotation(self, pages):
+        """Zapisuje w historii kąty obrotu stron przed ich obróceniem."""
+        if self.pdf_document:
+            self.history.record_rotation(self.pdf_document, pages)
+            self.update_tool_button_states()
+
+    def _record_undo_deletion(self, pages):
+        """Zapisuje w historii strony, które za chwilę zostaną usunięte."""
+        if self.pdf_document:
+            self.history.record_deletion(self.pdf_document, pages)
+            self.page_refs.delete(pages)
+            self.update_tool_button_states()
+
+    def _record_undo_insertion(self, pages, origins=None):
+        """
+        Zapisuje w historii indeksy stron właśnie wstawionych do dokumentu.
+        origins - odwołania do stron źródłowych w kolejności rosnących indeksów (None - nowe strony).
+        """
+        if self.pdf_document:
+            self.history.record_insertion(pages)
+            self.page_refs.insert(pages, origins)
+            self.update_tool_button_states()
+
+    def _record_undo_permutation(self, order):
+        """Zapisuje w historii zmianę kolejności stron (strona i po zmianie = strona order[i] przed zmianą)."""
+        if self.pdf_document:
+            self.history.record_permutation(order)
+            self.page_refs.permute(order)
+            self.update_tool_button_states()
             
     def _get_page_bytes(self, page_indices: Set[int]) -> bytes:
-        temp_doc = fitz.open()
-        sorted_indices = sorted(list(page_indices))
-        for index in sorted_indices:
-            temp_doc.insert_pdf(self.pdf_document, from_page=index, to_page=index)
-        page_bytes = temp_doc.write()
-        temp_doc.close()
-        return page_bytes
+        return page_transfer.pages_to_bytes(self.pdf_document, sorted(page_indices))
     
     def copy_selected_pages(self):
         if not self.pdf_document or not self.selected_pages:
@@ -6040,7 +6249,7 @@ class SelectablePDFViewer:
             self._update_status("BŁĄD: Zaznacz strony do wycięcia.")
             return
         try:
-            self._save_state_to_undo()
+            self._record_undo_deletion(self.selected_pages)
             self.clipboard = self._get_page_bytes(self.selected_pages)
             self.pages_in_clipboard_count = len(self.selected_pages)
             pages_to_delete = sorted(list(self.selected_pages), reverse=True)
@@ -6056,10 +6265,8 @@ class SelectablePDFViewer:
             else:
                 self.active_page_index = 0
             
-            self.tk_images.clear()
-            for widget in list(self.scrollable_frame.winfo_children()): widget.destroy()
-            self.thumb_frames.clear()  
-            self._reconfigure_grid()
+            self._refresh_after_structure_change(
+                page_order.deletion_map(len(self.pdf_document) + deleted_count, pages_to_delete))
             self.update_tool_button_states()
             self.update_focus_display()
             self._update_status(f"Wycięto {deleted_count} stron i skopiowano do schowka. Odświeżanie miniatur...")
@@ -6102,37 +6309,27 @@ class SelectablePDFViewer:
             self._perform_paste(target_index)
         else:
             try:
-                self._save_state_to_undo()
-                # Sort selected pages rosnąco (wstawianie od końca nie sprawdza się, bo za każdym razem przesuwamy dokument)
+                # Schowek wstawiany przed/za każdą zaznaczoną stroną jedną operacją (wspólne zasoby kopiowane raz)
                 sorted_pages = sorted(self.selected_pages)
-                new_page_indices = set()
-                offset = 0  # Ile już wstawiono (przesunięcie indeksów po każdej insercji)
 
                 # Pokaż pasek postępu
-                self.show_progressbar(maximum=len(sorted_pages))
+                self.show_progressbar(maximum=len(sorted_pages) * pages_per_paste)
                 self._update_status("Wklejanie stron...")
 
-                for idx, page_index in enumerate(sorted_pages):
-                    if before:
-                        target_index = page_index + offset
-                    else:
-                        target_index = page_index + 1 + offset
-
-                    self.pdf_document.insert_pdf(temp_doc, start_at=target_index)
-                    # Dodajemy do zaznaczenia nowo wstawione indeksy
-                    for i in range(pages_per_paste):
-                        new_page_indices.add(target_index + i)
-                    offset += pages_per_paste
-                    self.update_progressbar(idx + 1)
+                placements = [(0, pages_per_paste - 1, page_index if before else page_index + 1)
+                              for page_index in sorted_pages]
+                new_page_indices = set(page_transfer.insert_pages_at(
+                    self.pdf_document, temp_doc, placements,
+                    progressbar_callback=lambda current, total: self.update_progressbar(current)))
 
                 temp_doc.close()
-                self.selected_pages = new_page_indices
+                self._record_undo_insertion(
+                    new_page_indices,
+                    self.page_refs.source_pages(range(pages_per_paste), data=self.clipboard) * len(sorted_pages))
+                self.selected_pages = PageSelection(new_page_indices)
 
-                self.tk_images.clear()
-                for widget in list(self.scrollable_frame.winfo_children()):
-                    widget.destroy()
-                self.thumb_frames.clear()
-                self._reconfigure_grid()
+                self._refresh_after_structure_change(page_order.insertion_map(
+                    len(self.pdf_document) - len(new_page_indices), new_page_indices))
                 self.update_selection_display()
                 self.update_tool_button_states()
                 self.update_focus_display()
@@ -6150,7 +6347,6 @@ class SelectablePDFViewer:
 
     def _perform_paste(self, target_index: int):
         try:
-            self._save_state_to_undo()
             temp_doc = fitz.open("pdf", self.clipboard)
             num_inserted = len(temp_doc)
             
@@ -6160,15 +6356,14 @@ class SelectablePDFViewer:
             
             self.pdf_document.insert_pdf(temp_doc, start_at=target_index)
             temp_doc.close()
+            self._record_undo_insertion(range(target_index, target_index + num_inserted),
+                                        self.page_refs.source_pages(range(num_inserted), data=self.clipboard))
 
             # Select the newly pasted pages
-            self.selected_pages = set(range(target_index, target_index + num_inserted))
+            self.selected_pages = PageSelection.from_range(target_index, target_index + num_inserted)
 
-            self.tk_images.clear()
-            for widget in list(self.scrollable_frame.winfo_children()):
-                widget.destroy()
-            self.thumb_frames.clear()
-            self._reconfigure_grid()
+            self._refresh_after_structure_change(page_order.insertion_map(
+                len(self.pdf_document) - num_inserted, range(target_index, target_index + num_inserted)))
             self.update_selection_display()
             self.update_tool_button_states()
             self.update_focus_display()
@@ -6207,7 +6402,7 @@ class SelectablePDFViewer:
         deleted_count = 0
         try:
             if save_state:
-                self._save_state_to_undo()
+                self._record_undo_deletion(pages_to_delete)
             
             self.show_progressbar(maximum=len(pages_to_delete))
             self._update_status("Usuwanie stron...")
@@ -6219,13 +6414,12 @@ class SelectablePDFViewer:
             
             self.hide_progressbar()
             self.selected_pages.clear()
-            self.tk_images.clear()
-            for widget in list(self.scrollable_frame.winfo_children()): widget.destroy()
-            self.thumb_frames.clear()  
             self.total_pages = len(self.pdf_document)
             self.active_page_index = min(self.active_page_index, self.total_pages - 1)
             self.active_page_index = max(0, self.active_page_index)
-            self._reconfigure_grid()  
+            # Pozostałe strony zachowują miniatury i ramki - jedna aktualizacja geometrii siatki
+            self._refresh_after_structure_change(
+                page_order.deletion_map(self.total_pages + deleted_count, pages_to_delete))
             self.update_tool_button_states()
             self.update_focus_display()  
             if save_state:
@@ -6376,155 +6570,114 @@ class SelectablePDFViewer:
                 self._update_status(f"BŁĄD Eksportu: Nie udało się zapisać plików: {e}")
 
     def undo(self):
-        """Cofnij ostatnią operację - przywraca stan ze stosu undo."""
-        if len(self.undo_stack) == 0:
+        """Cofnij ostatnią operację - odtwarza tylko strony zmienione przez operację."""
+        if not self.history.can_undo():
             self._update_status("Brak operacji do cofnięcia!")
             return
+        self._apply_history_step(undo=True)
+            
+    def redo(self):
+        """Ponów cofniętą operację - odtwarza tylko strony zmienione przez operację."""
+        if not self.history.can_redo():
+            self._update_status("Brak operacji do ponowienia!")
+            return
+        self._apply_history_step(undo=False)
 
-        # Zapisz bieżący stan na stos redo
-        if self.pdf_document:
-            current_state = self.pdf_document.write()
-            self.redo_stack.append(current_state)
-            if len(self.redo_stack) > self.max_stack_size:
-                self.redo_stack.pop(0)
-
-        # Pobierz poprzedni stan ze stosu undo
-        previous_state_bytes = self.undo_stack.pop()
-        
+    def _apply_history_step(self, undo: bool):
+        """Wspólna logika cofania/ponawiania: stosuje deltę z historii i odświeża miniatury."""
+        done_msg = "Cofnięto ostatnią operację." if undo else "Ponowiono operację."
         try:
-            old_page_count = len(self.pdf_document) if self.pdf_document else 0
-
-            if self.pdf_document:
-                self.pdf_document.close()
-            self.pdf_document = fitz.open("pdf", previous_state_bytes)
+            # Stan stron objętych wpisem przed jego zastosowaniem - do porównania ze stanem po kroku
+            entry = self.history.peek(undo)
+            page_map = entry.page_map(len(self.pdf_document)) if entry is not None else None
+            delta_pages = entry.indices if entry is not None and entry.kind in ('pages', 'rotation') else []
+            fingerprints = self._page_fingerprints(delta_pages)
+            placements = self._capture_thumbnail_placements(delta_pages)
+            # Historia zapisuje treść z powrotem do tych samych obiektów stron - listy wyświetlania są nieaktualne
+            self.display_lists.invalidate_pages(self.pdf_document, delta_pages)
+            if undo:
+                self.pdf_document, changed_pages = self.history.undo(self.pdf_document)
+            else:
+                self.pdf_document, changed_pages = self.history.redo(self.pdf_document)
             new_page_count = len(self.pdf_document)
 
-            # Przywróć selekcję i indeks aktywnej strony
             self.selected_pages.clear()
 
-            # Jeśli liczba stron się nie zmieniła – nie czyść ramek/widgetów!
-            if old_page_count == new_page_count and self.thumb_frames:
-                self.tk_images.clear()
-                # Pokaz progress bar dla odświeżenia miniatur (jeśli plik jest duży)
-                if new_page_count > 10:
-                    self.show_progressbar(maximum=new_page_count, mode="determinate")
-                else:
-                    self.show_progressbar(maximum=1, mode="determinate")
-                self._update_status("Przywracanie dokumentu po cofnięciu...")
-
-                # Validate and clamp active_page_index to valid range
-                if self.pdf_document and new_page_count > 0:
-                    self.active_page_index = min(self.active_page_index, new_page_count - 1)
-                    self.active_page_index = max(0, self.active_page_index)
-                else:
-                    self.active_page_index = 0
+            # Validate and clamp active_page_index to valid range
+            if new_page_count > 0:
+                self.active_page_index = min(self.active_page_index, new_page_count - 1)
+                self.active_page_index = max(0, self.active_page_index)
+            else:
+                self.active_page_index = 0
 
-                for idx in range(new_page_count):
-                    self._update_status("Cofnięto ostatnią operację. Odświeżanie miniatur...")
-                    self.update_single_thumbnail(idx)
-                    if new_page_count > 10:
-                        self.update_progressbar(idx + 1)
+            if page_map is not None:
+                # Wstawienie, usunięcie lub zmiana kolejności - miniatury przechodzą razem ze stronami
+                self._refresh_after_structure_change(page_map)
+            elif changed_pages is not None:
+                # Struktura bez zmian: odśwież tylko strony, których treść lub obrót się zmieniły
+                self._refresh_changed_pages(changed_pages, fingerprints, placements)
             else:
-                # Liczba stron się zmieniła: czyść wszystko i przebuduj siatkę
-                self.selected_pages.clear()
-                self.tk_images.clear()
-                self.thumb_frames.clear()
-                for widget in list(self.scrollable_frame.winfo_children()):
-                    widget.destroy()
-                self._reconfigure_grid()
-                # Validate and clamp active_page_index to valid range
-                if self.pdf_document and new_page_count > 0:
-                    self.active_page_index = min(self.active_page_index, new_page_count - 1)
-                    self.active_page_index = max(0, self.active_page_index)
-                else:
-                    self.active_page_index = 0
+                # Dokument zastąpiony migawką: przebuduj siatkę
+                self._rebuild_thumbnail_grid()
 
             self.update_tool_button_states()
             self.update_focus_display()
             self.hide_progressbar()
-            self._update_status("Cofnięto ostatnią operację. Odświeżanie miniatur...")
+            self._update_status(done_msg)
         except Exception as e:
             self.hide_progressbar()
-            self._update_status(f"BŁĄD: Nie udało się cofnąć operacji: {e}")
-            self.pdf_document = None
+            action = "cofnąć" if undo else "ponowić"
+            self._update_status(f"BŁĄD: Nie udało się {action} operacji: {e}")
             self.update_tool_button_states()
-            
-    def redo(self):
-        """Ponów cofniętą operację - przywraca stan ze stosu redo."""
-        if len(self.redo_stack) == 0:
-            self._update_status("Brak operacji do ponowienia!")
-            return
-
-        # Zapisz bieżący stan na stos undo
-        if self.pdf_document:
-            current_state = self.pdf_document.write()
-            self.undo_stack.append(current_state)
-            if len(self.undo_stack) > self.max_stack_size:
-                self.undo_stack.pop(0)
-
-        # Pobierz następny stan ze stosu redo
-        next_state_bytes = self.redo_stack.pop()
-        
-        try:
-            old_page_count = len(self.pdf_document) if self.pdf_document else 0
-
-            if self.pdf_document:
-                self.pdf_document.close()
-            self.pdf_document = fitz.open("pdf", next_state_bytes)
-            new_page_count = len(self.pdf_document)
 
-            # Przywróć selekcję i indeks aktywnej strony
-            self.selected_pages.clear()
+    def _page_fingerprints(self, indices):
+        """
+        Odciski stron: (skrót treści bez obrotu, obrót). Skrót nie zależy od numerów xref, więc strona
+        przywrócona z historii (nowe obiekty treści i zasobów) z tą samą treścią ma ten sam odcisk.
+        """
+        if not indices:
+            return {}
+        hasher = PageContentHasher(self.pdf_document)
+        return {i: (hasher.page_hash(i, include_rotation=False), self.pdf_document[i].rotation) for i in indices}
 
-            # Jeśli liczba stron się nie zmieniła – nie czyść ramek/widgetów!
-            if old_page_count == new_page_count and self.thumb_frames:
-                self.tk_images.clear()
-                # Pokaz progress bar dla odświeżenia miniatur (jeśli plik jest duży)
-                if new_page_count > 10:
-                    self.show_progressbar(maximum=new_page_count, mode="determinate")
-                else:
-                    self.show_progressbar(maximum=1, mode="determinate")
-                self._update_status("Przywracanie dokumentu po ponowieniu...")
+    def _refresh_changed_pages(self, pages, fingerprints, placements):
+        """
+        Odświeża miniatury stron objętych krokiem historii na podstawie odcisków sprzed i po kroku.
 
-                # Validate and clamp active_page_index to valid range
-                if self.pdf_document and new_page_count > 0:
-                    self.active_page_index = min(self.active_page_index, new_page_count - 1)
-                    self.active_page_index = max(0, self.active_page_index)
-                else:
-                    self.active_page_index = 0
+        Strony bez zmian zachowują miniatury, strony różniące się tylko obrotem dostają miniaturę
+        obróconą z cache, pozostałe są renderowane w tle.
 
-                for idx in range(new_page_count):
-                    self._update_status("Ponowiono operację. Odświeżanie miniatur...")
-                    self.update_single_thumbnail(idx)
-                    if new_page_count > 10:
-                        self.update_progressbar(idx + 1)
-            else:
-                # Liczba stron się zmieniła: czyść wszystko i przebuduj siatkę
-                self.selected_pages.clear()
-                self.tk_images.clear()
-                self.thumb_frames.clear()
-                for widget in list(self.scrollable_frame.winfo_children()):
-                    widget.destroy()
-                self._reconfigure_grid()
-                # Validate and clamp active_page_index to valid range
-                if self.pdf_document and new_page_count > 0:
-                    self.active_page_index = min(self.active_page_index, new_page_count - 1)
-                    self.active_page_index = max(0, self.active_page_index)
-                else:
-                    self.active_page_index = 0
+        Args:
+            pages: Indeksy stron objętych krokiem
+            fingerprints: Odciski stron sprzed kroku (_page_fingerprints)
+            placements: Położenie stron sprzed kroku (_capture_thumbnail_placements)
+        """
+        rotated = []
+        for page_index, fingerprint in self._page_fingerprints(pages).items():
+            previous = fingerprints.get(page_index)
+            if fingerprint == previous:
+                continue
+            if previous is not None and previous[0] == fingerprint[0]:
+                rotated.append(page_index)
+                continue
+            self._clear_thumbnail_cache(page_index)
+            self._refresh_thumbnail_frame(page_index, self.thumb_width, render=False)
+        if rotated:
+            self._apply_thumbnail_transform(rotated, placements, ROTATION)
+        else:
+            self._request_thumbnails()
 
-            self.update_tool_button_states()
-            self.update_focus_display()
-            self.hide_progressbar()
-            self._update_status("Ponowiono operację. Odświeżanie miniatur...")
-        except Exception as e:
-            self.hide_progressbar()
-            self._update_status(f"BŁĄD: Nie udało się ponowić operacji: {e}")
-            self.pdf_document = None
-            self.update_tool_button_states()
+    def save_document(self, on_saved=None):
+        """
+        Zapisuje dokument profilem z preferencji (zapis przyrostowy od razu, pozostałe w tle).
         
-    def save_document(self):
+        Args:
+            on_saved: Funkcja wywoływana po udanym zapisie (np. zamknięcie programu)
+        """
         if not self.pdf_document: return
+        if self.background_saver.running:
+            self._update_status("Trwa zapisywanie dokumentu (ESC - anuluj zapis).")
+            return
         
         # Użyj domyślnej ścieżki zapisu lub ostatniej użytej ścieżki
         default_save_path = self.prefs_manager.get('default_save_path', '')
@@ -6548,18 +6701,104 @@ class SelectablePDFViewer:
             import os
             self.prefs_manager.set('last_save_path', os.path.dirname(filepath))
         
+        profile_name = self.prefs_manager.get('save_profile', DEFAULT_SAVE_PROFILE)
+        profile = get_profile(profile_name)
+        image_preset = self.prefs_manager.get('save_image_preset', '')
+        image_preset = image_preset if image_preset in IMAGE_PRESETS else None
+        version = self.history.version
         try:
-            self.pdf_document.save(filepath, garbage=4, clean=True, pretty=True)  
-            self._update_status(f"Dokument pomyślnie zapisany jako: {filepath}")
-            self.prefs_manager.set('last_saved_file', filepath) 
-            # Po zapisaniu czyścimy stosy undo/redo
-            self.undo_stack.clear()
-            self.redo_stack.clear()
-            print("DEBUG: Czyszczenie historii save_document")
-            self.update_tool_button_states() 
+            if not image_preset and can_save_incrementally(self.pdf_document, filepath, profile_name):
+                # Dopisanie zmian na końcu pliku źródłowego trwa milisekundy - bez procesu w tle
+                save_incrementally(self.pdf_document)
+                self._on_document_saved(filepath, version, "zapis przyrostowy")
+                if on_saved:
+                    on_saved()
+                return
             
+            source_path = self._current_source_path()
+            if source_path and not is_source_file(self.pdf_document, filepath):
+                # Dokument bez zmian od otwarcia lub zapisu - proces zapisu czyta plik sam, bez migawki
+                data = None
+            else:
+                source_path = None
+                # Migawka: dalsza edycja nie wpływa na zapisywany plik. Blokuje wątek Tk (ok. 0.1 s/MB,
+                # patrz benchmark_save.py) - dokumentu nie wolno w tym czasie czytać z innego wątku
+                self._update_status(f"Zapisywanie ({profile.label}): przygotowanie migawki dokumentu...")
+                data = self.pdf_document.tobytes(**SNAPSHOT_OPTIONS)
+            if is_source_file(self.pdf_document, filepath):
+                # Plik źródłowy zostanie podmieniony - dokument roboczy nie może dalej czytać z niego obiektów
+                self.display_lists.invalidate_pages(self.pdf_document)
+                self.pdf_document.close()
+                self.pdf_document = fitz.open("pdf", data)
+            self.show_progressbar(mode="indeterminate")
+            self.background_saver.start(
+                data, filepath, profile_name,
+                on_done=lambda success, error: self._on_background_save_done(
+                    filepath, version, profile.label, success, error, on_saved),
+                on_stage=lambda stage: self._update_status(f"Zapisywanie ({profile.label}): {stage}... (ESC - anuluj)"),
+                image_preset=image_preset,
+                before_replace=lambda: self._release_render_documents(filepath),
+                source_path=source_path,
+            )
         except Exception as e:
+            self.hide_progressbar()
             self._update_status(f"BŁĄD: Nie udało się zapisać pliku: {e}")
+    
+    def _release_render_documents(self, filepath):
+        """Przed podmianą istniejącego pliku wątki renderujące zamykają swoje uchwyty (w Windows blokują podmianę)"""
+        if not os.path.exists(filepath):
+            return
+        self.thumbnail_service.release_documents()
+        # Kolejne zlecenie miniatur przekaże wątkom źródło od nowa
+        self._render_source_key = None
+
+    def _on_background_save_done(self, filepath, version, profile_label, success, error, on_saved):
+        self.hide_progressbar()
+        if not success:
+            self._update_status(f"BŁĄD: Nie udało się zapisać pliku: {error}")
+            return
+        self._on_document_saved(filepath, version, profile_label, reopen=True)
+        if on_saved:
+            on_saved()
+    
+    def _on_document_saved(self, filepath, version, profile_label, reopen=False):
+        """
+        Po zapisie: plik staje się źródłem stron, a historia jest czyszczona - o ile dokument się nie zmienił.
+        
+        Args:
+            reopen: Plik zapisano w całości (nie przyrostowo) - dokument roboczy jest otwierany z niego
+                    ponownie, więc nie trzyma migawki w pamięci, a kolejny szybki zapis może być przyrostowy
+        """
+        self.prefs_manager.set('last_saved_file', filepath) 
+        if self.pdf_document is None or self.history.version != version:
+            # Dokument zmieniono (lub zamknięto) w trakcie zapisu - plik zawiera stan z chwili rozpoczęcia
+            self._update_status(f"Zapisano stan dokumentu sprzed ostatnich zmian jako: {filepath}")
+            return
+        if reopen:
+            try:
+                saved_doc = fitz.open(filepath)
+            except Exception as e:
+                print(f"[SAVE] Nie udało się ponownie otworzyć zapisanego pliku: {e}")
+            else:
+                self.display_lists.invalidate_pages(self.pdf_document)
+                self.pdf_document.close()
+                self.pdf_document = saved_doc
+        # Zapisany plik zawiera wszystkie strony w bieżącej kolejności - staje się ich jedynym źródłem
+        self.page_refs.reset(len(self.pdf_document), path=filepath)
+        # Po zapisaniu czyścimy stosy undo/redo
+        self.history.clear()
+        if is_source_file(self.pdf_document, filepath):
+            # Dokument roboczy odpowiada plikowi - wątki renderujące mogą czytać wprost z dysku
+            self._render_source_path = filepath
+            self._render_path_key = self._current_render_key()
+            self._render_source_key = None
+        self._update_status(f"Dokument pomyślnie zapisany jako: {filepath} ({profile_label})")
+        self.update_tool_button_states() 
+    
+    def _cancel_background_save(self):
+        self.background_saver.cancel()
+        self.hide_progressbar()
+        self._update_status("Anulowano zapisywanie - plik docelowy nie został zmieniony.")
             
     def rotate_selected_page(self, angle):
         if not self.pdf_document or not self.selected_pages: 
@@ -6574,7 +6813,8 @@ class SelectablePDFViewer:
         
         pages_to_rotate = sorted(list(self.selected_pages))
         try:
-            self._save_state_to_undo()
+            placements = self._capture_thumbnail_placements(pages_to_rotate)
+            self._record_undo_rotation(pages_to_rotate)
             self.show_progressbar(maximum=len(pages_to_rotate))
             rotated_count = 0
             for idx, page_index in enumerate(pages_to_rotate):
@@ -6587,14 +6827,8 @@ class SelectablePDFViewer:
 
             self.hide_progressbar()
             
-            # Optymalizacja: odśwież tylko zmienione miniatury
-            self.show_progressbar(maximum=len(pages_to_rotate))
-            for i, page_index in enumerate(pages_to_rotate):
-                self._update_status(f"Obrócono {rotated_count} stron o {angle} stopni. Odświeżanie miniatur...")
-               
-                self.update_single_thumbnail(page_index)
-                self.update_progressbar(i + 1)
-            self.hide_progressbar()
+            # Miniatury obróconych stron powstają z obrazów w cache (transpozycja) - bez renderowania
+            self._apply_thumbnail_transform(pages_to_rotate, placements, ROTATION)
             
             self.update_tool_button_states()
             self.update_focus_display()
@@ -6629,8 +6863,6 @@ class SelectablePDFViewer:
         width, height = (595.276, 841.89)  # Domyślny A4
 
         try:
-            self._save_state_to_undo()
-
             sorted_pages = sorted(self.selected_pages)
             new_page_indices = set()
             offset = 0
@@ -6661,13 +6893,11 @@ class SelectablePDFViewer:
                 offset += 1
                 self.update_progressbar(idx + 1)
 
-            self.selected_pages = new_page_indices
+            self._record_undo_insertion(new_page_indices)
+            self.selected_pages = PageSelection(new_page_indices)
 
-            self.tk_images.clear()
-            for widget in list(self.scrollable_frame.winfo_children()):
-                widget.destroy()
-            self.thumb_frames.clear()
-            self._reconfigure_grid()
+            self._refresh_after_structure_change(page_order.insertion_map(
+                len(self.pdf_document) - len(new_page_indices), new_page_indices))
             self.update_selection_display()
             self.update_tool_button_states()
             self.update_focus_display()
@@ -6702,43 +6932,28 @@ class SelectablePDFViewer:
                 return
 
         try:
-            self._save_state_to_undo()
-
             # Sort pages in ascending order
             sorted_pages = sorted(self.selected_pages)
-            new_page_indices = set()
-            offset = 0
             
             self.show_progressbar(maximum=len(sorted_pages))
             self._update_status("Duplikowanie stron...")
 
-            for idx_progress, original_index in enumerate(sorted_pages):
-                # Po każdej insercji kolejne strony są przesunięte o offset
-                idx = original_index + offset
-
-                temp_doc = fitz.open()
-                temp_doc.insert_pdf(self.pdf_document, from_page=idx, to_page=idx)
-                self.pdf_document.insert_pdf(
-                    temp_doc,
-                    from_page=0,
-                    to_page=0,
-                    start_at=idx + 1
-                )
-                temp_doc.close()
-                # Wstawiona strona jest zawsze na pozycji idx+1
-                new_page_indices.add(idx + 1)
-                offset += 1
-                self.update_progressbar(idx_progress + 1)
+            # Kopie wszystkich stron w jednym dokumencie pomocniczym, potem każda kopia wstawiana za oryginałem
+            temp_doc = page_transfer.extract_pages(self.pdf_document, sorted_pages)
+            placements = [(k, k, original_index + 1) for k, original_index in enumerate(sorted_pages)]
+            new_page_indices = set(page_transfer.insert_pages_at(
+                self.pdf_document, temp_doc, placements,
+                progressbar_callback=lambda current, total: self.update_progressbar(current)))
+            temp_doc.close()
 
             self.hide_progressbar()
-            self.selected_pages = new_page_indices
+            # Kopie wskazują te same strony źródłowe co oryginały
+            self._record_undo_insertion(new_page_indices, self.page_refs.refs(sorted_pages))
+            self.selected_pages = PageSelection(new_page_indices)
 
-            # Odświeżenie GUI
-            self.tk_images.clear()
-            for widget in list(self.scrollable_frame.winfo_children()):
-                widget.destroy()
-            self.thumb_frames.clear()
-            self._reconfigure_grid()
+            # Odświeżenie GUI - renderowane są tylko kopie
+            self._refresh_after_structure_change(page_order.insertion_map(
+                len(self.pdf_document) - len(new_page_indices), new_page_indices))
             self.update_selection_display()
             self.update_tool_button_states()
             self.update_focus_display()
@@ -6758,61 +6973,25 @@ class SelectablePDFViewer:
             return
         
         try:
-            self._save_state_to_undo()
-            
-            # Pokaż pasek postępu (4 kroki: kopiuj stronę 1, kopiuj stronę 2, usuń, wstaw)
-            self.show_progressbar(maximum=4)
-            self._update_status("Zamiana stron miejscami...")
+            page1_idx, page2_idx = sorted(self.selected_pages)
             
-            # Get the two page indices
-            pages = sorted(list(self.selected_pages))
-            page1_idx = pages[0]
-            page2_idx = pages[1]
-            
-            # Create temporary documents for both pages
-            temp_doc1 = fitz.open()
-            temp_doc1.insert_pdf(self.pdf_document, from_page=page1_idx, to_page=page1_idx)
-            self.update_progressbar(1)
-            
-            temp_doc2 = fitz.open()
-            temp_doc2.insert_pdf(self.pdf_document, from_page=page2_idx, to_page=page2_idx)
-            self.update_progressbar(2)
-            
-            # Delete both pages (delete higher index first to maintain lower index)
-            self.pdf_document.delete_page(page2_idx)
-            self.pdf_document.delete_page(page1_idx)
-            self.update_progressbar(3)
-            
-            # Insert them in swapped positions
-            self.pdf_document.insert_pdf(temp_doc2, from_page=0, to_page=0, start_at=page1_idx)
-            self.pdf_document.insert_pdf(temp_doc1, from_page=0, to_page=0, start_at=page2_idx)
-            self.update_progressbar(4)
-            
-            temp_doc1.close()
-            temp_doc2.close()
-            
-            # Odśwież tylko zamienione miniatury
-            self.update_single_thumbnail(page1_idx)
-            self.update_single_thumbnail(page2_idx)
+            # Zamiana w drzewie stron - odświeżane są tylko zamienione miniatury
+            self._apply_page_order(page_order.swapped_order(len(self.pdf_document), page1_idx, page2_idx))
             
             self.update_selection_display()
-            self.update_tool_button_states()
-            self.update_focus_display()
-            self.hide_progressbar()
             self._update_status(f"Zamieniono strony {page1_idx + 1} i {page2_idx + 1} miejscami.")
         except Exception as e:
-            self.hide_progressbar()
             self._update_status(f"BŁĄD: Wystąpił błąd podczas zamiany stron: {e}")
   
     def merge_pages_to_grid(self):
         """
-        Scala zaznaczone strony w siatkę na nowym arkuszu.
-        Bitmapy renderowane są w 600dpi (bardzo wysoka jakość do druku).
-        Przed renderowaniem każda strona jest automatycznie obracana jeśli jej orientacja nie pasuje do komórki siatki.
+        Rozmieszcza zaznaczone strony w siatce na nowych arkuszach (tylu, ile wymaga wybrany układ:
+        kolejno, powielanie, wytnij i ułóż, broszura).
+        Domyślnie strony umieszczane są wektorowo (Form XObject) - bez renderowania i bez utraty jakości;
+        tryb "spłaszcz" renderuje komórki do bitmap w rozdzielczości wybranej w dialogu.
+        Każda strona jest automatycznie obracana jeśli jej orientacja nie pasuje do komórki siatki.
         Marginesy i odstępy pobierane są z dialogu (osobno dla każdej krawędzi/osi).
         """
-        import io
-
         if not self.pdf_document:
             self._update_status("BŁĄD: Otwórz najpierw dokument PDF.")
             return
@@ -6830,96 +7009,34 @@ class SelectablePDFViewer:
             return
 
         try:
-            sheet_width_pt = params["sheet_width_mm"] * self.MM_TO_POINTS
-            sheet_height_pt = params["sheet_height_mm"] * self.MM_TO_POINTS
-            margin_top_pt = params["margin_top_mm"] * self.MM_TO_POINTS
-            margin_bottom_pt = params["margin_bottom_mm"] * self.MM_TO_POINTS
-            margin_left_pt = params["margin_left_mm"] * self.MM_TO_POINTS
-            margin_right_pt = params["margin_right_mm"] * self.MM_TO_POINTS
-            spacing_x_pt = params["spacing_x_mm"] * self.MM_TO_POINTS
-            spacing_y_pt = params["spacing_y_mm"] * self.MM_TO_POINTS
             rows = params["rows"]
             cols = params["cols"]
+            mode = params.get("mode", page_imposition.MODE_VECTOR)
+            layout = params.get("layout", page_imposition.LAYOUT_GRID)
+            dpi = params.get("dpi", 600)
 
-            TARGET_DPI = params.get("dpi", 600)
-            PT_TO_INCH = 1 / 72
-
-            total_cells = rows * cols
-
-            # Poprawka: powielaj tylko jeśli jedna strona, przy wielu nie powielaj żadnej
-            if num_pages == 1:
-                source_pages = [selected_indices[0]] * total_cells
-            else:
-                source_pages = [selected_indices[i] if i < num_pages else None for i in range(total_cells)]
-
-            # Oblicz rozmiar komórki (punkt PDF)
-            if cols == 1:
-                cell_width = sheet_width_pt - margin_left_pt - margin_right_pt
-            else:
-                cell_width = (sheet_width_pt - margin_left_pt - margin_right_pt - (cols - 1) * spacing_x_pt) / cols
-            if rows == 1:
-                cell_height = sheet_height_pt - margin_top_pt - margin_bottom_pt
-            else:
-                cell_height = (sheet_height_pt - margin_top_pt - margin_bottom_pt - (rows - 1) * spacing_y_pt) / rows
-
-            self._save_state_to_undo()
-            new_page = self.pdf_document.new_page(width=sheet_width_pt, height=sheet_height_pt)
-
-            self.show_progressbar(maximum=len(source_pages))
+            self.show_progressbar(maximum=len(page_imposition.plan_sheets(selected_indices, rows * cols, layout)))
             self._update_status("Scalanie stron w siatkę...")
-            
-            for idx, src_idx in enumerate(source_pages):
-                row = idx // cols
-                col = idx % cols
-                if row >= rows:
-                    break
-                if src_idx is None:
-                    continue  # Pusta komórka
-
-                x = margin_left_pt + col * (cell_width + spacing_x_pt)
-                y = margin_top_pt + row * (cell_height + spacing_y_pt)
-
-                src_page = self.pdf_document[src_idx]
-                page_rect = src_page.rect
-                page_w = page_rect.width
-                page_h = page_rect.height
-
-                # Automatyczny obrót jeśli orientacja strony nie pasuje do komórki
-                page_landscape = page_w > page_h
-                cell_landscape = cell_width > cell_height
-                rotate = 0
-                if page_landscape != cell_landscape:
-                    rotate = 90  # Obróć o 90 stopni
-
-                # Skala renderowania: bitmapa ma dokładnie tyle pikseli, ile wynosi rozmiar komórki w punktach * 600 / 72
-                bitmap_w = int(round(cell_width * TARGET_DPI * PT_TO_INCH))
-                bitmap_h = int(round(cell_height * TARGET_DPI * PT_TO_INCH))
-
-                if rotate == 90:
-                    scale_x = bitmap_w / page_h
-                    scale_y = bitmap_h / page_w
-                else:
-                    scale_x = bitmap_w / page_w
-                    scale_y = bitmap_h / page_h
-
-                # Renderuj bitmapę w bardzo wysokiej rozdzielczości, z ewentualnym obrotem
-                pix = src_page.get_pixmap(matrix=fitz.Matrix(scale_x, scale_y).prerotate(rotate), alpha=False)
-                img_bytes = pix.tobytes("png")
-                rect = fitz.Rect(x, y, x + cell_width, y + cell_height)
-                new_page.insert_image(rect, stream=img_bytes)
-                self.update_progressbar(idx + 1)
+            sheets = page_imposition.impose(
+                self.pdf_document, selected_indices, rows, cols,
+                params["sheet_width_mm"] * self.MM_TO_POINTS, params["sheet_height_mm"] * self.MM_TO_POINTS,
+                params["margin_top_mm"] * self.MM_TO_POINTS, params["margin_bottom_mm"] * self.MM_TO_POINTS,
+                params["margin_left_mm"] * self.MM_TO_POINTS, params["margin_right_mm"] * self.MM_TO_POINTS,
+                params["spacing_x_mm"] * self.MM_TO_POINTS, params["spacing_y_mm"] * self.MM_TO_POINTS,
+                layout=layout, mode=mode, target_dpi=dpi,
+                progressbar_callback=lambda current, total: self.update_progressbar(current),
+                display_lists=self.display_lists
+            )
+            self._record_undo_insertion(sheets)
 
-            # Odświeżenie GUI
+            # Odświeżenie GUI - renderowane są tylko nowe arkusze
             self.hide_progressbar()
-            self.tk_images.clear()
-            for widget in list(self.scrollable_frame.winfo_children()):
-                widget.destroy()
-            self.thumb_frames.clear()
-            self._reconfigure_grid()
+            self._refresh_after_structure_change(page_order.insertion_map(len(self.pdf_document) - len(sheets), sheets))
             self.update_tool_button_states()
             self.update_focus_display()
+            content = "wektorowo" if mode == page_imposition.MODE_VECTOR else f"bitmapy {dpi}dpi"
             self._update_status(
-                f"Scalono {num_pages} stron w siatkę {rows}x{cols} na nowym arkuszu {params['format_name']} (bitmapy 600dpi). Odświeżanie miniatur..."
+                f"Scalono {num_pages} stron w siatkę {rows}x{cols} na {len(sheets)} nowych arkuszach {params['format_name']} ({content}). Odświeżanie miniatur..."
             )
         except Exception as e:
             self.hide_progressbar()
@@ -6928,6 +7045,12 @@ class SelectablePDFViewer:
             traceback.print_exc()
             
     # --- Metody obsługi widoku/GUI (Bez zmian) ---
+    def _on_canvas_yscroll(self, first, last):
+        """Aktualizuje pasek przewijania, przypisuje ramki do widocznych stron i zleca ich miniatury."""
+        self.scrollbar.set(first, last)
+        self._refresh_virtual_grid()
+        self._request_visible_thumbnails()
+
     def _on_mousewheel(self, event):
         # Oblicz różnicę w pozycji yview w zależności od scrolla
         step = 0.05  # Im mniejsza liczba, tym łagodniejsze przewijanie (np. 0.02)
@@ -6975,6 +7098,7 @@ class SelectablePDFViewer:
     def _reconfigure_grid(self, event=None):
         # Poprawka: sprawdzanie, czy dokument istnieje i nie jest zamknięty (NIE używaj "not self.pdf_document"!)
         if self.pdf_document is None or getattr(self.pdf_document, "is_closed", False):
+            self._reset_virtual_grid()
             self.canvas.config(scrollregion=self.canvas.bbox("all"))
             return
 
@@ -6991,6 +7115,7 @@ class SelectablePDFViewer:
 
         # Poprawka: sprawdzanie, czy dokument istnieje i nie jest zamknięty (NIE używaj "not self.pdf_document"!)
         if self.pdf_document is None or getattr(self.pdf_document, "is_closed", False):
+            self._reset_virtual_grid()
             self.canvas.config(scrollregion=self.canvas.bbox("all"))
             return
 
@@ -7009,33 +7134,14 @@ class SelectablePDFViewer:
 
         column_width = self.thumb_width
 
-        # Clean up non-thumbnail widgets
-        for widget in list(self.scrollable_frame.grid_slaves()):
-             if not isinstance(widget, ThumbnailFrame):
-                 widget.destroy()
-
-        # Configure grid columns
-        for col in range(self.max_cols):  
-             if col < num_cols:
-                 self.scrollable_frame.grid_columnconfigure(col, weight=0, minsize=column_width)
-             else:
-                 self.scrollable_frame.grid_columnconfigure(col, weight=0, minsize=0)
+        # Model siatki dla wszystkich stron; ramki powstają tylko dla widocznych wierszy
+        self._build_grid_layout(num_cols, column_width)
+        self.canvas.yview_moveto(0.0)
+        self._refresh_virtual_grid()
 
-        # Create or update widgets
-        if not self.thumb_frames:
-             self._create_widgets(num_cols, column_width)
-        else:
-             self._update_widgets(num_cols, column_width)
-
-        self.scrollable_frame.update_idletasks()  
-        bbox = self.canvas.bbox("all")
-        if bbox is not None:
-              self.canvas.config(scrollregion=(bbox[0], 0, bbox[2], bbox[3]))
-              self.canvas.yview_moveto(0.0)  
-              self.canvas.coords(self.canvas_window_id, 0, 0)
-              self.canvas.yview_moveto(0.0)
-        else:
-              self.canvas.config(scrollregion=(0, 0, actual_canvas_width, 10))
+        self.update_selection_display()
+        self.update_focus_display()
+        self._request_thumbnails(column_width)
 
 
     def _get_page_size_label(self, page_index):
@@ -7079,112 +7185,384 @@ class SelectablePDFViewer:
         return f"{width_mm} x {height_mm} mm"
 
 
-    def _create_widgets(self, num_cols, column_width):
-        """Tworzy wszystkie ramki miniatur dla aktualnego dokumentu PDF."""
-        page_count = len(self.pdf_document)
-        # Dodaj pasek postępu tylko przy większej liczbie stron (np. 10+), by nie przeszkadzać przy szybkim ładowaniu
-        if page_count > 10:
-            self.show_progressbar(maximum=page_count, mode="determinate")
-        for i in range(page_count):
-            page_frame = ThumbnailFrame(
-                parent=self.scrollable_frame,  
-                viewer_app=self,  
-                page_index=i,  
-                column_width=column_width
-            )
-            page_frame.grid(row=i // num_cols, column=i % num_cols, padx=self.THUMB_PADDING, pady=self.THUMB_PADDING, sticky="n")  
-            self.thumb_frames[i] = page_frame  
-            if page_count > 10:
-                self.update_progressbar(i + 1)
-        if page_count > 10:
-            self.hide_progressbar()
-        self.update_selection_display()
-        self.update_focus_display()
+    # ====================================================================
+    # WIRTUALNA SIATKA MINIATUR
+    # ====================================================================
+
+    def _thumbnail_height(self, page_index, column_width):
+        """Wysokość obrazu miniatury strony dla danej szerokości kolumny."""
+        page_rect = self.pdf_document.load_page(page_index).rect
+        aspect_ratio = page_rect.height / page_rect.width if page_rect.width != 0 else 1
+        return max(1, int(column_width * aspect_ratio))
 
-    def _update_widgets(self, num_cols, column_width):
+    def _get_grid_layout(self) -> Optional[ThumbnailGridLayout]:
+        """Zwraca model siatki, jeśli odpowiada bieżącemu dokumentowi."""
+        layout = self._grid_layout
+        if layout is None or self.pdf_document is None or getattr(self.pdf_document, "is_closed", False):
+            return None
+        if layout.page_count != len(self.pdf_document):
+            return None
+        return layout
+
+    def _build_grid_layout(self, num_cols, column_width):
+        """Wylicza geometrię siatki dla wszystkich stron i ustawia obszar przewijania."""
         page_count = len(self.pdf_document)
-        frame_bg = "#F5F5F5"
-
-        # Dodaj brakujące ramki miniaturek
-        for i in range(page_count):
-            if i not in self.thumb_frames:
-                page_frame = ThumbnailFrame(
-                    parent=self.scrollable_frame,
-                    viewer_app=self,
-                    page_index=i,
-                    column_width=column_width
-                )
-                self.thumb_frames[i] = page_frame
-
-        # Usuń nadmiarowe ramki (jeśli stron jest mniej niż widgetów)
-        to_remove = [idx for idx in self.thumb_frames if idx >= page_count]
-        for idx in to_remove:
-            self.thumb_frames[idx].destroy()
-            del self.thumb_frames[idx]
-
-        for i in range(page_count):
-            page_frame = self.thumb_frames[i]
-            page_frame.grid(row=i // num_cols, column=i % num_cols, padx=self.THUMB_PADDING, pady=self.THUMB_PADDING, sticky="n")
-            img_tk = self._render_and_scale(i, column_width)
-            page_frame.img_label.config(image=img_tk)
-            page_frame.img_label.image = img_tk
-            outer_frame_children = page_frame.outer_frame.winfo_children()
-            if len(outer_frame_children) > 2:
-                outer_frame_children[1].config(text=f"Strona {i + 1}", bg=frame_bg)
-                outer_frame_children[2].config(text=self._get_page_size_label(i), bg=frame_bg)
+        image_heights = [self._thumbnail_height(i, column_width) for i in range(page_count)]
+        extra_width, extra_height = self._measure_frame_chrome(column_width) if page_count else (0, 0)
+        self._grid_column_width = column_width
+        self._grid_layout = ThumbnailGridLayout(
+            image_heights, num_cols,
+            cell_width=column_width + extra_width,
+            chrome_height=extra_height,
+            padding=self.THUMB_PADDING
+        )
+        self._apply_grid_scrollregion()
+
+    def _apply_grid_scrollregion(self):
+        """Ustawia obszar przewijania płótna na rozmiar wirtualnej siatki."""
+        layout = self._grid_layout
+        self.canvas.config(scrollregion=(0, 0, max(1, layout.total_width), max(1, layout.total_height)))
+        self.canvas.itemconfigure(self.canvas_window_id, width=max(1, layout.total_width))
+
+    def _measure_frame_chrome(self, column_width):
+        """Mierzy część rozmiaru ramki miniatury niezależną od obrazu (marginesy, etykiety)."""
+        if self._frame_chrome is None:
+            frame = self._acquire_frame(0, column_width)
+            frame.update_idletasks()
+            self._frame_chrome = (
+                frame.winfo_reqwidth() - column_width,
+                frame.winfo_reqheight() - self._thumbnail_height(0, column_width)
+            )
+            self._spare_frames.append(frame)
+        return self._frame_chrome
+
+    def _acquire_frame(self, page_index, column_width):
+        """Pobiera ramkę z puli (przypisując ją do strony) lub tworzy nową."""
+        if self._spare_frames:
+            frame = self._spare_frames.pop()
+            frame.bind_page(page_index, column_width)
+            return frame
+        return ThumbnailFrame(
+            parent=self.scrollable_frame,
+            viewer_app=self,
+            page_index=page_index,
+            column_width=column_width
+        )
 
-        self.update_selection_display()
-        self.update_focus_display()
+    def _reset_virtual_grid(self):
+        """Porzuca model siatki (brak dokumentu) i przywraca naturalny rozmiar okna płótna."""
+        self._grid_layout = None
+        self._spare_frames = [frame for frame in self._spare_frames if frame.winfo_exists()]
+        self.canvas.coords(self.canvas_window_id, 0, 0)
+        self.canvas.itemconfigure(self.canvas_window_id, width=0, height=0)
 
-    
-    def _render_and_scale(self, page_index, column_width):
-        # Diagnostyka cache miniaturek
-        if page_index in self.tk_images and column_width in self.tk_images[page_index]:
-            print(f"[CACHE] Używam cache dla strony {page_index}, szerokość {column_width}")
-            return self.tk_images[page_index][column_width]
+    def _refresh_virtual_grid(self):
+        """
+        Dopasowuje żywe ramki do bieżącego widoku. Ramki stron, które wyszły poza widok,
+        wracają do puli i są przypisywane stronom, które weszły w widok.
+        """
+        layout = self._get_grid_layout()
+        if layout is None:
+            return
 
-        print(f"[RENDER] Generuję miniaturę dla strony {page_index}, szerokość {column_width}")
-        page = self.pdf_document.load_page(page_index)
-        page_width = page.rect.width
-        page_height = page.rect.height
-        aspect_ratio = page_height / page_width if page_width != 0 else 1
-        final_thumb_width = column_width
-        final_thumb_height = int(final_thumb_width * aspect_ratio)
-        if final_thumb_width <= 0:
-            final_thumb_width = 1
-        if final_thumb_height <= 0:
-            final_thumb_height = 1
+        # Pełne odświeżenie widoku niszczy wszystkie ramki - usuń martwe referencje
+        if any(not frame.winfo_exists() for frame in self.thumb_frames.values()):
+            self.thumb_frames = {i: f for i, f in self.thumb_frames.items() if f.winfo_exists()}
+        self._spare_frames = [frame for frame in self._spare_frames if frame.winfo_exists()]
+
+        # Okno z ramkami ma wysokość widoku i przesuwa się razem z nim,
+        # więc wysokość wirtualnego płótna nie jest ograniczona rozmiarem widgetu
+        view_top = int(self.canvas.canvasy(0))
+        view_height = max(1, self.canvas.winfo_height())
+        self.canvas.coords(self.canvas_window_id, 0, view_top)
+        self.canvas.itemconfigure(self.canvas_window_id, height=view_height)
+
+        visible = layout.pages_in_range(view_top, view_top + view_height)
+        for index in [i for i in self.thumb_frames if i not in visible]:
+            frame = self.thumb_frames.pop(index)
+            frame.place_forget()
+            self._spare_frames.append(frame)
+
+        column_width = self._grid_column_width
+        for index in visible:
+            frame = self.thumb_frames.get(index)
+            if frame is None:
+                frame = self._acquire_frame(index, column_width)
+                self.thumb_frames[index] = frame
+                self._style_acquired_frame(index, frame)
+            elif frame.column_width != column_width:
+                frame.bind_page(index, column_width)
+            x, y = layout.page_position(index)
+            frame.place(x=x, y=y - view_top)
+
+    def _style_acquired_frame(self, index, frame):
+        """Nadaje ramce przypisanej do strony styl zaznaczenia i fokusu i zapamiętuje go jako pokazany."""
+        selected = index in self.selected_pages
+        self._apply_selection_style(frame, selected)
+        if selected:
+            self._styled_selection.add(index)
+        else:
+            self._styled_selection.discard(index)
+        focused = index == self.active_page_index and not self._focus_hidden
+        if focused and self._styled_focus != index:
+            # Fokus przeszedł na tę stronę bez update_focus_display - zdejmij go z poprzedniej ramki
+            previous = self.thumb_frames.get(self._styled_focus)
+            if previous is not None and previous is not frame:
+                self._apply_focus_style(previous, False)
+            self._styled_focus = index
+        self._apply_focus_style(frame, focused)
+
+    def _rebuild_thumbnail_grid(self):
+        """Przebudowuje siatkę miniatur od zera (cache miniatur i ramki są usuwane)."""
+        self.tk_images.clear()
+        for widget in list(self.scrollable_frame.winfo_children()):
+            widget.destroy()
+        self.thumb_frames.clear()
+        self._styled_selection = PageSelection()
+        self._reconfigure_grid()
 
-        print(f"final_thumb_width={final_thumb_width}, final_thumb_height={final_thumb_height}")
+    def _refresh_after_structure_change(self, new_indices):
+        """
+        Odświeża siatkę po usunięciu, wstawieniu lub zmianie kolejności stron bez jej przebudowy.
 
-        mat = fitz.Matrix(self.render_dpi_factor, self.render_dpi_factor)
-        pix = page.get_pixmap(matrix=mat, alpha=False)
+        Miniatury w cache, wysokości w modelu siatki i ramki stron, które pozostały w dokumencie,
+        przenoszone są na nowe indeksy - renderowane są tylko strony wstawione. Gdy model siatki
+        nie odpowiada stanowi sprzed zmiany, siatka jest przebudowywana od zera.
 
-        img_data = pix.tobytes("ppm")
-        image = Image.open(io.BytesIO(img_data))
+        Args:
+            new_indices: Dla każdej strony sprzed zmiany jej nowy indeks (None - strona usunięta),
+                         z core.page_order (deletion_map, insertion_map, permutation_map)
+        """
+        layout = self._grid_layout
+        if (layout is None or layout.page_count != len(new_indices) or self._resize_timer is not None
+                or self._grid_column_width != self.thumb_width):
+            self._rebuild_thumbnail_grid()
+            return
 
-        print(f"Image.size (oryginalny render): {image.size}")
+        self.tk_images.remap(new_indices)
+        frames = {}
+        for old_index, frame in self.thumb_frames.items():
+            new_index = new_indices[old_index] if old_index < len(new_indices) else None
+            if new_index is None:
+                frame.place_forget()
+                self._spare_frames.append(frame)
+                continue
+            if new_index != old_index:
+                frame.set_page_index(new_index)
+            frames[new_index] = frame
+        self.thumb_frames = frames
+
+        column_width = self._grid_column_width
+        layout.remap(new_indices, len(self.pdf_document), lambda i: self._thumbnail_height(i, column_width))
+        self._apply_grid_scrollregion()
+        # Po usunięciu stron widok mógł wyjść poza krótszą siatkę
+        self.canvas.yview_moveto(self.canvas.yview()[0])
+        # Ramki zmieniły strony - pokazany stan zaznaczenia i fokusu liczony od nowa
+        self._styled_selection = PageSelection()
+        self._styled_focus = None if self._focus_hidden else self.active_page_index
+        self._refresh_virtual_grid()
+        for index, frame in self.thumb_frames.items():
+            self._style_acquired_frame(index, frame)
+        self._request_thumbnails(column_width)
 
-        resized_image = image.resize((final_thumb_width, final_thumb_height), Image.BILINEAR)
-        print(f"Resized image size: {resized_image.size}")
+    def _scroll_to_page(self, page_index):
+        """Przewija widok tak, by strona znalazła się przy górnej krawędzi okna."""
+        layout = self._get_grid_layout()
+        if layout is None or not (0 <= page_index < layout.page_count) or layout.total_height <= 0:
+            return
+        y1, _ = layout.page_bounds(page_index)
+        self.canvas.yview_moveto(max(0, y1 / layout.total_height - 0.1))
 
-        img_tk = ImageTk.PhotoImage(resized_image)
-        
-        # Cache the thumbnail for this width
-        if page_index not in self.tk_images:
-            self.tk_images[page_index] = {}
-        self.tk_images[page_index][column_width] = img_tk
+    def _refresh_grid_geometry(self):
+        """Stosuje zmiany wysokości wierszy (np. po kadrowaniu) bez przebudowy siatki."""
+        self._layout_refresh_pending = False
+        if self._get_grid_layout() is None:
+            return
+        self._apply_grid_scrollregion()
+        self._refresh_virtual_grid()
 
-        print(f"[CACHE UPDATE] Dodano do cache: strona {page_index}, szerokość {column_width}")
+    def _render_and_scale(self, page_index, column_width):
+        """Renderuje miniaturę synchronicznie (w wątku Tk) - dla pojedynczych, właśnie zmienionych stron."""
+        cached = self.tk_images.get(page_index, column_width)
+        if cached is not None:
+            return cached
+        img_tk = self._thumbnail_from_pyramid(page_index, column_width)
+        if img_tk is not None:
+            return img_tk
 
+        print(f"[RENDER] Generuję miniaturę dla strony {page_index}, szerokość {column_width}")
+        # Najpierw cache na dysku (klucz: skrót zawartości strony), dopiero potem rasteryzacja -
+        # zawsze w szerokości bazowej piramidy, mniejsze szerokości powstają przez skalowanie
+        image = render_thumbnail(self.pdf_document, page_index, self._pyramid_width(column_width),
+                                 self.render_dpi_factor, self.thumbnail_disk_cache, display_lists=self.display_lists)
+        self.tk_images.put_source(page_index, image)
+        return self._thumbnail_from_pyramid(page_index, column_width)
+
+    def _pyramid_width(self, column_width):
+        """Szerokość obrazu bazowego piramidy miniatur (największa szerokość miniatur)"""
+        return max(column_width, self.max_thumb_width)
+
+    def _thumbnail_from_pyramid(self, page_index, column_width):
+        """Miniatura przeskalowana z piramidy obrazów strony (bez renderowania); None, gdy piramidy brak"""
+        image = self.tk_images.derive(page_index, column_width, self._thumbnail_height(page_index, column_width))
+        if image is None:
+            return None
+        img_tk = ImageTk.PhotoImage(image)
+        self.tk_images.put(page_index, column_width, img_tk, image.height)
         return img_tk
 
+    def _get_thumbnail_image(self, page_index, column_width):
+        """
+        Zwraca miniaturę z cache lub placeholder o właściwych wymiarach.
+        Nie renderuje - skaluje piramidę strony, a brakujące piramidy zleca _request_thumbnails.
+        """
+        cached = self.tk_images.get(page_index, column_width)
+        if cached is not None:
+            return cached
+        img_tk = self._thumbnail_from_pyramid(page_index, column_width)
+        if img_tk is not None:
+            return img_tk
+        size = (max(1, column_width), self._thumbnail_height(page_index, column_width))
+        placeholder = self._placeholder_images.get(size)
+        if placeholder is None:
+            placeholder = ImageTk.PhotoImage(Image.new("RGB", size, "#E8E8E8"))
+            self._placeholder_images[size] = placeholder
+        return placeholder
+
+    def _current_render_key(self):
+        """Identyfikuje bieżącą wersję dokumentu (obiekt + licznik zmian historii)."""
+        return (id(self.pdf_document), self.history.version)
+
+    def _display_list_key(self, page):
+        """
+        Klucz listy wyświetlania niezmienionej strony dokumentu roboczego - strona pliku źródłowego,
+        wspólna z wątkami renderującymi miniatury. Wywoływane także w tych wątkach (dla ich dokumentów - None).
+        """
+        doc = self.pdf_document
+        if page.parent is not doc or len(self.page_refs) != len(doc):
+            return None
+        ref = self.page_refs.pages[page.number]
+        if ref is None:
+            return None
+        path, _, stamp = self.page_refs.sources.get(ref.source, (None, None, None))
+        return file_page_key(path, stamp, ref.page, page.rotation) if path else None
+
+    def _current_source_path(self):
+        """Ścieżka pliku, jeśli bieżąca wersja dokumentu odpowiada plikowi na dysku (inaczej None)."""
+        if self._render_source_path and self._current_render_key() == self._render_path_key:
+            return self._render_source_path
+        return None
+
+    def _get_analysis_index(self, render_scale=None):
+        """
+        Zwraca indeks analizy stron dla bieżącej wersji dokumentu.
+        Nowy indeks od razu zawiera geometrię stron; analizę kolorów itp. uzupełnia DocumentAnalyzer.
+        Zmiana skali renderowania unieważnia wyniki analizy kolorów.
+        """
+        key = (self._current_render_key(), render_scale)
+        index = self._analysis_index
+        if index is None or self._analysis_index_key[0] != key[0]:
+            index = PageAnalysisIndex.from_geometry(self.pdf_document)
+        elif render_scale is not None and self._analysis_index_key[1] != render_scale:
+            index.analyzed[:] = False
+        else:
+            return index
+        self._analysis_index = index
+        self._analysis_index_key = key
+        return index
+
+    def _sync_render_source(self):
+        """Przekazuje wątkom renderującym aktualną wersję dokumentu (tylko gdy się zmieniła)."""
+        key = self._current_render_key()
+        if key == self._render_source_key:
+            return
+        if self._current_source_path():
+            self.thumbnail_service.set_source(path=self._render_source_path)
+        else:
+            # Dokument zmieniony w pamięci - niezmienione strony wątki czytają ze źródeł,
+            # edytowane z migawki zawierającej tylko te strony
+            self.thumbnail_service.set_source(plan=self.page_refs.render_plan(self.pdf_document))
+        self._render_source_key = key
+
+    def _get_visible_page_range(self, overscan_rows=1):
+        """Zwraca zakres stron widocznych w oknie (z zapasem wierszy) według modelu siatki."""
+        layout = self._get_grid_layout()
+        if layout is None:
+            return range(0)
+        view_top = self.canvas.canvasy(0)
+        return layout.pages_in_range(view_top, view_top + self.canvas.winfo_height(), overscan_rows)
+
+    def _needs_render(self, page_index, width):
+        """Czy miniaturę trzeba renderować (brak jej w cache i brak piramidy strony)"""
+        return not self.tk_images.contains(page_index, width) and not self.tk_images.has_source(page_index, width)
+
+    def _request_thumbnails(self, column_width=None):
+        """Zleca w tle wszystkie brakujące piramidy miniatur - najpierw widoczne, potem pozostałe."""
+        if self.pdf_document is None or getattr(self.pdf_document, "is_closed", False):
+            return
+        width = column_width or self.thumb_width
+        page_count = len(self.pdf_document)
+        visible = self._get_visible_page_range()
+        self.tk_images.set_visible(visible)
+        # W tle tylko strony najbliższe widokowi, które zmieszczą się w budżecie pamięci miniatur
+        center = (visible.start + visible.stop) // 2 if visible else 0
+        nearby = pages_around(center, page_count, self._thumbnail_cache_capacity(width))
+        missing = [i for i in nearby if self._needs_render(i, width)]
+        if not missing:
+            return
+        self._sync_render_source()
+        render_width = self._pyramid_width(width)
+        self.thumbnail_service.request([i for i in visible if self._needs_render(i, width)],
+                                       render_width, self.render_dpi_factor, PRIORITY_VISIBLE)
+        self.thumbnail_service.request(missing, render_width, self.render_dpi_factor, PRIORITY_BACKGROUND)
+
+    def _thumbnail_cache_capacity(self, width):
+        """Szacuje, ile miniatur o danej szerokości (wraz z piramidami) mieści budżet pamięci miniatur."""
+        if not len(self.pdf_document):
+            return 0
+        pyramid_width = self._pyramid_width(width)
+        thumb_bytes = (width * self._thumbnail_height(0, width) * 3
+                       + pyramid_width * self._thumbnail_height(0, pyramid_width) * 4)
+        return max(1, self.tk_images.max_bytes // max(1, thumb_bytes))
+
+    def _request_visible_thumbnails(self):
+        """Po przewinięciu przesuwa brakujące miniatury widocznych stron na początek kolejki."""
+        if self.pdf_document is None or getattr(self.pdf_document, "is_closed", False) or not self.thumb_frames:
+            return
+        width = self.thumb_width
+        visible_range = self._get_visible_page_range()
+        self.tk_images.set_visible(visible_range)
+        visible = [i for i in visible_range if self._needs_render(i, width)]
+        if visible:
+            self._sync_render_source()
+            self.thumbnail_service.request(visible, self._pyramid_width(width), self.render_dpi_factor,
+                                           PRIORITY_VISIBLE)
+
+    def _on_thumbnail_rendered(self, page_index, width, image):
+        """Odbiera obraz bazowy piramidy z wątku renderującego (wywoływane w wątku Tk)."""
+        if self.pdf_document is None or getattr(self.pdf_document, "is_closed", False):
+            return
+        if self._render_source_key != self._current_render_key():
+            # Dokument zmienił się w trakcie renderowania - wynik nieaktualny.
+            # Nowa wersja trafia do wątków, więc kolejne stare wyniki odrzuci już sam serwis.
+            self._request_thumbnails()
+            return
+        if page_index >= len(self.pdf_document):
+            return
+        self.tk_images.put_source(page_index, image)
+        # Miniatury w szerokości widocznej ramki - pozostałe szerokości powstaną z piramidy przy wyświetleniu
+        page_frame = self.thumb_frames.get(page_index)
+        if page_frame is not None and page_frame.img_label:
+            img_tk = self._thumbnail_from_pyramid(page_index, page_frame.column_width)
+            if img_tk is not None:
+                page_frame.img_label.config(image=img_tk)
+                page_frame.img_label.image = img_tk
+
     def _clear_thumbnail_cache(self, page_index):
         """
         Usuwa cache miniatury dla konkretnej strony.
         """
-        if page_index in self.tk_images:
-            del self.tk_images[page_index]
+        self.tk_images.discard_page(page_index)
 
     def update_single_thumbnail(self, page_index, column_width=None):
         """
@@ -7198,18 +7576,39 @@ class SelectablePDFViewer:
         if not self.pdf_document or page_index >= len(self.pdf_document):
             return
         
-        if page_index not in self.thumb_frames:
-            return
-        
         # Użyj bieżącej szerokości miniatur, jeśli nie podano
         if column_width is None:
             column_width = self.thumb_width
         
-        # Usuń cache dla tej strony
+        # Usuń cache dla tej strony (także poza widokiem - ramka może powstać później)
         self._clear_thumbnail_cache(page_index)
+        self._refresh_thumbnail_frame(page_index, column_width)
+
+    def _refresh_thumbnail_frame(self, page_index, column_width, render=True):
+        """
+        Aktualizuje geometrię siatki i ramkę miniatury strony po zmianie jej cache.
+
+        Args:
+            page_index: Indeks strony
+            column_width: Szerokość kolumny
+            render: True - brakującą miniaturę renderuje od razu, False - placeholder (render w tle)
+        """
+        # Rozmiar strony mógł się zmienić (kadrowanie, obrót) - zaktualizuj geometrię siatki
+        layout = self._get_grid_layout()
+        if layout is not None and column_width == self._grid_column_width:
+            if layout.set_image_height(page_index, self._thumbnail_height(page_index, column_width)):
+                if not self._layout_refresh_pending:
+                    self._layout_refresh_pending = True
+                    self.master.after_idle(self._refresh_grid_geometry)
+        
+        if page_index not in self.thumb_frames:
+            return
         
         # Renderuj nową miniaturę
-        img_tk = self._render_and_scale(page_index, column_width)
+        if render:
+            img_tk = self._render_and_scale(page_index, column_width)
+        else:
+            img_tk = self._get_thumbnail_image(page_index, column_width)
         
         # Zaktualizuj obraz w istniejącym ThumbnailFrame
         page_frame = self.thumb_frames[page_index]
@@ -7218,41 +7617,58 @@ class SelectablePDFViewer:
             page_frame.img_label.image = img_tk
         
         # Zaktualizuj etykietę rozmiaru strony (może się zmienić przy kadracji/zmianie rozmiaru)
-        outer_frame_children = page_frame.outer_frame.winfo_children()
-        if len(outer_frame_children) > 2:
-            frame_bg = page_frame.bg_selected if page_index in self.selected_pages else page_frame.bg_normal
-            outer_frame_children[2].config(text=self._get_page_size_label(page_index), bg=frame_bg)
+        page_frame.format_label.config(text=self._get_page_size_label(page_index))
+
+    def _capture_thumbnail_placements(self, indices):
+        """Położenie stron z miniaturą w cache - zapamiętywane przed operacją geometryczną."""
+        return {i: page_placement(self.pdf_document[i]) for i in indices
+                if self.tk_images.source_image(i) is not None}
+
+    def _apply_thumbnail_transform(self, indices, placements, transforms):
+        """
+        Odświeża miniatury stron po operacji geometrycznej (obrót, kadrowanie, maski, rozmiar, przesunięcie).
+
+        Nowa miniatura wyliczana jest od razu z miniatury sprzed operacji; gdy wynik nie jest
+        dokładny (ThumbnailTransform.exact), strona trafia do renderowania w tle. Strony bez
+        miniatury w cache dostają placeholder i również są renderowane w tle.
+
+        Args:
+            indices: Indeksy zmienionych stron
+            placements: Położenie stron przed operacją (_capture_thumbnail_placements)
+            transforms: ThumbnailTransform wspólny dla stron albo słownik indeks -> ThumbnailTransform
+        """
+        column_width = self.thumb_width
+        for page_index in indices:
+            image = self.tk_images.source_image(page_index)
+            before = placements.get(page_index)
+            self._clear_thumbnail_cache(page_index)
+            if image is not None and before is not None:
+                transform = transforms.get(page_index, BOX_CHANGE) if isinstance(transforms, dict) else transforms
+                after = page_placement(self.pdf_document[page_index])
+                self.tk_images.put_source(page_index,
+                                          transform_thumbnail(image, before, after, transform, image.width),
+                                          exact=transform.exact)
+            self._refresh_thumbnail_frame(page_index, column_width, render=False)
+        # Tymczasowe i brakujące miniatury - dokładne renderowanie w tle
+        self._request_thumbnails()
 
     def update_selection_display(self):
         # Clean up selected_pages to remove any invalid indices
-        if self.pdf_document:
-            valid_indices = set(range(len(self.pdf_document)))
-            self.selected_pages = self.selected_pages & valid_indices
+        if self.pdf_document and self.selected_pages:
+            page_count = len(self.pdf_document)
+            if self.selected_pages.last() >= page_count:
+                self.selected_pages = self.selected_pages.limited(page_count)
         
         num_selected = len(self.selected_pages)
         
-        for frame_index, frame in self.thumb_frames.items():
-            inner_frame = frame.outer_frame
-            if frame_index in self.selected_pages:
-                frame.config(bg=frame.bg_selected)  
-                for widget in inner_frame.winfo_children():
-                    if isinstance(widget, tk.Label) and widget.cget('bg') != 'white':
-                         widget.config(bg=frame.bg_selected)
-                inner_frame.config(bg=frame.bg_selected)
-            else:
-                frame.config(bg=frame.bg_normal)
-                for widget in inner_frame.winfo_children():
-                    if isinstance(widget, tk.Label) and widget.cget('bg') != 'white':
-                         widget.config(bg=frame.bg_normal)
-                inner_frame.config(bg=frame.bg_normal)
-
-        self.update_tool_button_states()
+        # Styl ramek i przyciski - najwyżej raz na klatkę; status od razu (kolejne komunikaty go nadpisują)
+        self._ui_refresh.mark('selection')
         
         if self.pdf_document:
              if num_selected > 0:
                  msg = f"Zaznaczono {num_selected} stron. Użyj przycisków w panelu do edycji."
                  if num_selected == 1:
-                      page_num = list(self.selected_pages)[0] + 1
+                      page_num = self.selected_pages.first() + 1
                       msg = f"Zaznaczono 1 stronę (Strona {page_num}). Użyj przycisków w panelu do edycji."
                  self._update_status(msg)
              else:
@@ -7260,6 +7676,22 @@ class SelectablePDFViewer:
         else:
              self._update_status("Gotowy. Otwórz plik PDF.")
 
+    def _refresh_selection_display(self):
+        # Tylko strony, których zaznaczenie się zmieniło, i tylko żywe ramki - pozostałe strony
+        # dostaną styl przy przypisaniu ramki
+        selected = self.selected_pages
+        changed = selected ^ self._styled_selection
+        if len(changed) > len(self.thumb_frames):
+            # Duża zmiana (Ctrl+A, zakres Shift) - mniej ramek niż zmienionych stron
+            changed = list(self.thumb_frames)
+        for index in changed:
+            frame = self.thumb_frames.get(index)
+            if frame is not None:
+                self._apply_selection_style(frame, index in selected)
+        self._styled_selection = selected.copy()
+
+        self.update_tool_button_states()
+
     # ===================================================================
     # NOWE FUNKCJE: HASŁA PDF, USUWANIE PUSTYCH STRON, SCALANIE PDF
     # ===================================================================
@@ -7439,7 +7871,7 @@ class SelectablePDFViewer:
             custom_messagebox(self.master, "Błąd", f"Nie udało się zapisać PDF bez hasła:\n{e}", typ="error")
     
     def remove_empty_pages(self):
-        """Usuwa puste strony z dokumentu PDF"""
+        """Wykrywa puste strony w tle (DocumentAnalyzer) i usuwa je po zakończeniu skanowania"""
         if not self.pdf_document:
             custom_messagebox(self.master, "Błąd", "Brak otwartego dokumentu PDF.", typ="error")
             return
@@ -7447,7 +7879,7 @@ class SelectablePDFViewer:
         answer = custom_messagebox(
             self.master,
             "Potwierdzenie",
-            "Czy usunąć wszystkie puste strony?\n(Pusta strona = brak tekstu i białe tło)",
+            "Czy usunąć wszystkie puste strony?\n(Pusta strona = brak treści lub pokrycie tuszem poniżej progu z preferencji)",
             typ="question"
         )
         
@@ -7455,37 +7887,46 @@ class SelectablePDFViewer:
             return
         
         try:
-            self._save_state_to_undo()
-            empty_pages = []
-            
-            total_pages = len(self.pdf_document)
-            
-            # Pokaż pasek postępu dla skanowania stron
-            self.show_progressbar(maximum=total_pages)
-            self._update_status("Skanowanie pustych stron...")
-            
-            # Identyfikuj puste strony
-            for page_index in range(total_pages):
-                page = self.pdf_document[page_index]
-                text = page.get_text().strip()
-                
-                # Sprawdź czy strona ma tekst
-                if not text:
-                    # Sprawdź czy tło jest białe (bardzo prosty test)
-                    # Możemy sprawdzić czy są jakieś rysunki/obrazy
-                    drawings = page.get_drawings()
-                    images = page.get_images()
-                    
-                    # Jeśli brak tekstu, rysunków i obrazów - strona jest pusta
-                    if not drawings and not images:
-                        empty_pages.append(page_index)
-                
-                self.update_progressbar(page_index + 1)
-            
+            ink_percent = float(self.prefs_manager.get('empty_page_ink_percent', '0.02'))
+        except ValueError:
+            ink_percent = 0.02
+        
+        total_pages = len(self.pdf_document)
+        self._empty_page_results = EmptyPageResults(total_pages)
+        self._empty_page_key = self._current_render_key()
+        
+        # Pasek postępu rośnie w miarę napływania wyników z procesów roboczych
+        self.show_progressbar(maximum=total_pages)
+        self._update_status("Skanowanie pustych stron...")
+        self.empty_page_analyzer.start(self._empty_page_results, self.pdf_document,
+                                       path=self._current_source_path(), task=detect_empty_page,
+                                       ink_threshold=ink_percent / 100)
+    
+    def _on_empty_scan_progress(self, pages):
+        self.update_progressbar(self._empty_page_results.done_count)
+    
+    def _on_empty_scan_done(self):
+        """Usuwa strony wykryte jako puste (z pewnością co najmniej empty_page_min_confidence)"""
+        if self._current_render_key() != self._empty_page_key:
+            self.hide_progressbar()
+            self._update_status("Dokument zmienił się w trakcie skanowania - nie usunięto pustych stron.")
+            return
+        
+        try:
+            min_confidence = float(self.prefs_manager.get('empty_page_min_confidence', '0.5'))
+        except ValueError:
+            min_confidence = 0.5
+        results = self._empty_page_results
+        
+        try:
+            empty_pages = results.empty_pages(min_confidence)
             if not empty_pages:
                 self.hide_progressbar()
                 custom_messagebox(self.master, "Informacja", "Nie znaleziono pustych stron w dokumencie.", typ="info")
                 return
+            lowest_confidence = float(results.confidence[empty_pages].min())
+            
+            self._record_undo_deletion(empty_pages)
             
             # Zmień pasek na usuwanie stron
             self.show_progressbar(maximum=len(empty_pages))
@@ -7498,23 +7939,66 @@ class SelectablePDFViewer:
             
             # Odśwież widok
             self.selected_pages.clear()
-            self.tk_images.clear()
-            self.thumb_frames.clear()
-            for widget in list(self.scrollable_frame.winfo_children()):
-                widget.destroy()
-            
             self.active_page_index = 0
-            self._reconfigure_grid()
+            self._refresh_after_structure_change(
+                page_order.deletion_map(len(self.pdf_document) + len(empty_pages), empty_pages))
             self.update_tool_button_states()
             self.update_focus_display()
             
             self.hide_progressbar()
             
-            self._update_status(f"Usunięto {len(empty_pages)} pustych stron. Odswieżanie miniatur...")
+            self._update_status(f"Usunięto {len(empty_pages)} pustych stron (najniższa pewność {lowest_confidence:.0%}). "
+                                f"Odswieżanie miniatur...")
         except Exception as e:
             self.hide_progressbar()
             custom_messagebox(self.master, "Błąd", f"Nie udało się usunąć pustych stron:\n{e}", typ="error")
     
+    def optimize_document_images(self, preset_name, show_report=True):
+        """
+        Zmniejsza i ponownie kompresuje obrazy dokumentu (core.image_optimizer).
+        
+        Args:
+            preset_name: Nazwa ustawień z IMAGE_PRESETS ('print' - druk, 'screen' - ekran)
+            show_report: Pokaż okno z oszczędnością na stronach (makra - tylko pasek stanu)
+        """
+        if not self.pdf_document:
+            return
+        preset = IMAGE_PRESETS[preset_name]
+        self._record_action('optimize_images', preset=preset_name)
+        
+        try:
+            self._update_status(f"Optymalizacja obrazów ({preset.label})...")
+            plan = plan_image_optimization(self.pdf_document, preset_name)
+            if not plan.pages:
+                self._update_status(f"Optymalizacja obrazów ({preset.label}): brak obrazów do zmniejszenia.")
+                return
+            
+            path = self._current_source_path()
+            self._save_state_to_undo(plan.pages)
+            self.show_progressbar(maximum=max(1, len(plan.jobs)))
+            report = apply_image_optimization(self.pdf_document, plan, path=path,
+                                              progress_callback=lambda done, total: self.update_progressbar(done))
+            self.hide_progressbar()
+            
+            # Odśwież tylko strony, na których zmieniły się obrazy
+            for page_index in sorted(report.saved_by_page):
+                self.update_single_thumbnail(page_index)
+            
+            summary = (f"Optymalizacja obrazów ({preset.label}): zmniejszono {report.images_optimized} obrazów, "
+                       f"scalono {report.duplicates_merged} duplikatów, "
+                       f"oszczędność {report.total_saved / 1048576:.2f} MB.")
+            self._update_status(summary)
+            if not show_report:
+                return
+            largest = sorted(report.saved_by_page.items(), key=lambda item: item[1], reverse=True)[:10]
+            lines = [f"Strona {page_index + 1}: {saved / 1024:.0f} KB" for page_index, saved in largest]
+            if len(report.saved_by_page) > len(largest):
+                lines.append(f"... oraz {len(report.saved_by_page) - len(largest)} innych stron")
+            custom_messagebox(self.master, "Optymalizacja obrazów", "\n".join([summary, ""] + lines), typ="info")
+        except Exception as e:
+            self.hide_progressbar()
+            custom_messagebox(self.master, "Błąd", f"Nie udało się zoptymalizować obrazów:\n{e}", typ="error")
+    
     def merge_pdf_files(self):
         """Otwiera okno dialogowe do scalania plików PDF"""
         MergePDFDialog(self.master)
@@ -7603,9 +8087,13 @@ class SelectablePDFViewer:
                 elif action == 'select_landscape':
                     self._select_landscape_pages()
                 elif action == 'select_custom' and params:
-                    indices = params.get('indices', [])
-                    if isinstance(indices, int):
-                        indices = [indices]
+                    if 'pages' in params:
+                        indices = PageSelection.parse(params['pages'])
+                    else:
+                        # Makra nagrane przed wprowadzeniem opisu stron - lista indeksów
+                        indices = params.get('indices', [])
+                        if isinstance(indices, int):
+                            indices = [indices]
                     source_page_count = params.get('source_page_count', None)
                     self._apply_selection_by_indices(indices, macro_source_page_count=source_page_count)
                 # Parameterized actions - replay with saved parameters
@@ -7617,6 +8105,8 @@ class SelectablePDFViewer:
                     self._replay_remove_page_numbers(params)
                 elif action == 'apply_page_crop_resize' and params:
                     self._replay_apply_page_crop_resize(params)
+                elif action == 'optimize_images' and params.get('preset') in IMAGE_PRESETS:
+                    self.optimize_document_images(params['preset'], show_report=False)
             
             self._update_status(f"Wykonano makro '{macro_name}' ({len(actions)} akcji).")
         except Exception as e:
@@ -7629,66 +8119,20 @@ class SelectablePDFViewer:
         if not self.pdf_document or not self.selected_pages:
             return
 
-        dx_pt = params['x_mm'] * self.MM_TO_POINTS
-        dy_pt = params['y_mm'] * self.MM_TO_POINTS
         x_sign = 1 if params['x_dir'] == 'P' else -1
         y_sign = 1 if params['y_dir'] == 'G' else -1
-        final_dx = dx_pt * x_sign
-        final_dy = dy_pt * y_sign
+        final_dx_mm = params['x_mm'] * x_sign
+        final_dy_mm = params['y_mm'] * y_sign
 
         try:
-            self._save_state_to_undo()
             pages_to_shift = sorted(list(self.selected_pages))
-            pages_to_shift_set = set(pages_to_shift)
-            total_pages = len(self.pdf_document)
-
-            # 1. Oczyszczanie przez PyMuPDF
-            import io
-            import fitz
-            from pypdf import PdfReader, PdfWriter, Transformation
-
-            original_pdf_bytes = self.pdf_document.tobytes()
-            pymupdf_doc = fitz.open("pdf", original_pdf_bytes)
-            cleaned_doc = fitz.open()
-            for idx in range(len(pymupdf_doc)):
-                if idx in pages_to_shift_set:
-                    temp = fitz.open()
-                    temp.insert_pdf(pymupdf_doc, from_page=idx, to_page=idx)
-                    cleaned_doc.insert_pdf(temp)
-                    temp.close()
-                else:
-                    cleaned_doc.insert_pdf(pymupdf_doc, from_page=idx, to_page=idx)
-            cleaned_pdf_bytes = cleaned_doc.write()
-            pymupdf_doc.close()
-            cleaned_doc.close()
-
-            # 2. Przesuwanie przez PyPDF
-            pdf_reader = PdfReader(io.BytesIO(cleaned_pdf_bytes))
-            pdf_writer = PdfWriter()
-            transform = Transformation().translate(tx=final_dx, ty=final_dy)
-
-            for i, page in enumerate(pdf_reader.pages):
-                if i in pages_to_shift_set:
-                    page.add_transformation(transform)
-                pdf_writer.add_page(page)
-
-            new_pdf_stream = io.BytesIO()
-            pdf_writer.write(new_pdf_stream)
-            new_pdf_bytes = new_pdf_stream.getvalue()
-
-            # 3. Aktualizacja dokumentu w aplikacji przez PyMuPDF
-            if self.pdf_document:
-                self.pdf_document.close()
-            self.pdf_document = fitz.open("pdf", new_pdf_bytes)
+            placements = self._capture_thumbnail_placements(pages_to_shift)
+            self._save_state_to_undo(self.selected_pages)
+            page_geometry.shift_pages(self.pdf_document, pages_to_shift, final_dx_mm, final_dy_mm)
             
-            # Optymalizacja: odśwież tylko zmienione miniatury
-            self.show_progressbar(maximum=len(pages_to_shift))
-            for i, page_index in enumerate(pages_to_shift):
-                self._update_status("Makro: Przesunięto zawartość stron zgodnie z parametrami. Odświeżanie miniatur...")
-                
-                self.update_single_thumbnail(page_index)
-                self.update_progressbar(i + 1)
-            self.hide_progressbar()
+            # Miniatury wyliczane z obrazów w cache (przesunięcie), dokładne renderowanie w tle
+            shift = ThumbnailTransform(content=fitz.Matrix(*page_geometry.shift_matrix(final_dx_mm, final_dy_mm)))
+            self._apply_thumbnail_transform(pages_to_shift, placements, shift)
             
             self._update_status("Makro: Przesunięto zawartość stron zgodnie z parametrami.")
         except Exception as e:
@@ -7704,7 +8148,7 @@ class SelectablePDFViewer:
         MM_PT = self.MM_TO_POINTS
         
         try:
-            self._save_state_to_undo()
+            self._save_state_to_undo(self.selected_pages)
             
             # Extract parameters
             start_number = params.get('start_num', 1)
@@ -7863,7 +8307,7 @@ class SelectablePDFViewer:
         try:
             pages_to_process = sorted(list(self.selected_pages))
             if pages_to_process:
-                self._save_state_to_undo()
+                self._save_state_to_undo(pages_to_process)
             modified_count = 0
             
             for page_index in pages_to_process:
@@ -7921,39 +8365,35 @@ class SelectablePDFViewer:
             return
         
         try:
-            pdf_bytes_export = io.BytesIO()
-            self.pdf_document.save(pdf_bytes_export)
-            pdf_bytes_export.seek(0)
-            pdf_bytes_val = pdf_bytes_export.read()
             indices = sorted(list(self.selected_pages))
             
             crop_mode = params.get("crop_mode", "nocrop")
             resize_mode = params.get("resize_mode", "noresize")
             
             if crop_mode == "crop_only" and resize_mode == "noresize":
-                new_pdf_bytes = self._mask_crop_pages(
-                    pdf_bytes_val, indices,
+                operation = lambda: self._mask_crop_pages(
+                    indices,
                     params.get("crop_top_mm", 0), params.get("crop_bottom_mm", 0),
                     params.get("crop_left_mm", 0), params.get("crop_right_mm", 0),
                 )
                 msg = "Makro: Dodano białe maski."
             elif crop_mode == "crop_resize" and resize_mode == "noresize":
-                new_pdf_bytes = self._crop_pages(
-                    pdf_bytes_val, indices,
+                operation = lambda: self._crop_pages(
+                    indices,
                     params.get("crop_top_mm", 0), params.get("crop_bottom_mm", 0),
                     params.get("crop_left_mm", 0), params.get("crop_right_mm", 0),
                     reposition=False
                 )
                 msg = "Makro: Zastosowano przycięcie."
             elif resize_mode == "resize_scale":
-                new_pdf_bytes = self._resize_scale(
-                    pdf_bytes_val, indices,
+                operation = lambda: self._resize_scale(
+                    indices,
                     params.get("target_width_mm", 210), params.get("target_height_mm", 297)
                 )
                 msg = "Makro: Zmieniono rozmiar ze skalowaniem."
             elif resize_mode == "resize_noscale":
-                new_pdf_bytes = self._resize_noscale(
-                    pdf_bytes_val, indices,
+                operation = lambda: self._resize_noscale(
+                    indices,
                     params.get("target_width_mm", 210), params.get("target_height_mm", 297),
                     pos_mode=params.get("position_mode", "center"),
                     offset_x_mm=params.get("offset_x_mm", 0),
@@ -7964,18 +8404,14 @@ class SelectablePDFViewer:
                 self._update_status("Makro: Brak operacji do wykonania.")
                 return
             
-            self._save_state_to_undo()
-            self.pdf_document.close()
-            self.pdf_document = fitz.open("pdf", new_pdf_bytes)
+            placements = self._capture_thumbnail_placements(indices)
+            transforms = self._crop_resize_transforms(indices, params)
+            self._save_state_to_undo(indices)
+            operation()
             self._update_status(msg)
             
-            # Optymalizacja: odśwież tylko zmienione miniatury
-            self.show_progressbar(maximum=len(indices))
-            for i, page_index in enumerate(indices):
-                self._update_status("Operacja zakończona. Odświeżanie miniatur...")
-                self.update_single_thumbnail(page_index)
-                self.update_progressbar(i + 1)
-            self.hide_progressbar()
+            # Miniatury wyliczane z obrazów w cache, dokładne renderowanie w tle
+            self._apply_thumbnail_transform(indices, placements, transforms)
             
             if hasattr(self, "update_selection_display"):
                 self.update_selection_display()
@@ -7987,14 +8423,37 @@ class SelectablePDFViewer:
 
     def update_focus_display(self, hide_mouse_focus: bool = False):
         if not self.pdf_document: return
-        for index, frame in self.thumb_frames.items():
-            inner_frame = frame.outer_frame
-            if index == self.active_page_index and not hide_mouse_focus:
-                inner_frame.config(highlightbackground=FOCUS_HIGHLIGHT_COLOR, highlightcolor=FOCUS_HIGHLIGHT_COLOR)
-            else:
-                inner_frame.config(highlightbackground=frame.bg_normal, highlightcolor=frame.bg_normal)
+        self._focus_hidden = hide_mouse_focus
+        focus = None if hide_mouse_focus else self.active_page_index
+        # Tylko poprzednio i obecnie wyróżniona strona
+        for index in {self._styled_focus, focus}:
+            frame = self.thumb_frames.get(index)
+            if frame is not None:
+                self._apply_focus_style(frame, index == focus)
+        self._styled_focus = focus
+
+    def _apply_selection_style(self, frame, selected):
+        """Ustawia tło ramki miniatury zależnie od zaznaczenia."""
+        if frame.selected == selected:
+            return
+        frame.selected = selected
+        bg = frame.bg_selected if selected else frame.bg_normal
+        frame.config(bg=bg)
+        frame.outer_frame.config(bg=bg)
+        # Etykiety pod obrazem (kontener obrazu pozostaje biały)
+        frame.page_label.config(bg=bg)
+        frame.format_label.config(bg=bg)
+
+    def _apply_focus_style(self, frame, focused):
+        """Ustawia obramowanie fokusu ramki miniatury."""
+        if frame.focused == focused:
+            return
+        frame.focused = focused
+        color = FOCUS_HIGHLIGHT_COLOR if focused else frame.bg_normal
+        frame.outer_frame.config(highlightbackground=color, highlightcolor=color)
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()  # Procesy analizy stron w wersji spakowanej (exe)
     try:
         from tkinterdnd2 import TkinterDnD
         root = TkinterDnD.Tk()
@@ -8006,5 +8465,5 @@ if __name__ == '__main__':
         app = SelectablePDFViewer(root)
         root.mainloop()
     except ImportError as e:
-        print(f"BŁĄD: Wymagane biblioteki nie są zainstalowane. Upewnij się, że masz PyMuPDF (pip install PyMuPDF) i Pillow (pip install Pillow). Szczegóły: {e}")
+        print(f"BŁĄD: Wymagane biblioteki nie są zainstalowane. Upewnij się, że masz PyMuPDF (pip install PyMuPDF), Pillow (pip install Pillow) i NumPy (pip install numpy). Szczegóły: {e}")
         sys.exit(1)
\ No newline at end of file
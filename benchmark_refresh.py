@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Benchmark odświeżania interfejsu w długich operacjach.
+
+Obraca wszystkie strony dokumentu (jak "Obróć w prawo" na zaznaczeniu całego
+dokumentu) w oknie Tk z paskiem statusu, paskiem postępu, panelem przycisków
+i menu o rozmiarach jak w przeglądarce. Po każdej stronie aktualizowany jest
+postęp, a stany przycisków i menu zgłaszane są ponownie - tak jak w pętlach
+przeglądarki. Porównywane są:
+
+- sama operacja (bez interfejsu),
+- dawne odświeżanie: update_idletasks() i przejście po wszystkich przyciskach
+  i pozycjach menu po każdej stronie,
+- RefreshScheduler: zgłoszenia łączone i wykonywane najwyżej raz na klatkę.
+
+Wymaga ekranu (Tk).
+
+Użycie:
+    python benchmark_refresh.py [--pages 1000] [--buttons 30] [--menu-items 60]
+"""
+
+import time
+import argparse
+import tkinter as tk
+from tkinter import ttk
+
+import fitz  # PyMuPDF
+
+from core.refresh_scheduler import RefreshScheduler
+
+
+class BenchmarkWindow:
+    """Okno z elementami odświeżanymi przez przeglądarkę w trakcie operacji"""
+
+    def __init__(self, root, buttons, menu_items):
+        self.root = root
+        toolbar = tk.Frame(root)
+        toolbar.pack(side=tk.TOP, fill=tk.X)
+        self.buttons = [tk.Button(toolbar, text=f"B{i}") for i in range(buttons)]
+        for button in self.buttons:
+            button.pack(side=tk.LEFT)
+        menubar = tk.Menu(root)
+        self.menu = tk.Menu(menubar, tearoff=0)
+        for i in range(menu_items):
+            self.menu.add_command(label=f"Pozycja {i}")
+        menubar.add_cascade(label="Edycja", menu=self.menu)
+        root.config(menu=menubar)
+        status_frame = tk.Frame(root)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        self.status_bar = tk.Label(status_frame, text="Gotowy.", anchor=tk.W)
+        self.status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.progress_bar = ttk.Progressbar(status_frame, length=200)
+        self.progress_bar.pack(side=tk.RIGHT)
+        self.button_state_updates = 0
+
+    def refresh_button_states(self):
+        """Odpowiednik _refresh_tool_button_states: konfiguracja każdego przycisku i pozycji menu"""
+        self.button_state_updates += 1
+        for button in self.buttons:
+            button.config(state=tk.NORMAL)
+        for i in range(self.menu.index("end") + 1):
+            self.menu.entryconfig(i, state=tk.NORMAL)
+
+
+def rotate_pages(doc, on_page):
+    """Pętla obrotu jak w rotate_selected_page"""
+    for idx in range(len(doc)):
+        page = doc.load_page(idx)
+        page.set_rotation((page.rotation + 90) % 360)
+        on_page(idx + 1)
+
+
+def run_plain(doc, window):
+    start = time.perf_counter()
+    rotate_pages(doc, lambda done: None)
+    return time.perf_counter() - start, 0, 0
+
+
+def run_legacy(doc, window):
+    root = window.root
+    window.button_state_updates = 0
+    window.progress_bar["maximum"] = len(doc)
+
+    def on_page(done):
+        window.progress_bar["value"] = done
+        root.update_idletasks()
+        window.refresh_button_states()
+        window.status_bar.config(text=f"Obracanie {done}/{len(doc)}")
+        root.update_idletasks()
+
+    start = time.perf_counter()
+    rotate_pages(doc, on_page)
+    window.refresh_button_states()
+    root.update_idletasks()
+    return time.perf_counter() - start, 2 * len(doc) + 1, window.button_state_updates
+
+
+def run_scheduled(doc, window):
+    root = window.root
+    window.button_state_updates = 0
+    window.progress_bar["maximum"] = len(doc)
+    scheduler = RefreshScheduler(root)
+    scheduler.register('buttons', window.refresh_button_states)
+
+    def on_page(done):
+        window.progress_bar["value"] = done
+        scheduler.redraw()
+        scheduler.mark('buttons')
+        window.status_bar.config(text=f"Obracanie {done}/{len(doc)}")
+        scheduler.redraw()
+
+    start = time.perf_counter()
+    rotate_pages(doc, on_page)
+    scheduler.mark('buttons')
+    scheduler.flush()
+    return time.perf_counter() - start, scheduler.flushes, window.button_state_updates
+
+
+def build_document(pages):
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Strona {i + 1}", fontsize=24)
+    return doc
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark odświeżania interfejsu")
+    parser.add_argument("--pages", type=int, default=1000, help="Liczba obracanych stron")
+    parser.add_argument("--buttons", type=int, default=30, help="Liczba przycisków w panelu")
+    parser.add_argument("--menu-items", type=int, default=60, help="Liczba pozycji menu")
+    args = parser.parse_args()
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"Benchmark wymaga ekranu (Tk): {e}")
+        return
+    root.title("Benchmark odświeżania")
+    window = BenchmarkWindow(root, args.buttons, args.menu_items)
+    root.update()
+
+    print(f"Obrót {args.pages} stron, {args.buttons} przycisków, {args.menu_items} pozycji menu")
+    print(f"{'Odświeżanie':<24}{'czas [s]':>10}{'ms/strona':>11}{'odrysowania':>13}{'stany przycisków':>18}")
+    for label, run in (("sama operacja", run_plain),
+                       ("dawne (co stronę)", run_legacy),
+                       ("RefreshScheduler", run_scheduled)):
+        doc = build_document(args.pages)
+        seconds, redraws, button_updates = run(doc, window)
+        doc.close()
+        print(f"{label:<24}{seconds:>10.3f}{seconds * 1000 / args.pages:>11.3f}{redraws:>13}{button_updates:>18}")
+        root.update()
+    root.destroy()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark profili zapisu.
+
+Dla każdego dokumentu korpusu wykonuje typową edycję (obrót pierwszej strony,
+usunięcie ostatniej) i mierzy czas oraz rozmiar pliku:
+
+- dawnego zapisu (garbage=4, clean, pretty - w całości w wątku Tk),
+- migawki przekazywanej do procesu zapisu - jedyny koszt ponoszony w wątku Tk
+  (okno nie reaguje, a pasek postępu i ESC działają dopiero po jej utworzeniu);
+  pod tabelą podawany jest ten czas w przeliczeniu na 1 MB pliku, co pozwala
+  oszacować zamrożenie okna dla dużych dokumentów (dokument bez zmian od
+  otwarcia lub zapisu zapisywany jest bez migawki),
+- każdego profilu z core.save_profiles (przyrostowo, gdy profil na to pozwala).
+
+Bez argumentów korpus tworzą dwa dokumenty generowane: dokument testowy
+z benchmark_thumbnails oraz ten sam dokument scalony wielokrotnie (powtórzone
+czcionki i obrazy, jak po kolejnych importach).
+
+Użycie:
+    python benchmark_save.py [plik.pdf ...] [--pages N] [--copies 5]
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+
+import fitz  # PyMuPDF
+
+from benchmark_thumbnails import build_sample_document
+from core.save_profiles import (SAVE_PROFILES, SNAPSHOT_OPTIONS, can_save_incrementally,
+                                optimize_and_save, save_incrementally)
+
+
+SNAPSHOT_LABEL = "migawka (wątek Tk)"
+
+
+def build_merged_document(pdf_bytes, copies):
+    """Dokument scalony z copies kopii - każda kopia wnosi własne czcionki i obrazy"""
+    doc = fitz.open()
+    for _ in range(copies):
+        part = fitz.open("pdf", pdf_bytes)
+        doc.insert_pdf(part)
+        part.close()
+    return doc.tobytes()
+
+
+def open_edited(path):
+    """Otwiera plik i wprowadza typową edycję"""
+    doc = fitz.open(path)
+    doc[0].set_rotation((doc[0].rotation + 90) % 360)
+    if len(doc) > 1:
+        doc.delete_page(len(doc) - 1)
+    return doc
+
+
+def measure(source_path, workdir):
+    """Zwraca listę (nazwa, sekundy, bajty) dla dawnego zapisu, migawki i profili"""
+    results = []
+    output = os.path.join(workdir, "output.pdf")
+
+    doc = open_edited(source_path)
+    start = time.perf_counter()
+    doc.save(output, garbage=4, clean=True, pretty=True)
+    results.append(("dawny zapis", time.perf_counter() - start, os.path.getsize(output)))
+    doc.close()
+
+    doc = open_edited(source_path)
+    start = time.perf_counter()
+    snapshot = doc.tobytes(**SNAPSHOT_OPTIONS)
+    results.append((SNAPSHOT_LABEL, time.perf_counter() - start, len(snapshot)))
+    doc.close()
+
+    for name in SAVE_PROFILES:
+        # Zapis do pliku źródłowego - profil przyrostowy może dopisać zmiany
+        target = os.path.join(workdir, f"{name}.pdf")
+        shutil.copyfile(source_path, target)
+        doc = open_edited(target)
+        start = time.perf_counter()
+        if can_save_incrementally(doc, target, name):
+            save_incrementally(doc)
+            label = f"{name} (przyrostowo)"
+        else:
+            work = fitz.open("pdf", doc.tobytes(**SNAPSHOT_OPTIONS))
+            optimize_and_save(work, output, name)
+            work.close()
+            os.replace(output, target)
+            label = name
+        results.append((label, time.perf_counter() - start, os.path.getsize(target)))
+        doc.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark profili zapisu")
+    parser.add_argument("pdf", nargs="*", help="Pliki PDF (domyślnie generowany korpus)")
+    parser.add_argument("--pages", type=int, default=200, help="Liczba stron dokumentu testowego")
+    parser.add_argument("--copies", type=int, default=5, help="Liczba kopii w dokumencie scalonym")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        corpus = []
+        for path in args.pdf:
+            corpus.append((os.path.basename(path), path))
+        if not corpus:
+            sample = build_sample_document(args.pages)
+            for name, data in (("dokument testowy", sample),
+                               ("scalony", build_merged_document(sample, args.copies))):
+                path = os.path.join(workdir, f"source-{len(corpus)}.pdf")
+                with open(path, "wb") as f:
+                    f.write(data)
+                corpus.append((name, path))
+
+        for name, path in corpus:
+            print(f"\n{name}: {os.path.getsize(path) / 1048576:.1f} MB, stron: {fitz.open(path).page_count}")
+            print(f"{'Zapis':<22}{'czas [s]':>10}{'rozmiar [MB]':>14}")
+            for label, seconds, size in measure(path, workdir):
+                print(f"{label:<22}{seconds:>10.3f}{size / 1048576:>14.2f}")
+                if label == SNAPSHOT_LABEL:
+                    snapshot = (seconds, size)
+            seconds, size = snapshot
+            print(f"Migawka blokuje wątek Tk: {seconds * 1000:.0f} ms "
+                  f"({seconds * 1000 / max(size / 1048576, 0.001):.0f} ms/MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Benchmark renderowania miniatur.
+
+Porównuje dotychczasowy potok (render w skali dpi_factor -> PPM -> Image.open -> resize)
+z renderowaniem bezpośrednio w docelowym rozmiarze (render_page_image).
+Dla każdego potoku podaje średni czas na miniaturę i szczytowe zużycie pamięci.
+
+Każdy potok uruchamiany jest w osobnym procesie, żeby pomiar szczytowej pamięci
+(ru_maxrss, tylko Linux/macOS) nie był zafałszowany przez poprzedni przebieg.
+Na Windows podawany jest tylko szczyt alokacji Pythona (tracemalloc).
+
+Użycie:
+    python benchmark_thumbnails.py [plik.pdf] [--pages N] [--width 205] [--dpi 0.8]
+"""
+
+import io
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+import multiprocessing
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from core.thumbnail_renderer import render_page_image
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def render_legacy(page, column_width, dpi_factor):
+    """Dotychczasowy potok: pełny render, kodowanie PPM, dekodowanie i skalowanie PIL"""
+    page_width = page.rect.width
+    page_height = page.rect.height
+    aspect_ratio = page_height / page_width if page_width != 0 else 1
+    final_thumb_width = max(1, column_width)
+    final_thumb_height = max(1, int(final_thumb_width * aspect_ratio))
+    mat = fitz.Matrix(dpi_factor, dpi_factor)
+    pix = page.get_pixmap(matrix=mat, alpha=False)
+    image = Image.open(io.BytesIO(pix.tobytes("ppm")))
+    return image.resize((final_thumb_width, final_thumb_height), Image.BILINEAR)
+
+
+PIPELINES = {
+    "ppm+resize": render_legacy,
+    "bezpośredni": render_page_image,
+}
+
+
+def build_sample_document(page_count):
+    """Tworzy dokument testowy: tekst, grafika wektorowa i obraz rastrowy na stronach A4"""
+    doc = fitz.open()
+    photo = Image.effect_noise((600, 400), 64).convert("RGB")
+    buffer = io.BytesIO()
+    photo.save(buffer, format="JPEG", quality=85)
+    photo_bytes = buffer.getvalue()
+    for i in range(page_count):
+        page = doc.new_page(width=595, height=842)
+        page.insert_text((56, 72), f"Strona testowa {i + 1}", fontsize=24)
+        for line in range(30):
+            page.insert_text((56, 110 + line * 14), "Lorem ipsum dolor sit amet, consectetur adipiscing elit " * 2, fontsize=9)
+        page.draw_rect(fitz.Rect(56, 540, 300, 780), color=(0.8, 0.1, 0.1), fill=(0.9, 0.9, 0.2))
+        page.draw_circle((420, 660), 90, color=(0.1, 0.3, 0.8), width=3)
+        if i % 2 == 0:
+            page.insert_image(fitz.Rect(320, 420, 540, 560), stream=photo_bytes)
+    return doc.tobytes()
+
+
+def _run_pipeline(name, pdf_bytes, page_count, width, dpi_factor, queue):
+    """Mierzy jeden potok w osobnym procesie i odsyła wyniki przez kolejkę"""
+    doc = fitz.open("pdf", pdf_bytes)
+    render = PIPELINES[name]
+    render(doc.load_page(0), width, dpi_factor)  # rozgrzewka (czcionki, obrazy)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None
+    tracemalloc.start()
+    start = time.perf_counter()
+    for i in range(page_count):
+        render(doc.load_page(i % len(doc)), width, dpi_factor)
+    elapsed = time.perf_counter() - start
+    _, python_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None
+    if rss_after is not None and sys.platform == "darwin":
+        rss_before, rss_after = rss_before // 1024, rss_after // 1024  # macOS podaje bajty
+    queue.put({
+        "ms_per_thumb": elapsed * 1000.0 / page_count,
+        "python_peak_kb": python_peak / 1024.0,
+        "peak_rss_kb": rss_after,
+        "rss_growth_kb": (rss_after - rss_before) if rss_after is not None else None,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark renderowania miniatur")
+    parser.add_argument("pdf", nargs="?", help="Plik PDF (domyślnie generowany dokument testowy)")
+    parser.add_argument("--pages", type=int, default=50, help="Liczba renderowanych miniatur")
+    parser.add_argument("--width", type=int, default=205, help="Szerokość miniatury w pikselach")
+    parser.add_argument("--dpi", type=float, default=0.8, help="Współczynnik jakości (0.4 / 0.8 / 1.2)")
+    args = parser.parse_args()
+
+    if args.pdf:
+        with open(args.pdf, "rb") as f:
+            pdf_bytes = f.read()
+        source = os.path.basename(args.pdf)
+    else:
+        pdf_bytes = build_sample_document(min(args.pages, 20))
+        source = "dokument testowy"
+
+    print(f"Źródło: {source}, miniatur: {args.pages}, szerokość: {args.width}px, dpi_factor: {args.dpi}")
+    print(f"{'Potok':<14}{'ms/miniatura':>14}{'szczyt RSS [MB]':>18}{'przyrost RSS [MB]':>20}{'szczyt Python [KB]':>20}")
+
+    context = multiprocessing.get_context("spawn")
+    for name in PIPELINES:
+        queue = context.Queue()
+        process = context.Process(target=_run_pipeline,
+                                  args=(name, pdf_bytes, args.pages, args.width, args.dpi, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        peak = f"{result['peak_rss_kb'] / 1024:.1f}" if result["peak_rss_kb"] is not None else "-"
+        growth = f"{result['rss_growth_kb'] / 1024:.1f}" if result["rss_growth_kb"] is not None else "-"
+        print(f"{name:<14}{result['ms_per_thumb']:>14.2f}{peak:>18}{growth:>20}{result['python_peak_kb']:>20.0f}")
+
+
+if __name__ == "__main__":
+    main()
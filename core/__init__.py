@@ -2,3 +2,19 @@
 from .preferences_manager import PreferencesManager
 from .pdf_tools import PDFTools
 from .macro_manager import MacroManager
+from .undo_history import UndoHistory
+from .virtual_document import VirtualDocument, PageRef, RenderPlan
+from .save_profiles import BackgroundSaver, SAVE_PROFILES, SaveProfile
+from .image_optimizer import IMAGE_PRESETS, ImagePreset, optimize_images
+from .thumbnail_renderer import ThumbnailRenderService, render_page_image, render_thumbnail
+from .thumbnail_cache import ThumbnailDiskCache, PageContentHasher
+from .image_cache import ThumbnailImageCache
+from .thumbnail_transforms import ThumbnailTransform, page_placement, transform_thumbnail
+from .display_list_cache import DisplayListCache
+from .thumbnail_layout import ThumbnailGridLayout, pages_around
+from . import page_geometry, page_imposition, page_order, page_transfer
+from .color_analysis import page_colorfulness, colorfulness_score
+from .document_analysis import DocumentAnalyzer, PageAnalysisIndex, analyze_page
+from .empty_pages import detect_empty_page, EmptyPageResults
+from .refresh_scheduler import RefreshScheduler
+from .page_selection import PageSelection
@@ -0,0 +1,66 @@
+"""
+ColorAnalysis - Klasyfikacja stron kolorowych i czarno-białych
+
+Strona renderowana jest raz (RGB, w skali color_detect_scale), a próbki
+pixmapy oglądane są jako tablica NumPy (wysokość, szerokość, 3) bez kopiowania.
+Dla każdego piksela liczona jest rozbieżność kanałów max(R, G, B) - min(R, G, B):
+dla szarości wynosi 0, dla koloru rośnie wraz z nasyceniem.
+
+Wynikiem jest "kolorowość" strony w jednostkach progu color_detect_threshold
+(0-255): największa rozbieżność kanałów po pominięciu najbardziej odstających
+pikseli (szum, pojedyncze piksele wygładzania). Analizowana jest cała strona,
+więc małe kolorowe logo nie zostaje pominięte jak przy próbkowaniu co N-ty piksel.
+"""
+
+import fitz  # PyMuPDF
+import numpy as np
+from typing import Optional
+
+
+# Część pikseli strony o największej rozbieżności pomijana jako szum
+OUTLIER_FRACTION = 0.0002
+
+
+def colorfulness_score(samples: np.ndarray) -> float:
+    """
+    Kolorowość obrazu RGB.
+
+    Args:
+        samples: Tablica uint8 o kształcie (wysokość, szerokość, 3)
+
+    Returns:
+        Rozbieżność kanałów (0-255) przekraczana tylko przez OUTLIER_FRACTION pikseli
+    """
+    if samples.size == 0:
+        return 0.0
+    divergence = (samples.max(axis=2) - samples.min(axis=2)).ravel()
+    rank = divergence.size - 1 - int(divergence.size * OUTLIER_FRACTION)
+    return float(np.partition(divergence, rank)[rank])
+
+
+def page_colorfulness(page, render_scale: float = 0.2, max_samples: Optional[int] = None) -> float:
+    """
+    Renderuje stronę raz i zwraca jej kolorowość.
+
+    Args:
+        page: Strona fitz.Page
+        render_scale: Skala renderowania (0.2 = ok. 14 DPI)
+        max_samples: Ograniczenie liczby analizowanych pikseli (próbka warstwowa
+                     z regularnej siatki); None - cała strona
+
+    Returns:
+        Kolorowość strony (0-255), porównywana z progiem color_detect_threshold
+    """
+    pix = page.get_pixmap(matrix=fitz.Matrix(render_scale, render_scale),
+                          colorspace=fitz.csRGB, alpha=False)
+    if pix.width == 0 or pix.height == 0:
+        return 0.0
+    # Widok na próbki pixmapy bez kopiowania (wiersze mogą mieć wyrównanie - stride)
+    rows = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)
+    samples = rows[:, :pix.width * 3].reshape(pix.height, pix.width, 3)
+    if max_samples and pix.width * pix.height > max_samples:
+        step = int(np.ceil(np.sqrt(pix.width * pix.height / max_samples)))
+        samples = samples[step // 2::step, step // 2::step]
+    score = colorfulness_score(samples)
+    del rows, samples  # widok musi zniknąć przed zwolnieniem pixmapy
+    return score
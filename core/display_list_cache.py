@@ -0,0 +1,216 @@
+"""
+DisplayListCache - Listy wyświetlania stron do wielokrotnej rasteryzacji
+
+Renderowanie strony to interpretacja strumienia treści (parsowanie operatorów,
+czcionki, ścieżki) oraz rasteryzacja. fitz.DisplayList zapamiętuje wynik
+interpretacji, więc kolejne renderowania tej samej strony w innej skali (zmiana
+szerokości miniatur, eksport w wysokiej rozdzielczości, arkusze w trybie
+"spłaszcz") kosztują tylko rasteryzację. Na stronach wektorowych z dużą liczbą
+ścieżek i opisów (rysunki CAD) to ok. połowa czasu renderowania.
+
+Cache jest wspólny dla wątku Tk i wątków renderujących miniatury (dostęp pod
+blokadą; listę wyświetlania można rasteryzować w dowolnym wątku, także po
+zamknięciu dokumentu, z którego powstała). Rozmiar list szacowany jest na
+podstawie długości strumienia treści; po przekroczeniu budżetu usuwane są
+najdawniej używane wpisy (LRU).
+
+Klucze stron:
+- strona pliku na dysku: ścieżka, znacznik pliku (czas modyfikacji, rozmiar),
+  numer strony i obrót - wspólne dla wszystkich dokumentów otwartych z pliku,
+- strona dokumentu w pamięci: dokument, xref strony i obrót - wpis trzyma
+  referencję dokumentu, więc jego id() nie zostanie użyte ponownie; zmiana
+  treści strony wymaga invalidate_pages(),
+- strona migawki renderowania: ("snapshot", generacja, ...) - usuwane przez
+  ThumbnailRenderService po zmianie źródła.
+
+Cache zlicza trafienia, chybienia i usunięcia wpisów.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Iterable, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+
+# Zmierzony narzut listy wyświetlania względem rozmiaru (rozpakowanego) strumienia treści
+DISPLAY_LIST_BYTES_PER_CONTENT_BYTE = 3.5
+# Minimalny szacowany rozmiar wpisu (strony bez treści, obrazy, formularze)
+MIN_ENTRY_BYTES = 16 * 1024
+
+DEFAULT_MAX_BYTES = 128 * 1024 * 1024
+
+
+def file_stamp(path: str) -> Optional[Tuple[float, int]]:
+    """Znacznik pliku (czas modyfikacji, rozmiar); None, gdy pliku nie ma"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+
+def file_page_key(path: str, stamp: Optional[Tuple[float, int]], page_number: int, rotation: int) -> Optional[tuple]:
+    """
+    Klucz strony pliku PDF na dysku.
+
+    Args:
+        path: Ścieżka pliku
+        stamp: Znacznik pliku z chwili otwarcia (file_stamp); None - brak klucza
+        page_number: Numer strony w pliku
+        rotation: Obrót strony, z którym jest renderowana
+
+    Returns:
+        Klucz albo None (plik nie istniał)
+    """
+    if stamp is None:
+        return None
+    return ("file", os.path.abspath(path), stamp, page_number, rotation % 360)
+
+
+def estimate_display_list_bytes(page) -> int:
+    """Szacowany rozmiar listy wyświetlania strony"""
+    try:
+        content_bytes = len(page.read_contents())
+    except Exception:
+        content_bytes = 0
+    return max(MIN_ENTRY_BYTES, int(content_bytes * DISPLAY_LIST_BYTES_PER_CONTENT_BYTE))
+
+
+class DisplayListCache:
+    """Wspólny cache LRU list wyświetlania stron z budżetem pamięci"""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Args:
+            max_bytes: Budżet pamięci w bajtach (szacunek)
+        """
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        # Klucz strony dokumentu w pamięci dla stron, których treść pochodzi z pliku (np. VirtualDocument);
+        # funkcja (strona) -> klucz lub None. Wywoływana także w wątkach roboczych.
+        self.key_resolver: Optional[Callable[[Any], Optional[tuple]]] = None
+        # klucz -> (lista wyświetlania, szacowany rozmiar, dokument - tylko dla kluczy dokumentu w pamięci)
+        self._entries: "OrderedDict[tuple, Tuple[fitz.DisplayList, int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ============================================================================
+    # ODCZYT I RENDEROWANIE
+    # ============================================================================
+
+    def page_key(self, page) -> tuple:
+        """Klucz strony: z key_resolver, a gdy ten go nie zna - strona dokumentu w pamięci"""
+        if self.key_resolver is not None:
+            key = self.key_resolver(page)
+            if key is not None:
+                return key
+        return ("doc", id(page.parent), page.xref, page.rotation)
+
+    def get(self, page, key: Optional[tuple] = None, store: bool = True) -> fitz.DisplayList:
+        """
+        Zwraca listę wyświetlania strony z cache albo ją buduje.
+
+        Args:
+            page: Strona fitz.Page
+            key: Klucz strony (domyślnie page_key(page))
+            store: Czy zbudowaną listę zapamiętać (False - np. jednorazowe renderowanie w tle)
+
+        Returns:
+            fitz.DisplayList
+        """
+        key = key or self.page_key(page)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        display_list = page.get_displaylist()
+        if store:
+            nbytes = estimate_display_list_bytes(page)
+            owner = page.parent if key[0] == "doc" else None
+            with self._lock:
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self.total_bytes -= old[1]
+                self._entries[key] = (display_list, nbytes, owner)
+                self.total_bytes += nbytes
+                self._evict(keep=key)
+        return display_list
+
+    def get_pixmap(self, page, matrix, colorspace=None, alpha: bool = False,
+                   key: Optional[tuple] = None, store: bool = True) -> fitz.Pixmap:
+        """Renderuje stronę (jak Page.get_pixmap) z listy wyświetlania z cache"""
+        return self.get(page, key, store).get_pixmap(matrix=matrix, colorspace=colorspace or fitz.csRGB, alpha=alpha)
+
+    # ============================================================================
+    # UNIEWAŻNIANIE I BUDŻET
+    # ============================================================================
+
+    def invalidate_pages(self, doc, page_indices: Optional[Iterable[int]] = None):
+        """
+        Usuwa listy stron dokumentu w pamięci (przed zmianą ich treści).
+
+        Args:
+            doc: Dokument fitz.Document
+            page_indices: Indeksy stron; None - wszystkie strony dokumentu
+        """
+        xrefs = None if page_indices is None else {doc.page_xref(i) for i in page_indices}
+        doc_id = id(doc)
+        self.discard(lambda key: key[0] == "doc" and key[1] == doc_id and (xrefs is None or key[2] in xrefs))
+
+    def discard(self, predicate: Callable[[tuple], bool]):
+        """Usuwa wpisy, których klucz spełnia predicate"""
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                self.total_bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        """Usuwa wszystkie wpisy (liczniki pozostają)"""
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def set_budget(self, max_bytes: int):
+        """Zmienia budżet pamięci i od razu go egzekwuje"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def stats(self) -> dict:
+        """Liczniki i zajętość cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+    def summary(self) -> str:
+        """Krótki opis stanu cache do logów"""
+        s = self.stats()
+        return (f"{s['entries']} list wyświetlania, {s['bytes'] / (1024 * 1024):.1f}/{s['max_bytes'] / (1024 * 1024):.0f} MB, "
+                f"trafienia {s['hits']} ({s['hit_ratio']:.0%}), chybienia {s['misses']}, usunięte {s['evictions']}")
+
+    def _evict(self, keep: Optional[tuple] = None):
+        """Usuwa wpisy LRU ponad budżet (wywoływane pod blokadą)"""
+        for key in list(self._entries):
+            if self.total_bytes <= self.max_bytes:
+                return
+            if key == keep:
+                continue
+            self.total_bytes -= self._entries.pop(key)[1]
+            self.evictions += 1
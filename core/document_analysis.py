@@ -0,0 +1,339 @@
+"""
+DocumentAnalysis - Równoległa analiza stron dokumentu z indeksem wyników
+
+Analiza (kolorowość, format, orientacja, obecność tekstu, liczba obrazów)
+wykonywana jest w puli procesów - każdy proces roboczy sam otwiera plik
+(albo migawkę bajtów zmodyfikowanego dokumentu) i analizuje paczki stron.
+Wyniki spływają do wątku Tk w miarę ukończenia paczek (odpytywanie przez after),
+więc okno nie zamarza, a częściowe wyniki można pokazywać od razu.
+
+Wyniki trafiają do kolumnowego indeksu PageAnalysisIndex (tablice NumPy po
+jednej na cechę). Zapytania (strony pionowe, kolorowe, grupy format/kolor)
+korzystają z indeksu zamiast ponownie wczytywać strony.
+
+Małe dokumenty analizowane są w wątku Tk w krótkich porcjach - uruchomienie
+puli procesów trwałoby dłużej niż sama analiza.
+"""
+
+import os
+import queue
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+import numpy as np
+
+from .color_analysis import page_colorfulness
+
+
+# Formaty stron (w mm), rozpoznawane z tolerancją FORMAT_TOLERANCE_MM
+PAGE_FORMATS = {
+    'A0': (841, 1189),
+    'A1': (594, 841),
+    'A2': (420, 594),
+    'A3': (297, 420),
+    'A4': (210, 297),
+    'Letter': (216, 279),
+}
+FORMAT_TOLERANCE_MM = 5
+CUSTOM_FORMAT = "Niestandardowy"
+FORMAT_NAMES = list(PAGE_FORMATS) + [CUSTOM_FORMAT]
+
+# Dokumenty do tylu stron analizowane są bez puli procesów
+INLINE_PAGE_LIMIT = 48
+
+# Rekord strony: (szerokość pt, wysokość pt, kolorowość, czy jest tekst, liczba obrazów)
+PageRecord = Tuple[float, float, float, bool, int]
+
+
+def detect_format(width_pt: float, height_pt: float) -> str:
+    """Rozpoznaje format strony (A4, A3, ...) w dowolnej orientacji"""
+    width_mm = round(width_pt / 72 * 25.4)
+    height_mm = round(height_pt / 72 * 25.4)
+    tol = FORMAT_TOLERANCE_MM
+    for name, (fw, fh) in PAGE_FORMATS.items():
+        if (abs(width_mm - fw) <= tol and abs(height_mm - fh) <= tol) or \
+           (abs(width_mm - fh) <= tol and abs(height_mm - fw) <= tol):
+            return name
+    return CUSTOM_FORMAT
+
+
+def analyze_page(page, render_scale: float = 0.2) -> PageRecord:
+    """
+    Analizuje pojedynczą stronę.
+
+    Args:
+        page: Strona fitz.Page
+        render_scale: Skala renderowania do oceny kolorowości
+
+    Returns:
+        Rekord (szerokość, wysokość, kolorowość, czy_tekst, liczba_obrazów)
+    """
+    rect = page.rect
+    try:
+        score = page_colorfulness(page, render_scale)
+    except Exception:
+        score = 0.0  # If error, assume grayscale
+    has_text = bool(page.get_text("text").strip())
+    image_count = len(page.get_images(full=False))
+    return rect.width, rect.height, score, has_text, image_count
+
+
+class PageAnalysisIndex:
+    """Kolumnowy indeks wyników analizy stron (jedna tablica NumPy na cechę)"""
+
+    def __init__(self, page_count: int):
+        self.page_count = page_count
+        self.width = np.zeros(page_count, dtype=np.float32)
+        self.height = np.zeros(page_count, dtype=np.float32)
+        self.format_code = np.full(page_count, len(FORMAT_NAMES) - 1, dtype=np.int8)
+        self.colorfulness = np.zeros(page_count, dtype=np.float32)
+        self.has_text = np.zeros(page_count, dtype=bool)
+        self.image_count = np.zeros(page_count, dtype=np.int32)
+        self.has_geometry = np.zeros(page_count, dtype=bool)
+        self.analyzed = np.zeros(page_count, dtype=bool)
+
+    @classmethod
+    def from_geometry(cls, doc) -> "PageAnalysisIndex":
+        """Indeks z samą geometrią stron (bez renderowania) - wystarcza do zapytań o orientację"""
+        index = cls(len(doc))
+        for i in range(len(doc)):
+            rect = doc.load_page(i).rect
+            index.set_geometry(i, rect.width, rect.height)
+        return index
+
+    @property
+    def analyzed_count(self) -> int:
+        return int(self.analyzed.sum())
+
+    @property
+    def complete(self) -> bool:
+        return bool(self.analyzed.all())
+
+    # ============================================================================
+    # ZAPIS
+    # ============================================================================
+
+    def set_geometry(self, page_index: int, width: float, height: float):
+        self.width[page_index] = width
+        self.height[page_index] = height
+        self.format_code[page_index] = FORMAT_NAMES.index(detect_format(width, height))
+        self.has_geometry[page_index] = True
+
+    def store(self, page_index: int, record: PageRecord):
+        """Zapisuje rekord analizy strony"""
+        width, height, score, has_text, image_count = record
+        self.set_geometry(page_index, width, height)
+        self.colorfulness[page_index] = score
+        self.has_text[page_index] = has_text
+        self.image_count[page_index] = image_count
+        self.analyzed[page_index] = True
+
+    # ============================================================================
+    # ZAPYTANIA
+    # ============================================================================
+
+    def portrait_pages(self) -> List[int]:
+        """Strony pionowe (wysokość > szerokość)"""
+        return np.flatnonzero(self.has_geometry & (self.height > self.width)).tolist()
+
+    def landscape_pages(self) -> List[int]:
+        """Strony poziome (szerokość >= wysokość)"""
+        return np.flatnonzero(self.has_geometry & (self.width >= self.height)).tolist()
+
+    def color_pages(self, threshold: float) -> List[int]:
+        """Przeanalizowane strony o kolorowości powyżej progu"""
+        return np.flatnonzero(self.analyzed & (self.colorfulness > threshold)).tolist()
+
+    def text_pages(self) -> List[int]:
+        """Przeanalizowane strony zawierające tekst"""
+        return np.flatnonzero(self.analyzed & self.has_text).tolist()
+
+    def groups(self, threshold: float) -> Dict[Tuple[bool, str], dict]:
+        """
+        Grupuje przeanalizowane strony według kolorystyki i formatu.
+
+        Returns:
+            Słownik (czy_kolor, format) -> {'pages': [...], 'landscape_count': n},
+            gdzie poziome są strony o szerokości większej niż wysokość
+        """
+        result = {}
+        is_color = self.colorfulness > threshold
+        landscape = self.width > self.height
+        for color in (False, True):
+            for code, name in enumerate(FORMAT_NAMES):
+                mask = self.analyzed & (is_color == color) & (self.format_code == code)
+                pages = np.flatnonzero(mask)
+                if pages.size:
+                    result[(color, name)] = {
+                        'pages': pages.tolist(),
+                        'landscape_count': int((landscape & mask).sum()),
+                    }
+        return result
+
+
+# ============================================================================
+# PROCESY ROBOCZE
+# ============================================================================
+
+_worker_doc = None
+
+
+def _worker_open(path: Optional[str], data: Optional[bytes]):
+    """Inicjalizacja procesu roboczego - otwiera własną kopię dokumentu"""
+    global _worker_doc
+    _worker_doc = fitz.open(path) if path else fitz.open("pdf", data)
+
+
+def _worker_run(task: Callable, page_indices: List[int], options: dict) -> List[Tuple[int, tuple]]:
+    """Wykonuje funkcję strony dla paczki stron w procesie roboczym"""
+    return [(i, task(_worker_doc.load_page(i), **options)) for i in page_indices]
+
+
+class DocumentAnalyzer:
+    """Analiza stron w puli procesów z przekazywaniem częściowych wyników do wątku Tk"""
+
+    def __init__(self, master, on_progress: Callable[[List[int]], None],
+                 on_done: Optional[Callable[[], None]] = None, workers: Optional[int] = None,
+                 chunk_size: int = 16, poll_ms: int = 50, inline_batch: int = 4):
+        """
+        Args:
+            master: Widget Tk używany do planowania odpytywania (after)
+            on_progress: Callback z listą stron, których wyniki właśnie trafiły do indeksu
+            on_done: Callback po zakończeniu analizy wszystkich stron
+            workers: Liczba procesów roboczych (domyślnie liczba CPU - 1, max 8)
+            chunk_size: Liczba stron w jednym zleceniu dla procesu
+            poll_ms: Odstęp odpytywania wyników w ms
+            inline_batch: Liczba stron analizowanych w jednym cyklu w trybie bez puli
+        """
+        self.master = master
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.worker_count = workers or max(1, min(8, (os.cpu_count() or 2) - 1))
+        self.chunk_size = chunk_size
+        self.poll_ms = poll_ms
+        self.inline_batch = inline_batch
+        self.index = None
+        self._executor = None
+        self._results = queue.Queue()
+        self._remaining = 0
+        self._inline_doc = None
+        self._inline_pages: List[int] = []
+        self._task = analyze_page
+        self._options = {}
+        self._poll_id = None
+        self._run = 0
+
+    @property
+    def running(self) -> bool:
+        return self._remaining > 0
+
+    def start(self, index, doc, path: Optional[str] = None, data: Optional[bytes] = None,
+              page_indices: Optional[Iterable[int]] = None, task: Callable = analyze_page, **options):
+        """
+        Rozpoczyna analizę stron (przerywa poprzednią).
+
+        Args:
+            index: Odbiorca wyników z metodą store(page_index, rekord), np. PageAnalysisIndex
+            doc: Otwarty dokument (tryb bez puli dla małych dokumentów)
+            path: Ścieżka pliku, gdy dokument w pamięci odpowiada plikowi
+            data: Bajty dokumentu (gdy dokument był modyfikowany); None - pobierane z doc
+            page_indices: Strony do analizy (domyślnie wszystkie)
+            task: Funkcja strony task(page, **options) -> rekord; musi być zdefiniowana
+                  na poziomie modułu (przekazywana do procesów roboczych)
+            **options: Parametry funkcji strony (np. render_scale dla analyze_page)
+        """
+        self.cancel()
+        self._run += 1
+        self.index = index
+        self._task = task
+        self._options = options
+        pages = list(range(len(doc)) if page_indices is None else page_indices)
+        self._remaining = len(pages)
+        if not pages:
+            self._finish()
+            return
+        if len(pages) <= INLINE_PAGE_LIMIT:
+            self._inline_doc = doc
+            self._inline_pages = pages
+        else:
+            if not path and data is None:
+                data = doc.tobytes(encryption=fitz.PDF_ENCRYPT_NONE)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.worker_count,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_worker_open, initargs=(path, data if not path else None),
+            )
+            run = self._run
+            for start in range(0, len(pages), self.chunk_size):
+                chunk = pages[start:start + self.chunk_size]
+                future = self._executor.submit(_worker_run, task, chunk, options)
+                future.add_done_callback(lambda f, run=run, count=len(chunk): self._results.put((run, count, f)))
+        self._schedule_poll()
+
+    def cancel(self):
+        """Przerywa bieżącą analizę (wyniki już zapisane w indeksie pozostają)"""
+        self._remaining = 0
+        self._inline_doc = None
+        self._inline_pages = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._poll_id is not None:
+            try:
+                self.master.after_cancel(self._poll_id)
+            except Exception:
+                pass
+            self._poll_id = None
+
+    # ============================================================================
+    # DOSTARCZANIE WYNIKÓW (WĄTEK TK)
+    # ============================================================================
+
+    def _schedule_poll(self):
+        if self._poll_id is None and self._remaining > 0:
+            self._poll_id = self.master.after(self.poll_ms, self._poll)
+
+    def _poll(self):
+        """Przenosi gotowe wyniki do indeksu i zgłasza je callbackiem"""
+        self._poll_id = None
+        updated = []
+        if self._inline_doc is not None:
+            batch, self._inline_pages = self._inline_pages[:self.inline_batch], self._inline_pages[self.inline_batch:]
+            for i in batch:
+                self.index.store(i, self._task(self._inline_doc.load_page(i), **self._options))
+                updated.append(i)
+        else:
+            while True:
+                try:
+                    run, count, future = self._results.get_nowait()
+                except queue.Empty:
+                    break
+                if run != self._run or future.cancelled():
+                    continue
+                try:
+                    records = future.result()
+                except Exception as e:
+                    print(f"[ANALIZA] Błąd analizy stron: {e}")
+                    self._remaining -= count  # Strony bez wyników - analiza i tak musi się zakończyć
+                    continue
+                for i, record in records:
+                    self.index.store(i, record)
+                    updated.append(i)
+        self._remaining -= len(updated)
+        if updated:
+            self.on_progress(updated)
+        if self._remaining > 0:
+            self._schedule_poll()
+        else:
+            self._finish()
+
+    def _finish(self):
+        self._remaining = 0
+        self._inline_doc = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self.on_done:
+            self.on_done()
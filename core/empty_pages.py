@@ -0,0 +1,186 @@
+"""
+EmptyPages - Wielostopniowe wykrywanie pustych stron
+
+Najtańsze testy wykonywane są najpierw, droższe tylko gdy tańsze nie rozstrzygają:
+
+1. Struktura: strona bez treści (puste strumienie /Contents, brak widocznych
+   adnotacji) albo treść bez żadnego operatora rysującego (np. same "q cm Q")
+   - pusta z pewnością 1.0.
+2. Tekst: strona z czcionkami w zasobach i niepustym tekstem - niepusta z pewnością 1.0.
+3. Raster: render RGB i pomiar pokrycia "tuszem" (NumPy) - piksele, których
+   dowolna składowa różni się od tła (mediana składowej) o więcej niż tolerancja,
+   więc jasne barwne wypełnienia też są tuszem. Strony ze ścieżkami (operatory
+   obrysu/wypełnienia w treści lub Form XObject) renderowane są w większej skali,
+   by cienkie linie (0.3 pt) miały pełny kontrast; koszt renderu zależy głównie
+   od interpretacji treści, nie od liczby pikseli. Skany renderowane są w skali
+   podstawowej - test rozpoznaje zeskanowane puste strony (szum, szare tło papieru).
+
+Wynik strony to (czy_pusta, pewność 0.5-1.0, pokrycie tuszem). Pewność testu
+rastrowego rośnie z odległością pokrycia od progu.
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+import fitz  # PyMuPDF
+import numpy as np
+
+
+# Domyślny próg pokrycia tuszem (część powierzchni strony)
+DEFAULT_INK_THRESHOLD = 0.0002
+
+# Piksel jest "tuszem", gdy różni się od tła o więcej niż tyle poziomów szarości
+DEFAULT_TOLERANCE = 32
+
+# Skala renderowania testu rastrowego (1.0 = 72 DPI - cienkie linie skanu zachowują kontrast)
+DEFAULT_RENDER_SCALE = 1.0
+
+# Minimalna skala renderowania stron ze ścieżkami (216 DPI - linia 0.3 pt ma prawie piksel szerokości)
+HAIRLINE_RENDER_SCALE = 3.0
+
+# Tło ciemniejsze niż ta wartość nie jest pustą kartką
+LIGHT_BACKGROUND_MIN = 160
+
+# Strumienie treści do tej długości sprawdzane są pod kątem operatorów rysujących
+STRUCTURE_SCAN_LIMIT = 4096
+
+# Operatory, które mogą coś narysować (ścieżki, tekst, obrazy, cieniowania, obrazy inline)
+_PAINT_OPERATORS = re.compile(rb"(?<![A-Za-z0-9*'\"/])(f\*?|F|S|s|B\*?|b\*?|sh|Do|Tj|TJ|'|\"|BI)(?![A-Za-z0-9*])")
+
+# Operatory rysujące ścieżki (obrys, wypełnienie)
+_PATH_OPERATORS = re.compile(rb"(?<![A-Za-z0-9*'\"/])(f\*?|F|S|s|B\*?|b\*?)(?![A-Za-z0-9*])")
+
+# Rodzaje adnotacji, które nie są drukowane na stronie
+_INVISIBLE_ANNOTS = {fitz.PDF_ANNOT_LINK, fitz.PDF_ANNOT_POPUP}
+
+# Rekord strony: (czy pusta, pewność, pokrycie tuszem)
+EmptyPageRecord = Tuple[bool, float, float]
+
+
+def _has_visible_annotations(page) -> bool:
+    return any(annot.type[0] not in _INVISIBLE_ANNOTS for annot in page.annots())
+
+
+def _structure_is_empty(page) -> Optional[bool]:
+    """Test strukturalny: True - na pewno pusta, None - nie rozstrzyga"""
+    doc = page.parent
+    contents = page.get_contents()
+    total = 0
+    streams = []
+    for xref in contents:
+        kind, length = doc.xref_get_key(xref, "Length")
+        if kind == "int" and int(length) > STRUCTURE_SCAN_LIMIT:
+            return None  # Duży strumień - nie warto go dekodować na tym etapie
+        data = doc.xref_stream(xref) or b""
+        total += len(data)
+        if total > STRUCTURE_SCAN_LIMIT:
+            return None
+        streams.append(data)
+    if _PAINT_OPERATORS.search(b"\n".join(streams)):
+        return None
+    if _has_visible_annotations(page):
+        return None
+    return True
+
+
+def _has_fonts(page) -> bool:
+    return bool(page.get_fonts(full=False))
+
+
+def _has_paths(page) -> bool:
+    """Czy treść strony rysuje ścieżki (Form XObject traktowane jak ścieżki)"""
+    if page.get_xobjects():
+        return True
+    doc = page.parent
+    return any(_PATH_OPERATORS.search(doc.xref_stream(xref) or b"") for xref in page.get_contents())
+
+
+def ink_coverage(page, render_scale: float = DEFAULT_RENDER_SCALE, tolerance: int = DEFAULT_TOLERANCE) -> float:
+    """
+    Część powierzchni strony pokryta "tuszem".
+
+    Args:
+        page: Strona fitz.Page
+        render_scale: Skala renderowania (1.0 = 72 DPI)
+        tolerance: Różnica składowej od tła, od której piksel jest tuszem
+
+    Returns:
+        Pokrycie 0.0-1.0 (1.0, gdy tło jest ciemne - to nie jest pusta kartka)
+    """
+    pix = page.get_pixmap(matrix=fitz.Matrix(render_scale, render_scale),
+                          colorspace=fitz.csRGB, alpha=False, annots=True)
+    if pix.width == 0 or pix.height == 0:
+        return 0.0
+    rows = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)
+    rgb = rows[:, :pix.width * 3].reshape(pix.height, pix.width, 3)
+    ink = np.zeros((pix.height, pix.width), dtype=bool)
+    coverage = None
+    for channel in range(3):
+        values = rgb[:, :, channel]
+        background = int(np.median(values[::4, ::4]))
+        if background < LIGHT_BACKGROUND_MIN:
+            coverage = 1.0
+            break
+        ink |= values < background - tolerance
+        ink |= values > background + tolerance
+    if coverage is None:
+        coverage = np.count_nonzero(ink) / ink.size
+    del rows, rgb, values  # widoki muszą zniknąć przed zwolnieniem pixmapy
+    return coverage
+
+
+def detect_empty_page(page, ink_threshold: float = DEFAULT_INK_THRESHOLD,
+                      tolerance: int = DEFAULT_TOLERANCE,
+                      render_scale: float = DEFAULT_RENDER_SCALE) -> EmptyPageRecord:
+    """
+    Sprawdza, czy strona jest pusta (testy od najtańszego).
+
+    Args:
+        page: Strona fitz.Page
+        ink_threshold: Maksymalne pokrycie tuszem pustej strony (część powierzchni)
+        tolerance: Tolerancja tła w poziomach szarości
+        render_scale: Skala renderowania testu rastrowego (strony ze ścieżkami - co najmniej
+                      HAIRLINE_RENDER_SCALE)
+
+    Returns:
+        Rekord (czy_pusta, pewność, pokrycie_tuszem)
+    """
+    if _structure_is_empty(page):
+        return True, 1.0, 0.0
+    if _has_fonts(page) and page.get_text("text").strip():
+        return False, 1.0, 1.0
+    if _has_paths(page):
+        render_scale = max(render_scale, HAIRLINE_RENDER_SCALE)
+    coverage = float(ink_coverage(page, render_scale, tolerance))
+    if ink_threshold <= 0:
+        return coverage == 0, 1.0, coverage
+    ratio = coverage / ink_threshold
+    if ratio <= 1.0:
+        return True, 1.0 - 0.5 * ratio, coverage
+    return False, 1.0 - 0.5 / ratio, coverage
+
+
+class EmptyPageResults:
+    """Wyniki wykrywania pustych stron (odbiorca wyników dla DocumentAnalyzer)"""
+
+    def __init__(self, page_count: int):
+        self.page_count = page_count
+        self.empty = np.zeros(page_count, dtype=bool)
+        self.confidence = np.zeros(page_count, dtype=np.float32)
+        self.coverage = np.zeros(page_count, dtype=np.float32)
+        self.done = np.zeros(page_count, dtype=bool)
+
+    @property
+    def done_count(self) -> int:
+        return int(self.done.sum())
+
+    def store(self, page_index: int, record: EmptyPageRecord):
+        is_empty, confidence, coverage = record
+        self.empty[page_index] = is_empty
+        self.confidence[page_index] = confidence
+        self.coverage[page_index] = coverage
+        self.done[page_index] = True
+
+    def empty_pages(self, min_confidence: float = 0.0) -> List[int]:
+        """Puste strony (z pewnością co najmniej min_confidence)"""
+        return np.flatnonzero(self.done & self.empty & (self.confidence >= min_confidence)).tolist()
@@ -0,0 +1,250 @@
+"""
+ThumbnailImageCache - Cache miniatur w pamięci ograniczony budżetem bajtów
+
+Przechowuje obrazy miniatur (ImageTk.PhotoImage) dla par (strona, szerokość).
+Każdy wpis ma przybliżony rozmiar w×h×3 bajtów. Po przekroczeniu budżetu
+usuwane są najdawniej używane wpisy (LRU), w pierwszej kolejności strony
+spoza widoku - miniatury widocznych stron usuwane są dopiero na końcu.
+
+Dla każdej strony cache trzyma też piramidę obrazów PIL: obraz bazowy
+wyrenderowany raz w największej szerokości miniatur i poziomy pomniejszone
+o połowę (Image.reduce). Miniatura w dowolnej mniejszej szerokości powstaje
+przez przeskalowanie najbliższego większego poziomu - zmiana powiększenia
+nie wymaga ponownego renderowania strony. Piramida liczy się do budżetu
+i jest usuwana razem z miniaturami strony (discard_page, clear).
+
+Cache zlicza trafienia, chybienia i usunięcia wpisów.
+"""
+
+from collections import OrderedDict
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+from PIL import Image
+
+
+# Szerokość w kluczu wpisu z piramidą obrazów strony (miniatury mają szerokość > 0)
+PYRAMID_KEY_WIDTH = 0
+
+
+def pyramid_image(levels: List[Image.Image], width: int, height: int) -> Image.Image:
+    """
+    Obraz o rozmiarze (width, height) z piramidy; brakujące poziomy (kolejne połowy) są dopisywane do levels.
+
+    Args:
+        levels: Poziomy piramidy od największego (obraz bazowy)
+        width, height: Rozmiar wynikowy (nie większy niż obraz bazowy)
+
+    Returns:
+        Obraz PIL - poziom piramidy albo jego przeskalowanie (uśrednianie pikseli)
+    """
+    while levels[-1].width // 2 >= width and levels[-1].height // 2 >= 1:
+        levels.append(levels[-1].reduce(2))
+    for level in reversed(levels):
+        if level.width >= width:
+            break
+    if level.size == (width, height):
+        return level
+    return level.resize((width, height), Image.BOX)
+
+
+class ThumbnailImageCache:
+    """Cache LRU miniatur (strona, szerokość) -> obraz z budżetem pamięci"""
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        """
+        Args:
+            max_bytes: Budżet pamięci w bajtach
+        """
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        # (strona, szerokość) -> (PhotoImage, rozmiar); (strona, PYRAMID_KEY_WIDTH) -> (poziomy piramidy, rozmiar)
+        self._entries: "OrderedDict[Tuple[int, int], Tuple[Any, int]]" = OrderedDict()
+        self._visible = frozenset()
+        # Strony, których piramida jest tymczasowa (wyliczona z poprzedniej wersji strony)
+        self._provisional = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ============================================================================
+    # ODCZYT I ZAPIS
+    # ============================================================================
+
+    def get(self, page_index: int, width: int) -> Optional[Any]:
+        """Zwraca obraz i oznacza go jako ostatnio użyty (None, gdy brak)"""
+        key = (page_index, width)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def contains(self, page_index: int, width: int) -> bool:
+        """Czy obraz jest w cache (bez wpływu na kolejność LRU i liczniki)"""
+        return (page_index, width) in self._entries
+
+    # ============================================================================
+    # PIRAMIDA OBRAZÓW
+    # ============================================================================
+
+    def put_source(self, page_index: int, image: Image.Image, exact: bool = True):
+        """
+        Zapamiętuje obraz bazowy piramidy strony (miniatura w największej szerokości).
+
+        Args:
+            page_index: Indeks strony
+            image: Obraz bazowy (PIL)
+            exact: False - obraz tymczasowy (np. przekształcona poprzednia miniatura); has_source()
+                   zwraca dla niego False, więc strona trafia do renderowania, a do tego czasu
+                   derive() korzysta z obrazu tymczasowego
+        """
+        if exact:
+            self._provisional.discard(page_index)
+        else:
+            self._provisional.add(page_index)
+        key = (page_index, PYRAMID_KEY_WIDTH)
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.total_bytes -= old[1]
+        # Poziomy pomniejszone o połowę zajmują łącznie najwyżej 1/3 obrazu bazowego
+        nbytes = image.width * image.height * 3 * 4 // 3
+        self._entries[key] = ([image], nbytes)
+        self.total_bytes += nbytes
+        self._evict(keep=key)
+
+    def has_source(self, page_index: int, width: int = 0) -> bool:
+        """Czy dokładna piramida strony może dać miniaturę o szerokości width (bez wpływu na LRU)"""
+        entry = self._entries.get((page_index, PYRAMID_KEY_WIDTH))
+        return entry is not None and entry[0][0].width >= width and page_index not in self._provisional
+
+    def source_image(self, page_index: int) -> Optional[Image.Image]:
+        """Obraz bazowy piramidy strony (np. do przekształcenia po obrocie); None, gdy brak"""
+        entry = self._entries.get((page_index, PYRAMID_KEY_WIDTH))
+        return entry[0][0] if entry is not None else None
+
+    def derive(self, page_index: int, width: int, height: int) -> Optional[Image.Image]:
+        """
+        Miniatura strony z piramidy (bez renderowania).
+
+        Args:
+            page_index: Indeks strony
+            width, height: Rozmiar miniatury
+
+        Returns:
+            Obraz PIL albo None (brak piramidy lub obraz bazowy mniejszy niż width)
+        """
+        key = (page_index, PYRAMID_KEY_WIDTH)
+        entry = self._entries.get(key)
+        if entry is None or entry[0][0].width < width:
+            return None
+        self._entries.move_to_end(key)
+        return pyramid_image(entry[0], width, height)
+
+    def put(self, page_index: int, width: int, image: Any, height: int):
+        """
+        Dodaje obraz do cache i usuwa nadmiarowe wpisy.
+
+        Args:
+            page_index: Indeks strony
+            width: Szerokość miniatury
+            image: Obraz miniatury
+            height: Wysokość miniatury (do oszacowania rozmiaru w×h×3)
+        """
+        key = (page_index, width)
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.total_bytes -= old[1]
+        nbytes = width * height * 3
+        self._entries[key] = (image, nbytes)
+        self.total_bytes += nbytes
+        self._evict(keep=key)
+
+    def discard_page(self, page_index: int):
+        """Usuwa wszystkie szerokości miniatury strony (np. po zmianie jej zawartości)"""
+        for key in [key for key in self._entries if key[0] == page_index]:
+            self.total_bytes -= self._entries.pop(key)[1]
+        self._provisional.discard(page_index)
+
+    def remap(self, new_indices: Sequence[Optional[int]]):
+        """
+        Przenosi wpisy na nowe indeksy stron po usunięciu, wstawieniu lub zmianie kolejności stron.
+
+        Args:
+            new_indices: Dla każdej strony sprzed zmiany jej nowy indeks (None - strona usunięta),
+                         np. z core.page_order.deletion_map()
+        """
+        def new_index(page_index):
+            return new_indices[page_index] if page_index < len(new_indices) else None
+
+        entries = OrderedDict()
+        for (page_index, width), entry in self._entries.items():
+            target = new_index(page_index)
+            if target is None:
+                self.total_bytes -= entry[1]
+            else:
+                entries[(target, width)] = entry
+        self._entries = entries
+        self._provisional = {new_index(i) for i in self._provisional} - {None}
+        self._visible = frozenset(new_index(i) for i in self._visible) - {None}
+
+    def clear(self):
+        """Usuwa wszystkie wpisy (liczniki pozostają)"""
+        self._entries.clear()
+        self._provisional.clear()
+        self.total_bytes = 0
+
+    # ============================================================================
+    # BUDŻET I WIDOCZNOŚĆ
+    # ============================================================================
+
+    def set_visible(self, page_indices: Iterable[int]):
+        """Ustawia strony widoczne w oknie - ich miniatury są usuwane w ostatniej kolejności"""
+        self._visible = frozenset(page_indices)
+
+    def set_budget(self, max_bytes: int):
+        """Zmienia budżet pamięci i od razu go egzekwuje"""
+        self.max_bytes = max_bytes
+        self._evict()
+
+    def stats(self) -> dict:
+        """Liczniki i zajętość cache"""
+        lookups = self.hits + self.misses
+        pyramids = sum(1 for key in self._entries if key[1] == PYRAMID_KEY_WIDTH)
+        return {
+            'entries': len(self._entries) - pyramids,
+            'pyramids': pyramids,
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+
+    def summary(self) -> str:
+        """Krótki opis stanu cache do logów"""
+        s = self.stats()
+        return (f"{s['entries']} miniatur, {s['pyramids']} piramid, {s['bytes'] / (1024 * 1024):.1f}/{s['max_bytes'] / (1024 * 1024):.0f} MB, "
+                f"trafienia {s['hits']}, chybienia {s['misses']}, usunięte {s['evictions']}")
+
+    # ============================================================================
+    # METODY POMOCNICZE
+    # ============================================================================
+
+    def _evict(self, keep: Optional[Tuple[int, int]] = None):
+        """Usuwa wpisy LRU ponad budżet: najpierw strony niewidoczne, potem widoczne"""
+        if self.total_bytes <= self.max_bytes:
+            return
+        for spare_visible in (True, False):
+            for key in list(self._entries):
+                if self.total_bytes <= self.max_bytes:
+                    return
+                if key == keep or (spare_visible and key[0] in self._visible):
+                    continue
+                self.total_bytes -= self._entries.pop(key)[1]
+                self.evictions += 1
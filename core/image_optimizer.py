@@ -0,0 +1,441 @@
+"""
+ImageOptimizer - Zmniejszanie i ponowna kompresja obrazów w dokumencie
+
+Skany mają często obrazy 600-1200 DPI, choć do druku wystarcza 300 DPI,
+a do ekranu 150 DPI. Optymalizacja przebiega w trzech krokach:
+
+1. Plan (wątek wywołujący): dla każdego obrazu efektywna rozdzielczość
+   z położenia na stronach (najmniejsza ze wszystkich użyć - obraz musi
+   wystarczyć do największego z nich) oraz scalenie identycznych strumieni
+   obrazów (odwołania duplikatów w zasobach stron wskazują jeden obiekt).
+2. Przetwarzanie (pula procesów, jak DocumentAnalyzer): obrazy powyżej progu
+   są zmniejszane do rozdzielczości docelowej i kompresowane ponownie - JPEG
+   dla obrazów kolorowych i szarych (obraz RGB bez koloru zapisywany jest jako
+   szary), CCITT G4 dla obrazów czarno-białych (1 bit).
+3. Zapis wyników do dokumentu (wątek wywołujący) - tylko gdy nowy strumień jest
+   mniejszy od dotychczasowego.
+
+Pomijane są obrazy, których nie da się bezpiecznie zamienić: maski (/ImageMask),
+obrazy z maską kolorów (/Mask), obrazy wbudowane w treść strony oraz przestrzenie
+barw inne niż szarość i RGB (CMYK, Lab, Separation).
+"""
+
+import io
+import os
+import re
+import zlib
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+
+from .color_analysis import colorfulness_score
+
+
+class ImagePreset(NamedTuple):
+    """Parametry optymalizacji obrazów"""
+    label: str           # Nazwa wyświetlana
+    target_dpi: int      # Rozdzielczość docelowa obrazów kolorowych i szarych
+    threshold_dpi: int   # Obrazy powyżej tej rozdzielczości są zmniejszane
+    jpeg_quality: int    # Jakość JPEG (1-95)
+    bilevel_dpi: int     # Rozdzielczość docelowa obrazów czarno-białych (próg - proporcjonalnie)
+
+
+IMAGE_PRESETS: Dict[str, ImagePreset] = {
+    'print': ImagePreset("Druk 300 DPI", 300, 450, 85, 600),
+    'screen': ImagePreset("Ekran 150 DPI", 150, 225, 75, 300),
+}
+
+# Obraz RGB, którego kolorowość (0-255) nie przekracza tej wartości, zapisywany jest jako szary
+GRAY_MAX_COLORFULNESS = 8
+
+# Do tylu obrazów przetwarzanie odbywa się bez puli procesów
+INLINE_IMAGE_LIMIT = 4
+
+# Filtry obrazów czarno-białych, których nie warto kompresować ponownie
+_BILEVEL_FILTERS = ("/CCITTFaxDecode", "/JBIG2Decode")
+
+# Przestrzenie barw, których obrazy optymalizator zapisuje jako szare lub RGB
+_SUPPORTED_COLORSPACES = ("DeviceGray", "DeviceRGB", "CalGray", "CalRGB", "ICCBased", "Indexed")
+_UNSUPPORTED_COLORSPACES = ("DeviceCMYK", "Lab", "Separation", "DeviceN", "Pattern")
+
+_LENGTH_KEY = re.compile(r"/Length \d+(?: 0 R)?")
+_REFERENCE = re.compile(r"(\d+) 0 R")
+# Głębokość rozwijania odwołań przy porównywaniu obrazów (obraz -> przestrzeń barw -> profil ICC)
+_REFERENCE_DEPTH = 3
+
+
+class ImageJob(NamedTuple):
+    """Obraz do przetworzenia"""
+    xref: int
+    scale: float      # Skala zmniejszenia (1.0 - tylko ponowna kompresja)
+    bilevel: bool     # Obraz czarno-biały (1 bit, szarość)
+    raw_size: int     # Rozmiar dotychczasowego strumienia w zapisanym pliku (_stored_size)
+    first_page: int   # Strona, której przypisywana jest oszczędność
+
+
+class DuplicateImage(NamedTuple):
+    """Obraz identyczny z innym - odwołania do niego zastępowane są odwołaniem do obrazu canonical"""
+    xref: int
+    canonical: int
+    raw_size: int
+    first_page: int
+
+
+class ImageOptimizationPlan(NamedTuple):
+    """Plan optymalizacji: duplikaty do scalenia, obrazy do przetworzenia i strony, których dotyczą"""
+    preset: ImagePreset
+    duplicates: List[DuplicateImage]
+    jobs: List[ImageJob]
+    pages: List[int]             # Strony korzystające z obrazów zmienianych lub scalanych
+
+
+class ImageOptimizationReport:
+    """Wynik optymalizacji z oszczędnością bajtów na stronę"""
+
+    def __init__(self):
+        self.saved_by_page: Dict[int, int] = {}
+        self.images_optimized = 0
+        self.duplicates_merged = 0
+
+    @property
+    def total_saved(self) -> int:
+        return sum(self.saved_by_page.values())
+
+    def add(self, page_index: int, saved: int):
+        self.saved_by_page[page_index] = self.saved_by_page.get(page_index, 0) + saved
+
+
+# ============================================================================
+# PLAN
+# ============================================================================
+
+def effective_dpi(width: int, height: int, transform) -> float:
+    """
+    Rozdzielczość obrazu w miejscu użycia.
+
+    Args:
+        width, height: Wymiary obrazu w pikselach
+        transform: Macierz (a, b, c, d, e, f) odwzorowująca kwadrat jednostkowy obrazu na stronę
+
+    Returns:
+        Mniejsza z rozdzielczości poziomej i pionowej (DPI); 0 dla obrazu zdegenerowanego
+    """
+    a, b, c, d = transform[:4]
+    extent_x = (a * a + b * b) ** 0.5
+    extent_y = (c * c + d * d) ** 0.5
+    if extent_x == 0 or extent_y == 0:
+        return 0.0
+    return min(width * 72.0 / extent_x, height * 72.0 / extent_y)
+
+
+def _image_placements(page) -> List[Tuple[int, dict]]:
+    """
+    Użycia obrazów na stronie jako pary (xref, informacje z get_image_info).
+
+    get_image_info(xrefs=True) dekoduje każdy obraz, by go rozpoznać (sekundy dla skanów),
+    więc obrazy dopasowywane są po wymiarach do listy get_images(); dekodowanie tylko
+    wtedy, gdy na stronie są różne obrazy o tych samych wymiarach.
+    """
+    xrefs_by_size: Dict[Tuple[int, int], set] = {}
+    for image in page.get_images(full=True):
+        xrefs_by_size.setdefault((image[2], image[3]), set()).add(image[0])
+    infos = page.get_image_info()
+    if any(len(xrefs_by_size.get((info["width"], info["height"]), ())) != 1 for info in infos):
+        return [(info["xref"], info) for info in page.get_image_info(xrefs=True)]
+    return [(next(iter(xrefs_by_size[(info["width"], info["height"])])), info) for info in infos]
+
+
+def _object_key(doc, xref: int) -> str:
+    """
+    Klucz identyczności obrazu: skrót surowego strumienia i słownika obiektu (bez /Length).
+    Odwołania w słowniku (przestrzeń barw, profil ICC, /SMask) zastępowane są skrótem
+    wskazanego obiektu - kopie tego samego pliku mają identyczne obrazy z różnymi numerami profili.
+    """
+    def object_digest(target: int, depth: int) -> str:
+        definition = _LENGTH_KEY.sub("", doc.xref_object(target, compressed=True))
+        if depth < _REFERENCE_DEPTH:
+            definition = _REFERENCE.sub(lambda match: object_digest(int(match.group(1)), depth + 1), definition)
+        content = definition.encode()
+        if doc.xref_is_stream(target):
+            content += doc.xref_stream_raw(target) or b""
+        return hashlib.md5(content).hexdigest()
+
+    return object_digest(xref, 0)
+
+
+def _stored_size(doc, xref: int) -> int:
+    """
+    Rozmiar strumienia w zapisanym pliku. Strumień bez filtra (np. obraz wstawiony
+    w tej sesji) jest w pamięci nieskompresowany, a przy zapisie kompresowany (deflate) -
+    porównywanie z jego surowym rozmiarem zawyżałoby oszczędność.
+    """
+    raw = doc.xref_stream_raw(xref) or b""
+    if doc.xref_get_key(xref, "Filter")[0] == "null":
+        return len(zlib.compress(raw))
+    return len(raw)
+
+
+def _colorspace(doc, xref: int) -> str:
+    """Opis przestrzeni barw obrazu (obiekt pośredni rozwinięty)"""
+    kind, value = doc.xref_get_key(xref, "ColorSpace")
+    if kind == "xref":
+        value = doc.xref_object(int(value.split()[0]), compressed=True)
+    return value
+
+
+def _is_optimizable(doc, xref: int, colorspace: str) -> bool:
+    """Czy obraz można zastąpić nowym strumieniem (patrz opis modułu)"""
+    for key in ("ImageMask", "Mask"):
+        kind, value = doc.xref_get_key(xref, key)
+        if kind != "null" and value != "false":
+            return False
+    return (any(name in colorspace for name in _SUPPORTED_COLORSPACES)
+            and not any(name in colorspace for name in _UNSUPPORTED_COLORSPACES))
+
+
+def plan_image_optimization(doc, preset_name: str) -> ImageOptimizationPlan:
+    """
+    Wyznacza obrazy do scalenia i przetworzenia w całym dokumencie.
+
+    Args:
+        doc: Dokument fitz.Document
+        preset_name: Nazwa ustawień z IMAGE_PRESETS
+
+    Returns:
+        ImageOptimizationPlan
+    """
+    preset = IMAGE_PRESETS[preset_name]
+    pages_by_xref: Dict[int, List[int]] = {}
+    dpi_by_xref: Dict[int, float] = {}
+    for page_index in range(len(doc)):
+        for xref, info in _image_placements(doc.load_page(page_index)):
+            if not xref:
+                continue  # Obraz wbudowany w treść strony
+            pages = pages_by_xref.setdefault(xref, [])
+            if not pages or pages[-1] != page_index:
+                pages.append(page_index)
+            dpi = effective_dpi(info["width"], info["height"], info["transform"])
+            dpi_by_xref[xref] = min(dpi_by_xref.get(xref, dpi), dpi)
+
+    # Identyczne strumienie: pierwszy obraz zastępuje pozostałe
+    canonical_by_key: Dict[str, int] = {}
+    duplicates = []
+    affected = set()
+    for xref in sorted(pages_by_xref):
+        canonical = canonical_by_key.setdefault(_object_key(doc, xref), xref)
+        if canonical != xref:
+            pages = pages_by_xref.pop(xref)
+            duplicates.append(DuplicateImage(xref, canonical, _stored_size(doc, xref), pages[0]))
+            affected.update(pages)
+            pages_by_xref[canonical] = sorted(set(pages_by_xref[canonical]) | set(pages))
+            dpi_by_xref[canonical] = min(dpi_by_xref[canonical], dpi_by_xref[xref])
+
+    bilevel_threshold = preset.bilevel_dpi * preset.threshold_dpi / preset.target_dpi
+    jobs = []
+    for xref, pages in pages_by_xref.items():
+        colorspace = _colorspace(doc, xref)
+        if not _is_optimizable(doc, xref, colorspace):
+            continue
+        dpi = dpi_by_xref[xref]
+        bilevel = doc.xref_get_key(xref, "BitsPerComponent")[1] == "1" and "Indexed" not in colorspace
+        if bilevel:
+            scale = preset.bilevel_dpi / dpi if dpi > bilevel_threshold else 1.0
+            filters = doc.xref_get_key(xref, "Filter")[1]
+            if scale >= 1.0 and any(name in filters for name in _BILEVEL_FILTERS):
+                continue
+        elif dpi > preset.threshold_dpi:
+            scale = preset.target_dpi / dpi
+        else:
+            continue
+        jobs.append(ImageJob(xref, scale, bilevel, _stored_size(doc, xref), pages[0]))
+        affected.update(pages)
+    return ImageOptimizationPlan(preset, duplicates, jobs, sorted(affected))
+
+
+# ============================================================================
+# PRZETWARZANIE OBRAZÓW
+# ============================================================================
+
+def _encode_group4(image: Image.Image) -> bytes:
+    """Dane CCITT G4 obrazu 1-bitowego (jeden pas TIFF)"""
+    buffer = io.BytesIO()
+    image.save(buffer, format="TIFF", compression="group4", tiffinfo={278: image.height})
+    tiff = Image.open(io.BytesIO(buffer.getvalue()))
+    offset, length = tiff.tag_v2[273][0], tiff.tag_v2[279][0]
+    return buffer.getvalue()[offset:offset + length]
+
+
+def _decode_image(doc, job: ImageJob, size: Tuple[int, int]) -> Image.Image:
+    """
+    Obraz PIL (L lub RGB) z obiektu obrazu, nie mniejszy niż size.
+
+    Zmniejszany JPEG dekodowany jest od razu w skali 1/2, 1/4 lub 1/8, jeśli to wystarcza
+    (Image.draft - skalowanie DCT), co przy skanach 600 DPI skraca dekodowanie kilkakrotnie.
+    """
+    if job.scale < 1.0 and doc.xref_get_key(job.xref, "Filter")[1] == "/DCTDecode" \
+            and doc.xref_get_key(job.xref, "Decode")[0] == "null":
+        image = Image.open(io.BytesIO(doc.xref_stream_raw(job.xref)))
+        if image.mode in ("L", "RGB"):
+            image.draft(image.mode, size)
+            return image.convert(image.mode)
+    pix = fitz.Pixmap(doc, job.xref)
+    if pix.alpha:
+        pix = fitz.Pixmap(pix, 0)
+    if pix.n not in (1, 3):
+        pix = fitz.Pixmap(fitz.csRGB, pix)
+    return Image.frombytes("L" if pix.n == 1 else "RGB", (pix.width, pix.height), pix.samples)
+
+
+def optimize_image(doc, job: ImageJob, preset: ImagePreset) -> Optional[Tuple[bytes, Dict[str, str]]]:
+    """
+    Zmniejsza i kompresuje jeden obraz.
+
+    Args:
+        doc: Dokument fitz.Document
+        job: Obraz do przetworzenia
+        preset: Parametry optymalizacji
+
+    Returns:
+        (nowy strumień, klucze słownika obrazu) albo None, gdy wynik nie jest mniejszy
+    """
+    width = int(doc.xref_get_key(job.xref, "Width")[1])
+    height = int(doc.xref_get_key(job.xref, "Height")[1])
+    size = (max(1, int(width * job.scale)), max(1, int(height * job.scale)))
+    image = _decode_image(doc, job, size)
+    if image.size != size:
+        image = image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+
+    if job.bilevel:
+        bilevel = image.convert("L").convert("1", dither=Image.Dither.NONE)
+        data = _encode_group4(bilevel)
+        keys = {
+            "Filter": "/CCITTFaxDecode",
+            "DecodeParms": f"<</K -1/Columns {bilevel.width}/Rows {bilevel.height}/BlackIs1 true>>",
+            "ColorSpace": "/DeviceGray",
+            "BitsPerComponent": "1",
+        }
+    else:
+        if image.mode == "RGB":
+            samples = np.asarray(image)
+            if colorfulness_score(samples) <= GRAY_MAX_COLORFULNESS:
+                image = image.convert("L")
+            del samples
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=preset.jpeg_quality, optimize=True)
+        data = buffer.getvalue()
+        keys = {
+            "Filter": "/DCTDecode",
+            "DecodeParms": "null",
+            "ColorSpace": "/DeviceGray" if image.mode == "L" else "/DeviceRGB",
+            "BitsPerComponent": "8",
+        }
+    if len(data) >= job.raw_size:
+        return None
+    keys.update({"Width": str(image.width), "Height": str(image.height), "Decode": "null"})
+    return data, keys
+
+
+_worker_doc = None
+
+
+def _worker_open(path: Optional[str], data: Optional[bytes]):
+    """Inicjalizacja procesu roboczego - otwiera własną kopię dokumentu"""
+    global _worker_doc
+    _worker_doc = fitz.open(path) if path else fitz.open("pdf", data)
+
+
+def _worker_optimize(job: ImageJob, preset: ImagePreset):
+    return optimize_image(_worker_doc, job, preset)
+
+
+# ============================================================================
+# ZAPIS WYNIKÓW
+# ============================================================================
+
+def _resources_holder(doc, xref: int, path: List[str]) -> Tuple[int, str]:
+    """Obiekt zawierający ostatni klucz ścieżki (odwołania pośrednie są rozwijane)"""
+    for depth in range(len(path) - 1):
+        kind, value = doc.xref_get_key(xref, "/".join(path[:depth + 1]))
+        if kind == "xref":
+            return _resources_holder(doc, int(value.split()[0]), path[depth + 1:])
+    return xref, "/".join(path)
+
+
+def merge_duplicate_images(doc, duplicates: List[DuplicateImage], page_indices: List[int]):
+    """Zamienia odwołania do duplikatów w zasobach stron i formularzy na obraz zastępujący"""
+    canonical_by_xref = {duplicate.xref: duplicate.canonical for duplicate in duplicates}
+    if not canonical_by_xref:
+        return
+    for page_index in page_indices:
+        page = doc.load_page(page_index)
+        for xref, _, _, _, _, _, _, name, _, referencer in page.get_images(full=True):
+            if xref in canonical_by_xref:
+                holder, key = _resources_holder(doc, referencer or page.xref, ["Resources", "XObject", name])
+                doc.xref_set_key(holder, key, f"{canonical_by_xref[xref]} 0 R")
+
+
+def apply_image_optimization(doc, plan: ImageOptimizationPlan, path: Optional[str] = None,
+                             data: Optional[bytes] = None, workers: Optional[int] = None,
+                             progress_callback: Optional[Callable[[int, int], None]] = None) -> ImageOptimizationReport:
+    """
+    Wykonuje plan optymalizacji.
+
+    Args:
+        doc: Dokument fitz.Document, w którym wyznaczono plan
+        plan: Wynik plan_image_optimization()
+        path: Ścieżka pliku, gdy dokument w pamięci odpowiada plikowi (dla procesów roboczych)
+        data: Bajty dokumentu dla procesów roboczych; None - pobierane z doc
+        workers: Liczba procesów roboczych (domyślnie liczba CPU - 1, max 8)
+        progress_callback: Funkcja callback postępu (przetworzone obrazy, wszystkie obrazy)
+
+    Returns:
+        ImageOptimizationReport
+    """
+    report = ImageOptimizationReport()
+    merge_duplicate_images(doc, plan.duplicates, plan.pages)
+    for duplicate in plan.duplicates:
+        report.add(duplicate.first_page, duplicate.raw_size)
+    report.duplicates_merged = len(plan.duplicates)
+
+    results: Dict[int, Optional[Tuple[bytes, Dict[str, str]]]] = {}
+    worker_count = workers or max(1, min(8, (os.cpu_count() or 2) - 1))
+    if len(plan.jobs) <= INLINE_IMAGE_LIMIT or worker_count == 1:
+        for number, job in enumerate(plan.jobs, 1):
+            results[job.xref] = optimize_image(doc, job, plan.preset)
+            if progress_callback:
+                progress_callback(number, len(plan.jobs))
+    else:
+        if not path and data is None:
+            data = doc.tobytes(encryption=fitz.PDF_ENCRYPT_NONE)  # Numery obiektów bez zmian
+        with ProcessPoolExecutor(max_workers=worker_count, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_worker_open, initargs=(path, data if not path else None)) as executor:
+            futures = {executor.submit(_worker_optimize, job, plan.preset): job.xref for job in plan.jobs}
+            for number, future in enumerate(as_completed(futures), 1):
+                results[futures[future]] = future.result()
+                if progress_callback:
+                    progress_callback(number, len(plan.jobs))
+
+    for job in plan.jobs:
+        result = results.get(job.xref)
+        if result is None:
+            continue
+        stream, keys = result
+        doc.update_stream(job.xref, stream, compress=False)
+        for key, value in keys.items():
+            doc.xref_set_key(job.xref, key, value)
+        report.images_optimized += 1
+        report.add(job.first_page, job.raw_size - len(stream))
+    return report
+
+
+def optimize_images(doc, preset_name: str, path: Optional[str] = None, data: Optional[bytes] = None,
+                    workers: Optional[int] = None,
+                    progress_callback: Optional[Callable[[int, int], None]] = None) -> ImageOptimizationReport:
+    """Wyznacza i wykonuje plan optymalizacji obrazów (parametry jak w apply_image_optimization)"""
+    plan = plan_image_optimization(doc, preset_name)
+    return apply_image_optimization(doc, plan, path, data, workers, progress_callback)
@@ -0,0 +1,200 @@
+"""
+PageGeometry - Kadrowanie, zmiana rozmiaru i przesuwanie stron w miejscu
+
+Operacje modyfikują bezpośrednio otwarty dokument fitz.Document i dotykają
+wyłącznie wskazanych stron - bez serializacji całego pliku do bajtów,
+ponownego parsowania (PdfReader/PdfWriter) i otwierania wyniku od nowa.
+Koszt kadrowania 10 stron dokumentu 1000-stronicowego zależy od tych 10 stron.
+
+Pola stron (MediaBox, CropBox, TrimBox, ArtBox) zapisywane są jako tablice
+we współrzędnych PDF (oś Y w górę), tak samo jak robiło to pypdf.
+Transformacja zawartości dopisuje do /Contents dwa małe strumienie:
+"q a b c d e f cm" przed oryginalną treścią i "Q" po niej - istniejące
+strumienie strony nie są ani dekodowane, ani przepisywane.
+"""
+
+from typing import Callable, Iterable, Optional, Tuple
+
+from utils import mm2pt
+
+
+Matrix = Tuple[float, float, float, float, float, float]
+
+
+def _pdf_number(value: float) -> str:
+    """Liczba w zapisie PDF (bez notacji wykładniczej i zbędnych zer)"""
+    text = f"{value:.5f}".rstrip("0").rstrip(".")
+    return "0" if text in ("", "-0") else text
+
+
+def _set_box(doc, page_xref: int, key: str, box: Tuple[float, float, float, float]):
+    """Zapisuje pole strony (np. CropBox) jako tablicę [x0 y0 x1 y1] we współrzędnych PDF"""
+    doc.xref_set_key(page_xref, key, "[" + " ".join(_pdf_number(v) for v in box) + "]")
+
+
+def _new_stream(doc, data: bytes) -> int:
+    """Tworzy nowy obiekt strumienia i zwraca jego numer xref"""
+    xref = doc.get_new_xref()
+    doc.update_object(xref, "<<>>")
+    doc.update_stream(xref, data)
+    return xref
+
+
+def transform_page_contents(doc, page_index: int, matrix: Matrix) -> bool:
+    """
+    Nakłada macierz przekształcenia na zawartość strony (odpowiednik pypdf add_transformation).
+
+    Args:
+        doc: Dokument fitz.Document (modyfikowany w miejscu)
+        page_index: Indeks strony
+        matrix: Macierz PDF (a, b, c, d, e, f)
+
+    Returns:
+        True, jeśli strona miała zawartość do przekształcenia
+    """
+    page = doc[page_index]
+    contents = page.get_contents()
+    if not contents:
+        return False
+    cm = " ".join(_pdf_number(v) for v in matrix)
+    prefix = _new_stream(doc, f"q\n{cm} cm\n".encode())
+    suffix = _new_stream(doc, b"\nQ\n")
+    refs = " ".join(f"{xref} 0 R" for xref in [prefix, *contents, suffix])
+    doc.xref_set_key(page.xref, "Contents", f"[{refs}]")
+    return True
+
+
+def resize_matrix(orig_width: float, orig_height: float, target_width: float, target_height: float,
+                  scale_content: bool = True, pos_mode: str = "center",
+                  offset_x_mm: float = 0, offset_y_mm: float = 0) -> Matrix:
+    """
+    Macierz zawartości strony przy zmianie rozmiaru (patrz resize_pages).
+
+    Args:
+        orig_width, orig_height: Rozmiar MediaBox przed zmianą w punktach
+        target_width, target_height: Nowy rozmiar w punktach
+        scale_content: True - zawartość skalowana i wyśrodkowana, False - tylko przesunięcie
+        pos_mode: Tryb pozycjonowania bez skalowania ("center" lub "custom")
+        offset_x_mm, offset_y_mm: Przesunięcie w mm (gdy pos_mode="custom")
+
+    Returns:
+        Macierz PDF (a, b, c, d, e, f)
+    """
+    if scale_content:
+        scale = min(target_width / orig_width, target_height / orig_height)
+        return (scale, 0, 0, scale,
+                (target_width - orig_width * scale) / 2, (target_height - orig_height * scale) / 2)
+    if pos_mode == "center":
+        return (1, 0, 0, 1, (target_width - orig_width) / 2, (target_height - orig_height) / 2)
+    return (1, 0, 0, 1, mm2pt(offset_x_mm), mm2pt(offset_y_mm))
+
+
+def shift_matrix(dx_mm: float, dy_mm: float) -> Matrix:
+    """Macierz przesunięcia zawartości (dodatnie dx w prawo, dodatnie dy w górę)"""
+    return (1, 0, 0, 1, mm2pt(dx_mm), mm2pt(dy_mm))
+
+
+# ============================================================================
+# OPERACJE NA STRONACH
+# ============================================================================
+
+def crop_pages(doc, selected_indices: Iterable[int],
+               top_mm: float, bottom_mm: float, left_mm: float, right_mm: float,
+               reposition: bool = False, pos_mode: str = "center",
+               offset_x_mm: float = 0, offset_y_mm: float = 0,
+               progressbar_callback: Optional[Callable[[int, int], None]] = None) -> int:
+    """
+    Kadruje strony przez ustawienie CropBox/TrimBox/ArtBox (MediaBox bez zmian).
+
+    Args:
+        doc: Dokument fitz.Document (modyfikowany w miejscu)
+        selected_indices: Indeksy stron do kadrowania
+        top_mm, bottom_mm, left_mm, right_mm: Marginesy kadrowania w mm
+        reposition: Czy przesunąć zawartość
+        pos_mode: Tryb pozycjonowania ("center" lub "custom")
+        offset_x_mm, offset_y_mm: Przesunięcie w mm (gdy pos_mode="custom")
+        progressbar_callback: Funkcja callback dla paska postępu (current, total)
+
+    Returns:
+        Liczba skadrowanych stron
+    """
+    indices = sorted(set(selected_indices))
+    dx = mm2pt(offset_x_mm) if reposition and pos_mode == "custom" else 0
+    dy = mm2pt(offset_y_mm) if reposition and pos_mode == "custom" else 0
+    changed = 0
+    for done, i in enumerate(indices, 1):
+        page = doc[i]
+        mediabox = page.mediabox
+        x0, y0, x1, y1 = mediabox.x0, mediabox.y0, mediabox.x1, mediabox.y1
+        new_box = (x0 + mm2pt(left_mm), y0 + mm2pt(bottom_mm),
+                   x1 - mm2pt(right_mm), y1 - mm2pt(top_mm))
+        if new_box[0] < new_box[2] and new_box[1] < new_box[3]:
+            _set_box(doc, page.xref, "MediaBox", (x0, y0, x1, y1))
+            for key in ("CropBox", "TrimBox", "ArtBox"):
+                _set_box(doc, page.xref, key, new_box)
+            if dx or dy:
+                transform_page_contents(doc, i, (1, 0, 0, 1, dx, dy))
+            changed += 1
+        if progressbar_callback:
+            progressbar_callback(done, len(indices))
+    return changed
+
+
+def resize_pages(doc, selected_indices: Iterable[int], width_mm: float, height_mm: float,
+                 scale_content: bool = True, pos_mode: str = "center",
+                 offset_x_mm: float = 0, offset_y_mm: float = 0,
+                 progressbar_callback: Optional[Callable[[int, int], None]] = None) -> int:
+    """
+    Zmienia rozmiar stron (MediaBox i CropBox = [0 0 szerokość wysokość]).
+
+    Args:
+        doc: Dokument fitz.Document (modyfikowany w miejscu)
+        selected_indices: Indeksy stron do zmiany rozmiaru
+        width_mm, height_mm: Nowy rozmiar w mm
+        scale_content: True - zawartość skalowana i wyśrodkowana, False - tylko przesunięcie
+        pos_mode: Tryb pozycjonowania bez skalowania ("center" lub "custom")
+        offset_x_mm, offset_y_mm: Przesunięcie w mm (gdy pos_mode="custom")
+        progressbar_callback: Funkcja callback dla paska postępu (current, total)
+
+    Returns:
+        Liczba zmienionych stron
+    """
+    indices = sorted(set(selected_indices))
+    target_width = mm2pt(width_mm)
+    target_height = mm2pt(height_mm)
+    for done, i in enumerate(indices, 1):
+        page = doc[i]
+        matrix = resize_matrix(page.mediabox.width, page.mediabox.height, target_width, target_height,
+                               scale_content, pos_mode, offset_x_mm, offset_y_mm)
+        if matrix != (1, 0, 0, 1, 0, 0):
+            transform_page_contents(doc, i, matrix)
+        _set_box(doc, page.xref, "MediaBox", (0, 0, target_width, target_height))
+        _set_box(doc, page.xref, "CropBox", (0, 0, target_width, target_height))
+        if progressbar_callback:
+            progressbar_callback(done, len(indices))
+    return len(indices)
+
+
+def shift_pages(doc, selected_indices: Iterable[int], dx_mm: float, dy_mm: float,
+                progressbar_callback: Optional[Callable[[int, int], None]] = None) -> int:
+    """
+    Przesuwa zawartość stron (dodatnie dx w prawo, dodatnie dy w górę).
+
+    Args:
+        doc: Dokument fitz.Document (modyfikowany w miejscu)
+        selected_indices: Indeksy stron do przesunięcia
+        dx_mm, dy_mm: Przesunięcie w mm
+        progressbar_callback: Funkcja callback dla paska postępu (current, total)
+
+    Returns:
+        Liczba przesuniętych stron
+    """
+    indices = sorted(set(selected_indices))
+    matrix = shift_matrix(dx_mm, dy_mm)
+    changed = 0
+    for done, i in enumerate(indices, 1):
+        if transform_page_contents(doc, i, matrix):
+            changed += 1
+        if progressbar_callback:
+            progressbar_callback(done, len(indices))
+    return changed
@@ -0,0 +1,343 @@
+"""
+PageImposition - Impozycja stron na arkuszach (N-up, broszura, powielanie, wytnij i ułóż)
+
+Tryb wektorowy: każda strona źródłowa zamieniana jest raz na Form XObject
+w tym samym dokumencie (jej strumień treści + odwołanie do istniejących
+/Resources - czcionki i obrazy nie są kopiowane), a komórki arkusza
+wskazują ten obiekt operatorem "Do" z własną macierzą "cm".
+Koszt komórki to kilka operacji na słownikach, a rozmiar pliku prawie
+nie rośnie - także gdy ta sama strona trafia do wielu komórek.
+
+Tryb "spłaszcz" (flatten) renderuje komórki do bitmap o zadanej
+rozdzielczości, tak jak wcześniej - na wypadek, gdy wynik ma być obrazem.
+
+Geometria obu trybów jest taka sama: marginesy, odstępy, automatyczny
+obrót o 90° zgodnie z ruchem wskazówek zegara, gdy orientacja strony nie
+pasuje do komórki, i dopasowanie strony do całej komórki.
+
+Układ arkuszy (plan_sheets) decyduje tylko o przydziale stron do komórek,
+więc zaznaczenie dowolnej długości rozkładane jest na tyle arkuszy, ile trzeba:
+kolejno, z powielaniem strony na cały arkusz, "wytnij i ułóż" albo jako
+broszura zeszytowa (arkusze przód/tył, strony uzupełniane do wielokrotności 4).
+"""
+
+import zlib
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import fitz  # PyMuPDF
+
+from .page_geometry import _new_stream, _pdf_number
+
+
+MODE_VECTOR = "vector"
+MODE_FLATTEN = "flatten"
+
+
+# ============================================================================
+# GEOMETRIA SIATKI
+# ============================================================================
+
+def grid_cells(sheet_width_pt: float, sheet_height_pt: float, rows: int, cols: int,
+               margin_top_pt: float, margin_bottom_pt: float,
+               margin_left_pt: float, margin_right_pt: float,
+               spacing_x_pt: float, spacing_y_pt: float) -> List[fitz.Rect]:
+    """
+    Prostokąty komórek siatki (wierszami, współrzędne z początkiem w lewym górnym rogu).
+
+    Returns:
+        Lista rows*cols prostokątów fitz.Rect
+    """
+    cell_width = (sheet_width_pt - margin_left_pt - margin_right_pt - (cols - 1) * spacing_x_pt) / cols
+    cell_height = (sheet_height_pt - margin_top_pt - margin_bottom_pt - (rows - 1) * spacing_y_pt) / rows
+    cells = []
+    for row in range(rows):
+        for col in range(cols):
+            x = margin_left_pt + col * (cell_width + spacing_x_pt)
+            y = margin_top_pt + row * (cell_height + spacing_y_pt)
+            cells.append(fitz.Rect(x, y, x + cell_width, y + cell_height))
+    return cells
+
+
+def needs_rotation(page_rect: fitz.Rect, cell: fitz.Rect) -> bool:
+    """Czy stronę trzeba obrócić o 90°, by jej orientacja pasowała do komórki"""
+    return (page_rect.width > page_rect.height) != (cell.width > cell.height)
+
+
+def cell_matrix(page_rect: fitz.Rect, cell: fitz.Rect, rotate: bool) -> fitz.Matrix:
+    """
+    Macierz przenosząca widoczny obszar strony (0, 0, w, h) na komórkę arkusza.
+
+    Args:
+        page_rect: Widoczny prostokąt strony (page.rect)
+        cell: Komórka arkusza
+        rotate: Obrót o 90° zgodnie z ruchem wskazówek zegara
+
+    Returns:
+        Macierz we współrzędnych fitz (początek w lewym górnym rogu)
+    """
+    w, h = page_rect.width, page_rect.height
+    if rotate:
+        matrix = fitz.Matrix(0, 1, -1, 0, h, 0)
+        w, h = h, w
+    else:
+        matrix = fitz.Matrix(1, 0, 0, 1, 0, 0)
+    return matrix * fitz.Matrix(cell.width / w, 0, 0, cell.height / h, cell.x0, cell.y0)
+
+
+# ============================================================================
+# STRONY JAKO FORM XOBJECT
+# ============================================================================
+
+def _page_resources(doc, page) -> str:
+    """Słownik /Resources strony (także dziedziczony z drzewa stron) jako tekst PDF"""
+    xref = page.xref
+    while xref:
+        kind, value = doc.xref_get_key(xref, "Resources")
+        if kind != "null":
+            return value
+        kind, parent = doc.xref_get_key(xref, "Parent")
+        xref = int(parent.split()[0]) if kind == "xref" else 0
+    return "<<>>"
+
+
+def _pdf_cropbox(page) -> fitz.Rect:
+    """CropBox strony we współrzędnych PDF (oś Y page.cropbox liczona jest od górnej krawędzi MediaBox)"""
+    mediabox, cropbox = page.mediabox, page.cropbox
+    return fitz.Rect(cropbox.x0, mediabox.y1 - cropbox.y1, cropbox.x1, mediabox.y1 - cropbox.y0)
+
+
+def page_display_matrix(page) -> fitz.Matrix:
+    """
+    Macierz z przestrzeni treści strony (PDF) do widocznej strony (page.rect, z obrotem /Rotate).
+    Liczona z CropBox, bo page.transformation_matrix pomija przesunięcie CropBox na obróconych stronach.
+    """
+    box = _pdf_cropbox(page)
+    return fitz.Matrix(1, 0, 0, -1, -box.x0, box.y1) * page.rotation_matrix
+
+
+def page_form_xobject(page) -> int:
+    """
+    Tworzy Form XObject z treścią strony (PageForms tworzy go raz na stronę).
+
+    Obiekt odwołuje się do /Resources strony - zasoby nie są kopiowane.
+    Pojedynczy strumień treści przenoszony jest bez dekodowania (z jego /Filter).
+
+    Args:
+        page: Strona źródłowa fitz.Page
+
+    Returns:
+        Numer xref obiektu (0, gdy strona nie ma treści)
+    """
+    doc = page.parent
+    contents = page.get_contents()
+    if not contents:
+        return 0
+    if len(contents) == 1:
+        data = doc.xref_stream_raw(contents[0])
+        filters = ""
+        for key in ("Filter", "DecodeParms"):
+            kind, value = doc.xref_get_key(contents[0], key)
+            if kind != "null":
+                filters += f"/{key} {value}"
+    else:
+        data = zlib.compress(b"\n".join(doc.xref_stream(c) or b"" for c in contents))
+        filters = "/Filter /FlateDecode"
+    box = " ".join(_pdf_number(v) for v in _pdf_cropbox(page))
+    xref = doc.get_new_xref()
+    doc.update_object(xref, "<<>>")
+    doc.update_stream(xref, data, compress=False)
+    # Słownik zapisywany po strumieniu - update_stream usuwa /Filter
+    doc.update_object(xref, f"<</Type /XObject /Subtype /Form /BBox [{box}] {filters} /Length {len(data)}"
+                            f" /Resources {_page_resources(doc, page)}>>")
+    return xref
+
+
+class PageForms:
+    """Form XObject i geometria stron źródłowych - tworzone raz, współdzielone przez wszystkie komórki i arkusze"""
+
+    def __init__(self, doc):
+        self.doc = doc
+        self._geometry: Dict[int, Tuple[fitz.Rect, fitz.Matrix]] = {}
+        self._xrefs: Dict[int, int] = {}
+
+    def geometry(self, page_index: int) -> Tuple[fitz.Rect, fitz.Matrix]:
+        """(widoczny prostokąt strony, macierz treść -> widoczna strona)"""
+        if page_index not in self._geometry:
+            self._load(page_index)
+        return self._geometry[page_index]
+
+    def xref(self, page_index: int) -> int:
+        """Numer xref Form XObject strony (0 - strona bez treści)"""
+        xref = self._xrefs.get(page_index)
+        if xref is None:
+            xref = self._xrefs[page_index] = page_form_xobject(self._load(page_index))
+        return xref
+
+    def _load(self, page_index: int):
+        page = self.doc[page_index]
+        self._geometry[page_index] = (page.rect, page_display_matrix(page))
+        return page
+
+
+def place_pages(doc, sheet_index: int, placements: Sequence, forms: Optional[PageForms] = None) -> int:
+    """
+    Umieszcza strony jako Form XObject w komórkach arkusza (jeden strumień treści na arkusz).
+
+    Args:
+        doc: Dokument fitz.Document
+        sheet_index: Indeks arkusza (nowej, pustej strony)
+        placements: Sekwencja (indeks_strony, komórka fitz.Rect, obrót_90: bool)
+        forms: Obiekty stron współdzielone między arkuszami (domyślnie nowe)
+
+    Returns:
+        Liczba umieszczonych stron
+    """
+    forms = forms or PageForms(doc)
+    sheet_xref = doc.page_xref(sheet_index)
+    sheet_height = doc.page_cropbox(sheet_index).height
+    to_pdf = fitz.Matrix(1, 0, 0, -1, 0, sheet_height)
+    names = {}
+    ops = []
+    for page_index, cell, rotate in placements:
+        xref = forms.xref(page_index)
+        if not xref:
+            continue
+        name = names.setdefault(xref, f"Fx{len(names)}")
+        rect, display = forms.geometry(page_index)
+        # treść strony (PDF) -> widoczna strona -> komórka -> arkusz (PDF)
+        matrix = display * cell_matrix(rect, cell, rotate) * to_pdf
+        cm = " ".join(_pdf_number(v) for v in matrix)
+        ops.append(f"q {cm} cm /{name} Do Q")
+    if not ops:
+        return 0
+    xobjects = " ".join(f"/{name} {xref} 0 R" for xref, name in names.items())
+    doc.xref_set_key(sheet_xref, "Resources", f"<</XObject <<{xobjects}>>>>")
+    content = _new_stream(doc, "\n".join(ops).encode())
+    doc.xref_set_key(sheet_xref, "Contents", f"{content} 0 R")
+    return len(ops)
+
+
+def flatten_page_into(target_page, cell: fitz.Rect, src_page, rotate: bool, dpi: int, display_lists=None):
+    """
+    Renderuje stronę do bitmapy o rozdzielczości dpi i wstawia ją w komórkę (tryb "spłaszcz").
+    Z cache list wyświetlania (DisplayListCache) strona powtórzona w wielu komórkach jest interpretowana raz.
+    """
+    bitmap_w = int(round(cell.width * dpi / 72))
+    bitmap_h = int(round(cell.height * dpi / 72))
+    page_w, page_h = src_page.rect.width, src_page.rect.height
+    if rotate:
+        page_w, page_h = page_h, page_w
+    matrix = fitz.Matrix(bitmap_w / page_w, bitmap_h / page_h).prerotate(90 if rotate else 0)
+    if display_lists is not None:
+        pix = display_lists.get_pixmap(src_page, matrix)
+    else:
+        pix = src_page.get_pixmap(matrix=matrix, alpha=False)
+    target_page.insert_image(cell, stream=pix.tobytes("png"))
+
+
+# ============================================================================
+# UKŁADY ARKUSZY
+# ============================================================================
+
+LAYOUT_GRID = "grid"                # Strony po kolei, tyle arkuszy ile potrzeba
+LAYOUT_STEP_REPEAT = "step_repeat"  # Każda strona powielona na cały arkusz
+LAYOUT_CUT_STACK = "cut_stack"      # Po przecięciu stosu arkuszy każdy stos zachowuje kolejność stron
+LAYOUT_BOOKLET = "booklet"          # Broszura zeszytowa: składki po 4 strony, strony arkusza przód/tył
+LAYOUTS = (LAYOUT_GRID, LAYOUT_STEP_REPEAT, LAYOUT_CUT_STACK, LAYOUT_BOOKLET)
+
+
+def plan_sheets(page_indices: Sequence[int], cells_per_sheet: int,
+                layout: str = LAYOUT_GRID) -> List[List[Optional[int]]]:
+    """
+    Przydział stron do komórek kolejnych arkuszy (bez dotykania dokumentu).
+
+    Args:
+        page_indices: Strony źródłowe w kolejności
+        cells_per_sheet: Liczba komórek na arkuszu (wiersze x kolumny)
+        layout: Jeden z LAYOUTS
+
+    Returns:
+        Lista arkuszy; arkusz to lista indeksów stron dla kolejnych komórek (None - pusta komórka)
+
+    Raises:
+        ValueError: Nieznany układ albo broszura z liczbą komórek różną od 2
+    """
+    pages = list(page_indices)
+    count = len(pages)
+    cells = cells_per_sheet
+    if not pages:
+        return []
+    if layout == LAYOUT_GRID:
+        if count == 1:  # Jedna strona wypełnia cały arkusz (jak dotychczas)
+            return [pages * cells]
+        padded = pages + [None] * (-count % cells)
+        return [padded[i:i + cells] for i in range(0, len(padded), cells)]
+    if layout == LAYOUT_STEP_REPEAT:
+        return [[page] * cells for page in pages]
+    if layout == LAYOUT_CUT_STACK:
+        sheets = -(-count // cells)
+        return [[pages[c * sheets + s] if c * sheets + s < count else None for c in range(cells)]
+                for s in range(sheets)]
+    if layout == LAYOUT_BOOKLET:
+        if cells != 2:
+            raise ValueError("Broszura wymaga dwóch komórek na arkuszu (siatka 1x2 lub 2x1).")
+        total = -(-count // 4) * 4
+        page = lambda i: pages[i] if i < count else None
+        plan = []
+        for s in range(total // 4):
+            plan.append([page(total - 1 - 2 * s), page(2 * s)])      # przód arkusza
+            plan.append([page(2 * s + 1), page(total - 2 - 2 * s)])  # tył arkusza
+        return plan
+    raise ValueError(f"Nieznany układ arkuszy: {layout}")
+
+
+def impose(doc, page_indices: Sequence[int], rows: int, cols: int,
+           sheet_width_pt: float, sheet_height_pt: float,
+           margin_top_pt: float, margin_bottom_pt: float,
+           margin_left_pt: float, margin_right_pt: float,
+           spacing_x_pt: float, spacing_y_pt: float,
+           layout: str = LAYOUT_GRID, mode: str = MODE_VECTOR, target_dpi: int = 600,
+           progressbar_callback: Optional[Callable[[int, int], None]] = None,
+           display_lists=None) -> List[int]:
+    """
+    Rozmieszcza strony na tylu nowych arkuszach, ile wymaga układ (arkusze dodawane na końcu dokumentu).
+    Każda strona źródłowa staje się jednym Form XObject, do którego odwołują się wszystkie jej komórki.
+
+    Args:
+        doc: Dokument fitz.Document (modyfikowany w miejscu)
+        page_indices: Indeksy stron źródłowych w kolejności
+        rows, cols: Liczba wierszy i kolumn siatki
+        sheet_width_pt, sheet_height_pt: Rozmiar arkusza w punktach
+        margin_top_pt, margin_bottom_pt, margin_left_pt, margin_right_pt: Marginesy w punktach
+        spacing_x_pt, spacing_y_pt: Odstępy między komórkami w punktach
+        layout: Układ arkuszy (LAYOUTS)
+        mode: MODE_VECTOR (Form XObject) lub MODE_FLATTEN (bitmapy)
+        target_dpi: Rozdzielczość bitmap w trybie MODE_FLATTEN
+        progressbar_callback: Funkcja callback dla paska postępu (arkusz, liczba arkuszy)
+        display_lists: Cache list wyświetlania dla MODE_FLATTEN (DisplayListCache; None - bez cache)
+
+    Returns:
+        Indeksy nowych arkuszy
+    """
+    cells = grid_cells(sheet_width_pt, sheet_height_pt, rows, cols,
+                       margin_top_pt, margin_bottom_pt, margin_left_pt, margin_right_pt,
+                       spacing_x_pt, spacing_y_pt)
+    plan = plan_sheets(page_indices, len(cells), layout)
+    forms = PageForms(doc)
+    first_sheet = len(doc)
+    if progressbar_callback:
+        progressbar_callback(0, len(plan))
+    for number, sheet_pages in enumerate(plan):
+        doc.new_page(width=sheet_width_pt, height=sheet_height_pt)
+        sheet_index = first_sheet + number
+        placements = [(src, cell, needs_rotation(forms.geometry(src)[0], cell))
+                      for src, cell in zip(sheet_pages, cells) if src is not None]
+        if mode == MODE_FLATTEN:
+            sheet = doc[sheet_index]
+            for src, cell, rotate in placements:
+                flatten_page_into(sheet, cell, doc[src], rotate, target_dpi, display_lists)
+        else:
+            place_pages(doc, sheet_index, placements, forms)
+        if progressbar_callback:
+            progressbar_callback(number + 1, len(plan))
+    return list(range(first_sheet, first_sheet + len(plan)))
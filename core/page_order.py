@@ -0,0 +1,225 @@
+"""
+PageOrder - Zmiana kolejności stron w miejscu
+
+Kolejność stron PDF wyznacza drzewo stron (/Pages -> /Kids). Permutacja nie
+musi kopiować stron ani ich zasobów: wystarczy zapisać nową, płaską tablicę
+/Kids w korzeniu drzewa. Obiekty stron zostają te same, więc zakładki, linki
+i adnotacje wskazujące strony pozostają poprawne.
+
+Atrybuty dziedziczone z pośrednich węzłów drzewa (/Resources, /MediaBox,
+/CropBox, /Rotate) są przed spłaszczeniem przepisywane do stron. Odwrócenie
+kolejności 5000 stron trwa kilka milisekund (Document.select() - ok. 2 s).
+
+Kolejność opisuje lista: strona i po zmianie = strona order[i] przed zmianą.
+Skutek usunięcia, wstawienia lub zmiany kolejności dla danych indeksowanych
+numerem strony (miniatury, ramki siatki) opisuje mapowanie: dla każdej strony
+sprzed zmiany jej nowy indeks (None - strona usunięta).
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Sequence
+
+
+# Atrybuty strony dziedziczone z węzłów drzewa stron
+INHERITABLE_KEYS = ("Resources", "MediaBox", "CropBox", "Rotate")
+
+_ORDER_PART = re.compile(r"^(\d+|[nN])(?:\s*-\s*(\d+|[nN]))?$")
+
+
+def _xref_of(value: str) -> int:
+    """Numer obiektu z odwołania "12 0 R" (0, gdy to nie odwołanie)"""
+    parts = value.split()
+    if len(parts) == 3 and parts[2] == "R":
+        return int(parts[0])
+    return 0
+
+
+def parse_page_order(spec: str, page_count: int) -> List[int]:
+    """
+    Zamienia opis kolejności na listę indeksów.
+
+    Numery stron od 1, zakresy mogą być malejące, "N" oznacza ostatnią stronę,
+    np. "N-1" odwraca dokument, a "3,1-2" przenosi stronę 3 na początek.
+    Strony pominięte w opisie dopisywane są na końcu w dotychczasowej kolejności.
+
+    Args:
+        spec: Opis kolejności, np. "5-1, 6, 8, 7"
+        page_count: Liczba stron dokumentu
+
+    Returns:
+        Kolejność stron (indeksy od 0)
+
+    Raises:
+        ValueError: Niepoprawny opis, numer spoza dokumentu lub powtórzona strona
+    """
+    def page_number(token: str) -> int:
+        number = page_count if token in ("n", "N") else int(token)
+        if not 1 <= number <= page_count:
+            raise ValueError(f"Strona {number} spoza zakresu 1-{page_count}")
+        return number - 1
+
+    order = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        match = _ORDER_PART.match(part)
+        if not match:
+            raise ValueError(f"Niepoprawny fragment opisu kolejności: '{part}'")
+        first = page_number(match.group(1))
+        last = page_number(match.group(2)) if match.group(2) else first
+        step = 1 if last >= first else -1
+        order.extend(range(first, last + step, step))
+
+    if len(set(order)) != len(order):
+        raise ValueError("Strona występuje w opisie kolejności więcej niż raz")
+    listed = set(order)
+    order.extend(i for i in range(page_count) if i not in listed)
+    return order
+
+
+def check_permutation(order: Sequence[int], page_count: int):
+    """Sprawdza, czy order zawiera każdą stronę dokładnie raz (ValueError, jeśli nie)"""
+    if len(order) != page_count or sorted(order) != list(range(page_count)):
+        raise ValueError("Kolejność musi zawierać każdą stronę dokumentu dokładnie raz")
+
+
+def inverse_order(order: Sequence[int]) -> List[int]:
+    """Kolejność przywracająca stan sprzed zastosowania order"""
+    inverse = [0] * len(order)
+    for new_index, old_index in enumerate(order):
+        inverse[old_index] = new_index
+    return inverse
+
+
+def changed_positions(order: Sequence[int]) -> List[int]:
+    """Pozycje, na których po zmianie kolejności stoi inna strona"""
+    return [i for i, old_index in enumerate(order) if old_index != i]
+
+
+def reversed_order(page_count: int) -> List[int]:
+    return list(range(page_count - 1, -1, -1))
+
+
+def swapped_order(page_count: int, first: int, second: int) -> List[int]:
+    order = list(range(page_count))
+    order[first], order[second] = order[second], order[first]
+    return order
+
+
+def moved_order(page_count: int, pages: Iterable[int], insert_at: int) -> List[int]:
+    """
+    Kolejność po przeniesieniu stron w nowe miejsce (np. przeciągnięcie miniatur).
+
+    Args:
+        page_count: Liczba stron dokumentu
+        pages: Przenoszone strony (zachowują wzajemną kolejność)
+        insert_at: Pozycja wstawienia liczona przed przeniesieniem (0 - przed pierwszą stroną,
+                   page_count - za ostatnią)
+
+    Returns:
+        Kolejność stron (identyczność, gdy strony już tam są)
+    """
+    moving = sorted(set(pages))
+    moving_set = set(moving)
+    before = [i for i in range(insert_at) if i not in moving_set]
+    after = [i for i in range(insert_at, page_count) if i not in moving_set]
+    return before + moving + after
+
+
+# ============================================================================
+# MAPOWANIE INDEKSÓW (STARY -> NOWY)
+# ============================================================================
+
+def deletion_map(page_count: int, deleted: Iterable[int]) -> List[Optional[int]]:
+    """Nowe indeksy stron po usunięciu stron deleted (None - strona usunięta)"""
+    removed = set(deleted)
+    mapping = []
+    new_index = 0
+    for i in range(page_count):
+        if i in removed:
+            mapping.append(None)
+        else:
+            mapping.append(new_index)
+            new_index += 1
+    return mapping
+
+
+def insertion_map(page_count: int, inserted: Iterable[int]) -> List[Optional[int]]:
+    """
+    Nowe indeksy stron po wstawieniu nowych stron.
+
+    Args:
+        page_count: Liczba stron przed wstawieniem
+        inserted: Pozycje wstawionych stron w dokumencie po zmianie (jak VirtualDocument.insert)
+    """
+    positions = set(inserted)
+    return [i for i in range(page_count + len(positions)) if i not in positions]
+
+
+def permutation_map(order: Sequence[int]) -> List[Optional[int]]:
+    """Nowe indeksy stron po zmianie kolejności order"""
+    return inverse_order(order)
+
+
+def _pages_root(doc) -> int:
+    return _xref_of(doc.xref_get_key(doc.pdf_catalog(), "Pages")[1])
+
+
+def _inherited_attributes(doc, node: int, root: int, cache: Dict[int, Dict[str, str]]) -> Dict[str, str]:
+    """Atrybuty dziedziczone z węzła drzewa i jego przodków (bez korzenia - ten zostaje rodzicem)"""
+    if node == root or not node:
+        return {}
+    if node not in cache:
+        attributes = dict(_inherited_attributes(doc, _xref_of(doc.xref_get_key(node, "Parent")[1]), root, cache))
+        for key in INHERITABLE_KEYS:
+            kind, value = doc.xref_get_key(node, key)
+            if kind != "null":
+                attributes[key] = value
+        cache[node] = attributes
+    return cache[node]
+
+
+def apply_page_order(doc, order: Sequence[int]) -> List[int]:
+    """
+    Zmienia kolejność stron w miejscu, przepisując drzewo stron.
+
+    Args:
+        doc: Dokument fitz.Document (PDF)
+        order: Nowa kolejność - strona i po zmianie to strona order[i] przed zmianą
+
+    Returns:
+        Pozycje, na których stoi inna strona niż przed zmianą
+
+    Raises:
+        ValueError: order nie jest permutacją stron dokumentu
+    """
+    order = list(order)
+    check_permutation(order, len(doc))
+    changed = changed_positions(order)
+    if not changed:
+        return changed
+
+    root = _pages_root(doc)
+    page_xrefs = [doc.page_xref(i) for i in range(len(doc))]
+
+    # Drzewo płaskie, gdy korzeń ma tyle dzieci, ile stron (każde dziecko to co najmniej jedna strona)
+    kids = doc.xref_get_key(root, "Kids")[1]
+    nested = kids.count(" R") != len(page_xrefs)
+
+    # Strony spoza korzenia: przepisanie atrybutów dziedziczonych i nowy rodzic
+    cache: Dict[int, Dict[str, str]] = {}
+    for xref in (page_xrefs if nested else ()):
+        parent = _xref_of(doc.xref_get_key(xref, "Parent")[1])
+        if parent == root:
+            continue
+        for key, value in _inherited_attributes(doc, parent, root, cache).items():
+            if doc.xref_get_key(xref, key)[0] == "null":
+                doc.xref_set_key(xref, key, value)
+        doc.xref_set_key(xref, "Parent", f"{root} 0 R")
+
+    doc.xref_set_key(root, "Kids", "[" + " ".join(f"{page_xrefs[i]} 0 R" for i in order) + "]")
+    doc.xref_set_key(root, "Count", str(len(order)))
+    # Otwarte obiekty stron mają stare numery - tak samo jak Document.select()
+    doc._reset_page_refs()
+    return changed
@@ -0,0 +1,320 @@
+"""
+PageSelection - Zbiór zaznaczonych stron jako mapa bitowa
+
+Zaznaczenie przechowywane jako set liczb całkowitych kosztuje kilkadziesiąt
+bajtów na stronę, a "Zaznacz wszystkie" lub strony nieparzyste dokumentu
+z 20 000 stron tworzy dziesiątki tysięcy obiektów int. Zapis takiego
+zaznaczenia w makrze jako listy indeksów daje ogromny blok JSON.
+
+PageSelection to zbiór indeksów stron (od 0) w mapie bitowej (bytearray,
+bit na stronę - 2,5 KB dla 20 000 stron):
+
+- sprawdzenie, dodanie i usunięcie strony - O(1),
+- suma, iloczyn, różnica, różnica symetryczna i dopełnienie - operacje na
+  liczbach całkowitych Pythona (w C), bez iterowania po stronach,
+- len() - licznik aktualizowany przy każdej zmianie,
+- iteracja zawsze rosnąco (jak sorted() zbioru),
+- interfejs zbioru (collections.abc.MutableSet), więc kod operujący na set
+  działa bez zmian.
+
+Zwarty opis tekstowy (numery stron od 1) - to_spec() / parse():
+    "1-500,502,600-900"   - zakresy i pojedyncze strony
+    "1-19999/2"           - co druga strona (np. nieparzyste)
+"""
+
+import re
+from collections.abc import MutableSet, Set as AbstractSet
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+
+_SPEC_PART = re.compile(r"^(\d+)(?:\s*-\s*(\d+)(?:\s*/\s*(\d+))?)?$")
+_RUNS = re.compile(r"1+")
+
+# Pozycje ustawionych bitów każdej wartości bajtu (iteracja po mapie bitowej)
+_BYTE_BITS = tuple(tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256))
+
+# Minimalna liczba pojedynczych stron w równych odstępach zapisywana jako "a-b/krok"
+_MIN_STEP_RUN = 3
+
+
+def _range_mask(start: int, stop: int, step: int = 1) -> int:
+    """Maska bitowa stron range(start, stop, step)"""
+    if stop <= start:
+        return 0
+    if step == 1:
+        return ((1 << (stop - start)) - 1) << start
+    count = (stop - start + step - 1) // step
+    # Wzorzec "1 co step bitów" budowany jako tekst (w C), najmłodszy bit na końcu
+    pattern = ("0" * (step - 1) + "1") * count
+    return int(pattern[step - 1:], 2) << start
+
+
+class PageSelection(MutableSet):
+    """Zbiór indeksów stron w mapie bitowej z operacjami zbiorów i zwartym opisem"""
+
+    def __init__(self, indices: Iterable[int] = ()):
+        """
+        Args:
+            indices: Początkowe indeksy stron (nieujemne); może to być inny PageSelection lub range
+        """
+        self._bits = bytearray()
+        self._count = 0
+        if isinstance(indices, PageSelection):
+            self._bits = bytearray(indices._bits)
+            self._count = indices._count
+        elif isinstance(indices, range) and indices.step > 0:
+            self._set_int(_range_mask(max(0, indices.start), indices.stop, indices.step))
+        else:
+            for index in indices:
+                self.add(index)
+
+    # ============================================================================
+    # TWORZENIE
+    # ============================================================================
+
+    @classmethod
+    def from_range(cls, start: int, stop: int, step: int = 1) -> "PageSelection":
+        """Strony range(start, stop, step), np. nieparzyste strony: from_range(0, page_count, 2)"""
+        selection = cls()
+        selection._set_int(_range_mask(max(0, start), stop, max(1, step)))
+        return selection
+
+    @classmethod
+    def parse(cls, spec: str, page_count: Optional[int] = None) -> "PageSelection":
+        """
+        Zbiór stron z opisu tekstowego (numery stron od 1).
+
+        Args:
+            spec: Opis, np. "1-500, 502, 600-900" lub "1-19999/2"; pusty tekst - pusty zbiór
+            page_count: Liczba stron dokumentu - strony dalsze są pomijane (None - bez ograniczenia)
+
+        Returns:
+            PageSelection
+
+        Raises:
+            ValueError: Niepoprawny fragment opisu
+        """
+        value = 0
+        for part in spec.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            match = _SPEC_PART.match(part)
+            if not match:
+                raise ValueError(f"Niepoprawny fragment opisu stron: '{part}'")
+            first = int(match.group(1))
+            last = int(match.group(2)) if match.group(2) else first
+            step = int(match.group(3)) if match.group(3) else 1
+            if first < 1 or last < first or step < 1:
+                raise ValueError(f"Niepoprawny zakres stron: '{part}'")
+            if page_count is not None:
+                last = min(last, page_count)
+            value |= _range_mask(first - 1, last, step)
+        selection = cls()
+        selection._set_int(value)
+        return selection
+
+    @classmethod
+    def _from_iterable(cls, iterable):
+        # Wynik operacji mieszanych z collections.abc.Set
+        return cls(iterable)
+
+    def copy(self) -> "PageSelection":
+        return PageSelection(self)
+
+    # ============================================================================
+    # INTERFEJS ZBIORU
+    # ============================================================================
+
+    def __contains__(self, index) -> bool:
+        if not isinstance(index, int) or index < 0:
+            return False
+        byte = index >> 3
+        return byte < len(self._bits) and bool(self._bits[byte] >> (index & 7) & 1)
+
+    def __iter__(self) -> Iterator[int]:
+        for byte_index, value in enumerate(self._bits):
+            if value:
+                base = byte_index << 3
+                for bit in _BYTE_BITS[value]:
+                    yield base + bit
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __repr__(self) -> str:
+        return f"PageSelection('{self.to_spec()}')"
+
+    def add(self, index: int):
+        """Dodaje stronę (indeks od 0)"""
+        if index < 0:
+            raise ValueError(f"Indeks strony nie może być ujemny: {index}")
+        byte, mask = index >> 3, 1 << (index & 7)
+        if byte >= len(self._bits):
+            self._bits.extend(bytes(byte + 1 - len(self._bits)))
+        if not self._bits[byte] & mask:
+            self._bits[byte] |= mask
+            self._count += 1
+
+    def discard(self, index: int):
+        """Usuwa stronę, jeśli jest zaznaczona"""
+        if index in self:
+            self._bits[index >> 3] &= ~(1 << (index & 7)) & 0xFF
+            self._count -= 1
+
+    def remove(self, index: int):
+        if index not in self:
+            raise KeyError(index)
+        self.discard(index)
+
+    def clear(self):
+        self._bits = bytearray()
+        self._count = 0
+
+    def update(self, *others: Iterable[int]):
+        """Dodaje strony z innych zbiorów (jak set.update)"""
+        for other in others:
+            self |= other
+
+    def first(self) -> Optional[int]:
+        """Najmniejszy indeks (None - pusty zbiór)"""
+        value = self._as_int()
+        return (value & -value).bit_length() - 1 if value else None
+
+    def last(self) -> Optional[int]:
+        """Największy indeks (None - pusty zbiór)"""
+        value = self._as_int()
+        return value.bit_length() - 1 if value else None
+
+    # ============================================================================
+    # OPERACJE NA ZBIORACH (MAPY BITOWE)
+    # ============================================================================
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, PageSelection):
+            return self._count == other._count and self._as_int() == other._as_int()
+        return super().__eq__(other)
+
+    def __or__(self, other):
+        return self._combine(other, lambda a, b: a | b)
+
+    def __and__(self, other):
+        return self._combine(other, lambda a, b: a & b)
+
+    def __sub__(self, other):
+        return self._combine(other, lambda a, b: a & ~b)
+
+    def __xor__(self, other):
+        return self._combine(other, lambda a, b: a ^ b)
+
+    __ror__ = __or__
+    __rand__ = __and__
+    __rxor__ = __xor__
+
+    def __rsub__(self, other):
+        return self._combine(other, lambda a, b: b & ~a)
+
+    def __ior__(self, other):
+        return self._combine_in_place(other, lambda a, b: a | b)
+
+    def __iand__(self, other):
+        return self._combine_in_place(other, lambda a, b: a & b)
+
+    def __isub__(self, other):
+        return self._combine_in_place(other, lambda a, b: a & ~b)
+
+    def __ixor__(self, other):
+        return self._combine_in_place(other, lambda a, b: a ^ b)
+
+    union = __or__
+    intersection = __and__
+    difference = __sub__
+    symmetric_difference = __xor__
+
+    def complement(self, page_count: int) -> "PageSelection":
+        """Strony dokumentu o page_count stronach, których nie ma w zbiorze"""
+        result = PageSelection()
+        result._set_int(_range_mask(0, page_count) & ~self._as_int())
+        return result
+
+    def limited(self, page_count: int) -> "PageSelection":
+        """Zbiór bez stron o indeksach >= page_count"""
+        result = PageSelection()
+        result._set_int(self._as_int() & _range_mask(0, page_count))
+        return result
+
+    # ============================================================================
+    # ZAKRESY I OPIS TEKSTOWY
+    # ============================================================================
+
+    def ranges(self) -> Iterator[Tuple[int, int]]:
+        """Ciągłe zakresy stron (start, stop) rosnąco - stop nie należy do zakresu"""
+        value = self._as_int()
+        if not value:
+            return
+        # Najmłodszy bit na początku tekstu - pozycja znaku to indeks strony
+        for match in _RUNS.finditer(format(value, "b")[::-1]):
+            yield match.start(), match.end()
+
+    def to_spec(self) -> str:
+        """
+        Zwarty opis zbioru (numery stron od 1), np. "1-500,502,600-900".
+
+        Co najmniej trzy pojedyncze strony w równych odstępach zapisywane są
+        z krokiem: strony nieparzyste dokumentu z 20 000 stron to "1-19999/2".
+        """
+        runs = list(self.ranges())
+        parts: List[str] = []
+        i = 0
+        while i < len(runs):
+            start, stop = runs[i]
+            if stop - start == 1:
+                j = i + 1
+                step = runs[j][0] - start if j < len(runs) else 0
+                while j < len(runs) and runs[j][1] - runs[j][0] == 1 and runs[j][0] - runs[j - 1][0] == step:
+                    j += 1
+                if j - i >= _MIN_STEP_RUN:
+                    parts.append(f"{start + 1}-{runs[j - 1][0] + 1}/{step}")
+                    i = j
+                    continue
+                parts.append(str(start + 1))
+            else:
+                parts.append(f"{start + 1}-{stop}")
+            i += 1
+        return ",".join(parts)
+
+    # ============================================================================
+    # WEWNĘTRZNE
+    # ============================================================================
+
+    def _as_int(self) -> int:
+        return int.from_bytes(self._bits, "little")
+
+    def _set_int(self, value: int):
+        self._bits = bytearray(value.to_bytes((value.bit_length() + 7) // 8, "little"))
+        self._count = value.bit_count()
+
+    @staticmethod
+    def _other_int(other) -> Optional[int]:
+        if isinstance(other, PageSelection):
+            return other._as_int()
+        if isinstance(other, range) and other.step > 0:
+            return _range_mask(max(0, other.start), other.stop, other.step)
+        if isinstance(other, (AbstractSet, list, tuple, frozenset)):
+            return PageSelection(i for i in other if isinstance(i, int) and i >= 0)._as_int()
+        return None
+
+    def _combine(self, other, operation):
+        value = self._other_int(other)
+        if value is None:
+            return NotImplemented
+        result = PageSelection()
+        result._set_int(operation(self._as_int(), value))
+        return result
+
+    def _combine_in_place(self, other, operation):
+        value = self._other_int(other)
+        if value is None:
+            value = PageSelection(other)._as_int()
+        self._set_int(operation(self._as_int(), value))
+        return self
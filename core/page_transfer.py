@@ -0,0 +1,123 @@
+"""
+PageTransfer - Hurtowe kopiowanie stron między dokumentami
+
+insert_pdf() wywołane osobno dla każdej strony tworzy za każdym razem nową
+mapę przeszczepów (graft map), więc wspólne zasoby stron - czcionki, obrazy,
+profile ICC - kopiowane są do dokumentu docelowego tyle razy, ile jest stron.
+
+transfer_pages() dzieli dowolny zbiór stron na ciągłe zakresy i kopiuje je
+kolejnymi wywołaniami insert_pdf() ze wspólną mapą przeszczepów (final=0,
+zamknięcie mapy dopiero przy ostatnim zakresie). Każdy wspólny zasób trafia
+do celu raz, a ciągłe zakresy kopiowane są jednym wywołaniem.
+insert_pages_at() robi to samo dla wstawiania w wielu miejscach naraz
+(wklejanie za każdą zaznaczoną stroną, duplikowanie stron).
+"""
+
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+
+# Przy pasku postępu długie zakresy kopiowane są porcjami tej wielkości
+PROGRESS_CHUNK_PAGES = 64
+
+
+def page_runs(page_indices: Iterable[int], max_run: Optional[int] = None) -> List[Tuple[int, int]]:
+    """
+    Dzieli strony (w podanej kolejności) na ciągłe rosnące zakresy.
+
+    Args:
+        page_indices: Indeksy stron, np. [3, 4, 5, 9, 2]
+        max_run: Maksymalna długość zakresu (np. dla częstszych aktualizacji postępu)
+
+    Returns:
+        Lista zakresów (pierwsza, ostatnia) włącznie, np. [(3, 5), (9, 9), (2, 2)]
+    """
+    runs = []
+    for index in page_indices:
+        if runs:
+            first, last = runs[-1]
+            if index == last + 1 and (max_run is None or last - first + 1 < max_run):
+                runs[-1] = (first, index)
+                continue
+        runs.append((index, index))
+    return runs
+
+
+def insert_pages_at(target, source, placements: Iterable[Tuple[int, int, int]],
+                    progressbar_callback: Optional[Callable[[int, int], None]] = None) -> List[int]:
+    """
+    Wstawia zakresy stron źródła w wielu miejscach celu ze wspólną mapą przeszczepów.
+
+    Args:
+        target: Dokument docelowy fitz.Document
+        source: Dokument źródłowy fitz.Document (inny obiekt niż target)
+        placements: Trójki (pierwsza, ostatnia, pozycja): zakres stron źródła i miejsce wstawienia
+                    liczone w celu sprzed operacji; przy równych pozycjach zachowana jest kolejność
+        progressbar_callback: Funkcja callback dla paska postępu (current, total)
+
+    Returns:
+        Indeksy wstawionych stron w celu po operacji (w kolejności wstawiania)
+    """
+    placements = sorted(placements, key=lambda placement: placement[2])
+    total = sum(last - first + 1 for first, last, _ in placements)
+    inserted = []
+    for number, (first, last, position) in enumerate(placements, 1):
+        at = position + len(inserted)
+        target.insert_pdf(source, from_page=first, to_page=last, start_at=at,
+                          final=1 if number == len(placements) else 0)
+        inserted.extend(range(at, at + last - first + 1))
+        if progressbar_callback:
+            progressbar_callback(len(inserted), total)
+    return inserted
+
+
+def transfer_pages(target, source, page_indices: Iterable[int], start_at: int = -1,
+                   progressbar_callback: Optional[Callable[[int, int], None]] = None,
+                   chunk_size: Optional[int] = None) -> int:
+    """
+    Kopiuje strony z source do target jedną operacją ze wspólną mapą przeszczepów.
+
+    Args:
+        target: Dokument docelowy fitz.Document
+        source: Dokument źródłowy fitz.Document (inny obiekt niż target)
+        page_indices: Indeksy stron źródła w kolejności wstawiania (mogą się powtarzać)
+        start_at: Indeks w celu, od którego wstawić strony (-1 = na końcu)
+        progressbar_callback: Funkcja callback dla paska postępu (current, total)
+        chunk_size: Maksymalna liczba stron na jedno wywołanie insert_pdf
+                    (domyślnie PROGRESS_CHUNK_PAGES, gdy podano progressbar_callback)
+
+    Returns:
+        Liczba skopiowanych stron
+    """
+    if chunk_size is None and progressbar_callback:
+        chunk_size = PROGRESS_CHUNK_PAGES
+    position = len(target) if start_at < 0 else start_at
+    runs = page_runs(page_indices, chunk_size)
+    return len(insert_pages_at(target, source, [(first, last, position) for first, last in runs],
+                               progressbar_callback))
+
+
+def extract_pages(source, page_indices: Iterable[int]) -> fitz.Document:
+    """
+    Tworzy nowy dokument z wybranych stron (w podanej kolejności).
+
+    Args:
+        source: Dokument źródłowy fitz.Document
+        page_indices: Indeksy stron
+
+    Returns:
+        Nowy dokument fitz.Document
+    """
+    new_doc = fitz.open()
+    transfer_pages(new_doc, source, page_indices)
+    return new_doc
+
+
+def pages_to_bytes(source, page_indices: Iterable[int], **save_options) -> bytes:
+    """Bajty nowego dokumentu PDF z wybranych stron (opcje przekazywane do tobytes)"""
+    new_doc = extract_pages(source, page_indices)
+    try:
+        return new_doc.tobytes(**save_options)
+    finally:
+        new_doc.close()
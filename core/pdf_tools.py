@@ -8,16 +8,20 @@ Ten moduł zawiera wszystkie operacje związane z manipulacją dokumentów PDF:
 - Operacje clipboard (kopiowanie, wycinanie, wklejanie)
 - Import i eksport PDF oraz obrazów
 - Przesuwanie zawartości, scalanie stron
+
+Operacje na wybranych stronach przyjmują zaznaczenie przeglądarki (PageSelection -
+indeksy rosnąco, len() i sprawdzanie strony w O(1)) albo listę indeksów.
 """
 
 import io
 import fitz  # PyMuPDF
-from pypdf import PdfReader, PdfWriter, Transformation
-from pypdf.generic import RectangleObject, FloatObject, ArrayObject, NameObject
 from PIL import Image
 import os
-from typing import Set, Optional, Callable
+from typing import Collection, Iterable, Optional, Callable
 from utils import mm2pt, custom_messagebox, generate_unique_export_filename
+from . import page_geometry, page_imposition, page_order, page_transfer
+from .empty_pages import DEFAULT_INK_THRESHOLD, EmptyPageResults, detect_empty_page
+from .page_selection import PageSelection
 
 
 class PDFTools:
@@ -35,7 +39,7 @@ class PDFTools:
     # KADROWANIE I ZMIANA ROZMIARU
     # ============================================================================
     
-    def crop_pages(self, pdf_bytes: bytes, selected_indices: Set[int], 
+    def crop_pages(self, pdf_bytes: bytes, selected_indices: Iterable[int], 
                    top_mm: float, bottom_mm: float, left_mm: float, right_mm: float,
                    reposition: bool = False, pos_mode: str = "center", 
                    offset_x_mm: float = 0, offset_y_mm: float = 0,
@@ -57,61 +61,16 @@ class PDFTools:
         Returns:
             Bajty zmodyfikowanego dokumentu PDF
         """
-        reader = PdfReader(io.BytesIO(pdf_bytes))
-        writer = PdfWriter()
-        total_pages = len(reader.pages)
-        
         if progress_callback:
             progress_callback("Kadrowanie stron...")
-        if progressbar_callback:
-            progressbar_callback(0, total_pages)
-        
-        for i, page in enumerate(reader.pages):
-            if i not in selected_indices:
-                writer.add_page(page)
-                if progressbar_callback:
-                    progressbar_callback(i + 1, total_pages)
-                continue
-                
-            orig_mediabox = RectangleObject([float(v) for v in page.mediabox])
-            x0, y0, x1, y1 = [float(v) for v in orig_mediabox]
-            new_x0 = x0 + mm2pt(left_mm)
-            new_y0 = y0 + mm2pt(bottom_mm)
-            new_x1 = x1 - mm2pt(right_mm)
-            new_y1 = y1 - mm2pt(top_mm)
-            
-            if new_x0 >= new_x1 or new_y0 >= new_y1:
-                writer.add_page(page)
-                if progressbar_callback:
-                    progressbar_callback(i + 1, total_pages)
-                continue
-                
-            new_rect = RectangleObject([new_x0, new_y0, new_x1, new_y1])
-            
-            # Ustaw tylko cropbox, trimbox, artbox - mediabox zostaje oryginalny
-            page.cropbox = new_rect
-            page.trimbox = new_rect
-            page.artbox = new_rect
-            page.mediabox = orig_mediabox
-            
-            # Opcjonalnie: przesuwanie zawartości strony
-            if reposition:
-                dx = mm2pt(offset_x_mm) if pos_mode == "custom" else 0
-                dy = mm2pt(offset_y_mm) if pos_mode == "custom" else 0
-                if dx != 0 or dy != 0:
-                    transform = Transformation().translate(tx=dx, ty=dy)
-                    page.add_transformation(transform)
-            
-            writer.add_page(page)
-            if progressbar_callback:
-                progressbar_callback(i + 1, total_pages)
-        
-        out = io.BytesIO()
-        writer.write(out)
-        out.seek(0)
-        return out.read()
+        return self._apply_geometry(
+            pdf_bytes, page_geometry.crop_pages, selected_indices,
+            top_mm, bottom_mm, left_mm, right_mm,
+            reposition=reposition, pos_mode=pos_mode,
+            offset_x_mm=offset_x_mm, offset_y_mm=offset_y_mm,
+            progressbar_callback=progressbar_callback)
     
-    def mask_crop_pages(self, pdf_bytes: bytes, selected_indices: Set[int],
+    def mask_crop_pages(self, pdf_bytes: bytes, selected_indices: Iterable[int],
                        top_mm: float, bottom_mm: float, left_mm: float, right_mm: float,
                        progress_callback: Optional[Callable[[str], None]] = None,
                        progressbar_callback: Optional[Callable[[int, int], None]] = None) -> bytes:
@@ -137,8 +96,10 @@ class PDFTools:
         if progressbar_callback:
             progressbar_callback(0, total_pages)
         
+        # Sprawdzanie strony w O(1) także dla listy indeksów
+        selected = selected_indices if isinstance(selected_indices, PageSelection) else PageSelection(selected_indices)
         for i in range(total_pages):
-            if i not in selected_indices:
+            if i not in selected:
                 if progressbar_callback:
                     progressbar_callback(i + 1, total_pages)
                 continue
@@ -170,7 +131,7 @@ class PDFTools:
         out.seek(0)
         return out.read()
     
-    def resize_pages_with_scale(self, pdf_bytes: bytes, selected_indices: Set[int],
+    def resize_pages_with_scale(self, pdf_bytes: bytes, selected_indices: Iterable[int],
                                width_mm: float, height_mm: float,
                                progress_callback: Optional[Callable[[str], None]] = None,
                                progressbar_callback: Optional[Callable[[int, int], None]] = None) -> bytes:
@@ -187,44 +148,13 @@ class PDFTools:
         Returns:
             Bajty zmodyfikowanego dokumentu PDF
         """
-        reader = PdfReader(io.BytesIO(pdf_bytes))
-        writer = PdfWriter()
-        target_width = mm2pt(width_mm)
-        target_height = mm2pt(height_mm)
-        total_pages = len(reader.pages)
-        
         if progress_callback:
             progress_callback("Zmiana rozmiaru stron ze skalowaniem...")
-        if progressbar_callback:
-            progressbar_callback(0, total_pages)
-        
-        for i, page in enumerate(reader.pages):
-            if i not in selected_indices:
-                writer.add_page(page)
-                if progressbar_callback:
-                    progressbar_callback(i + 1, total_pages)
-                continue
-                
-            orig_w = float(page.mediabox.width)
-            orig_h = float(page.mediabox.height)
-            scale = min(target_width / orig_w, target_height / orig_h)
-            dx = (target_width - orig_w * scale) / 2
-            dy = (target_height - orig_h * scale) / 2
-            transform = Transformation().scale(sx=scale, sy=scale).translate(tx=dx, ty=dy)
-            page.add_transformation(transform)
-            page.mediabox = RectangleObject([0, 0, target_width, target_height])
-            page.cropbox = RectangleObject([0, 0, target_width, target_height])
-            writer.add_page(page)
-            
-            if progressbar_callback:
-                progressbar_callback(i + 1, total_pages)
-        
-        out = io.BytesIO()
-        writer.write(out)
-        out.seek(0)
-        return out.read()
+        return self._apply_geometry(
+            pdf_bytes, page_geometry.resize_pages, selected_indices, width_mm, height_mm,
+            scale_content=True, progressbar_callback=progressbar_callback)
     
-    def resize_pages_without_scale(self, pdf_bytes: bytes, selected_indices: Set[int],
+    def resize_pages_without_scale(self, pdf_bytes: bytes, selected_indices: Iterable[int],
                                    width_mm: float, height_mm: float,
                                    pos_mode: str = "center", offset_x_mm: float = 0, offset_y_mm: float = 0,
                                    progress_callback: Optional[Callable[[str], None]] = None,
@@ -244,55 +174,33 @@ class PDFTools:
         Returns:
             Bajty zmodyfikowanego dokumentu PDF
         """
-        reader = PdfReader(io.BytesIO(pdf_bytes))
-        writer = PdfWriter()
-        target_width = mm2pt(width_mm)
-        target_height = mm2pt(height_mm)
-        total_pages = len(reader.pages)
-        
         if progress_callback:
             progress_callback("Zmiana rozmiaru stron bez skalowania...")
-        if progressbar_callback:
-            progressbar_callback(0, total_pages)
-        
-        for i, page in enumerate(reader.pages):
-            if i not in selected_indices:
-                writer.add_page(page)
-                if progressbar_callback:
-                    progressbar_callback(i + 1, total_pages)
-                continue
-                
-            orig_w = float(page.mediabox.width)
-            orig_h = float(page.mediabox.height)
-            
-            if pos_mode == "center":
-                dx = (target_width - orig_w) / 2
-                dy = (target_height - orig_h) / 2
-            else:  # custom
-                dx = mm2pt(offset_x_mm)
-                dy = mm2pt(offset_y_mm)
-            
-            if dx != 0 or dy != 0:
-                transform = Transformation().translate(tx=dx, ty=dy)
-                page.add_transformation(transform)
-            
-            page.mediabox = RectangleObject([0, 0, target_width, target_height])
-            page.cropbox = RectangleObject([0, 0, target_width, target_height])
-            writer.add_page(page)
-            
-            if progressbar_callback:
-                progressbar_callback(i + 1, total_pages)
-        
-        out = io.BytesIO()
-        writer.write(out)
-        out.seek(0)
-        return out.read()
+        return self._apply_geometry(
+            pdf_bytes, page_geometry.resize_pages, selected_indices, width_mm, height_mm,
+            scale_content=False, pos_mode=pos_mode,
+            offset_x_mm=offset_x_mm, offset_y_mm=offset_y_mm,
+            progressbar_callback=progressbar_callback)
+    
+    @staticmethod
+    def _apply_geometry(pdf_bytes: bytes, operation: Callable, selected_indices: Iterable[int],
+                        *args, **kwargs) -> bytes:
+        """
+        Wykonuje operację z core.page_geometry na dokumencie z bajtów i zwraca wynik.
+        Zmieniane są tylko wybrane strony - bez przepisywania pozostałych przez pypdf.
+        """
+        doc = fitz.open("pdf", pdf_bytes)
+        try:
+            operation(doc, selected_indices, *args, **kwargs)
+            return doc.tobytes()
+        finally:
+            doc.close()
     
     # ============================================================================
     # NUMERACJA STRON
     # ============================================================================
     
-    def insert_page_numbers(self, pdf_document, selected_indices: list, settings: dict,
+    def insert_page_numbers(self, pdf_document, selected_indices: Collection[int], settings: dict,
                            progress_callback: Optional[Callable[[str], None]] = None,
                            progressbar_callback: Optional[Callable[[int, int], None]] = None):
         """
@@ -300,7 +208,7 @@ class PDFTools:
         
         Args:
             pdf_document: Dokument fitz (PyMuPDF)
-            selected_indices: Lista indeksów stron do numeracji (posortowana)
+            selected_indices: Indeksy stron do numeracji (rosnąco - posortowana lista lub PageSelection)
             settings: Słownik z ustawieniami numeracji
             progress_callback: Funkcja callback dla statusu
             progressbar_callback: Funkcja callback dla paska postępu
@@ -425,7 +333,7 @@ class PDFTools:
             if progressbar_callback:
                 progressbar_callback(idx + 1, len(selected_indices))
     
-    def remove_page_numbers(self, pdf_document, selected_indices: list, settings: dict,
+    def remove_page_numbers(self, pdf_document, selected_indices: Collection[int], settings: dict,
                            progress_callback: Optional[Callable[[str], None]] = None,
                            progressbar_callback: Optional[Callable[[int, int], None]] = None):
         """
@@ -433,7 +341,7 @@ class PDFTools:
         
         Args:
             pdf_document: Dokument fitz (PyMuPDF)
-            selected_indices: Lista indeksów stron
+            selected_indices: Indeksy stron
             settings: Słownik z ustawieniami obszaru usuwania
             progress_callback: Funkcja callback dla statusu
             progressbar_callback: Funkcja callback dla paska postępu
@@ -477,7 +385,7 @@ class PDFTools:
             if progressbar_callback:
                 progressbar_callback(idx + 1, len(selected_indices))
     
-    def remove_page_numbers_by_pattern(self, pdf_document, selected_indices: list, 
+    def remove_page_numbers_by_pattern(self, pdf_document, selected_indices: Collection[int], 
                                       top_mm: float, bottom_mm: float,
                                       progress_callback: Optional[Callable[[str], None]] = None,
                                       progressbar_callback: Optional[Callable[[int, int], None]] = None) -> int:
@@ -487,7 +395,7 @@ class PDFTools:
         
         Args:
             pdf_document: Dokument fitz (PyMuPDF)
-            selected_indices: Lista indeksów stron do przetworzenia
+            selected_indices: Indeksy stron do przetworzenia
             top_mm: Wysokość górnego marginesu w mm
             bottom_mm: Wysokość dolnego marginesu w mm
             progress_callback: Funkcja callback dla statusu
@@ -561,7 +469,7 @@ class PDFTools:
     # OBRACANIE STRON
     # ============================================================================
     
-    def rotate_pages(self, pdf_document, selected_indices: list, angle: int,
+    def rotate_pages(self, pdf_document, selected_indices: Collection[int], angle: int,
                     progress_callback: Optional[Callable[[str], None]] = None,
                     progressbar_callback: Optional[Callable[[int, int], None]] = None) -> int:
         """
@@ -569,7 +477,7 @@ class PDFTools:
         
         Args:
             pdf_document: Dokument fitz (PyMuPDF)
-            selected_indices: Lista indeksów stron do obrotu
+            selected_indices: Indeksy stron do obrotu
             angle: Kąt obrotu (90, -90, 180, itp.)
             progress_callback: Funkcja callback dla statusu
             progressbar_callback: Funkcja callback dla paska postępu
@@ -648,11 +556,40 @@ class PDFTools:
             page1_index: Indeks pierwszej strony
             page2_index: Indeks drugiej strony
         """
-        pdf_document.move_page(page1_index, page2_index)
-        if page1_index < page2_index:
-            pdf_document.move_page(page2_index - 1, page1_index)
-        else:
-            pdf_document.move_page(page2_index + 1, page1_index)
+        self.reorder_pages(pdf_document, page_order.swapped_order(len(pdf_document), page1_index, page2_index))
+    
+    def reorder_pages(self, pdf_document, order) -> list:
+        """
+        Zmienia kolejność stron w miejscu (bez kopiowania stron).
+        
+        Args:
+            pdf_document: Dokument fitz (PyMuPDF)
+            order: Nowa kolejność - lista indeksów (strona i po zmianie = strona order[i])
+                   albo opis zakresów, np. "N-1" lub "3,1-2" (numery od 1)
+            
+        Returns:
+            Pozycje, na których stoi inna strona niż przed zmianą
+        """
+        if isinstance(order, str):
+            order = page_order.parse_page_order(order, len(pdf_document))
+        return page_order.apply_page_order(pdf_document, order)
+    
+    def move_pages(self, pdf_document, page_indices, insert_at: int) -> list:
+        """
+        Przenosi strony w nowe miejsce, zachowując ich wzajemną kolejność.
+        
+        Args:
+            pdf_document: Dokument fitz (PyMuPDF)
+            page_indices: Indeksy przenoszonych stron
+            insert_at: Pozycja wstawienia liczona przed przeniesieniem (0 - na początek)
+            
+        Returns:
+            Nowe indeksy przeniesionych stron
+        """
+        order = page_order.moved_order(len(pdf_document), page_indices, insert_at)
+        self.reorder_pages(pdf_document, order)
+        moved = set(page_indices)
+        return [i for i, old_index in enumerate(order) if old_index in moved]
     
     def insert_blank_pages(self, pdf_document, sorted_pages: list, before: bool,
                           width: float = 595.276, height: float = 841.89,
@@ -696,7 +633,7 @@ class PDFTools:
     # CLIPBOARD (KOPIOWANIE, WYCINANIE, WKLEJANIE)
     # ============================================================================
     
-    def get_page_bytes(self, pdf_document, page_indices: Set[int]) -> bytes:
+    def get_page_bytes(self, pdf_document, page_indices: Iterable[int]) -> bytes:
         """
         Pobiera bajty wybranych stron jako osobny dokument PDF.
         
@@ -707,14 +644,7 @@ class PDFTools:
         Returns:
             Bajty dokumentu PDF zawierającego wybrane strony
         """
-        temp_doc = fitz.open()
-        for idx in sorted(page_indices):
-            temp_doc.insert_pdf(pdf_document, from_page=idx, to_page=idx)
-        out = io.BytesIO()
-        temp_doc.save(out)
-        temp_doc.close()
-        out.seek(0)
-        return out.read()
+        return page_transfer.pages_to_bytes(pdf_document, sorted(page_indices))
     
     def paste_pages(self, pdf_document, clipboard_bytes: bytes, target_index: int,
                    progress_callback: Optional[Callable[[str], None]] = None,
@@ -741,10 +671,8 @@ class PDFTools:
         if progressbar_callback:
             progressbar_callback(0, pages_count)
         
-        for i in range(pages_count):
-            pdf_document.insert_pdf(clipboard_doc, from_page=i, to_page=i, start_at=target_index + i)
-            if progressbar_callback:
-                progressbar_callback(i + 1, pages_count)
+        page_transfer.transfer_pages(pdf_document, clipboard_doc, range(pages_count), start_at=target_index,
+                                     progressbar_callback=progressbar_callback)
         
         clipboard_doc.close()
         return pages_count
@@ -753,7 +681,7 @@ class PDFTools:
     # PRZESUWANIE ZAWARTOŚCI
     # ============================================================================
     
-    def shift_page_content(self, pdf_bytes: bytes, selected_indices: Set[int],
+    def shift_page_content(self, pdf_bytes: bytes, selected_indices: Iterable[int],
                           dx_mm: float, dy_mm: float,
                           progress_callback: Optional[Callable[[str], None]] = None,
                           progressbar_callback: Optional[Callable[[int, int], None]] = None) -> bytes:
@@ -770,32 +698,11 @@ class PDFTools:
         Returns:
             Bajty zmodyfikowanego dokumentu PDF
         """
-        reader = PdfReader(io.BytesIO(pdf_bytes))
-        writer = PdfWriter()
-        total_pages = len(reader.pages)
-        
         if progress_callback:
             progress_callback("Przesuwanie zawartości stron...")
-        
-        if progressbar_callback:
-            progressbar_callback(0, total_pages)
-        
-        dx_pt = mm2pt(dx_mm)
-        dy_pt = mm2pt(dy_mm)
-        
-        for i, page in enumerate(reader.pages):
-            if i in selected_indices:
-                transform = Transformation().translate(tx=dx_pt, ty=dy_pt)
-                page.add_transformation(transform)
-            writer.add_page(page)
-            
-            if progressbar_callback:
-                progressbar_callback(i + 1, total_pages)
-        
-        out = io.BytesIO()
-        writer.write(out)
-        out.seek(0)
-        return out.read()
+        return self._apply_geometry(
+            pdf_bytes, page_geometry.shift_pages, selected_indices, dx_mm, dy_mm,
+            progressbar_callback=progressbar_callback)
     
     # ============================================================================
     # IMPORT I EKSPORT
@@ -826,10 +733,8 @@ class PDFTools:
         if progressbar_callback:
             progressbar_callback(0, pages_count)
         
-        for i in range(pages_count):
-            pdf_document.insert_pdf(imported_doc, from_page=i, to_page=i, start_at=target_index + i)
-            if progressbar_callback:
-                progressbar_callback(i + 1, pages_count)
+        page_transfer.transfer_pages(pdf_document, imported_doc, range(pages_count), start_at=target_index,
+                                     progressbar_callback=progressbar_callback)
         
         imported_doc.close()
         return pages_count
@@ -901,7 +806,7 @@ class PDFTools:
                 progress_callback(f"Błąd importu obrazu: {e}")
             return False
     
-    def export_pages_to_pdf(self, pdf_document, selected_indices: list, output_filepath: str,
+    def export_pages_to_pdf(self, pdf_document, selected_indices: Collection[int], output_filepath: str,
                            progress_callback: Optional[Callable[[str], None]] = None,
                            progressbar_callback: Optional[Callable[[int, int], None]] = None) -> bool:
         """
@@ -909,7 +814,7 @@ class PDFTools:
         
         Args:
             pdf_document: Dokument fitz (PyMuPDF) źródłowy
-            selected_indices: Lista indeksów stron do eksportu
+            selected_indices: Indeksy stron do eksportu
             output_filepath: Ścieżka do pliku wyjściowego
             progress_callback: Funkcja callback dla statusu
             progressbar_callback: Funkcja callback dla paska postępu
@@ -926,10 +831,8 @@ class PDFTools:
             if progressbar_callback:
                 progressbar_callback(0, len(selected_indices))
             
-            for idx, page_index in enumerate(selected_indices):
-                new_doc.insert_pdf(pdf_document, from_page=page_index, to_page=page_index)
-                if progressbar_callback:
-                    progressbar_callback(idx + 1, len(selected_indices))
+            page_transfer.transfer_pages(new_doc, pdf_document, selected_indices,
+                                         progressbar_callback=progressbar_callback)
             
             new_doc.save(output_filepath)
             new_doc.close()
@@ -940,22 +843,25 @@ class PDFTools:
                 progress_callback(f"Błąd eksportu: {e}")
             return False
     
-    def export_pages_to_images(self, pdf_document, selected_indices: list, output_dir: str,
+    def export_pages_to_images(self, pdf_document, selected_indices: Collection[int], output_dir: str,
                               base_filename: str, dpi: int, image_format: str = 'png',
                               progress_callback: Optional[Callable[[str], None]] = None,
-                              progressbar_callback: Optional[Callable[[int, int], None]] = None) -> list:
+                              progressbar_callback: Optional[Callable[[int, int], None]] = None,
+                              display_lists=None) -> list:
         """
         Eksportuje wybrane strony jako obrazy.
         
         Args:
             pdf_document: Dokument fitz (PyMuPDF) źródłowy
-            selected_indices: Lista indeksów stron do eksportu
+            selected_indices: Indeksy stron do eksportu
             output_dir: Katalog docelowy
             base_filename: Bazowa nazwa pliku
             dpi: Rozdzielczość eksportu
             image_format: Format obrazu ('png', 'jpg', 'tiff')
             progress_callback: Funkcja callback dla statusu
             progressbar_callback: Funkcja callback dla paska postępu
+            display_lists: Cache list wyświetlania (DisplayListCache) - strony już interpretowane
+                           (np. dla miniatur) są tylko rasteryzowane
             
         Returns:
             Lista ścieżek do wyeksportowanych plików
@@ -973,7 +879,11 @@ class PDFTools:
         
         for idx, page_index in enumerate(selected_indices):
             page = pdf_document.load_page(page_index)
-            pix = page.get_pixmap(matrix=mat, alpha=False)
+            if display_lists is not None:
+                # Eksport jednorazowy - lista nie jest zapamiętywana, jeśli jej jeszcze nie było
+                pix = display_lists.get_pixmap(page, mat, store=False)
+            else:
+                pix = page.get_pixmap(matrix=mat, alpha=False)
             
             # Generuj unikalną nazwę pliku
             single_page_range = str(page_index + 1)
@@ -1086,101 +996,47 @@ class PDFTools:
     # SCALANIE STRON W SIATKĘ
     # ============================================================================
     
-    def merge_pages_into_grid(self, pdf_document, selected_indices: list, rows: int, cols: int,
+    def merge_pages_into_grid(self, pdf_document, selected_indices: Collection[int], rows: int, cols: int,
                              sheet_width_pt: float, sheet_height_pt: float,
                              margin_top_pt: float, margin_bottom_pt: float,
                              margin_left_pt: float, margin_right_pt: float,
                              spacing_x_pt: float, spacing_y_pt: float,
                              target_dpi: int = 600,
                              progress_callback: Optional[Callable[[str], None]] = None,
-                             progressbar_callback: Optional[Callable[[int, int], None]] = None) -> None:
+                             progressbar_callback: Optional[Callable[[int, int], None]] = None,
+                             mode: str = page_imposition.MODE_VECTOR,
+                             layout: str = page_imposition.LAYOUT_GRID) -> list:
         """
-        Scala strony w siatkę na nowym arkuszu.
-        Bitmapy renderowane są w wysokiej rozdzielczości (domyślnie 600dpi).
-        Przed renderowaniem każda strona jest automatycznie obracana jeśli jej orientacja nie pasuje do komórki siatki.
+        Rozmieszcza strony w siatce na nowych arkuszach (tylu, ile wymaga układ).
+        Domyślnie strony umieszczane są wektorowo (Form XObject, bez renderowania);
+        tryb "flatten" renderuje komórki do bitmap w rozdzielczości target_dpi.
+        Każda strona jest automatycznie obracana jeśli jej orientacja nie pasuje do komórki siatki.
         
         Args:
             pdf_document: Dokument fitz (PyMuPDF)
-            selected_indices: Lista indeksów stron do scalenia
+            selected_indices: Indeksy stron do scalenia
             rows, cols: Liczba wierszy i kolumn w siatce
             sheet_width_pt, sheet_height_pt: Rozmiar arkusza w punktach
             margin_top_pt, margin_bottom_pt, margin_left_pt, margin_right_pt: Marginesy w punktach
             spacing_x_pt, spacing_y_pt: Odstępy między komórkami w punktach
-            target_dpi: Rozdzielczość renderowania bitmap (domyślnie 600)
+            target_dpi: Rozdzielczość renderowania bitmap w trybie "flatten" (domyślnie 600)
             progress_callback: Funkcja callback dla statusu
             progressbar_callback: Funkcja callback dla paska postępu
+            mode: "vector" (domyślnie) lub "flatten"
+            layout: "grid" (domyślnie), "step_repeat", "cut_stack" lub "booklet"
+            
+        Returns:
+            Lista indeksów nowych arkuszy
         """
         if progress_callback:
             progress_callback("Scalanie stron w siatkę...")
         
-        num_pages = len(selected_indices)
-        total_cells = rows * cols
-        
-        # Poprawka: powielaj tylko jeśli jedna strona, przy wielu nie powielaj żadnej
-        if num_pages == 1:
-            source_pages = [selected_indices[0]] * total_cells
-        else:
-            source_pages = [selected_indices[i] if i < num_pages else None for i in range(total_cells)]
-        
-        # Oblicz rozmiar komórki
-        if cols == 1:
-            cell_width = sheet_width_pt - margin_left_pt - margin_right_pt
-        else:
-            cell_width = (sheet_width_pt - margin_left_pt - margin_right_pt - (cols - 1) * spacing_x_pt) / cols
-        if rows == 1:
-            cell_height = sheet_height_pt - margin_top_pt - margin_bottom_pt
-        else:
-            cell_height = (sheet_height_pt - margin_top_pt - margin_bottom_pt - (rows - 1) * spacing_y_pt) / rows
-        
-        new_page = pdf_document.new_page(width=sheet_width_pt, height=sheet_height_pt)
-        
-        if progressbar_callback:
-            progressbar_callback(0, len(source_pages))
-        
-        PT_TO_INCH = 1 / 72
-        
-        for idx, src_idx in enumerate(source_pages):
-            row = idx // cols
-            col = idx % cols
-            if row >= rows:
-                break
-            if src_idx is None:
-                continue  # Pusta komórka
-            
-            x = margin_left_pt + col * (cell_width + spacing_x_pt)
-            y = margin_top_pt + row * (cell_height + spacing_y_pt)
-            
-            src_page = pdf_document[src_idx]
-            page_rect = src_page.rect
-            page_w = page_rect.width
-            page_h = page_rect.height
-            
-            # Automatyczny obrót jeśli orientacja strony nie pasuje do komórki
-            page_landscape = page_w > page_h
-            cell_landscape = cell_width > cell_height
-            rotate = 0
-            if page_landscape != cell_landscape:
-                rotate = 90  # Obróć o 90 stopni
-            
-            # Skala renderowania: bitmapa ma dokładnie tyle pikseli, ile wynosi rozmiar komórki w punktach * DPI / 72
-            bitmap_w = int(round(cell_width * target_dpi * PT_TO_INCH))
-            bitmap_h = int(round(cell_height * target_dpi * PT_TO_INCH))
-            
-            if rotate == 90:
-                scale_x = bitmap_w / page_h
-                scale_y = bitmap_h / page_w
-            else:
-                scale_x = bitmap_w / page_w
-                scale_y = bitmap_h / page_h
-            
-            # Renderuj bitmapę w bardzo wysokiej rozdzielczości, z ewentualnym obrotem
-            pix = src_page.get_pixmap(matrix=fitz.Matrix(scale_x, scale_y).prerotate(rotate), alpha=False)
-            img_bytes = pix.tobytes("png")
-            rect = fitz.Rect(x, y, x + cell_width, y + cell_height)
-            new_page.insert_image(rect, stream=img_bytes)
-            
-            if progressbar_callback:
-                progressbar_callback(idx + 1, len(source_pages))
+        return page_imposition.impose(
+            pdf_document, list(selected_indices), rows, cols, sheet_width_pt, sheet_height_pt,
+            margin_top_pt, margin_bottom_pt, margin_left_pt, margin_right_pt,
+            spacing_x_pt, spacing_y_pt, layout=layout, mode=mode, target_dpi=target_dpi,
+            progressbar_callback=progressbar_callback
+        )
     
     # ============================================================================
     # WYKRYWANIE I USUWANIE PUSTYCH STRON
@@ -1188,15 +1044,20 @@ class PDFTools:
     
     def detect_empty_pages(self, pdf_document,
                           progress_callback: Optional[Callable[[str], None]] = None,
-                          progressbar_callback: Optional[Callable[[int, int], None]] = None) -> list:
+                          progressbar_callback: Optional[Callable[[int, int], None]] = None,
+                          ink_threshold: float = DEFAULT_INK_THRESHOLD,
+                          min_confidence: float = 0.0) -> list:
         """
         Wykrywa puste strony w dokumencie PDF.
-        Pusta strona = brak tekstu, rysunków i obrazów.
+        Testy od najtańszego: struktura strony, tekst, pokrycie tuszem w niskiej
+        rozdzielczości (rozpoznaje też zeskanowane puste kartki).
         
         Args:
             pdf_document: Dokument fitz (PyMuPDF)
             progress_callback: Funkcja callback dla statusu
             progressbar_callback: Funkcja callback dla paska postępu
+            ink_threshold: Maksymalne pokrycie tuszem pustej strony (część powierzchni)
+            min_confidence: Minimalna pewność wykrycia (0.5-1.0)
             
         Returns:
             Lista indeksów pustych stron
@@ -1204,30 +1065,19 @@ class PDFTools:
         if progress_callback:
             progress_callback("Skanowanie pustych stron...")
         
-        empty_pages = []
         total_pages = len(pdf_document)
+        results = EmptyPageResults(total_pages)
         
         if progressbar_callback:
             progressbar_callback(0, total_pages)
         
         for page_index in range(total_pages):
-            page = pdf_document[page_index]
-            text = page.get_text().strip()
-            
-            # Sprawdź czy strona ma tekst
-            if not text:
-                # Sprawdź czy są jakieś rysunki/obrazy
-                drawings = page.get_drawings()
-                images = page.get_images()
-                
-                # Jeśli brak tekstu, rysunków i obrazów - strona jest pusta
-                if not drawings and not images:
-                    empty_pages.append(page_index)
+            results.store(page_index, detect_empty_page(pdf_document[page_index], ink_threshold=ink_threshold))
             
             if progressbar_callback:
                 progressbar_callback(page_index + 1, total_pages)
         
-        return empty_pages
+        return results.empty_pages(min_confidence)
     
     def remove_empty_pages(self, pdf_document, empty_pages: list,
                           progress_callback: Optional[Callable[[str], None]] = None,
@@ -1266,8 +1116,7 @@ class PDFTools:
                      progress_callback: Optional[Callable[[str], None]] = None,
                      progressbar_callback: Optional[Callable[[int, int], None]] = None):
         """
-        Odwraca kolejność wszystkich stron w dokumencie PDF.
-        Zwraca nowy dokument z odwróconą kolejnością stron.
+        Odwraca kolejność wszystkich stron w dokumencie PDF (w miejscu, bez kopiowania stron).
         
         Args:
             pdf_document: Dokument fitz (PyMuPDF)
@@ -1275,29 +1124,24 @@ class PDFTools:
             progressbar_callback: Funkcja callback dla paska postępu
             
         Returns:
-            Nowy dokument fitz z odwróconą kolejnością stron
+            Ten sam dokument fitz z odwróconą kolejnością stron
         """
         if progress_callback:
             progress_callback("Odwracanie kolejności stron...")
         
         page_count = len(pdf_document)
-        new_doc = fitz.open()
+        self.reorder_pages(pdf_document, page_order.reversed_order(page_count))
         
         if progressbar_callback:
-            progressbar_callback(0, page_count)
-        
-        for idx, i in enumerate(range(page_count - 1, -1, -1)):
-            new_doc.insert_pdf(pdf_document, from_page=i, to_page=i)
-            if progressbar_callback:
-                progressbar_callback(idx + 1, page_count)
+            progressbar_callback(page_count, page_count)
         
-        return new_doc
+        return pdf_document
     
     # ============================================================================
     # EKSPORT STRON DO PDF
     # ============================================================================
     
-    def extract_pages_to_single_pdf(self, pdf_document, selected_indices: list, 
+    def extract_pages_to_single_pdf(self, pdf_document, selected_indices: Collection[int], 
                                     output_filepath: str,
                                     progress_callback: Optional[Callable[[str], None]] = None,
                                     progressbar_callback: Optional[Callable[[int, int], None]] = None) -> bool:
@@ -1306,7 +1150,7 @@ class PDFTools:
         
         Args:
             pdf_document: Dokument fitz (PyMuPDF)
-            selected_indices: Lista indeksów stron do ekstraktowania
+            selected_indices: Indeksy stron do ekstraktowania
             output_filepath: Ścieżka do pliku wyjściowego
             progress_callback: Funkcja callback dla statusu
             progressbar_callback: Funkcja callback dla paska postępu
@@ -1326,7 +1170,7 @@ class PDFTools:
                 progress_callback(f"BŁĄD: {e}")
             return False
     
-    def extract_pages_to_separate_pdfs(self, pdf_document, selected_indices: list,
+    def extract_pages_to_separate_pdfs(self, pdf_document, selected_indices: Collection[int],
                                       output_dir: str, base_filename: str,
                                       progress_callback: Optional[Callable[[str], None]] = None,
                                       progressbar_callback: Optional[Callable[[int, int], None]] = None) -> int:
@@ -1335,7 +1179,7 @@ class PDFTools:
         
         Args:
             pdf_document: Dokument fitz (PyMuPDF)
-            selected_indices: Lista indeksów stron do ekstraktowania
+            selected_indices: Indeksy stron do ekstraktowania
             output_dir: Katalog wyjściowy
             base_filename: Nazwa bazowa plików
             progress_callback: Funkcja callback dla statusu
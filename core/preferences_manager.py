@@ -18,6 +18,11 @@ class PreferencesManager:
             'thumbnail_quality': 'Średnia',
             'confirm_delete': 'False',
             'export_image_dpi': '300',  # DPI dla eksportu obrazów (150, 300, 600)
+            'undo_history_budget_mb': '512',  # Budżet pamięci historii cofania (MB)
+            'thumbnail_cache_mb': '256',  # Limit cache miniatur na dysku (MB, 0 = wyłączony)
+            'thumbnail_memory_mb': '256',  # Budżet pamięci miniatur wyświetlanych w oknie (MB)
+            'save_profile': 'balanced',  # Profil zapisu: fast, balanced, compact
+            'save_image_preset': '',  # Optymalizacja obrazów przy zapisie: '', print, screen
             
             # PageCropResizeDialog
             'PageCropResizeDialog.crop_mode': 'nocrop',
@@ -67,6 +72,8 @@ class PreferencesManager:
             'MergePageGridDialog.spacing_x_mm': '10',
             'MergePageGridDialog.spacing_y_mm': '10',
             'MergePageGridDialog.dpi_var': '300',
+            'MergePageGridDialog.mode_var': 'vector',
+            'MergePageGridDialog.layout_var': 'grid',
             
             # EnhancedPageRangeDialog
             'EnhancedPageRangeDialog.last_range': '',
@@ -85,8 +92,11 @@ class PreferencesManager:
             
             # Color detection settings
             'color_detect_threshold': '5',
-            'color_detect_samples': '300',
             'color_detect_scale': '0.2',
+            
+            # Empty page detection settings
+            'empty_page_ink_percent': '0.02',
+            'empty_page_min_confidence': '0.5',
         }
         self.load_preferences()
     
@@ -0,0 +1,135 @@
+"""
+RefreshScheduler - Łączenie odświeżeń interfejsu w jedno na klatkę
+
+Pasek statusu, pasek postępu, stany przycisków i menu oraz styl zaznaczenia
+miniatur odświeżane są po każdym kroku długich operacji (obrót, usuwanie
+numerów stron, cofanie). Każde wymuszone odrysowanie (update_idletasks)
+i każde przejście po wszystkich przyciskach i pozycjach menu kosztuje więcej
+niż sama operacja na stronie - pętla po tysiącu stron była ograniczona
+szybkością odrysowywania Tk, a nie PyMuPDF.
+
+Planista zbiera zgłoszenia i wykonuje je najwyżej raz na klatkę (domyślnie 16 ms):
+
+- mark(nazwa) - oznacza zarejestrowaną funkcję odświeżającą jako nieaktualną;
+  funkcja zostanie wywołana raz, przy najbliższym opróżnieniu kolejki
+  (callback after() albo redraw() w trakcie pętli),
+- redraw() - prośba o odrysowanie okna; gdy od poprzedniego opróżnienia minęła
+  co najmniej klatka, kolejka opróżniana jest od razu razem z update_idletasks()
+  (pętla blokująca wątek Tk nadal pokazuje postęp), w przeciwnym razie
+  odrysowanie następuje w callbacku after() po upływie klatki,
+- flush() - natychmiastowe opróżnienie kolejki (np. przed oknem dialogowym).
+
+Funkcje odświeżające wywoływane są w kolejności rejestracji; zgłoszenia
+z wnętrza funkcji odświeżającej (np. odświeżenie zaznaczenia zgłasza stany
+przycisków) są wykonywane w tym samym opróżnieniu.
+"""
+
+import time
+from typing import Callable, Dict
+
+# Odstęp między odrysowaniami (ok. 60 klatek na sekundę)
+DEFAULT_INTERVAL_MS = 16
+
+
+class RefreshScheduler:
+    """Kolejka odświeżeń interfejsu opróżniana najwyżej raz na klatkę"""
+
+    def __init__(self, master, interval_ms: int = DEFAULT_INTERVAL_MS):
+        """
+        Args:
+            master: Widget Tk używany do planowania (after) i odrysowania (update_idletasks)
+            interval_ms: Minimalny odstęp między opróżnieniami kolejki w ms
+        """
+        self.master = master
+        self.interval = interval_ms / 1000.0
+        self._callbacks: Dict[str, Callable[[], None]] = {}
+        self._dirty = set()
+        self._redraw = False
+        self._after_id = None
+        self._flushing = False
+        self._last_flush = 0.0
+        # Liczniki (benchmark, logi)
+        self.requests = 0
+        self.flushes = 0
+
+    def register(self, name: str, callback: Callable[[], None]):
+        """Rejestruje funkcję odświeżającą wywoływaną po mark(name)"""
+        self._callbacks[name] = callback
+
+    # ============================================================================
+    # ZGŁOSZENIA
+    # ============================================================================
+
+    def mark(self, *names: str):
+        """Oznacza funkcje odświeżające jako nieaktualne (wykonanie przy najbliższym opróżnieniu)"""
+        self.requests += 1
+        self._dirty.update(names)
+        self._schedule()
+
+    def redraw(self):
+        """Prośba o odrysowanie okna - od razu, gdy od ostatniego minęła klatka, inaczej po jej upływie"""
+        self.requests += 1
+        self._redraw = True
+        if self._flushing:
+            return
+        if time.perf_counter() - self._last_flush >= self.interval:
+            self.flush()
+        else:
+            self._schedule()
+
+    @property
+    def pending(self) -> bool:
+        """Czy są niewykonane zgłoszenia"""
+        return bool(self._dirty) or self._redraw
+
+    # ============================================================================
+    # OPRÓŻNIANIE KOLEJKI
+    # ============================================================================
+
+    def flush(self):
+        """Wykonuje zaległe funkcje odświeżające i odrysowuje okno"""
+        if self._flushing:
+            return
+        self._cancel_timer()
+        if not self.pending:
+            return
+        self._flushing = True
+        try:
+            # Funkcje mogą zgłaszać kolejne odświeżenia - powtarzaj, aż kolejka będzie pusta
+            names = [name for name in self._callbacks if name in self._dirty]
+            while names:
+                for name in names:
+                    self._dirty.discard(name)
+                    self._callbacks[name]()
+                names = [name for name in self._callbacks if name in self._dirty]
+            # Nieznane nazwy nie mają funkcji - nie mogą zostać w kolejce
+            self._dirty.clear()
+            self._redraw = False
+            self.master.update_idletasks()
+        finally:
+            self._flushing = False
+            self._last_flush = time.perf_counter()
+            self.flushes += 1
+
+    def cancel(self):
+        """Porzuca zaległe zgłoszenia (np. przy zamykaniu okna)"""
+        self._cancel_timer()
+        self._dirty.clear()
+        self._redraw = False
+
+    def _schedule(self):
+        if self._after_id is None and not self._flushing:
+            delay = max(0.0, self.interval - (time.perf_counter() - self._last_flush))
+            self._after_id = self.master.after(max(1, int(delay * 1000)), self._on_timer)
+
+    def _on_timer(self):
+        self._after_id = None
+        self.flush()
+
+    def _cancel_timer(self):
+        if self._after_id is not None:
+            try:
+                self.master.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
@@ -0,0 +1,295 @@
+"""
+SaveProfiles - Profile zapisu dokumentu i zapis w tle
+
+Zapis z pełnym odśmiecaniem i czyszczeniem strumieni (garbage=4, clean) trwa
+na dużych dokumentach kilka sekund - wykonany w wątku Tk zamraża okno. Profile
+pozwalają wybrać kompromis między czasem zapisu a rozmiarem pliku:
+
+- "fast" - zapis przyrostowy (dopisanie zmienionych obiektów na końcu pliku),
+  gdy dokument zapisywany jest do pliku, z którego go otwarto; w pozostałych
+  przypadkach zwykły zapis bez optymalizacji,
+- "balanced" - odśmiecanie, usuwanie duplikatów, czyszczenie i kompresja strumieni,
+- "compact" - jak "balanced", a do tego kompresja obrazów i czcionek, strumienie
+  obiektów oraz podzbiory czcionek (tylko użyte znaki).
+
+Niezależnie od profilu przed zapisem można zmniejszyć obrazy (ustawienia
+z core.image_optimizer, np. "Ekran 150 DPI") - wtedy zapis nigdy nie jest przyrostowy.
+
+Profile inne niż przyrostowy zapisywane są w osobnym procesie na podstawie
+migawki bajtów dokumentu - okno pozostaje responsywne, a edycja może trwać.
+Samą migawkę (Document.tobytes) tworzy wątek Tk: dokumentu PyMuPDF nie wolno
+używać z dwóch wątków naraz, a wątek Tk czyta go przy każdym odświeżeniu.
+Koszt migawki mierzy benchmark_save.py (wiersz "migawka (wątek Tk)"): ok.
+0.1 s na 1 MB dokumentów z wieloma małymi obiektami (mniej dla plików, których
+rozmiar to głównie obrazy), więc przy dużych katalogach okno zamiera na kilka
+sekund, zanim pojawi się postęp zapisu. Gdy dokument nie zmienił się od otwarcia
+lub zapisu, migawki nie ma - proces zapisu otwiera plik źródłowy sam.
+Proces zapisuje plik tymczasowy obok docelowego; dopiero po sukcesie wątek Tk
+podmienia plik (os.replace), więc anulowanie nie zostawia uszkodzonego pliku.
+"""
+
+import os
+import shutil
+import tempfile
+import multiprocessing
+from typing import Callable, Dict, NamedTuple, Optional
+
+import fitz  # PyMuPDF
+
+from .image_optimizer import optimize_images
+
+
+class SaveProfile(NamedTuple):
+    """Parametry profilu zapisu"""
+    label: str                 # Nazwa wyświetlana
+    options: Optional[dict]    # Opcje Document.save(); None - migawka zapisywana bez zmian
+    incremental: bool          # Zapis przyrostowy do pliku źródłowego, gdy to możliwe
+    subset_fonts: bool         # Podzbiory czcionek przed zapisem
+
+
+SAVE_PROFILES: Dict[str, SaveProfile] = {
+    'fast': SaveProfile("Szybki", None, True, False),
+    'balanced': SaveProfile("Zrównoważony", dict(garbage=4, clean=True, deflate=True), False, False),
+    'compact': SaveProfile("Kompaktowy", dict(garbage=4, clean=True, deflate=True, deflate_images=True,
+                                              deflate_fonts=True, use_objstms=1), False, True),
+}
+DEFAULT_SAVE_PROFILE = 'balanced'
+
+# Opcje migawki przekazywanej do procesu zapisu (usuwa obiekty bez odwołań, np. po usuniętych stronach)
+SNAPSHOT_OPTIONS = dict(garbage=1, encryption=fitz.PDF_ENCRYPT_NONE)
+
+
+def get_profile(name: str) -> SaveProfile:
+    """Profil o podanej nazwie (nieznana nazwa - profil domyślny)"""
+    return SAVE_PROFILES.get(name, SAVE_PROFILES[DEFAULT_SAVE_PROFILE])
+
+
+def profile_name_for_label(label: str) -> str:
+    """Nazwa profilu dla nazwy wyświetlanej (np. z listy w preferencjach)"""
+    for name, profile in SAVE_PROFILES.items():
+        if profile.label == label:
+            return name
+    return DEFAULT_SAVE_PROFILE
+
+
+def is_source_file(doc, filepath: str) -> bool:
+    """Czy filepath to plik, z którego otwarto dokument"""
+    if not doc.name or not os.path.exists(doc.name) or not os.path.exists(filepath):
+        return False
+    try:
+        return os.path.samefile(doc.name, filepath)
+    except OSError:
+        return False
+
+
+def can_save_incrementally(doc, filepath: str, profile_name: str) -> bool:
+    """Czy zapis profilem profile_name do filepath może być przyrostowy"""
+    return (get_profile(profile_name).incremental and is_source_file(doc, filepath)
+            and bool(doc.can_save_incrementally()))
+
+
+def save_incrementally(doc):
+    """Dopisuje zmiany do pliku, z którego otwarto dokument (szyfrowanie bez zmian)"""
+    doc.save(doc.name, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+
+
+def optimize_and_save(doc, filepath: str, profile_name: str,
+                      stage_callback: Optional[Callable[[str], None]] = None,
+                      image_preset: Optional[str] = None, data: Optional[bytes] = None,
+                      path: Optional[str] = None):
+    """
+    Zapisuje dokument z opcjami profilu (bez zapisu przyrostowego).
+
+    Args:
+        doc: Dokument fitz.Document - przy podzbiorach czcionek i optymalizacji obrazów jest modyfikowany
+        filepath: Ścieżka pliku wynikowego
+        profile_name: Nazwa profilu z SAVE_PROFILES
+        stage_callback: Funkcja wywoływana z opisem kolejnego etapu
+        image_preset: Nazwa ustawień z IMAGE_PRESETS (None - obrazy bez zmian)
+        data: Bajty dokumentu dla procesów optymalizujących obrazy (None - pobierane z doc)
+        path: Plik dokumentu dla procesów optymalizujących obrazy (zamiast data)
+    """
+    profile = get_profile(profile_name)
+    if image_preset:
+        def image_progress(done, total):
+            if stage_callback:
+                stage_callback(f"Optymalizacja obrazów {done}/{total}")
+
+        report = optimize_images(doc, image_preset, path=path, data=data, progress_callback=image_progress)
+        if stage_callback:
+            stage_callback(f"Obrazy mniejsze o {report.total_saved / 1048576:.1f} MB")
+    if profile.subset_fonts:
+        if stage_callback:
+            stage_callback("Tworzenie podzbiorów czcionek")
+        doc.subset_fonts()
+    if stage_callback:
+        stage_callback("Zapisywanie pliku")
+    doc.save(filepath, **(profile.options or {}))
+
+
+def _save_worker(conn, data: Optional[bytes], source_path: Optional[str], filepath: str, profile_name: str,
+                 image_preset: Optional[str]):
+    """Proces zapisu: otwiera migawkę (lub plik źródłowy), zapisuje ją z opcjami profilu i zgłasza wynik przez potok"""
+    try:
+        doc = fitz.open(source_path) if data is None else fitz.open("pdf", data)
+        optimize_and_save(doc, filepath, profile_name, lambda stage: conn.send(("stage", stage)),
+                          image_preset, data, source_path if data is None else None)
+        doc.close()
+        conn.send(("done", os.path.getsize(filepath)))
+    except Exception as e:
+        conn.send(("error", str(e)))
+    finally:
+        conn.close()
+
+
+def _copy_permissions(temp_path: str, filepath: str):
+    """Plik tymczasowy (tworzony z prawami 0600) dostaje prawa pliku docelowego lub domyślne"""
+    if os.path.exists(filepath):
+        shutil.copymode(filepath, temp_path)
+    else:
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp_path, 0o666 & ~umask)
+
+
+class BackgroundSaver:
+    """Zapis migawki dokumentu w osobnym procesie z raportowaniem etapów do wątku Tk"""
+
+    def __init__(self, master, poll_ms: int = 100):
+        """
+        Args:
+            master: Widget Tk używany do planowania odpytywania (after)
+            poll_ms: Odstęp odpytywania procesu zapisu w ms
+        """
+        self.master = master
+        self.poll_ms = poll_ms
+        self.filepath = None
+        self.profile_name = None
+        self._process = None
+        self._conn = None
+        self._temp_path = None
+        self._on_stage = None
+        self._on_done = None
+        self._before_replace = None
+        self._poll_id = None
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None
+
+    def start(self, data: Optional[bytes], filepath: str, profile_name: str,
+              on_done: Callable[[bool, str], None], on_stage: Optional[Callable[[str], None]] = None,
+              image_preset: Optional[str] = None, before_replace: Optional[Callable[[], None]] = None,
+              source_path: Optional[str] = None):
+        """
+        Rozpoczyna zapis migawki (przerywa poprzedni zapis).
+
+        Args:
+            data: Bajty dokumentu (migawka, np. doc.tobytes(**SNAPSHOT_OPTIONS)); None - zapisywany jest
+                  plik source_path (dokument bez zmian od otwarcia - bez migawki w wątku Tk)
+            filepath: Ścieżka pliku docelowego - podmieniana dopiero po udanym zapisie
+            profile_name: Nazwa profilu z SAVE_PROFILES
+            on_done: Callback (sukces, komunikat błędu) po zakończeniu; nie jest wywoływany po cancel()
+            on_stage: Callback z opisem etapu zapisu
+            image_preset: Nazwa ustawień optymalizacji obrazów z IMAGE_PRESETS (None - bez zmian)
+            before_replace: Wywoływane w wątku Tk tuż przed podmianą pliku docelowego - np. zamknięcie
+                            uchwytów tego pliku w innych wątkach (Windows nie podmienia otwartego pliku)
+            source_path: Plik dokumentu, gdy data to None (nieszyfrowany, różny od filepath)
+        """
+        self.cancel()
+        self.filepath = filepath
+        self.profile_name = profile_name
+        self._on_done = on_done
+        self._on_stage = on_stage
+        self._before_replace = before_replace
+
+        fd, self._temp_path = tempfile.mkstemp(suffix=".pdf.tmp", dir=os.path.dirname(os.path.abspath(filepath)))
+        os.close(fd)
+        profile = get_profile(profile_name)
+        if profile.options is None and not profile.subset_fonts and not image_preset:
+            # Migawka jest wynikiem - wystarczy ją zapisać (bez uruchamiania procesu)
+            try:
+                if data is None:
+                    shutil.copyfile(source_path, self._temp_path)
+                else:
+                    with open(self._temp_path, "wb") as f:
+                        f.write(data)
+            except OSError as e:
+                self._finish(False, str(e))
+                return
+            self._finish(True, "")
+            return
+
+        context = multiprocessing.get_context("spawn")
+        self._conn, child_conn = context.Pipe(duplex=False)
+        # Bez daemon - proces zapisu może uruchomić pulę procesów optymalizujących obrazy
+        self._process = context.Process(target=_save_worker,
+                                        args=(child_conn, data, source_path, self._temp_path, profile_name,
+                                              image_preset))
+        self._process.start()
+        child_conn.close()
+        self._poll_id = self.master.after(self.poll_ms, self._poll)
+
+    def cancel(self):
+        """Przerywa zapis - plik docelowy pozostaje bez zmian"""
+        if self._poll_id is not None:
+            try:
+                self.master.after_cancel(self._poll_id)
+            except Exception:
+                pass
+            self._poll_id = None
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+        self._cleanup()
+
+    # ============================================================================
+    # WYNIKI PROCESU (WĄTEK TK)
+    # ============================================================================
+
+    def _poll(self):
+        self._poll_id = None
+        try:
+            while self._conn.poll():
+                kind, value = self._conn.recv()
+                if kind == "stage":
+                    if self._on_stage:
+                        self._on_stage(value)
+                else:
+                    self._process.join()
+                    self._finish(kind == "done", "" if kind == "done" else value)
+                    return
+        except (EOFError, OSError):
+            self._process.join()
+            self._finish(False, "Proces zapisu zakończył się nieoczekiwanie")
+            return
+        self._poll_id = self.master.after(self.poll_ms, self._poll)
+
+    def _finish(self, success: bool, error: str):
+        if success:
+            try:
+                if self._before_replace:
+                    self._before_replace()
+                _copy_permissions(self._temp_path, self.filepath)
+                os.replace(self._temp_path, self.filepath)
+                self._temp_path = None
+            except OSError as e:
+                success, error = False, str(e)
+        on_done = self._on_done
+        self._cleanup()
+        on_done(success, error)
+
+    def _cleanup(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        self._process = None
+        if self._temp_path and os.path.exists(self._temp_path):
+            try:
+                os.remove(self._temp_path)
+            except OSError:
+                pass
+        self._temp_path = None
+        self._on_done = None
+        self._on_stage = None
+        self._before_replace = None
@@ -0,0 +1,272 @@
+"""
+ThumbnailDiskCache - Trwały cache miniatur na dysku
+
+Miniatury zapisywane są w bazie SQLite obok pliku preferencji, więc ponowne
+otwarcie dokumentu (także następnego dnia) nie wymaga rasteryzacji stron.
+
+Kluczem wpisu jest skrót zawartości strony (strumienie treści, zasoby,
+adnotacje, geometria i obrót) oraz szerokość miniatury i współczynnik DPI.
+Skrót nie zależy od numeracji obiektów PDF - ta sama strona w innym pliku
+lub po zapisie dokumentu trafia w ten sam wpis.
+
+Po przekroczeniu limitu rozmiaru usuwane są najdawniej używane wpisy (LRU).
+"""
+
+import io
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from PIL import Image
+from typing import Optional
+
+
+# Odwołanie do obiektu pośredniego w tekście obiektu PDF, np. "12 0 R"
+_REF_PATTERN = re.compile(r"(\d+) (\d+) R")
+
+# Po przekroczeniu limitu cache jest zmniejszany do tej części budżetu
+_EVICT_TARGET_RATIO = 0.9
+
+
+class PageContentHasher:
+    """
+    Wylicza skróty zawartości stron dokumentu.
+
+    Skrót obiektu obejmuje jego tekst z odwołaniami zastąpionymi skrótami obiektów
+    docelowych (oraz surowe dane strumienia), więc nie zależy od numerów xref.
+    Skróty obiektów współdzielonych (czcionki, obrazy) liczone są raz na dokument.
+    Obiekt nie jest bezpieczny wątkowo - każdy wątek używa własnej instancji.
+    """
+
+    def __init__(self, doc):
+        """
+        Args:
+            doc: Dokument fitz.Document (nie może być modyfikowany w trakcie użycia)
+        """
+        self.doc = doc
+        self._digests = {}
+        self._active = set()
+
+    def page_hash(self, page_index: int, include_rotation: bool = True) -> str:
+        """
+        Zwraca skrót zawartości strony.
+
+        Args:
+            page_index: Indeks strony
+            include_rotation: False - skrót bez kąta obrotu (np. do rozpoznania samego obrotu strony)
+
+        Returns:
+            Skrót szesnastkowy (32 znaki)
+        """
+        doc = self.doc
+        page = doc[page_index]
+        h = hashlib.blake2b(digest_size=16)
+        rotation = page.rotation if include_rotation else ""
+        h.update(f"{rotation}|{tuple(page.mediabox)}|{tuple(page.cropbox)}".encode())
+        for xref in page.get_contents():
+            h.update(self._object_digest(xref))
+        h.update(self._resources_digest(page.xref))
+        for annot_xref, _, _ in page.annot_xrefs():
+            # Adnotacje odwołują się do strony (/P), więc bez rekurencji - tylko tekst i wygląd
+            h.update(doc.xref_object(annot_xref, compressed=True).encode())
+            kind, value = doc.xref_get_key(annot_xref, "AP/N")
+            if kind == "xref":
+                h.update(self._object_digest(int(value.split()[0])))
+        return h.hexdigest()
+
+    def _resources_digest(self, page_xref: int) -> bytes:
+        """Skrót zasobów strony (z uwzględnieniem dziedziczenia po węzłach /Pages)"""
+        xref = page_xref
+        for _ in range(64):
+            kind, value = self.doc.xref_get_key(xref, "Resources")
+            if kind == "xref":
+                return self._object_digest(int(value.split()[0]))
+            if kind == "dict":
+                return self._text_digest(value)
+            kind, value = self.doc.xref_get_key(xref, "Parent")
+            if kind != "xref":
+                break
+            xref = int(value.split()[0])
+        return b""
+
+    def _text_digest(self, text: str, stream: Optional[bytes] = None) -> bytes:
+        """Skrót tekstu obiektu z odwołaniami zastąpionymi skrótami obiektów docelowych"""
+        h = hashlib.blake2b(digest_size=16)
+        position = 0
+        for match in _REF_PATTERN.finditer(text):
+            h.update(text[position:match.start()].encode())
+            h.update(self._object_digest(int(match.group(1))))
+            position = match.end()
+        h.update(text[position:].encode())
+        if stream is not None:
+            h.update(stream)
+        return h.digest()
+
+    def _object_digest(self, xref: int) -> bytes:
+        """Skrót obiektu pośredniego (z pamięcią podręczną i ochroną przed cyklami)"""
+        digest = self._digests.get(xref)
+        if digest is not None:
+            return digest
+        if xref in self._active:
+            return b"cycle"
+        doc = self.doc
+        if xref <= 0 or xref >= doc.xref_length():
+            return b"null"
+        if doc.xref_get_key(xref, "Type")[1] in ("/Page", "/Pages"):
+            # Odwołanie do drzewa stron (np. /Parent) - nie wchodzimy w inne strony
+            return b"page"
+        self._active.add(xref)
+        try:
+            stream = doc.xref_stream_raw(xref) if doc.xref_is_stream(xref) else None
+            digest = self._text_digest(doc.xref_object(xref, compressed=True), stream)
+        finally:
+            self._active.discard(xref)
+        self._digests[xref] = digest
+        return digest
+
+
+class ThumbnailDiskCache:
+    """Cache miniatur w bazie SQLite z usuwaniem najdawniej używanych wpisów"""
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024):
+        """
+        Args:
+            path: Ścieżka pliku bazy danych
+            max_bytes: Limit rozmiaru zapisanych miniatur w bajtach (0 wyłącza cache)
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        if max_bytes > 0:
+            self._open()
+
+    @property
+    def enabled(self) -> bool:
+        return self._conn is not None and self.max_bytes > 0
+
+    @staticmethod
+    def make_key(content_hash: str, width: int, dpi_factor: float) -> str:
+        """Klucz wpisu: skrót zawartości strony + szerokość miniatury + współczynnik DPI"""
+        return f"{content_hash}:{width}:{dpi_factor:.3f}"
+
+    # ============================================================================
+    # ODCZYT I ZAPIS
+    # ============================================================================
+
+    def get(self, key: str) -> Optional[Image.Image]:
+        """
+        Zwraca miniaturę z cache lub None. Trafienie odświeża czas ostatniego użycia.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            try:
+                row = self._conn.execute("SELECT data FROM thumbnails WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                self._conn.execute("UPDATE thumbnails SET last_used = ? WHERE key = ?", (time.time(), key))
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"[CACHE] Błąd odczytu cache miniatur: {e}")
+                return None
+        try:
+            image = Image.open(io.BytesIO(row[0]))
+            image.load()
+            return image
+        except Exception:
+            return None
+
+    def put(self, key: str, image: Image.Image):
+        """Zapisuje miniaturę (PNG) i w razie potrzeby usuwa najstarsze wpisy"""
+        if not self.enabled:
+            return
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG", compress_level=1)
+        data = buffer.getvalue()
+        with self._lock:
+            try:
+                row = self._conn.execute("SELECT size FROM thumbnails WHERE key = ?", (key,)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO thumbnails (key, data, size, last_used) VALUES (?, ?, ?, ?)",
+                    (key, sqlite3.Binary(data), len(data), time.time())
+                )
+                self.total_bytes += len(data) - (row[0] if row else 0)
+                self._evict()
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"[CACHE] Błąd zapisu cache miniatur: {e}")
+
+    def set_budget(self, max_bytes: int):
+        """Zmienia limit rozmiaru cache (0 wyłącza cache)"""
+        self.max_bytes = max_bytes
+        if max_bytes > 0 and self._conn is None:
+            self._open()
+        if not self.enabled:
+            return
+        with self._lock:
+            try:
+                self._evict()
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"[CACHE] Błąd porządkowania cache miniatur: {e}")
+
+    def clear(self):
+        """Usuwa wszystkie wpisy"""
+        if self._conn is None:
+            return
+        with self._lock:
+            try:
+                self._conn.execute("DELETE FROM thumbnails")
+                self._conn.commit()
+                self.total_bytes = 0
+            except sqlite3.Error as e:
+                print(f"[CACHE] Błąd czyszczenia cache miniatur: {e}")
+
+    def close(self):
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+                self._conn = None
+
+    # ============================================================================
+    # METODY POMOCNICZE
+    # ============================================================================
+
+    def _open(self):
+        """Otwiera (lub tworzy) bazę; przy błędzie cache pozostaje wyłączony"""
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS thumbnails ("
+                "key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS thumbnails_last_used ON thumbnails (last_used)")
+            conn.commit()
+            self.total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM thumbnails").fetchone()[0]
+            self._conn = conn
+        except (sqlite3.Error, OSError) as e:
+            print(f"[CACHE] Nie można otworzyć cache miniatur {self.path}: {e}")
+            self._conn = None
+
+    def _evict(self):
+        """Usuwa najdawniej używane wpisy, aż rozmiar spadnie poniżej limitu (wywoływać pod blokadą)"""
+        if self.total_bytes <= self.max_bytes:
+            return
+        to_free = self.total_bytes - int(self.max_bytes * _EVICT_TARGET_RATIO)
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM thumbnails ORDER BY last_used"):
+            if to_free <= 0:
+                break
+            victims.append((key,))
+            to_free -= size
+            self.total_bytes -= size
+        self._conn.executemany("DELETE FROM thumbnails WHERE key = ?", victims)
@@ -0,0 +1,186 @@
+"""
+ThumbnailGridLayout - Geometria wirtualnej siatki miniatur
+
+Model siatki niezależny od widgetów: dla każdej strony wylicza położenie komórki
+na wirtualnym płótnie (canvas), a dla zakresu przewijania zwraca strony, które
+są widoczne. Dzięki temu GUI tworzy ramki miniatur tylko dla widocznych wierszy.
+
+Wysokość wiersza = najwyższa miniatura w wierszu + stała wysokość "ramki"
+(etykiety z numerem strony i formatem, marginesy).
+"""
+
+import bisect
+from typing import Callable, List, Optional, Sequence, Tuple
+
+
+def pages_around(center: int, page_count: int, limit: int) -> List[int]:
+    """
+    Strony w kolejności odległości od center (przy równej odległości wcześniejsza), najwyżej limit.
+
+    Koszt zależy od limit, a nie od liczby stron dokumentu.
+
+    Args:
+        center: Indeks strony środkowej
+        page_count: Liczba stron dokumentu
+        limit: Maksymalna liczba stron wyniku
+
+    Returns:
+        Lista indeksów stron
+    """
+    limit = min(max(0, limit), page_count)
+    if not limit:
+        return []
+    center = min(max(0, center), page_count - 1)
+    pages = [center]
+    distance = 1
+    while len(pages) < limit:
+        if center - distance >= 0:
+            pages.append(center - distance)
+        if center + distance < page_count and len(pages) < limit:
+            pages.append(center + distance)
+        distance += 1
+    return pages
+
+
+class ThumbnailGridLayout:
+    """Wylicza pozycje komórek siatki miniatur o zmiennej wysokości wierszy"""
+
+    def __init__(self, image_heights: List[int], num_cols: int, cell_width: int,
+                 chrome_height: int, padding: int = 0):
+        """
+        Args:
+            image_heights: Wysokość obrazu miniatury każdej strony (w pikselach)
+            num_cols: Liczba kolumn siatki
+            cell_width: Szerokość komórki (ramka miniatury)
+            chrome_height: Wysokość ramki poza obrazem (etykiety, marginesy)
+            padding: Odstęp wokół komórki
+        """
+        self.image_heights = list(image_heights)
+        self.num_cols = max(1, num_cols)
+        self.cell_width = cell_width
+        self.chrome_height = chrome_height
+        self.padding = padding
+        self.row_tops: List[int] = []
+        self.row_heights: List[int] = []
+        self._rebuild_rows(0)
+
+    @property
+    def page_count(self) -> int:
+        return len(self.image_heights)
+
+    @property
+    def num_rows(self) -> int:
+        return len(self.row_heights)
+
+    @property
+    def total_width(self) -> int:
+        return self.num_cols * (self.cell_width + 2 * self.padding)
+
+    @property
+    def total_height(self) -> int:
+        if not self.row_heights:
+            return 0
+        return self.row_tops[-1] + self.row_heights[-1]
+
+    def _rebuild_rows(self, first_row: int):
+        """Przelicza wysokości i pozycje wierszy od wskazanego wiersza"""
+        num_rows = (self.page_count + self.num_cols - 1) // self.num_cols
+        del self.row_heights[first_row:]
+        del self.row_tops[first_row:]
+        top = self.row_tops[-1] + self.row_heights[-1] if self.row_heights else 0
+        for row in range(first_row, num_rows):
+            start = row * self.num_cols
+            heights = self.image_heights[start:start + self.num_cols]
+            height = max(heights) + self.chrome_height + 2 * self.padding
+            self.row_tops.append(top)
+            self.row_heights.append(height)
+            top += height
+
+    def set_image_height(self, page_index: int, height: int) -> bool:
+        """
+        Aktualizuje wysokość miniatury strony (np. po kadrowaniu lub obrocie).
+
+        Returns:
+            True, jeśli zmieniła się geometria siatki
+        """
+        if self.image_heights[page_index] == height:
+            return False
+        self.image_heights[page_index] = height
+        self._rebuild_rows(page_index // self.num_cols)
+        return True
+
+    def remap(self, new_indices: Sequence[Optional[int]], page_count: int, height_of: Callable[[int], int]):
+        """
+        Przenosi wysokości miniatur na nowe indeksy po usunięciu, wstawieniu lub zmianie kolejności stron.
+        Wiersze przeliczane są od pierwszej strony, która zmieniła pozycję.
+
+        Args:
+            new_indices: Dla każdej strony sprzed zmiany jej nowy indeks (None - strona usunięta)
+            page_count: Liczba stron po zmianie
+            height_of: Funkcja (nowy indeks) -> wysokość miniatury strony wstawionej
+        """
+        heights: List[Optional[int]] = [None] * page_count
+        for old_index, new_index in enumerate(new_indices):
+            if new_index is not None:
+                heights[new_index] = self.image_heights[old_index]
+        first_changed = next((i for i, new_index in enumerate(new_indices) if new_index != i), len(new_indices))
+        self.image_heights = [height if height is not None else height_of(i) for i, height in enumerate(heights)]
+        self._rebuild_rows(min(first_changed, page_count) // self.num_cols)
+
+    def page_position(self, page_index: int) -> Tuple[int, int]:
+        """Zwraca (x, y) lewego górnego rogu ramki strony na wirtualnym płótnie"""
+        row, col = divmod(page_index, self.num_cols)
+        x = col * (self.cell_width + 2 * self.padding) + self.padding
+        y = self.row_tops[row] + self.padding
+        return x, y
+
+    def page_bounds(self, page_index: int) -> Tuple[int, int]:
+        """Zwraca (y_góra, y_dół) wiersza zawierającego stronę"""
+        row = page_index // self.num_cols
+        return self.row_tops[row], self.row_tops[row] + self.row_heights[row]
+
+    def row_at(self, y: float) -> int:
+        """Zwraca indeks wiersza na wysokości y"""
+        if not self.row_tops:
+            return 0
+        return max(0, min(self.num_rows - 1, bisect.bisect_right(self.row_tops, y) - 1))
+
+    def pages_in_range(self, y_top: float, y_bottom: float, overscan_rows: int = 1) -> range:
+        """
+        Zwraca zakres stron widocznych między y_top i y_bottom (plus zapas wierszy).
+        """
+        if not self.row_heights:
+            return range(0)
+        first_row = max(0, self.row_at(y_top) - overscan_rows)
+        last_row = min(self.num_rows - 1, self.row_at(y_bottom) + overscan_rows)
+        return range(first_row * self.num_cols, min(self.page_count, (last_row + 1) * self.num_cols))
+
+    def _insertion_cell(self, x: float, y: float) -> Tuple[int, int]:
+        row = self.row_at(y)
+        pitch = self.cell_width + 2 * self.padding
+        col = max(0, min(self.num_cols, int(round(x / pitch))))
+        col = min(col, self.page_count - row * self.num_cols)
+        return row, col
+
+    def insertion_index_at(self, x: float, y: float) -> int:
+        """
+        Zwraca pozycję wstawienia (0 - przed pierwszą stroną, page_count - za ostatnią)
+        dla punktu (x, y), np. miejsca upuszczenia przeciąganych miniatur.
+        """
+        if not self.row_heights:
+            return 0
+        row, col = self._insertion_cell(x, y)
+        return row * self.num_cols + col
+
+    def insertion_marker(self, x: float, y: float) -> Tuple[int, int, int]:
+        """Zwraca (x, y_góra, wysokość) znacznika miejsca wstawienia dla punktu (x, y)"""
+        if not self.row_heights:
+            return 0, 0, 0
+        row, col = self._insertion_cell(x, y)
+        return col * (self.cell_width + 2 * self.padding), self.row_tops[row], self.row_heights[row]
+
+    def average_row_height(self) -> float:
+        """Średnia wysokość wiersza (do przewijania PageUp/PageDown)"""
+        if not self.row_heights:
+            return 1.0
+        return self.total_height / self.num_rows
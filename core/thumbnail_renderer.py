@@ -0,0 +1,379 @@
+"""
+ThumbnailRenderService - Renderowanie miniatur w tle
+
+Rasteryzacja stron odbywa się w wątkach roboczych. Każdy wątek ma własny
+uchwyt fitz.Document (dokumentów PyMuPDF nie wolno współdzielić między wątkami).
+Gotowe obrazy PIL trafiają do kolejki, którą wątek Tk odpytuje przez after(),
+więc pętla zdarzeń nie jest blokowana nawet przy dokumentach z tysiącami stron.
+
+Zlecenia mają priorytety - strony widoczne w oknie renderowane są jako pierwsze.
+Obiekty ImageTk.PhotoImage tworzy wyłącznie wątek Tk (w callbacku on_ready).
+Przed rasteryzacją sprawdzany jest trwały cache miniatur na dysku (jeśli podano).
+Źródłem może być jeden dokument albo plan renderowania (RenderPlan) - wtedy
+strony czytane są z wielu źródeł (plików i migawek) według modelu VirtualDocument.
+Listy wyświetlania stron (DisplayListCache) są wspólne z wątkiem Tk - po zmianie
+szerokości miniatur strony z plików są tylko ponownie rasteryzowane.
+"""
+
+import os
+import queue
+import threading
+import itertools
+import time
+import fitz  # PyMuPDF
+from PIL import Image
+from typing import Callable, Iterable, Optional
+from .thumbnail_cache import PageContentHasher, ThumbnailDiskCache
+from .display_list_cache import DisplayListCache, file_page_key, file_stamp
+from .virtual_document import RenderPlan
+
+
+# Priorytety zleceń: strony widoczne przed pozostałymi
+PRIORITY_VISIBLE = 0
+PRIORITY_BACKGROUND = 1
+
+# Znacznik zlecenia zamknięcia dokumentów wątków (release_documents)
+_RELEASE = "release"
+
+# Współczynnik jakości, od którego miniatury są nadpróbkowane (2x2 piksele na piksel miniatury)
+SUPERSAMPLE_DPI_FACTOR = 1.0
+
+
+def supersample_factor(dpi_factor: float) -> int:
+    """Zwraca krotność nadpróbkowania dla współczynnika jakości miniatur"""
+    return 2 if dpi_factor >= SUPERSAMPLE_DPI_FACTOR else 1
+
+
+def render_page_image(page, column_width: int, dpi_factor: float,
+                      display_lists: Optional[DisplayListCache] = None, key: Optional[tuple] = None,
+                      store: bool = True) -> Image.Image:
+    """
+    Renderuje stronę do obrazu PIL o szerokości column_width.
+
+    Macierz renderowania dobierana jest tak, by MuPDF rasteryzował stronę od razu
+    w docelowym rozmiarze (przy wysokiej jakości - w rozmiarze 2x, zmniejszanym
+    uśrednianiem bloków 2x2). Obraz powstaje bezpośrednio z próbek pixmapy
+    (Image.frombuffer), bez kodowania do PPM i ponownego dekodowania.
+
+    Args:
+        page: Strona fitz.Page
+        column_width: Docelowa szerokość miniatury w pikselach
+        dpi_factor: Współczynnik jakości miniatur (patrz supersample_factor)
+        display_lists: Cache list wyświetlania (None - renderowanie wprost ze strony)
+        key: Klucz strony w display_lists (domyślnie DisplayListCache.page_key)
+        store: Czy zapamiętać nowo zbudowaną listę wyświetlania
+
+    Returns:
+        Obraz PIL (RGB) o szerokości kolumny
+    """
+    page_width = page.rect.width
+    page_height = page.rect.height
+    aspect_ratio = page_height / page_width if page_width != 0 else 1
+    final_thumb_width = max(1, column_width)
+    final_thumb_height = max(1, int(final_thumb_width * aspect_ratio))
+
+    supersample = supersample_factor(dpi_factor)
+    if page_width > 0 and page_height > 0:
+        mat = fitz.Matrix(final_thumb_width * supersample / page_width,
+                          final_thumb_height * supersample / page_height)
+    else:
+        mat = fitz.Matrix(dpi_factor, dpi_factor)
+    if display_lists is not None:
+        pix = display_lists.get_pixmap(page, mat, key=key, store=store)
+    else:
+        pix = page.get_pixmap(matrix=mat, alpha=False)
+    size = (pix.width, pix.height)
+    if supersample > 1:
+        # Bufor pixmapy bez kopiowania - reduce() tworzy nowy obraz, zanim pixmapa zostanie zwolniona
+        image = Image.frombuffer("RGB", size, pix.samples_mv, "raw", "RGB", pix.stride, 1).reduce(supersample)
+    else:
+        # Jedyna kopia próbek (obraz musi przeżyć pixmapę)
+        image = Image.frombuffer("RGB", size, pix.samples, "raw", "RGB", pix.stride, 1)
+    if image.size != (final_thumb_width, final_thumb_height):
+        # Zaokrąglenie rozmiaru pixmapy przez MuPDF - korekta o pojedyncze piksele
+        image = image.resize((final_thumb_width, final_thumb_height), Image.BILINEAR)
+    return image
+
+
+def render_thumbnail(doc, page_index: int, column_width: int, dpi_factor: float,
+                     disk_cache: Optional[ThumbnailDiskCache] = None,
+                     hasher: Optional[PageContentHasher] = None,
+                     display_lists: Optional[DisplayListCache] = None, key: Optional[tuple] = None,
+                     store: bool = True) -> Image.Image:
+    """
+    Zwraca miniaturę strony z cache na dysku albo ją renderuje (i zapisuje w cache).
+
+    Args:
+        doc: Dokument fitz.Document
+        page_index: Indeks strony
+        column_width: Docelowa szerokość miniatury w pikselach
+        dpi_factor: Współczynnik renderowania
+        disk_cache: Trwały cache miniatur (None - tylko renderowanie)
+        hasher: Obiekt liczący skróty stron doc (domyślnie tworzony dla jednego wywołania)
+        display_lists, key, store: Jak w render_page_image
+
+    Returns:
+        Obraz PIL (RGB)
+    """
+    if disk_cache is None or not disk_cache.enabled:
+        return render_page_image(doc.load_page(page_index), column_width, dpi_factor, display_lists, key, store)
+    hasher = hasher or PageContentHasher(doc)
+    cache_key = disk_cache.make_key(hasher.page_hash(page_index), column_width, dpi_factor)
+    image = disk_cache.get(cache_key)
+    if image is None:
+        image = render_page_image(doc.load_page(page_index), column_width, dpi_factor, display_lists, key, store)
+        disk_cache.put(cache_key, image)
+    return image
+
+
+class ThumbnailRenderService:
+    """Pula wątków renderujących miniatury z dostarczaniem wyników do wątku Tk"""
+
+    def __init__(self, master, on_ready: Callable[[int, int, Image.Image], None],
+                 workers: Optional[int] = None, poll_ms: int = 15, batch_ms: int = 12,
+                 disk_cache: Optional[ThumbnailDiskCache] = None,
+                 display_lists: Optional[DisplayListCache] = None):
+        """
+        Args:
+            master: Widget Tk używany do planowania odpytywania (after)
+            on_ready: Callback (page_index, width, image) wywoływany w wątku Tk
+            workers: Liczba wątków roboczych (domyślnie zależna od liczby CPU, max 4)
+            poll_ms: Odstęp odpytywania kolejki wyników w ms
+            batch_ms: Maksymalny czas obsługi wyników w jednym cyklu odpytywania
+            disk_cache: Trwały cache miniatur sprawdzany przed renderowaniem
+            display_lists: Wspólny cache list wyświetlania (listy zapamiętywane tylko dla stron widocznych)
+        """
+        self.master = master
+        self.on_ready = on_ready
+        self.disk_cache = disk_cache
+        self.display_lists = display_lists
+        self.poll_ms = poll_ms
+        self.batch_ms = batch_ms
+        self.worker_count = workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+
+        self._jobs = queue.PriorityQueue()
+        self._results = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = {}  # (page_index, width) -> priorytet ostatniego zlecenia
+        self._in_flight = 0  # Liczba zleceń właśnie renderowanych przez wątki
+        self._seq = itertools.count()
+        self._generation = 0
+        self._source = None  # RenderPlan bieżącej generacji
+        self._poll_id = None
+        self._threads = []
+        self._stopped = False
+
+    # ============================================================================
+    # ŹRÓDŁO DOKUMENTU
+    # ============================================================================
+
+    def set_source(self, path: Optional[str] = None, data: Optional[bytes] = None,
+                   plan: Optional[RenderPlan] = None):
+        """
+        Ustawia nową wersję dokumentu do renderowania i porzuca zaległe zlecenia.
+
+        Args:
+            path: Ścieżka pliku PDF (gdy dokument w pamięci odpowiada plikowi)
+            data: Bajty dokumentu (gdy dokument był modyfikowany)
+            plan: Plan renderowania stron z wielu źródeł (zamiast path/data)
+        """
+        if plan is None:
+            plan = RenderPlan({None: (path, data)}, None)
+        with self._lock:
+            self._generation += 1
+            self._source = plan
+            self._pending.clear()
+        self._discard_snapshot_lists()
+        self._ensure_workers()
+
+    def clear_source(self):
+        """Porzuca dokument (np. po zamknięciu pliku) i wszystkie zaległe zlecenia"""
+        with self._lock:
+            self._generation += 1
+            self._source = None
+            self._pending.clear()
+        self._discard_snapshot_lists()
+
+    def release_documents(self, timeout: float = 5.0) -> bool:
+        """
+        Porzuca źródło i czeka, aż każdy wątek zamknie swoje uchwyty dokumentów.
+
+        Wywoływać przed podmianą pliku źródłowego (os.replace) - w Windows plik
+        otwarty w innym wątku nie może zostać zastąpiony. Renderowanie wznawia
+        dopiero kolejne set_source().
+
+        Args:
+            timeout: Maksymalny czas oczekiwania na wątki w sekundach
+
+        Returns:
+            True, gdy wszystkie wątki zamknęły dokumenty w wyznaczonym czasie
+        """
+        self.clear_source()
+        if not self._threads:
+            return True
+        barrier = threading.Barrier(len(self._threads) + 1, timeout=timeout)
+        for _ in self._threads:
+            # Priorytet przed wszystkimi zleceniami; każdy wątek czeka na barierze, więc bierze jedno zlecenie
+            self._jobs.put((-1, next(self._seq), _RELEASE, barrier, None, None))
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            return False
+        return True
+
+    def _discard_snapshot_lists(self):
+        """Listy wyświetlania stron migawek poprzednich generacji są już bezużyteczne"""
+        if self.display_lists is not None:
+            generation = self._generation
+            self.display_lists.discard(lambda key: key[0] == "snapshot" and key[1] != generation)
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    # ============================================================================
+    # ZLECENIA
+    # ============================================================================
+
+    def request(self, page_indices: Iterable[int], width: int, dpi_factor: float,
+                priority: int = PRIORITY_BACKGROUND):
+        """
+        Zleca wyrenderowanie stron. Ponowne zlecenie z wyższym priorytetem
+        (mniejszą liczbą) przesuwa stronę na początek kolejki.
+
+        Args:
+            page_indices: Indeksy stron w kolejności renderowania
+            width: Szerokość miniatury w pikselach
+            dpi_factor: Współczynnik renderowania
+            priority: PRIORITY_VISIBLE lub PRIORITY_BACKGROUND
+        """
+        with self._lock:
+            if self._source is None:
+                return
+            generation = self._generation
+            for page_index in page_indices:
+                key = (page_index, width)
+                current = self._pending.get(key)
+                if current is not None and current <= priority:
+                    continue
+                self._pending[key] = priority
+                self._jobs.put((priority, next(self._seq), generation, page_index, width, dpi_factor))
+        self._schedule_poll()
+
+    def is_pending(self, page_index: int, width: int) -> bool:
+        """Czy strona czeka w kolejce na renderowanie"""
+        with self._lock:
+            return (page_index, width) in self._pending
+
+    def shutdown(self):
+        """Zatrzymuje wątki robocze i odpytywanie"""
+        self._stopped = True
+        self.clear_source()
+        for _ in self._threads:
+            self._jobs.put((-1, next(self._seq), None, None, None, None))
+        if self._poll_id is not None:
+            try:
+                self.master.after_cancel(self._poll_id)
+            except Exception:
+                pass
+            self._poll_id = None
+
+    # ============================================================================
+    # WĄTKI ROBOCZE
+    # ============================================================================
+
+    def _ensure_workers(self):
+        """Uruchamia wątki robocze przy pierwszym użyciu"""
+        if self._threads or self._stopped:
+            return
+        for i in range(self.worker_count):
+            thread = threading.Thread(target=self._worker_loop, name=f"thumbnail-render-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _worker_loop(self):
+        """Pętla wątku roboczego - każdy wątek otwiera własne kopie dokumentów źródłowych"""
+        docs = {}  # klucz źródła -> (dokument, hasher, znacznik pliku) bieżącej generacji
+        doc_generation = None
+        while True:
+            priority, _, generation, page_index, width, dpi_factor = self._jobs.get()
+            if generation is None:
+                break
+            if generation == _RELEASE:
+                _close_documents(docs)
+                doc_generation = None
+                try:
+                    page_index.wait()  # bariera release_documents
+                except threading.BrokenBarrierError:
+                    pass
+                continue
+            with self._lock:
+                if generation != self._generation or self._pending.get((page_index, width)) != priority:
+                    continue  # Zlecenie nieaktualne lub zastąpione nowszym
+                del self._pending[(page_index, width)]
+                source = self._source
+                self._in_flight += 1
+            try:
+                if doc_generation != generation:
+                    _close_documents(docs)
+                    doc_generation = generation
+                if source.pages is None:
+                    key, page_number, rotation = None, page_index, None
+                else:
+                    key, page_number, rotation = source.pages[page_index]
+                if key not in docs:
+                    path, data = source.sources[key]
+                    doc = fitz.open(path) if path else fitz.open("pdf", data)
+                    docs[key] = (doc, PageContentHasher(doc), path, file_stamp(path) if path else None)
+                doc, hasher, path, stamp = docs[key]
+                if rotation is not None and doc[page_number].rotation != rotation:
+                    # Obrót z dokumentu roboczego - prywatna kopia źródła wątku
+                    doc[page_number].set_rotation(rotation)
+                # Strony plików: klucz wspólny z wątkiem Tk i kolejnymi generacjami (znacznik z chwili otwarcia);
+                # strony migawek - tylko w obrębie generacji
+                rotation = doc[page_number].rotation
+                list_key = ((path and file_page_key(path, stamp, page_number, rotation))
+                            or ("snapshot", generation, key, page_number, rotation))
+                image = render_thumbnail(doc, page_number, width, dpi_factor, self.disk_cache, hasher,
+                                         self.display_lists, list_key, store=priority == PRIORITY_VISIBLE)
+                self._results.put((generation, page_index, width, image))
+            except Exception as e:
+                print(f"[RENDER] Błąd renderowania strony {page_index}: {e}")
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+        _close_documents(docs)
+
+    # ============================================================================
+    # DOSTARCZANIE WYNIKÓW (WĄTEK TK)
+    # ============================================================================
+
+    def _schedule_poll(self):
+        if self._poll_id is None and not self._stopped:
+            self._poll_id = self.master.after(self.poll_ms, self._poll)
+
+    def _poll(self):
+        """Przekazuje gotowe obrazy do callbacku, z limitem czasu na cykl"""
+        self._poll_id = None
+        deadline = _now_ms() + self.batch_ms
+        while _now_ms() < deadline:
+            try:
+                generation, page_index, width, image = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if generation == self._generation:
+                self.on_ready(page_index, width, image)
+        with self._lock:
+            busy = bool(self._pending) or self._in_flight > 0
+        if busy or not self._results.empty():
+            self._schedule_poll()
+
+
+def _close_documents(docs: dict):
+    for doc, *_ in docs.values():
+        doc.close()
+    docs.clear()
+
+
+def _now_ms() -> float:
+    return time.perf_counter() * 1000.0
@@ -0,0 +1,128 @@
+"""
+ThumbnailTransforms - Miniatury stron po zmianach geometrii bez ponownego renderowania
+
+Obrót, kadrowanie, maskowanie marginesów, zmiana rozmiaru i przesunięcie
+zawartości zmieniają stronę w sposób geometryczny: nowa miniatura jest
+przekształceniem afinicznym starej (plus ewentualnie białe prostokąty masek).
+Zamiast usuwać miniaturę z cache i rasteryzować stronę od nowa, przeglądarka
+zapamiętuje położenie strony przed operacją (page_placement), a po niej
+wylicza nową miniaturę z obrazu w cache (transform_thumbnail).
+
+Przekształcenie opisuje ThumbnailTransform:
+- content - macierz nałożona na zawartość w przestrzeni PDF (jak w
+  core.page_geometry.transform_page_contents),
+- masks - białe prostokąty dorysowane na stronie (współrzędne strony fitz, bez obrotu),
+- exact - czy wyliczona miniatura jest równoważna renderowaniu; obrót tylko
+  przestawia piksele i zmniejsza obraz, natomiast po kadrowaniu obraz jest
+  powiększany, a po przesunięciu lub zmniejszeniu zawartości mogą pojawić się
+  fragmenty spoza starego obszaru strony - takie miniatury są tymczasowe
+  i przeglądarka zleca ich dokładne renderowanie w tle.
+"""
+
+from typing import NamedTuple, Tuple
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageDraw
+
+
+# Tolerancja porównań współczynników macierzy
+_EPSILON = 1e-6
+
+
+class PagePlacement(NamedTuple):
+    """Położenie strony na miniaturze"""
+    matrix: fitz.Matrix      # Przestrzeń PDF -> współrzędne page.rect (po obrocie)
+    page_space: fitz.Matrix  # Współrzędne rysowania fitz (bez obrotu) -> współrzędne page.rect
+    width: float           # Rozmiar page.rect w punktach
+    height: float
+
+
+class ThumbnailTransform(NamedTuple):
+    """Geometryczny skutek operacji na stronie"""
+    content: fitz.Matrix = fitz.Identity        # Przekształcenie zawartości w przestrzeni PDF
+    masks: Tuple[fitz.Rect, ...] = ()           # Białe prostokąty (współrzędne strony fitz)
+    exact: bool = False                         # Czy wynik nie wymaga ponownego renderowania
+
+
+# Obrót strony (o wielokrotność 90°) - zawartość i obszar strony bez zmian
+ROTATION = ThumbnailTransform(exact=True)
+# Zmiana pól strony (CropBox, MediaBox) bez zmiany zawartości
+BOX_CHANGE = ThumbnailTransform()
+
+
+def page_placement(page) -> PagePlacement:
+    """Położenie strony fitz.Page - do zapamiętania przed operacją i porównania po niej"""
+    # Page.transformation_matrix pomija przesunięcie CropBox na stronach obróconych - macierz
+    # renderowania liczona jest z pól strony (CropBox w przestrzeni PDF: x0 bez zmian, y1 = MediaBox.y1 - y0)
+    cropbox = page.cropbox
+    matrix = fitz.Matrix(1, 0, 0, -1, -cropbox.x0, page.mediabox.y1 - cropbox.y0) * page.rotation_matrix
+    return PagePlacement(matrix, ~page.transformation_matrix * matrix, page.rect.width, page.rect.height)
+
+
+def transform_thumbnail(image: Image.Image, before: PagePlacement, after: PagePlacement,
+                        transform: ThumbnailTransform, width: int) -> Image.Image:
+    """
+    Wylicza miniaturę strony po operacji z miniatury sprzed operacji.
+
+    Args:
+        image: Miniatura strony sprzed operacji (RGB)
+        before: Położenie strony przed operacją
+        after: Położenie strony po operacji
+        transform: Geometryczny skutek operacji
+        width: Szerokość wynikowej miniatury
+
+    Returns:
+        Obraz PIL (RGB); obszary bez odpowiednika w starej miniaturze są białe
+    """
+    aspect = after.height / after.width if after.width else 1
+    size = (max(1, width), max(1, int(width * aspect)))
+    if before.width <= 0 or before.height <= 0 or after.width <= 0 or after.height <= 0:
+        return Image.new("RGB", size, "white")
+    old_pixels = fitz.Matrix(image.width / before.width, image.height / before.height)
+    new_pixels = fitz.Matrix(size[0] / after.width, size[1] / after.height)
+    # Piksel starej miniatury -> piksel nowej
+    forward = ~old_pixels * ~before.matrix * transform.content * after.matrix * new_pixels
+    result = _place_image(image, forward, size)
+    if transform.masks:
+        draw = ImageDraw.Draw(result)
+        to_pixels = after.page_space * new_pixels
+        for rect in transform.masks:
+            box = fitz.Rect(rect) * to_pixels
+            draw.rectangle((round(box.x0), round(box.y0), round(box.x1) - 1, round(box.y1) - 1), fill="white")
+    return result
+
+
+def _place_image(image: Image.Image, forward: fitz.Matrix, size: Tuple[int, int]) -> Image.Image:
+    """Nakłada przekształcenie forward (piksele źródła -> piksele wyniku) na obraz"""
+    # Obroty o 90° i odbicia - transpozycja (bez interpolacji), potem samo skalowanie i przesunięcie
+    if abs(forward.a) < _EPSILON and abs(forward.d) < _EPSILON:
+        image = image.transpose(Image.TRANSPOSE)
+        forward = fitz.Matrix(0, 1, 1, 0, 0, 0) * forward
+    if abs(forward.b) > _EPSILON or abs(forward.c) > _EPSILON:
+        # Przekształcenie nie zachowuje osi (nie występuje przy operacjach na stronach)
+        inverse = ~forward
+        return image.transform(size, Image.AFFINE,
+                               (inverse.a, inverse.c, inverse.e, inverse.b, inverse.d, inverse.f),
+                               resample=Image.BILINEAR, fillcolor="white")
+    if forward.a < 0:
+        image = image.transpose(Image.FLIP_LEFT_RIGHT)
+        forward = fitz.Matrix(-1, 0, 0, 1, image.width, 0) * forward
+    if forward.d < 0:
+        image = image.transpose(Image.FLIP_TOP_BOTTOM)
+        forward = fitz.Matrix(1, 0, 0, -1, 0, image.height) * forward
+
+    result = Image.new("RGB", size, "white")
+    # Obszar wyniku pokryty przez źródło (w całych pikselach)
+    x0 = max(0, round(forward.e))
+    y0 = max(0, round(forward.f))
+    x1 = min(size[0], round(forward.a * image.width + forward.e))
+    y1 = min(size[1], round(forward.d * image.height + forward.f))
+    if x1 <= x0 or y1 <= y0:
+        return result
+    box = ((x0 - forward.e) / forward.a, (y0 - forward.f) / forward.d,
+           (x1 - forward.e) / forward.a, (y1 - forward.f) / forward.d)
+    box = (max(0.0, box[0]), max(0.0, box[1]), min(image.width, box[2]), min(image.height, box[3]))
+    # Zmniejszanie - uśrednianie pikseli, powiększanie - interpolacja
+    resample = Image.BOX if forward.a <= 1 and forward.d <= 1 else Image.BILINEAR
+    result.paste(image.resize((x1 - x0, y1 - y0), resample, box=box), (x0, y0))
+    return result
@@ -0,0 +1,517 @@
+"""
+UndoHistory - Historia cofania/ponawiania oparta na deltach
+
+Zamiast przechowywać pełną kopię dokumentu przy każdej operacji (write()),
+historia zapisuje tylko zmiany na poziomie stron:
+- strony, których zawartość zmieniono (kopie stron w małym dokumencie pomocniczym)
+- same kąty obrotu przy obracaniu stron
+- indeksy stron wstawionych/usuniętych
+- permutację kolejności stron
+
+Zużycie pamięci zależy od rozmiaru edycji, a nie od rozmiaru dokumentu.
+Historię ogranicza budżet bajtów (a nie stała liczba kroków) - najstarsze
+wpisy są usuwane po przekroczeniu budżetu.
+
+Uwaga: historia obejmuje strony dokumentu. Zmiany na poziomie całego dokumentu
+(metadane, zakładki, szyfrowanie) nie są odtwarzane przez wpisy stronicowe -
+do tego służy wpis pełnej migawki (record_snapshot).
+
+Jeśli historia ma model odwołań stron (VirtualDocument), każdy wpis pamięta też
+jego stan po drugiej stronie edycji - cofanie przywraca pochodzenie stron.
+
+Zakładki i linki wskazują obiekty stron, a nie ich numery:
+- cofnięcie edycji treści zapisuje zawartość stron (/Contents, /Resources,
+  ramki, /Rotate, /Annots) z powrotem do tych samych obiektów stron,
+- usunięcie stron kasuje linki do nich na pozostałych stronach, a zakładki
+  zostają bez celu - wpis przywracający strony pamięta zakładki dokumentu
+  i linki związane z usuwanymi stronami i odtwarza je po ponownym wstawieniu,
+- linki stron zapisanych w dokumencie pomocniczym przechowywane są osobno
+  (kopiowanie stron gubi linki do stron spoza kopii).
+"""
+
+import re
+import fitz  # PyMuPDF
+from typing import List, Optional, Iterable, Tuple
+
+from .page_order import apply_page_order, deletion_map, insertion_map, inverse_order, permutation_map
+
+
+# Stały narzut pamięci wpisu (struktury Pythona), doliczany do budżetu
+ENTRY_OVERHEAD_BYTES = 256
+
+# Przybliżony rozmiar zapamiętanego linku lub pozycji spisu treści
+REFERENCE_BYTES = 128
+
+# Odwołanie do strony na początku tablicy celu linku: "[12 0 R /XYZ ...]"
+_DEST_PAGE = re.compile(r"^\[\s*\d+\s+\d+\s+R\s*")
+
+_REFERENCE = re.compile(r"(\d+)\s+\d+\s+R")
+_PARENT = re.compile(r"/Parent\s*\d+\s+\d+\s+R")
+
+
+
+def _contiguous_runs(indices: List[int]) -> List[Tuple[int, int]]:
+    """
+    Dzieli posortowaną listę indeksów na ciągłe zakresy.
+
+    Args:
+        indices: Posortowane rosnąco, unikalne indeksy stron
+
+    Returns:
+        Lista krotek (pierwszy, ostatni) dla każdego ciągłego zakresu
+    """
+    runs = []
+    for index in indices:
+        if runs and index == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0], index)
+        else:
+            runs.append((index, index))
+    return runs
+
+
+def _capture_pages(doc, indices: List[int]) -> bytes:
+    """
+    Kopiuje wskazane strony do dokumentu pomocniczego i zwraca jego bajty.
+    Kopiowane są tylko obiekty potrzebne tym stronom.
+    """
+    side_doc = fitz.open()
+    try:
+        for first, last in _contiguous_runs(indices):
+            # Linki zapamiętuje _capture_links - w kopii wskazywałyby złe strony
+            side_doc.insert_pdf(doc, from_page=first, to_page=last, links=False)
+        return side_doc.tobytes()
+    finally:
+        side_doc.close()
+
+
+def _capture_links(doc, indices: List[int], incoming: bool = False) -> List[Tuple[int, str, int]]:
+    """
+    Zapamiętuje adnotacje linków stron przed ich zastąpieniem lub usunięciem.
+
+    Zapisywana jest treść obiektu adnotacji (prostokąt, obramowanie, akcja) i indeks
+    strony docelowej - po odtworzeniu cel wskazuje obiekt strony, który wtedy stoi
+    pod tym indeksem.
+
+    Args:
+        doc: Dokument przed zmianą
+        indices: Posortowane indeksy stron
+        incoming: Czy dołączyć linki z pozostałych stron prowadzące do stron `indices`
+                  (usunięcie stron kasuje je razem ze stronami)
+
+    Returns:
+        Lista krotek (indeks_strony_z_linkiem, obiekt_adnotacji, indeks_strony_docelowej
+        albo -1) w numeracji stron sprzed zmiany
+    """
+    captured = set(indices)
+    if incoming:
+        # Tylko strony z adnotacjami - bez ładowania pozostałych stron
+        sources = [i for i in range(len(doc))
+                   if i in captured or doc.xref_get_key(doc.page_xref(i), "Annots")[0] != "null"]
+    else:
+        sources = indices
+    links = []
+    for index in sources:
+        for link in doc[index].get_links():
+            target = link.get("page", -1) if link.get("kind") == fitz.LINK_GOTO else -1
+            if index in captured or target in captured:
+                links.append((index, doc.xref_object(link["xref"], compressed=True), target))
+    return links
+
+
+def _annot_xrefs(doc, page_xref: int) -> List[int]:
+    """Numery obiektów adnotacji strony (tablica /Annots bezpośrednia lub pośrednia)"""
+    kind, value = doc.xref_get_key(page_xref, "Annots")
+    if kind == "xref":
+        value = doc.xref_object(int(value.split()[0]), compressed=True)
+    elif kind != "array":
+        return []
+    return [int(xref) for xref in _REFERENCE.findall(value)]
+
+
+def _append_annot(doc, page_xref: int, annot_xref: int):
+    """Dopisuje adnotację do tablicy /Annots strony (bezpośredniej lub pośredniej)"""
+    kind, value = doc.xref_get_key(page_xref, "Annots")
+    if kind == "xref":
+        array_xref = int(value.split()[0])
+        doc.update_object(array_xref, doc.xref_object(array_xref, compressed=True)[:-1] + f" {annot_xref} 0 R]")
+    elif kind == "array":
+        doc.xref_set_key(page_xref, "Annots", value[:-1] + f" {annot_xref} 0 R]")
+    else:
+        doc.xref_set_key(page_xref, "Annots", f"[{annot_xref} 0 R]")
+
+
+def _restore_links(doc, links: Optional[List[Tuple[int, str, int]]]):
+    """Odtwarza linki zapamiętane przez _capture_links jako nowe obiekty adnotacji"""
+    for index, source, target in links or ():
+        page_xref = doc.page_xref(index)
+        xref = doc.get_new_xref()
+        doc.update_object(xref, source)
+        doc.xref_set_key(xref, "P", f"{page_xref} 0 R")
+        if target >= 0:
+            # Cel jawny ([strona /XYZ ...]) - w /Dest albo w akcji GoTo
+            for key in ("Dest", "A/D"):
+                kind, value = doc.xref_get_key(xref, key)
+                if kind == "array":
+                    doc.xref_set_key(xref, key, _DEST_PAGE.sub(f"[{doc.page_xref(target)} 0 R ", value, count=1))
+                    break
+        _append_annot(doc, page_xref, xref)
+
+
+def _restore_pages_in_place(doc, source_doc, indices: List[int]):
+    """
+    Zapisuje strony `source_doc` do istniejących obiektów stron `indices`.
+
+    Strony są tymczasowo dołączane na końcu dokumentu, a ich słowniki kopiowane
+    do obiektów stron docelowych (bez /Parent) - numery obiektów stron się nie
+    zmieniają, więc zakładki i linki z innych stron nadal do nich prowadzą.
+    """
+    start = len(doc)
+    doc.insert_pdf(source_doc, links=False)
+    try:
+        for offset, index in enumerate(indices):
+            target = doc.page_xref(index)
+            parent = doc.xref_get_key(target, "Parent")[1]
+            source = doc.xref_object(doc.page_xref(start + offset), compressed=True)
+            doc.update_object(target, _PARENT.sub(f"/Parent {parent}", source, count=1))
+            # Adnotacje skopiowanej strony wskazują stronę tymczasową
+            for annot_xref in _annot_xrefs(doc, target):
+                if doc.xref_get_key(annot_xref, "P")[0] != "null":
+                    doc.xref_set_key(annot_xref, "P", f"{target} 0 R")
+    finally:
+        doc.delete_pages(start, len(doc) - 1)
+
+
+def _capture_entry(kind: str, doc, indices: List[int], removing: bool = False) -> "HistoryEntry":
+    """
+    Wpis przywracający strony `indices` w bieżącym stanie.
+
+    Args:
+        kind: Rodzaj wpisu ('pages' lub 'insert')
+        doc: Dokument przed zmianą
+        indices: Posortowane indeksy stron
+        removing: Czy strony zostaną usunięte - wtedy wpis pamięta też spis treści
+                  i linki z pozostałych stron do usuwanych
+    """
+    entry = HistoryEntry(kind, indices, data=_capture_pages(doc, indices))
+    entry.links = _capture_links(doc, indices, incoming=removing)
+    if removing:
+        entry.toc = doc.get_toc(simple=False)
+    return entry
+
+
+class HistoryEntry:
+    """
+    Pojedynczy wpis historii - opisuje, jak przywrócić stan po drugiej stronie edycji.
+
+    Rodzaje wpisów (kind):
+        'pages'       - zapisz strony z `data` do obiektów stron `indices`
+        'rotation'    - ustaw kąty `rotations` na stronach `indices`
+        'insert'      - wstaw strony z `data` tak, by trafiły na pozycje `indices`
+        'delete'      - usuń strony `indices`
+        'permutation' - ustaw kolejność stron: nowa[i] = bieżąca[order[i]]
+        'full'        - pełna migawka dokumentu w `data`
+    """
+
+    def __init__(self, kind: str, indices: Optional[List[int]] = None,
+                 data: Optional[bytes] = None, rotations: Optional[List[int]] = None,
+                 order: Optional[List[int]] = None):
+        self.kind = kind
+        self.indices = indices or []
+        self.data = data
+        self.rotations = rotations
+        self.order = order
+        self.page_refs = None  # Stan modelu odwołań stron do przywrócenia razem z wpisem
+        self.links = None      # Linki stron z `data` ('pages', 'insert') - patrz _capture_links
+        self.toc = None        # Spis treści do odtworzenia po ponownym wstawieniu stron ('insert')
+
+    @property
+    def nbytes(self) -> int:
+        """Przybliżony rozmiar wpisu w pamięci (w bajtach)"""
+        size = ENTRY_OVERHEAD_BYTES + 8 * len(self.indices)
+        if self.data is not None:
+            size += len(self.data)
+        if self.rotations is not None:
+            size += 8 * len(self.rotations)
+        if self.order is not None:
+            size += 8 * len(self.order)
+        if self.page_refs is not None:
+            size += 8 * len(self.page_refs)
+        if self.links is not None:
+            size += REFERENCE_BYTES * len(self.links)
+        if self.toc is not None:
+            size += REFERENCE_BYTES * len(self.toc)
+        return size
+
+    def page_map(self, page_count: int) -> Optional[List[Optional[int]]]:
+        """
+        Przesunięcie stron przez wpis (dla miniatur i siatki).
+
+        Args:
+            page_count: Liczba stron dokumentu przed apply()
+
+        Returns:
+            Dla każdej strony sprzed apply() jej nowy indeks (None - strona usunięta);
+            None, gdy wpis nie przesuwa stron ('pages', 'rotation') albo zastępuje dokument ('full')
+        """
+        if self.kind == 'insert':
+            return insertion_map(page_count, self.indices)
+        if self.kind == 'delete':
+            return deletion_map(page_count, self.indices)
+        if self.kind == 'permutation':
+            return permutation_map(self.order)
+        return None
+
+    def apply(self, doc):
+        """
+        Stosuje wpis do dokumentu.
+
+        Args:
+            doc: Dokument fitz.Document (modyfikowany w miejscu, poza wpisem 'full')
+
+        Returns:
+            Krotka (dokument, wpis_odwrotny, zmienione_strony).
+            zmienione_strony to lista indeksów stron do odświeżenia albo None,
+            jeśli zmieniła się struktura dokumentu (liczba stron).
+        """
+        if self.kind == 'pages':
+            inverse = _capture_entry('pages', doc, self.indices)
+            source_doc = fitz.open("pdf", self.data)
+            try:
+                _restore_pages_in_place(doc, source_doc, self.indices)
+            finally:
+                source_doc.close()
+            _restore_links(doc, self.links)
+            return doc, inverse, list(self.indices)
+
+        if self.kind == 'rotation':
+            current = [doc[index].rotation for index in self.indices]
+            inverse = HistoryEntry('rotation', self.indices, rotations=current)
+            for index, rotation in zip(self.indices, self.rotations):
+                doc[index].set_rotation(rotation)
+            return doc, inverse, list(self.indices)
+
+        if self.kind == 'insert':
+            source_doc = fitz.open("pdf", self.data)
+            try:
+                position = 0
+                for first, last in _contiguous_runs(self.indices):
+                    count = last - first + 1
+                    doc.insert_pdf(source_doc, from_page=position, to_page=position + count - 1,
+                                   start_at=first)
+                    position += count
+            finally:
+                source_doc.close()
+            # Nowe obiekty stron - zakładki i linki do nich trzeba odtworzyć
+            if self.toc:
+                doc.set_toc(self.toc)
+            _restore_links(doc, self.links)
+            return doc, HistoryEntry('delete', self.indices), None
+
+        if self.kind == 'delete':
+            inverse = _capture_entry('insert', doc, self.indices, removing=True)
+            for first, last in reversed(_contiguous_runs(self.indices)):
+                doc.delete_pages(first, last)
+            return doc, inverse, None
+
+        if self.kind == 'permutation':
+            changed = apply_page_order(doc, self.order)
+            return doc, HistoryEntry('permutation', order=inverse_order(self.order)), changed
+
+        if self.kind == 'full':
+            inverse = HistoryEntry('full', data=doc.write())
+            doc.close()
+            return fitz.open("pdf", self.data), inverse, None
+
+        raise ValueError(f"Nieznany rodzaj wpisu historii: {self.kind}")
+
+
+class UndoHistory:
+    """Historia cofania/ponawiania oparta na deltach stron, ograniczona budżetem bajtów"""
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024, page_refs=None):
+        """
+        Args:
+            max_bytes: Budżet pamięci całej historii (undo + redo) w bajtach
+            page_refs: Model odwołań stron (VirtualDocument) cofany razem z dokumentem;
+                       przy rejestrowaniu operacji musi jeszcze opisywać stan sprzed zmiany
+        """
+        self.max_bytes = max_bytes
+        self.page_refs = page_refs
+        self.undo_stack: List[HistoryEntry] = []
+        self.redo_stack: List[HistoryEntry] = []
+        self.total_bytes = 0
+        # Licznik zmian dokumentu - rośnie przy każdej operacji, cofnięciu, ponowieniu i czyszczeniu
+        self.version = 0
+
+    # ============================================================================
+    # STAN HISTORII
+    # ============================================================================
+
+    def can_undo(self) -> bool:
+        """Czy jest operacja do cofnięcia"""
+        return len(self.undo_stack) > 0
+
+    def can_redo(self) -> bool:
+        """Czy jest operacja do ponowienia"""
+        return len(self.redo_stack) > 0
+
+    def clear(self):
+        """Czyści całą historię (np. po zapisie lub zamknięciu pliku)"""
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.total_bytes = 0
+        self.version += 1
+
+    def set_budget(self, max_bytes: int):
+        """Zmienia budżet pamięci historii i od razu go egzekwuje"""
+        self.max_bytes = max_bytes
+        self._enforce_budget()
+
+    # ============================================================================
+    # REJESTROWANIE OPERACJI
+    # ============================================================================
+
+    def record_page_edit(self, doc, indices: Iterable[int]):
+        """
+        Rejestruje edycję zawartości stron (liczba stron się nie zmienia).
+        Wywoływać PRZED modyfikacją stron.
+
+        Args:
+            doc: Dokument przed zmianą
+            indices: Indeksy stron, które zostaną zmienione
+        """
+        indices = sorted(set(indices))
+        if not indices:
+            return
+        self._push(_capture_entry('pages', doc, indices))
+
+    def record_rotation(self, doc, indices: Iterable[int]):
+        """
+        Rejestruje obrót stron - zapamiętuje tylko bieżące kąty.
+        Wywoływać PRZED obrotem.
+        """
+        indices = sorted(set(indices))
+        if not indices:
+            return
+        rotations = [doc[index].rotation for index in indices]
+        self._push(HistoryEntry('rotation', indices, rotations=rotations))
+
+    def record_deletion(self, doc, indices: Iterable[int]):
+        """
+        Rejestruje usunięcie stron - kopiuje tylko usuwane strony.
+        Wywoływać PRZED usunięciem.
+        """
+        indices = sorted(set(indices))
+        if not indices:
+            return
+        self._push(_capture_entry('insert', doc, indices, removing=True))
+
+    def record_insertion(self, indices: Iterable[int]):
+        """
+        Rejestruje wstawienie stron. Wywoływać PO wstawieniu.
+
+        Args:
+            indices: Indeksy wstawionych stron w dokumencie po zmianie
+        """
+        indices = sorted(set(indices))
+        if not indices:
+            return
+        self._push(HistoryEntry('delete', indices))
+
+    def record_permutation(self, order: List[int]):
+        """
+        Rejestruje zmianę kolejności stron.
+
+        Args:
+            order: Nowa kolejność - strona i po zmianie to strona order[i] przed zmianą
+        """
+        self._push(HistoryEntry('permutation', order=inverse_order(order)))
+
+    def record_snapshot(self, doc):
+        """Rejestruje pełną migawkę dokumentu (dla operacji, których nie da się opisać deltą)"""
+        self._push(HistoryEntry('full', data=doc.write()))
+
+    # ============================================================================
+    # COFANIE I PONAWIANIE
+    # ============================================================================
+
+    def peek(self, undo: bool = True) -> Optional[HistoryEntry]:
+        """Wpis, który zastosuje najbliższe undo() (undo=False - redo()); None, gdy stos jest pusty"""
+        stack = self.undo_stack if undo else self.redo_stack
+        return stack[-1] if stack else None
+
+    def undo(self, doc):
+        """
+        Cofa ostatnią operację.
+
+        Returns:
+            Krotka (dokument, zmienione_strony) - patrz HistoryEntry.apply
+        """
+        entry = self.undo_stack.pop()
+        self.total_bytes -= entry.nbytes
+        try:
+            doc, inverse, changed = entry.apply(doc)
+        except Exception:
+            self.undo_stack.append(entry)
+            self.total_bytes += entry.nbytes
+            raise
+        self._swap_page_refs(entry, inverse)
+        self.redo_stack.append(inverse)
+        self.total_bytes += inverse.nbytes
+        self.version += 1
+        self._enforce_budget()
+        return doc, changed
+
+    def redo(self, doc):
+        """
+        Ponawia ostatnio cofniętą operację.
+
+        Returns:
+            Krotka (dokument, zmienione_strony) - patrz HistoryEntry.apply
+        """
+        entry = self.redo_stack.pop()
+        self.total_bytes -= entry.nbytes
+        try:
+            doc, inverse, changed = entry.apply(doc)
+        except Exception:
+            self.redo_stack.append(entry)
+            self.total_bytes += entry.nbytes
+            raise
+        self._swap_page_refs(entry, inverse)
+        self.undo_stack.append(inverse)
+        self.total_bytes += inverse.nbytes
+        self.version += 1
+        self._enforce_budget()
+        return doc, changed
+
+    # ============================================================================
+    # METODY POMOCNICZE
+    # ============================================================================
+
+    def _push(self, entry: HistoryEntry):
+        """Dodaje wpis na stos undo; każda nowa modyfikacja czyści stos redo"""
+        for redo_entry in self.redo_stack:
+            self.total_bytes -= redo_entry.nbytes
+        self.redo_stack.clear()
+        if self.page_refs is not None:
+            entry.page_refs = self.page_refs.state()
+        self.undo_stack.append(entry)
+        self.total_bytes += entry.nbytes
+        self.version += 1
+        self._enforce_budget()
+
+    def _swap_page_refs(self, entry: HistoryEntry, inverse: HistoryEntry):
+        """Przywraca stan modelu odwołań zapisany we wpisie, bieżący trafia do wpisu odwrotnego"""
+        if self.page_refs is None or entry.page_refs is None:
+            return
+        inverse.page_refs = self.page_refs.state()
+        self.page_refs.restore(entry.page_refs)
+
+    def _enforce_budget(self):
+        """Usuwa najstarsze wpisy, dopóki historia nie mieści się w budżecie (ostatni wpis zostaje zawsze)"""
+        while self.total_bytes > self.max_bytes and len(self.undo_stack) + len(self.redo_stack) > 1:
+            if self.redo_stack and (len(self.undo_stack) <= 1):
+                dropped = self.redo_stack.pop(0)
+            else:
+                dropped = self.undo_stack.pop(0)
+            self.total_bytes -= dropped.nbytes
@@ -0,0 +1,212 @@
+"""
+VirtualDocument - Strony dokumentu roboczego jako odwołania do stron źródłowych
+
+Dla każdej strony dokumentu roboczego model pamięta, skąd pochodzi: (źródło,
+numer strony w źródle). Źródłem jest plik PDF na dysku (otwarty, zaimportowany)
+albo bajty PDF (np. schowek). Strony nowe lub zmienione (kadrowanie, numeracja,
+puste strony, arkusze impozycji) nie mają odwołania - są "edytowane".
+
+Operacje strukturalne (import, wklejanie, duplikowanie, usuwanie, zmiana
+kolejności) to edycje listy odwołań proporcjonalne do liczby zmienionych stron.
+Dzięki temu wątki renderujące miniatury czytają niezmienione strony wprost ze
+źródeł, a migawka dokumentu roboczego obejmuje tylko strony edytowane - zamiast
+serializacji całego dokumentu po każdej operacji.
+
+Obrót stron nie zmienia odwołania - kąt odczytywany jest z dokumentu roboczego
+przy budowie planu renderowania.
+"""
+
+import os
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import fitz  # PyMuPDF
+
+from .page_transfer import pages_to_bytes
+
+
+# Klucz źródła z migawką stron edytowanych w planie renderowania
+WORKING_SOURCE = "working"
+
+
+class PageRef(NamedTuple):
+    """Odwołanie do strony źródłowej"""
+    source: str  # Klucz źródła w VirtualDocument.sources
+    page: int    # Numer strony w źródle
+
+
+class RenderPlan(NamedTuple):
+    """
+    Źródła i położenie stron dokumentu roboczego dla wątków renderujących.
+
+    sources: klucz -> (ścieżka, bajty) - jedno z nich jest None
+    pages: dla każdej strony dokumentu (klucz źródła, numer strony w źródle, obrót lub None - jak w źródle)
+    """
+    sources: Dict[str, Tuple[Optional[str], Optional[bytes]]]
+    pages: List[Tuple[str, int, Optional[int]]]
+
+
+def _file_stamp(path: str) -> Optional[Tuple[float, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+
+class VirtualDocument:
+    """Lista odwołań stron dokumentu roboczego do stron źródłowych (None - strona edytowana)"""
+
+    def __init__(self):
+        # klucz -> (ścieżka, bajty, znacznik pliku z chwili rejestracji)
+        self.sources: Dict[str, Tuple[Optional[str], Optional[bytes], Optional[Tuple[float, int]]]] = {}
+        self.pages: List[Optional[PageRef]] = []
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    # ============================================================================
+    # ŹRÓDŁA
+    # ============================================================================
+
+    def add_source(self, path: Optional[str] = None, data: Optional[bytes] = None) -> str:
+        """
+        Rejestruje źródło stron (plik albo bajty PDF) i zwraca jego klucz.
+
+        Bajty identyfikowane są obiektem (ten sam schowek wklejany wielokrotnie to jedno źródło);
+        model trzyma referencję, więc obiekt nie zostanie zwolniony, dopóki źródło istnieje.
+        """
+        if path:
+            path = os.path.abspath(path)
+            key = f"path:{path}"
+            if key not in self.sources:
+                self.sources[key] = (path, None, _file_stamp(path))
+        else:
+            key = f"data:{id(data)}"
+            if key not in self.sources:
+                self.sources[key] = (None, data, None)
+        return key
+
+    def source_pages(self, page_numbers: Iterable[int], path: Optional[str] = None,
+                     data: Optional[bytes] = None) -> List[PageRef]:
+        """Odwołania do stron źródła (rejestruje źródło)"""
+        key = self.add_source(path, data)
+        return [PageRef(key, page) for page in page_numbers]
+
+    def reset(self, page_count: int = 0, path: Optional[str] = None):
+        """
+        Nowy dokument roboczy: strony pliku path (otwarty lub właśnie zapisany dokument)
+        albo page_count stron bez źródła.
+        """
+        self.sources.clear()
+        if path:
+            self.pages = self.source_pages(range(page_count), path=path)
+        else:
+            self.pages = [None] * page_count
+
+    # ============================================================================
+    # OPERACJE NA LIŚCIE STRON
+    # ============================================================================
+
+    def refs(self, indices: Iterable[int]) -> List[Optional[PageRef]]:
+        """Odwołania wskazanych stron (np. do duplikowania)"""
+        return [self.pages[i] for i in indices]
+
+    def insert(self, indices: Iterable[int], refs: Optional[Sequence[Optional[PageRef]]] = None):
+        """
+        Wstawia strony tak, by znalazły się na pozycjach indices (indeksy po wstawieniu).
+
+        Args:
+            indices: Pozycje wstawionych stron w dokumencie po zmianie
+            refs: Odwołania w kolejności rosnących pozycji (None - strony edytowane)
+        """
+        indices = sorted(indices)
+        if refs is None:
+            refs = [None] * len(indices)
+        pages = []
+        existing = iter(self.pages)
+        inserted = iter(zip(indices, refs))
+        position, ref = next(inserted, (None, None))
+        for index in range(len(self.pages) + len(indices)):
+            if index == position:
+                pages.append(ref)
+                position, ref = next(inserted, (None, None))
+            else:
+                pages.append(next(existing))
+        self.pages = pages
+
+    def delete(self, indices: Iterable[int]):
+        removed = set(indices)
+        self.pages = [ref for i, ref in enumerate(self.pages) if i not in removed]
+
+    def permute(self, order: Sequence[int]):
+        """Nowa kolejność - strona i po zmianie to strona order[i] przed zmianą"""
+        self.pages = [self.pages[i] for i in order]
+
+    def mark_edited(self, indices: Optional[Iterable[int]] = None):
+        """Oznacza strony (domyślnie wszystkie) jako edytowane - tracą odwołanie do źródła"""
+        if indices is None:
+            self.pages = [None] * len(self.pages)
+            return
+        for i in indices:
+            self.pages[i] = None
+
+    def edited_pages(self) -> List[int]:
+        return [i for i, ref in enumerate(self.pages) if ref is None]
+
+    def state(self) -> tuple:
+        """Niezmienna migawka listy odwołań (dla historii cofania)"""
+        return tuple(self.pages)
+
+    def restore(self, state: tuple):
+        self.pages = list(state)
+
+    # ============================================================================
+    # PLAN RENDEROWANIA
+    # ============================================================================
+
+    def _invalidate_changed_files(self):
+        """Strony plików zmienionych na dysku (np. nadpisanych zapisem) przestają wskazywać źródło"""
+        stale = {key for key, (path, _, stamp) in self.sources.items()
+                 if path and _file_stamp(path) != stamp}
+        if stale:
+            self.pages = [None if ref is not None and ref.source in stale else ref for ref in self.pages]
+            for key in stale:
+                del self.sources[key]
+
+    def render_plan(self, doc) -> RenderPlan:
+        """
+        Buduje plan renderowania stron dokumentu roboczego.
+
+        Niezmienione strony czytane są ze źródeł, edytowane - z migawki zawierającej
+        tylko te strony. Gdy liczba stron modelu nie zgadza się z dokumentem,
+        wszystkie strony traktowane są jako edytowane.
+
+        Args:
+            doc: Dokument roboczy fitz.Document
+
+        Returns:
+            RenderPlan dla ThumbnailRenderService.set_source()
+        """
+        if len(self.pages) != len(doc):
+            self.reset(len(doc))
+        self._invalidate_changed_files()
+
+        edited = self.edited_pages()
+        sources = {}
+        if len(edited) == len(doc):
+            sources[WORKING_SOURCE] = (None, doc.tobytes(encryption=fitz.PDF_ENCRYPT_NONE))
+        elif edited:
+            sources[WORKING_SOURCE] = (None, pages_to_bytes(doc, edited))
+        working_numbers = {page_index: number for number, page_index in enumerate(edited)}
+
+        pages = []
+        for page_index, ref in enumerate(self.pages):
+            if ref is None:
+                pages.append((WORKING_SOURCE, working_numbers[page_index], None))
+                continue
+            if ref.source not in sources:
+                path, data, _ = self.sources[ref.source]
+                sources[ref.source] = (path, data)
+            kind, value = doc.xref_get_key(doc.page_xref(page_index), "Rotate")
+            pages.append((ref.source, ref.page, int(value) % 360 if kind == "int" else None))
+        return RenderPlan(sources, pages)
@@ -58,6 +58,25 @@ def check_module_structure():
     core_files = [
         ("core/__init__.py", "Core package init"),
         ("core/preferences_manager.py", "Preferences manager module"),
+        ("core/undo_history.py", "Delta-based undo history module"),
+        ("core/thumbnail_renderer.py", "Background thumbnail render service"),
+        ("core/thumbnail_layout.py", "Virtual thumbnail grid layout"),
+        ("core/thumbnail_cache.py", "Persistent thumbnail disk cache"),
+        ("core/image_cache.py", "Memory-bounded thumbnail image cache"),
+        ("core/thumbnail_transforms.py", "Geometric thumbnail derivation"),
+        ("core/page_geometry.py", "In-place page crop/resize/shift engine"),
+        ("core/page_imposition.py", "Vector multi-sheet page imposition"),
+        ("core/page_transfer.py", "Bulk page transfer with shared graft map"),
+        ("core/page_order.py", "In-place page permutation"),
+        ("core/virtual_document.py", "Page provenance model for rendering"),
+        ("core/save_profiles.py", "Save profiles and background saver"),
+        ("core/image_optimizer.py", "Image downsampling and recompression"),
+        ("core/display_list_cache.py", "Shared page display list cache"),
+        ("core/color_analysis.py", "Vectorized color page classifier"),
+        ("core/document_analysis.py", "Parallel page analysis engine and index"),
+        ("core/empty_pages.py", "Tiered empty page detector"),
+        ("core/refresh_scheduler.py", "Coalescing UI refresh scheduler"),
+        ("core/page_selection.py", "Bitset page selection with range specs"),
     ]
     
     for filepath, desc in core_files:
@@ -145,6 +164,25 @@ def check_syntax():
         "utils/tooltip.py",
         "core/__init__.py",
         "core/preferences_manager.py",
+        "core/undo_history.py",
+        "core/thumbnail_renderer.py",
+        "core/thumbnail_layout.py",
+        "core/thumbnail_cache.py",
+        "core/image_cache.py",
+        "core/thumbnail_transforms.py",
+        "core/page_geometry.py",
+        "core/page_imposition.py",
+        "core/page_transfer.py",
+        "core/page_order.py",
+        "core/virtual_document.py",
+        "core/save_profiles.py",
+        "core/image_optimizer.py",
+        "core/display_list_cache.py",
+        "core/color_analysis.py",
+        "core/document_analysis.py",
+        "core/empty_pages.py",
+        "core/refresh_scheduler.py",
+        "core/page_selection.py",
     ]
     
     all_ok = True
@@ -163,6 +201,71 @@ def check_syntax():
     print()
     return all_ok
 
+def _document_references(doc):
+    """Outline and link targets of every page (compared across undo/redo)"""
+    links = [[(link.get("page"), tuple(round(v) for v in link["from"])) for link in page.get_links()]
+             for page in doc]
+    return doc.get_toc(), links
+
+def check_undo_history():
+    """Check that a full undo/redo round-trip keeps the outline and links intact"""
+    print("=" * 60)
+    print("Checking Undo History Round-Trip")
+    print("=" * 60)
+    
+    try:
+        import fitz  # PyMuPDF
+        from core.undo_history import UndoHistory
+        from core.page_order import apply_page_order
+    except ImportError as e:
+        print(f"⚠ PyMuPDF not available - skipping undo history check ({e})")
+        print()
+        return True
+    
+    doc = fitz.open()
+    for i in range(6):
+        doc.new_page().insert_text((72, 72), f"Page {i + 1}")
+    doc.set_toc([[1, f"Page {i + 1}", i + 1] for i in range(6)] + [[2, "Section", 3]])
+    for target in range(1, 6):
+        doc[0].insert_link({"kind": fitz.LINK_GOTO, "page": target,
+                            "from": fitz.Rect(10, 10 * target, 60, 10 * target + 8)})
+    doc[3].set_rotation(90)
+    doc[3].insert_link({"kind": fitz.LINK_GOTO, "page": 0, "from": fitz.Rect(10, 10, 60, 18)})
+    
+    history = UndoHistory()
+    before = _document_references(doc)
+    history.record_page_edit(doc, [0, 1, 3])
+    for index in (0, 1, 3):
+        doc[index].insert_text((72, 144), "Edited")
+    history.record_deletion(doc, [0, 2])
+    doc.delete_pages([0, 2])
+    order = list(reversed(range(len(doc))))
+    apply_page_order(doc, order)
+    history.record_permutation(order)
+    history.record_rotation(doc, [1])
+    doc[1].set_rotation(180)
+    after = _document_references(doc)
+    
+    all_ok = True
+    while history.can_undo():
+        doc, _ = history.undo(doc)
+    if _document_references(doc) == before:
+        print("✓ Outline and links restored after undoing all steps")
+    else:
+        print("✗ Outline or links changed after undoing all steps")
+        all_ok = False
+    while history.can_redo():
+        doc, _ = history.redo(doc)
+    if _document_references(doc) == after:
+        print("✓ Outline and links restored after redoing all steps")
+    else:
+        print("✗ Outline or links changed after redoing all steps")
+        all_ok = False
+    doc.close()
+    
+    print()
+    return all_ok
+
 def main():
     """Main validation function"""
     print("\n" + "=" * 60)
@@ -178,6 +281,7 @@ def main():
     structure_ok = check_module_structure()
     syntax_ok = check_syntax()
     imports_ok = check_imports()
+    undo_ok = check_undo_history()
     
     print("=" * 60)
     print("Validation Summary")
@@ -185,9 +289,10 @@ def main():
     print(f"Module Structure: {'✓ PASS' if structure_ok else '✗ FAIL'}")
     print(f"Syntax Check:     {'✓ PASS' if syntax_ok else '✗ FAIL'}")
     print(f"Import Check:     {'✓ PASS' if imports_ok else '✗ FAIL'}")
+    print(f"Undo History:     {'✓ PASS' if undo_ok else '✗ FAIL'}")
     print("=" * 60)
     
-    if structure_ok and syntax_ok and imports_ok:
+    if structure_ok and syntax_ok and imports_ok and undo_ok:
         print("\n✓ All checks passed!")
         return 0
     else: